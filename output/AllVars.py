@@ -893,12 +893,10 @@ def powerspec_bins(ngrid, boxsize):
 
     mid = int(ngrid/2)
     # find the magnitude of the indices (i.e. ix**2+iy**2+iz**2 in the FFT convention)
-    n1 = np.arange(ngrid)
-    n1[1+mid:] -= ngrid
-    n2 = np.square(n1)
+    n2 = powerspec_index_squared(ngrid)
     nmag = np.sqrt(np.add.outer(np.add.outer(n2, n2), n2)).ravel()
 
-    nbins = (-1,) + tuple(np.arange(mid-1)+1.5) + (ngrid*2,)
+    nbins = powerspec_bin_edges(ngrid)
     #print 'nbins', nbins
     kbins = np.digitize(nmag, nbins) - 1
     assert(kbins.min()==0)
@@ -917,6 +915,113 @@ def powerspec_bins(ngrid, boxsize):
     return kmin, kmax, kbins, kvol
 
 
+def powerspec_index_squared(ngrid):
+    """
+    The square of the index of each mode along one dimension, in the FFT
+    convention of 0, ..., n/2, -n/2+1, ..., -1.
+    """
+
+    mid = int(ngrid/2)
+    n1 = np.arange(ngrid)
+    n1[1+mid:] -= ngrid
+
+    return np.square(n1)
+
+
+def powerspec_bin_edges(ngrid):
+    """
+    The edges (in units of the fundamental mode) of the power spectrum bins
+    used by ``powerspec_bins()``.
+    """
+
+    mid = int(ngrid/2)
+
+    return (-1,) + tuple(np.arange(mid-1)+1.5) + (ngrid*2,)
+
+
+def powerspec_slab_sums(modes, ngrid, first_slab=0, modes2=None):
+    """
+    Bins the power of a number of slabs (along the first axis) of fourier
+    modes, one slab at a time.  Unlike ``modes_to_pspec()`` this never creates
+    a temporary the size of the full grid, and the sums are accumulated in
+    double precision regardless of the precision of ``modes``.
+
+    modes      - (m,n,n) array of slabs first_slab, ..., first_slab+m-1 of the
+                 (n,n,n) array of modes (from ifftn of overdensity values)
+    ngrid      - num cells on side of the full cube
+    first_slab - index of the first slab of modes within the full cube
+    modes2     - if given, the cross power with these modes is binned instead
+
+    returns v0, v1, v2
+
+    v0 - the number of modes in each bin
+    v1 - the sum of the power in each bin
+    v2 - the sum of the squared power in each bin
+
+    The sums from different slabs (e.g., held by different tasks) can simply
+    be added together and passed to ``powerspec_from_sums()``.
+    """
+
+    n2 = powerspec_index_squared(ngrid)
+    nbins = powerspec_bin_edges(ngrid)
+    num_bins = len(nbins) - 1
+
+    # The magnitude of the (y, z) indices is the same for every slab.
+    n2_yz = np.add.outer(n2, n2).ravel()
+
+    v0 = np.zeros(num_bins)
+    v1 = np.zeros(num_bins)
+    v2 = np.zeros(num_bins)
+
+    for idx in range(modes.shape[0]):
+        nmag = np.sqrt(n2[first_slab + idx] + n2_yz)
+        kbins = np.digitize(nmag, nbins) - 1
+
+        slab = modes[idx].ravel()
+        if modes2 is None:
+            wts = np.square(slab.real) + np.square(slab.imag)
+        else:
+            slab2 = modes2[idx].ravel()
+            wts = slab.real*slab2.real + slab.imag*slab2.imag
+        wts = wts.astype(np.float64)
+
+        v0 += np.bincount(kbins, minlength=num_bins)
+        v1 += np.bincount(kbins, weights=wts, minlength=num_bins)
+        v2 += np.bincount(kbins, weights=np.square(wts), minlength=num_bins)
+
+    return v0, v1, v2
+
+
+def powerspec_from_sums(v0, v1, v2, ngrid, boxsize):
+    """
+    Computes the (binned) power spectrum with errors from the sums of
+    ``powerspec_slab_sums()`` over every slab of the grid.
+
+    returns kmid, pspec, perr (see ``modes_to_pspec()``)
+    """
+
+    mid = int(ngrid/2)
+    nbins = powerspec_bin_edges(ngrid)
+
+    # multiplier to go to k-space
+    kmult = 2.0 * np.pi / boxsize
+
+    kmin = (np.array(nbins) * kmult)[:-1]
+    kmin[0] = 0
+
+    kmax = (np.array(nbins) * kmult)[1:]
+    kmax[-1] = mid * kmult * np.sqrt(3.0)
+
+    kvol = v0 * (kmult * kmult * kmult)
+
+    powerspec = v1 * (1.0 / kvol)
+    p_err = np.sqrt((v2*v0 - v1*v1)/(v0-1)) / kvol
+
+    kmid_bins = 0.5 * (kmin+kmax)
+
+    return kmid_bins, powerspec, p_err
+
+
 def two_modes_to_pspec(modes, modes2, boxsize):
     """
     From a given set of fourier modes, compute the (binned) power spectrum
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+"""
+This file contains a registry of binned statistics (e.g., the mean escape
+fraction as a function of stellar mass) and the engine that accumulates them.
+
+Each statistic is declared once with ``statistic()`` as an (x field, y field,
+binning axis, transform, selection) combination.  The fields are looked up, by
+name, in a dictionary of the properties of every galaxy at a snapshot.  For
+example::
+
+    registry = [bstats.statistic("fesc_galaxy", "stellar_mass", "mass_gal", "fesc"),
+                bstats.statistic("sfr_galaxy", "stellar_mass", "mass_gal", "SFR",
+                                 transform=np.log10, selection="has_SFR")]
+
+The statistics are accumulated by ``BinnedStatistics``.  Rather than storing
+the mean and standard deviation (and pooling them file by file), the number of
+data points, the sum and the sum of squares within each bin are accumulated.
+These are simply added across files and tasks, the mean and standard
+deviation are only formed at the end.
+
+For each snapshot, every statistic on the same binning axis is evaluated in a
+single pass: the bin of each galaxy is found once for each (x field,
+selection) combination and the moments of all the statistics are then summed
+with a single ``np.bincount``.  The moments of every statistic live in one
+contiguous buffer so they are reduced across tasks with a single MPI call.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+
+import CollectiveStats as collective
+from ParallelBackend import MPI
+
+
+def make_axis(bin_width, low, high):
+    """
+    Defines a binning axis.  The bin edges are identical to those of
+    ``AllVars.Calculate_2D_Mean()``.
+
+    Parameters
+    ----------
+
+    bin_width, low, high : Floats
+        The width of each bin and the lower and upper edge of the axis.
+
+    Returns
+    ---------
+
+    axis : Dictionary
+        The bin ``edges``, number of bins ``Nbins`` and the bin parameters.
+    """
+
+    if high <= low:
+        raise ValueError("The upper edge of the axis ({0}) must be greater "
+                         "than the lower edge ({1})".format(high, low))
+
+    edges = np.arange(low, high + bin_width, bin_width)
+
+    axis = {"edges" : edges,
+            "Nbins" : len(edges) - 1,
+            "bin_width" : bin_width,
+            "low" : low,
+            "high" : high}
+
+    return axis
+
+
+def statistic(name, axis, x, y, transform=None, selection=None):
+    """
+    Declares a binned statistic.
+
+    Parameters
+    ----------
+
+    name : String
+        Name the statistic is accessed with.
+
+    axis : String
+        Name of the binning axis (see ``make_axis()``) the x-data is binned on.
+
+    x, y : Strings
+        Name of the fields that are binned and averaged, respectively.
+
+    transform : Function, optional
+        Applied to the (selected) y-data before it is binned, e.g.,
+        ``np.log10``.
+
+    selection : String, optional
+        Name of a boolean field.  Only the galaxies where it's ``True`` are
+        used.
+
+    Returns
+    ---------
+
+    spec : Dictionary
+        The specification of the statistic.
+    """
+
+    spec = {"name" : name,
+            "axis" : axis,
+            "x" : x,
+            "y" : y,
+            "transform" : transform,
+            "selection" : selection}
+
+    return spec
+
+
+def find_bins(data_x, edges):
+    """
+    Finds the bin of each data point.  Points equal to the final edge belong
+    to the last bin (as for ``np.histogram``).
+
+    Parameters
+    ----------
+
+    data_x : 1D ``np.ndarray`` of floats
+        The data being binned.
+
+    edges : 1D ``np.ndarray`` of floats
+        The bin edges.
+
+    Returns
+    ---------
+
+    bin_idx : 1D ``np.ndarray`` of integers
+        The bin of each point.  Points outside the edges are ``-1``.
+    """
+
+    data_x = np.asarray(data_x, dtype=np.float64)
+
+    bin_idx = np.searchsorted(edges, data_x, side="right") - 1
+    bin_idx[data_x == edges[-1]] = len(edges) - 2
+    bin_idx[(bin_idx < 0) | (bin_idx > len(edges) - 2)] = -1
+
+    return bin_idx
+
+
+class BinnedStatistics(object):
+    """
+    Accumulates a registry of binned statistics for every model and snapshot.
+
+    Parameters
+    ----------
+
+    axes : Dictionary
+        Keyed by the name of each binning axis.  Values are created by
+        ``make_axis()``.
+
+    registry : List of dictionaries
+        The statistics, created by ``statistic()``.
+
+    num_snaps_allmodels : List of integers
+        Number of snapshots the statistics are calculated for in each model.
+    """
+
+    def __init__(self, axes, registry, num_snaps_allmodels):
+
+        self.axes = axes
+        self.registry = registry
+        self.num_snaps_allmodels = list(num_snaps_allmodels)
+
+        num_models = len(self.num_snaps_allmodels)
+        max_snaps = max(self.num_snaps_allmodels + [0])
+
+        names = [spec["name"] for spec in registry]
+        if len(set(names)) != len(names):
+            raise ValueError("The names of the statistics must be unique.")
+
+        for spec in registry:
+            if spec["axis"] not in axes:
+                raise ValueError("Statistic {0} is binned on axis {1} which "
+                                 "hasn't been defined.".format(spec["name"],
+                                                               spec["axis"]))
+
+        # The statistics on each axis, in registry order.
+        self.axis_stats = {}
+        for spec in registry:
+            self.axis_stats.setdefault(spec["axis"], []).append(spec)
+
+        # Every axis gets a block of ``(num_models, max_snaps, 3, num_stats,
+        # Nbins)`` within the one contiguous buffer.
+        block_shapes = {}
+        buffer_size = 0
+        for axis_name, specs in self.axis_stats.items():
+            shape = (num_models, max_snaps, 3, len(specs),
+                     axes[axis_name]["Nbins"])
+            block_shapes[axis_name] = (buffer_size, shape)
+            buffer_size += int(np.prod(shape))
+
+        self.buffer = np.zeros(buffer_size, dtype=np.float64)
+
+        self.moments_by_axis = {}
+        for axis_name, (offset, shape) in block_shapes.items():
+            size = int(np.prod(shape))
+            self.moments_by_axis[axis_name] = \
+                self.buffer[offset:offset+size].reshape(shape)
+
+        # Where each statistic lives within its axis block.
+        self.stat_slot = {}
+        for axis_name, specs in self.axis_stats.items():
+            for slot, spec in enumerate(specs):
+                self.stat_slot[spec["name"]] = (axis_name, slot)
+
+    def accumulate(self, model_number, snapshot_idx, fields):
+        """
+        Adds a set of galaxies to every statistic.
+
+        Parameters
+        ----------
+
+        model_number, snapshot_idx : Integers
+            The model and snapshot the galaxies belong to.
+
+        fields : Dictionary
+            Keyed by the field names used in the registry.  Values are arrays
+            with one entry per galaxy.
+
+        Returns
+        ---------
+
+        None.  The moments are updated in place.
+        """
+
+        for axis_name, specs in self.axis_stats.items():
+            Nbins = self.axes[axis_name]["Nbins"]
+            edges = self.axes[axis_name]["edges"]
+
+            # The bins only need to be found once for each x field/selection.
+            binned = {}
+
+            flat_idx = []
+            weights = []
+            for slot, spec in enumerate(specs):
+                group = (spec["x"], spec["selection"])
+                if group not in binned:
+                    if spec["selection"] is None:
+                        mask = slice(None)
+                    else:
+                        mask = np.asarray(fields[spec["selection"]], dtype=bool)
+
+                    bin_idx = find_bins(np.asarray(fields[spec["x"]])[mask], edges)
+                    valid = bin_idx >= 0
+                    binned[group] = (mask, valid, bin_idx[valid])
+
+                mask, valid, bin_idx = binned[group]
+
+                data_y = np.asarray(fields[spec["y"]])[mask]
+                if spec["transform"] is not None:
+                    data_y = spec["transform"](data_y)
+                data_y = np.asarray(data_y, dtype=np.float64)[valid]
+
+                flat_idx.append(slot*Nbins + bin_idx)
+                weights.append(data_y)
+
+            flat_idx = np.concatenate(flat_idx)
+            weights = np.concatenate(weights)
+
+            num_cells = len(specs)*Nbins
+            moments = self.moments_by_axis[axis_name][model_number, snapshot_idx]
+
+            moments[0] += np.bincount(flat_idx,
+                                      minlength=num_cells).reshape(len(specs), Nbins)
+            moments[1] += np.bincount(flat_idx, weights=weights,
+                                      minlength=num_cells).reshape(len(specs), Nbins)
+            moments[2] += np.bincount(flat_idx, weights=weights*weights,
+                                      minlength=num_cells).reshape(len(specs), Nbins)
+
+    def reduce(self, comm, root=0):
+        """
+        Sums the moments of every statistic across tasks onto ``root`` with a
+        single MPI call.  Afterwards, ``root`` holds the totals and the other
+        tasks hold zeros (so pooling the results again, e.g., with
+        ``collect_across_tasks()``, leaves the totals unchanged).
+
+        Parameters
+        ----------
+
+        comm : MPI communicator
+            The tasks being reduced across.
+
+        root : Integer, optional
+            The task that receives the totals.
+        """
+
+        if comm.Get_rank() == root:
+            totals = np.zeros_like(self.buffer)
+        else:
+            totals = None
+
+        comm.Reduce([self.buffer, MPI.DOUBLE], [totals, MPI.DOUBLE],
+                    op=MPI.SUM, root=root)
+
+        if comm.Get_rank() == root:
+            self.buffer[:] = totals
+        else:
+            self.buffer[:] = 0.0
+
+    def moments(self, name):
+        """
+        Returns the number of data points, sum and sum of squares of a
+        statistic.  Each has shape ``(num_models, max_snaps, Nbins)``.
+        """
+
+        axis_name, slot = self.stat_slot[name]
+        moments = self.moments_by_axis[axis_name][:, :, :, slot]
+
+        return moments[:, :, 0], moments[:, :, 1], moments[:, :, 2]
+
+    def mean_std(self, name):
+        """
+        Returns the mean, standard deviation and number of data points of a
+        statistic within each bin.  Each has shape ``(num_models, max_snaps,
+        Nbins)``.  Bins without any data points have a mean and standard
+        deviation of 0.
+        """
+
+        N, sum_y, sum_y2 = self.moments(name)
+        mean, std = collective.sums_to_mean_std(N, sum_y, sum_y2)
+
+        return mean, std, N
+
+    def nested(self, name):
+        """
+        Returns the mean, standard deviation and number of data points of a
+        statistic as nested lists indexed by ``model_number`` then snapshot,
+        i.e., the layout used by the plotting functions.
+        """
+
+        mean, std, N = self.mean_std(name)
+
+        mean_nested = []
+        std_nested = []
+        N_nested = []
+        for model_number, num_snaps in enumerate(self.num_snaps_allmodels):
+            mean_nested.append([mean[model_number, snapshot_idx].astype(np.float32)
+                                for snapshot_idx in range(num_snaps)])
+            std_nested.append([std[model_number, snapshot_idx].astype(np.float32)
+                               for snapshot_idx in range(num_snaps)])
+            N_nested.append([N[model_number, snapshot_idx].astype(np.float32)
+                             for snapshot_idx in range(num_snaps)])
+
+        return mean_nested, std_nested, N_nested
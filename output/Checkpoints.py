@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+"""
+This file contains the functions for saving and loading the partial results
+of each work unit (e.g., a single galaxy file or a single reionization
+snapshot) that is processed by ``GalaxyData.generate_data()`` and
+``ReionData.generate_data()``.
+
+If a run dies part way through (e.g., hitting the wall time), re-running with
+the same ``checkpoint_dir`` loads the completed work units from disk and only
+processes those that are missing.
+
+Each checkpoint is a ``.npz`` file holding the arrays of the work unit along
+with a ``signature`` string describing the settings used to create it.  A
+checkpoint is only re-used if the signature matches the current settings.
+
+Checkpoints are named by the identity of their inputs (the settings along with
+the path, size and modification time of the files that are read) rather than
+by the model or file number.  Hence adding a model to the list being plotted,
+or extending ``LastFile``, only processes the new inputs; everything else is
+loaded from the existing checkpoints.  For statistics that are summed over
+files, the per-model totals are also saved along with the list of inputs they
+cover, so the new files are simply added to the existing totals.
+"""
+
+from __future__ import print_function
+
+import os
+import glob
+import json
+import hashlib
+
+import numpy as np
+
+
+def make_signature(settings):
+    """
+    Creates the signature string used to check whether a checkpoint was
+    created using the same settings as the current run.
+
+    Parameters
+    ----------
+
+    settings : Dictionary
+        The settings that affect the results of a work unit, e.g., which
+        statistics are calculated and the bins used.  Values can be numbers,
+        strings, lists or numpy arrays.
+
+    Returns
+    ---------
+
+    signature : String
+        ``settings`` serialized in a stable order.
+    """
+
+    def default(obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        return str(obj)
+
+    return json.dumps(settings, sort_keys=True, default=default)
+
+
+def save_partial(fname, partial, signature, unit_keys=None):
+    """
+    Saves the partial results of a single work unit.
+
+    The file is written to a temporary name then moved into place, so a run
+    that dies mid-write never leaves a truncated checkpoint behind.
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the checkpoint file. The directory is created if it does not
+        exist.
+
+    partial : Dictionary
+        The results of the work unit. Values are numpy arrays or scalars.
+        Values of ``None`` are not saved and are restored as ``None``.
+
+    signature : String
+        Signature of the settings used to create ``partial``. Created using
+        ``make_signature()``.
+
+    unit_keys : List of strings, optional
+        If ``partial`` holds the totals over several work units, the keys
+        (see ``make_key()``) of the work units that were summed.
+
+    Returns
+    ---------
+
+    None.
+    """
+
+    directory = os.path.dirname(fname)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    arrays = {}
+    for key in partial:
+        if partial[key] is not None:
+            arrays[key] = np.asarray(partial[key])
+    arrays["_signature"] = np.array(signature)
+    arrays["_keys"] = np.array(sorted(partial.keys()))
+    if unit_keys is not None:
+        arrays["_units"] = np.array(sorted(unit_keys))
+
+    # ``np.savez`` appends ``.npz`` to names without the extension.
+    tmp_fname = "{0}.{1}.tmp.npz".format(fname, os.getpid())
+    np.savez(tmp_fname, **arrays)
+    os.replace(tmp_fname, fname)
+
+
+def load_partial(fname, signature):
+    """
+    Loads the partial results of a single work unit.
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the checkpoint file.
+
+    signature : String
+        Signature of the current settings. Created using ``make_signature()``.
+
+    Returns
+    ---------
+
+    partial : Dictionary or ``None``
+        The results of the work unit with the same keys as were saved.
+        Zero-dimensional arrays are returned as scalars.  ``None`` if the
+        checkpoint doesn't exist, can't be read or was created with different
+        settings.
+    """
+
+    if not os.path.exists(fname):
+        return None
+
+    try:
+        with np.load(fname) as data:
+            if str(data["_signature"]) != signature:
+                print("Checkpoint {0} was created with different settings. "
+                      "Recalculating.".format(fname))
+                return None
+
+            partial = {}
+            for key in data["_keys"]:
+                key = str(key)
+                if key not in data.files:
+                    partial[key] = None
+                elif data[key].ndim == 0:
+                    partial[key] = data[key].item()
+                else:
+                    partial[key] = data[key]
+
+    except (IOError, OSError, ValueError, KeyError):
+        print("Could not read checkpoint {0}. Recalculating.".format(fname))
+        return None
+
+    return partial
+
+
+class CheckpointedWorker(object):
+    """
+    Wraps a work unit function so that its results are saved after it runs and
+    loaded (instead of recalculated) if they already exist.  Instances are
+    picklable so they can be handed to any of the ``ParallelBackend`` backends.
+
+    Parameters
+    ----------
+
+    worker : Function
+        Called as ``worker(work_unit)`` and returns a dictionary of results.
+
+    checkpoints : Dictionary
+        Keyed by the work unit.  Values are ``(path, signature)`` tuples giving
+        the checkpoint file and settings signature of that work unit.
+
+    Any extra arguments (e.g., the data loaded by a ``CheckpointedLoader``) are
+    passed through to ``worker``.
+    """
+
+    def __init__(self, worker, checkpoints):
+        self.worker = worker
+        self.checkpoints = checkpoints
+
+    def __call__(self, work_unit, *args):
+
+        fname, signature = self.checkpoints[work_unit]
+
+        partial = load_partial(fname, signature)
+        if partial is not None:
+            return partial
+
+        partial = self.worker(work_unit, *args)
+        save_partial(fname, partial, signature)
+
+        return partial
+
+
+class CheckpointedLoader(object):
+    """
+    Wraps the loader of a work unit (see ``ParallelBackend.map()``) so that
+    the files of work units that have already been checkpointed aren't read.
+
+    Parameters
+    ----------
+
+    loader : Function
+        Called as ``loader(work_unit, pool)`` and returns the data of the work
+        unit.
+
+    checkpoints : Dictionary
+        Keyed by the work unit.  Values are ``(path, signature)`` tuples.  See
+        ``CheckpointedWorker``.
+    """
+
+    def __init__(self, loader, checkpoints):
+        self.loader = loader
+        self.checkpoints = checkpoints
+
+    def __call__(self, work_unit, pool=None):
+
+        fname, signature = self.checkpoints[work_unit]
+        if has_checkpoint(fname, signature):
+            return None
+
+        return self.loader(work_unit, pool)
+
+
+def has_checkpoint(fname, signature):
+    """
+    Checks if a checkpoint exists and was created with the current settings.
+    """
+
+    if not os.path.exists(fname):
+        return False
+
+    try:
+        with np.load(fname) as data:
+            return str(data["_signature"]) == signature
+    except (IOError, OSError, ValueError, KeyError):
+        return False
+
+
+def file_identity(fnames):
+    """
+    Describes the files read by a work unit.  If any of the files are
+    re-written, their identity changes and the work unit is recalculated.
+
+    Parameters
+    ----------
+
+    fnames : List of strings
+        Paths to the input files.
+
+    Returns
+    ---------
+
+    identity : List of lists
+        The absolute path, size (in bytes) and modification time (in
+        nanoseconds) of each file.  Files that don't exist have a size and time
+        of ``None``.
+    """
+
+    identity = []
+    for fname in fnames:
+        fname = os.path.abspath(fname)
+        try:
+            stat = os.stat(fname)
+            identity.append([fname, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            identity.append([fname, None, None])
+
+    return identity
+
+
+def make_key(*args):
+    """
+    Creates a short, filesystem-safe key from any number of signatures or
+    other JSON-serializable objects.  Used to name the checkpoint files.
+    """
+
+    hasher = hashlib.sha1()
+    for arg in args:
+        if not isinstance(arg, str):
+            arg = make_signature(arg)
+        hasher.update(arg.encode("utf-8"))
+        hasher.update(b"\0")
+
+    return hasher.hexdigest()
+
+
+def save_totals(checkpoint_dir, model_key, totals, unit_keys, signature):
+    """
+    Saves the totals of a single model summed over a number of work units.
+
+    Once saved, any older totals of the model that only cover some of these
+    work units are superseded and deleted, so the checkpoint directory doesn't
+    grow with each incremental rerun.  Totals covering other work units (e.g.,
+    saved by other tasks) are kept.
+
+    Parameters
+    ----------
+
+    checkpoint_dir : String
+        Directory the checkpoints are saved in.
+
+    model_key : String
+        Key describing the model settings.  Created using ``make_key()``.
+
+    totals : Dictionary
+        The summed results.
+
+    unit_keys : List of strings
+        The keys of the work units that were summed into ``totals``.
+
+    signature : String
+        Signature of the settings used to create ``totals``.
+
+    Returns
+    ---------
+
+    None.
+    """
+
+    fname = "{0}/totals_{1}_{2}.npz".format(checkpoint_dir, model_key,
+                                            make_key(sorted(unit_keys)))
+    if not os.path.exists(fname):
+        save_partial(fname, totals, signature, unit_keys)
+
+    saved = set(unit_keys)
+    for old_fname in glob.glob("{0}/totals_{1}_*.npz".format(checkpoint_dir,
+                                                             model_key)):
+        # Skip the new totals and files other tasks are still writing.
+        if old_fname == fname or old_fname.endswith(".tmp.npz"):
+            continue
+
+        try:
+            with np.load(old_fname) as data:
+                covered = set(str(key) for key in data["_units"])
+        except (IOError, OSError, ValueError, KeyError):
+            continue
+
+        if covered <= saved:
+            try:
+                os.remove(old_fname)
+            except OSError:
+                pass
+
+
+def load_totals(checkpoint_dir, model_key, unit_keys, signature):
+    """
+    Finds the saved totals that cover the most of the requested work units
+    without including any that were not requested.
+
+    Parameters
+    ----------
+
+    checkpoint_dir : String
+        Directory the checkpoints are saved in.
+
+    model_key : String
+        Key describing the model settings.  Created using ``make_key()``.
+
+    unit_keys : List of strings
+        The keys of the work units that we want the totals of.
+
+    signature : String
+        Signature of the current settings.
+
+    Returns
+    ---------
+
+    totals : Dictionary or ``None``
+        The best matching totals.  ``None`` if there are no usable totals.
+
+    covered : Set of strings
+        The keys of the work units that were summed into ``totals``. The
+        remaining work units still need to be processed and added.
+    """
+
+    wanted = set(unit_keys)
+
+    best_fname = None
+    best_covered = set()
+    for fname in glob.glob("{0}/totals_{1}_*.npz".format(checkpoint_dir,
+                                                         model_key)):
+        try:
+            with np.load(fname) as data:
+                covered = set(str(key) for key in data["_units"])
+        except (IOError, OSError, ValueError, KeyError):
+            continue
+
+        if covered <= wanted and len(covered) > len(best_covered):
+            best_fname = fname
+            best_covered = covered
+
+    if best_fname is None:
+        return None, set()
+
+    totals = load_partial(best_fname, signature)
+    if totals is None:
+        return None, set()
+
+    return totals, best_covered
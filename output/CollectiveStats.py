@@ -1,6 +1,6 @@
 import numpy as np
 
-from mpi4py import MPI
+from ParallelBackend import MPI
 
 def update_cum_stats(mean_pool, std_pool, N_pool, mean_local, std_local, N_local):
     '''
@@ -64,6 +64,68 @@ def update_cum_stats(mean_pool, std_pool, N_pool, mean_local, std_local, N_local
     return mean_pool, std_pool
 
 
+def sums_to_mean_std(N, sum_local, sum_sq_local):
+    '''
+    Converts the number of data points, sum and sum of squares within each bin
+    into the mean and standard deviation.
+
+    Parameters
+    ----------
+    N, sum_local, sum_sq_local : array of floats.
+        The number of data points, the sum and the sum of squares of the data
+        within each bin.
+
+    Returns
+    -------
+    mean, std : array of floats.  Shape is identical to the input.
+        The mean and standard deviation within each bin.  Bins without any
+        data points have a mean and standard deviation of 0.
+
+    Units
+    -----
+    All units are kept the same as the input units.
+    '''
+
+    N = np.asarray(N, dtype=np.float64)
+    mean = np.zeros_like(N)
+    var = np.zeros_like(N)
+
+    w = np.where(N > 0)
+    mean[w] = sum_local[w] / N[w]
+    var[w] = sum_sq_local[w] / N[w] - mean[w]*mean[w]
+
+    # Round-off can push the variance of (near) identical values negative.
+    std = np.sqrt(np.clip(var, 0.0, None))
+
+    return mean, std
+
+
+def merge_partials(partial_pool, partial_local):
+    '''
+    Adds the statistics accumulated for a single work unit (e.g., one galaxy
+    file) to the running totals.  Every statistic must be additive, e.g.,
+    counts, sums or sums of squares.
+
+    Parameters
+    ----------
+    partial_pool : dictionary of arrays.
+        The running totals.  Updated in place.
+    partial_local : dictionary of arrays.  Keys and shapes are identical to
+                    ``partial_pool``.
+        The statistics being added.
+
+    Returns
+    -------
+    partial_pool : dictionary of arrays.
+        The updated running totals.
+    '''
+
+    for key in partial_local:
+        partial_pool[key] += partial_local[key]
+
+    return partial_pool
+
+
 def collect_hist_across_tasks(rank, comm, hists):
 
     master_hists = []
@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+"""
+This file contains a slab decomposed, distributed version of the power
+spectrum calculations in ``ReionData.calc_ps()`` and
+``AllVars.calc_cross_corr()``.
+
+Rather than a single task reading the full ``GridSize^3`` grids and FFTing
+them, each task reads a contiguous slab of ``GridSize / size`` planes straight
+from the binary grid on disk.  The 3D FFT is performed as a 2D FFT of each
+local plane, a global transpose (``comm.Alltoall()``) so that each task holds
+full columns along the remaining axis, then a 1D FFT along that axis.  The
+modes are binned locally and the binned sums are added across tasks.  Hence no
+task ever holds more than ``3 / size`` of a complex grid.
+
+The grids are stored in Fortran order (see
+``ReadScripts.read_binary_grid()``), so a slab along the last axis is a
+contiguous block of the file.  The slabs are handled with the axes reversed
+(i.e., ``grid.T``) which leaves the binned power spectra unchanged.
+
+The functions here must be called by every task of ``comm``.  The number of
+cells along a side must be divisible by the number of tasks.
+
+To validate the distributed spectra against the serial ones on random test
+fields:
+
+.. code::
+
+    $ mpirun -n 4 python DistributedFFT.py
+
+Passing ``<XHII_path> <XHII_precision> <density_path> <density_precision>
+<GridSize> <BoxSize>`` uses those grids instead.
+"""
+
+from __future__ import print_function
+
+import sys
+import numpy as np
+import scipy.fft as sfft
+
+import AllVars as av
+import ReadScripts as rs
+from ParallelBackend import MPI
+
+
+def slab_extent(GridSize, rank, size):
+    """
+    Determines the planes of the grid held by a task.
+
+    Parameters
+    ----------
+
+    GridSize : Integer
+        Number of cells along one side of the grid.
+
+    rank, size : Integers
+        The rank of this task and the total number of tasks.
+
+    Returns
+    ---------
+
+    first, count : Integers
+        The index of the first plane and number of planes held by this task.
+    """
+
+    if GridSize % size != 0:
+        raise ValueError("The distributed FFT requires the grid size to be "
+                         "divisible by the number of tasks. The grid size is "
+                         "{0} and there are {1} tasks.".format(GridSize, size))
+
+    count = GridSize // size
+
+    return rank*count, count
+
+
+def read_grid_slab(filepath, GridSize, precision, first, count, dtype=None):
+    """
+    Reads a slab of planes of a binary grid.
+
+    Parameters
+    ----------
+
+    filepath, GridSize, precision : See ``ReadScripts.read_binary_grid()``.
+
+    first, count : Integers
+        The index of the first plane and number of planes to read.
+
+    dtype : ``numpy`` data type, optional
+        If specified, the slab is converted to this type.
+
+    Returns
+    ---------
+
+    slab : 3D ``np.ndarray``
+        Planes ``first, ..., first+count-1`` of the grid, with shape
+        ``(count, GridSize, GridSize)``.  Equal to
+        ``grid[:, :, first:first+count].T`` of the full grid.
+    """
+
+    # The planes are contiguous, so only they are read from disk (or
+    # decompressed for compressed grids).
+    grid = rs.memmap_binary_grid(filepath, GridSize, precision)
+
+    plane_cells = GridSize*GridSize
+    slab = np.array(grid[first*plane_cells:(first+count)*plane_cells])
+    del grid
+
+    if dtype is not None:
+        slab = slab.astype(dtype, copy=False)
+
+    return slab.reshape(count, GridSize, GridSize)
+
+
+def read_field_slab(source, GridSize, comm, dtype=None, overdensity=False):
+    """
+    Reads the slab of a grid held by this task.
+
+    Parameters
+    ----------
+
+    source : ``(path, precision)`` tuple or 3D ``np.ndarray``
+        The binary grid on disk, or the full grid (which is then sliced).
+
+    GridSize : Integer
+        Number of cells along one side of the grid.
+
+    comm : Class ``mpi4py.MPI.Intracomm`` or ``ParallelBackend.SerialComm``
+        Communicator the grid is distributed over.
+
+    dtype : ``numpy`` data type, optional
+        If specified, the slab is converted to this type.
+
+    overdensity : Boolean, optional
+        If ``True``, the slab is normalized by the mean of the full grid and
+        returned as an overdensity, ``grid / <grid> - 1``.
+
+    Returns
+    ---------
+
+    slab : 3D ``np.ndarray``
+        See ``read_grid_slab()``.
+    """
+
+    first, count = slab_extent(GridSize, comm.Get_rank(), comm.Get_size())
+
+    if isinstance(source, tuple):
+        path, precision = source
+        slab = read_grid_slab(path, GridSize, precision, first, count, dtype)
+    else:
+        slab = np.ascontiguousarray(source[:, :, first:first+count].T,
+                                    dtype=dtype)
+
+    if overdensity:
+        local_sum = np.array([np.sum(slab, dtype=np.float64)])
+        total_sum = np.zeros(1)
+        comm.Allreduce([local_sum, MPI.DOUBLE], [total_sum, MPI.DOUBLE],
+                       op=MPI.SUM)
+
+        mean = total_sum[0] / float(GridSize)**3
+        slab = slab / slab.dtype.type(mean)
+        slab -= 1.0
+
+    return slab
+
+
+def distributed_ifftn(slab, comm):
+    """
+    Inverse FFT of a grid that is distributed in slabs across the tasks.
+
+    Parameters
+    ----------
+
+    slab : 3D ``np.ndarray``
+        The ``(count, GridSize, GridSize)`` slab held by this task.  Single
+        precision slabs are transformed in single precision.
+
+    comm : Class ``mpi4py.MPI.Intracomm`` or ``ParallelBackend.SerialComm``
+        Communicator the grid is distributed over.
+
+    Returns
+    ---------
+
+    modes : 3D ``np.ndarray`` of complex
+        The ``(count, GridSize, GridSize)`` slab of the modes held by this task
+        (with the same normalization as ``numpy.fft.ifftn()``).  The first axis
+        is the second axis of the full grid of modes, i.e., this is
+        ``modes.transpose(1, 0, 2)[first:first+count]`` where ``first, count``
+        are given by ``slab_extent()``.
+    """
+
+    size = comm.Get_size()
+    count, GridSize = slab.shape[0], slab.shape[1]
+
+    modes = sfft.ifft2(slab, axes=(1, 2))
+
+    # Split the second axis into a block for each task and send each block
+    # on.  Afterwards we hold every plane of our block of the second axis.
+    send = np.ascontiguousarray(modes.reshape(count, size, count, GridSize)
+                                .transpose(1, 0, 2, 3))
+    del modes
+    recv = np.empty_like(send)
+    comm.Alltoall(send, recv)
+    del send
+
+    modes = sfft.ifft(recv.reshape(GridSize, count, GridSize), axis=0,
+                      overwrite_x=True)
+
+    return modes.transpose(1, 0, 2)
+
+
+def distributed_pspec_sums(modes, GridSize, comm, modes2=None):
+    """
+    Bins the power of the distributed modes and adds the sums across tasks.
+
+    Parameters
+    ----------
+
+    modes : 3D ``np.ndarray`` of complex
+        The slab of modes held by this task, from ``distributed_ifftn()``.
+
+    GridSize : Integer
+        Number of cells along one side of the grid.
+
+    comm : Class ``mpi4py.MPI.Intracomm`` or ``ParallelBackend.SerialComm``
+        Communicator the grid is distributed over.
+
+    modes2 : 3D ``np.ndarray`` of complex, optional
+        If specified, the cross power with these modes is binned instead.
+
+    Returns
+    ---------
+
+    v0, v1, v2 : 1D ``np.ndarray`` of floats
+        The binned sums over the full grid.  See
+        ``AllVars.powerspec_slab_sums()``.
+    """
+
+    first, count = slab_extent(GridSize, comm.Get_rank(), comm.Get_size())
+
+    local_sums = np.array(av.powerspec_slab_sums(modes, GridSize, first,
+                                                 modes2))
+    sums = np.zeros_like(local_sums)
+    comm.Allreduce([local_sums, MPI.DOUBLE], [sums, MPI.DOUBLE], op=MPI.SUM)
+
+    return sums[0], sums[1], sums[2]
+
+
+def calc_ps_distributed(XHII_source, density_source, GridSize, boxsize, comm,
+                        single_precision=False):
+    """
+    Distributed version of ``ReionData.calc_ps()``.
+
+    Parameters
+    ----------
+
+    XHII_source, density_source : ``(path, precision)`` tuples or 3D
+                                  ``np.ndarray``
+        The ionization and density (rho/<rho>) grids.  See
+        ``read_field_slab()``.
+
+    GridSize : Integer
+        Number of cells along one side of the grids.
+
+    boxsize : Float
+        The simulation box size (units are Mpc/h).
+
+    comm : Class ``mpi4py.MPI.Intracomm`` or ``ParallelBackend.SerialComm``
+        Communicator the grids are distributed over.
+
+    single_precision : Boolean, optional
+        If ``True``, the slabs are read and transformed in single precision.
+
+    Returns
+    ---------
+
+    The same as ``ReionData.calc_ps()``, on every task.
+    """
+
+    if single_precision:
+        dtype = np.float32
+    else:
+        dtype = np.float64
+
+    XHII = read_field_slab(XHII_source, GridSize, comm, dtype)
+    density = read_field_slab(density_source, GridSize, comm, dtype)
+
+    Tb = np.subtract(dtype(1.0), XHII)
+    Tb *= density
+    del density
+
+    modes = distributed_ifftn(Tb, comm)
+    del Tb
+    kmid_bins, powerspec, p_err = \
+        av.powerspec_from_sums(*distributed_pspec_sums(modes, GridSize, comm),
+                               ngrid=GridSize, boxsize=boxsize)
+    del modes
+
+    modes = distributed_ifftn(XHII, comm)
+    kmid_bins_XHII, pspec_XHII, p_err_XHII = \
+        av.powerspec_from_sums(*distributed_pspec_sums(modes, GridSize, comm),
+                               ngrid=GridSize, boxsize=boxsize)
+
+    return (kmid_bins, powerspec, p_err,
+            kmid_bins_XHII, pspec_XHII, p_err_XHII)
+
+
+def calc_cross_corr_distributed(source1, source2, GridSize, boxsize, comm,
+                                overdensity=False, single_precision=False):
+    """
+    Distributed version of ``AllVars.calc_cross_corr()``.
+
+    Parameters
+    ----------
+
+    source1, source2 : ``(path, precision)`` tuples or 3D ``np.ndarray``
+        The two grids.  See ``read_field_slab()``.
+
+    GridSize : Integer
+        Number of cells along one side of the grids.
+
+    boxsize : Float
+        The simulation box size (units are Mpc/h).
+
+    comm : Class ``mpi4py.MPI.Intracomm`` or ``ParallelBackend.SerialComm``
+        Communicator the grids are distributed over.
+
+    overdensity : Boolean, optional
+        If ``True``, both grids are first converted to overdensities,
+        ``grid / <grid> - 1``.
+
+    single_precision : Boolean, optional
+        If ``True``, the slabs are read and transformed in single precision.
+
+    Returns
+    ---------
+
+    The same as ``AllVars.calc_cross_corr()``, on every task.
+    """
+
+    if single_precision:
+        dtype = np.float32
+    else:
+        dtype = np.float64
+
+    modes1 = distributed_ifftn(read_field_slab(source1, GridSize, comm, dtype,
+                                               overdensity), comm)
+    modes2 = distributed_ifftn(read_field_slab(source2, GridSize, comm, dtype,
+                                               overdensity), comm)
+
+    kmid_bins, pspec1, p_err = \
+        av.powerspec_from_sums(*distributed_pspec_sums(modes1, GridSize, comm),
+                               ngrid=GridSize, boxsize=boxsize)
+
+    kmid_bins, pspec2, p_err = \
+        av.powerspec_from_sums(*distributed_pspec_sums(modes2, GridSize, comm),
+                               ngrid=GridSize, boxsize=boxsize)
+
+    kmid_bins, cross_pspec, p_err = \
+        av.powerspec_from_sums(*distributed_pspec_sums(modes1, GridSize, comm,
+                                                       modes2),
+                               ngrid=GridSize, boxsize=boxsize)
+
+    return kmid_bins, cross_pspec, pspec1, pspec2
+
+
+def _max_rel_diff(serial, distributed):
+    return np.nanmax(np.abs((distributed - serial) / serial))
+
+
+if __name__ == "__main__":
+
+    import tempfile
+    import shutil
+
+    import ParallelBackend as pb
+    import ReionData as rd
+    import ps_precision
+
+    if pb.HAVE_MPI:
+        comm = pb.MPI.COMM_WORLD
+    else:
+        comm = pb.SerialComm()
+    rank = comm.Get_rank()
+
+    tmp_dir = None
+    if len(sys.argv) == 7:
+        XHII_source = (sys.argv[1], int(sys.argv[2]))
+        density_source = (sys.argv[3], int(sys.argv[4]))
+        GridSize = int(sys.argv[5])
+        boxsize = float(sys.argv[6])
+    elif len(sys.argv) == 1:
+        GridSize = 64
+        boxsize = 100.0
+
+        # Write the test fields to disk so the slabs are read by offset just
+        # as they are for real grids.
+        if rank == 0:
+            tmp_dir = tempfile.mkdtemp()
+            XHII, density = ps_precision.make_test_fields(GridSize)
+            XHII.ravel(order="F").tofile("{0}/XHII".format(tmp_dir))
+            density.ravel(order="F").tofile("{0}/density".format(tmp_dir))
+        tmp_dir = comm.bcast(tmp_dir, root=0)
+
+        XHII_source = ("{0}/XHII".format(tmp_dir), 2)
+        density_source = ("{0}/density".format(tmp_dir), 2)
+    else:
+        if rank == 0:
+            print(__doc__)
+        sys.exit(1)
+
+    ps = calc_ps_distributed(XHII_source, density_source, GridSize, boxsize,
+                             comm)
+    cross = calc_cross_corr_distributed(XHII_source, density_source, GridSize,
+                                        boxsize, comm, overdensity=True)
+
+    if rank == 0:
+        XHII = rs.read_binary_grid(XHII_source[0], GridSize, XHII_source[1])
+        density = rs.read_binary_grid(density_source[0], GridSize,
+                                      density_source[1])
+
+        serial_ps = rd.calc_ps(XHII, density, boxsize)
+        serial_cross = av.calc_cross_corr(XHII/np.mean(XHII) - 1.0,
+                                          density/np.mean(density) - 1.0,
+                                          boxsize)
+
+        print("Distributed over {0} tasks.".format(comm.Get_size()))
+        print("Maximum relative difference of the 21cm power spectrum is "
+              "{0:.4e}".format(_max_rel_diff(serial_ps[1], ps[1])))
+        print("Maximum relative difference of the HII power spectrum is "
+              "{0:.4e}".format(_max_rel_diff(serial_ps[4], ps[4])))
+        print("Maximum relative difference of the cross power spectrum is "
+              "{0:.4e}".format(_max_rel_diff(serial_cross[1], cross[1])))
+
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
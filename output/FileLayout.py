@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+"""
+This file contains the naming conventions (layouts) of the files produced and
+used by the pipeline and a catalogue of the files that exist on disk.
+
+Each kind of file (e.g., the ``XHII`` grids) has a template that builds its
+path from a base name (``fbase``) and the snapshot (``snap``) and/or file
+number (``filenr``).  New kinds are added with ``register_kind()``.
+
+On a parallel filesystem, probing many files one by one is slow.  Instead,
+``LayoutCatalogue`` lists each directory once (with ``os.scandir()``),
+recording the size of every file, and answers later queries from memory.
+Code that writes files the catalogue may have already listed must drop them
+with ``forget()`` (or query with ``refresh=True``).  Readers should use the
+module level functions (``exists()``, ``file_size()``, ``listdir()`` and
+``find()``), which share a single catalogue per process.
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import time
+
+# The template of each kind of file. ``{fbase}`` is the base name, ``{snap}``
+# the snapshot and ``{filenr}`` the file number.
+KINDS = {"XHII" : "{fbase}_{snap:03d}",
+         "photHI" : "{fbase}_{snap:03d}",
+         "nion" : "{fbase}_{snap:03d}",
+         "density" : "{fbase}{snap:03d}.dens.dat",
+         "galaxies" : "{fbase}_{filenr}",
+         "subgroup_trees" : "{fbase}/subgroup_trees_{filenr:03d}.dat",
+         "lhalotree" : "{fbase}/lhalotree.bin.{filenr}"}
+
+# The kind of tree file for each simulation. See
+# ``ReadScripts.read_trees_smallarray()``.
+TREE_KINDS = {0 : "subgroup_trees",
+              1 : "subgroup_trees",
+              2 : "lhalotree",
+              3 : "lhalotree",
+              4 : "subgroup_trees"}
+
+_FIELD_PATTERN = re.compile(r"\{(snap|filenr)(?::0?(\d+)d)?\}")
+
+
+def register_kind(kind, template):
+    """
+    Adds (or replaces) the template of a kind of file.
+
+    Parameters
+    ----------
+
+    kind : String
+        Name of the kind of file.
+
+    template : String
+        The path of the file.  Can use ``{fbase}``, ``{snap}`` and
+        ``{filenr}`` (with an optional zero-padded width, e.g.,
+        ``{snap:03d}``).  ``{fbase}`` must come before the other fields.
+    """
+
+    KINDS[kind] = template
+
+
+def format_path(kind, fbase, snap=None, filenr=None):
+    """
+    Builds the path of a file.
+
+    Parameters
+    ----------
+
+    kind : String
+        The kind of file, see ``KINDS``.
+
+    fbase : String
+        The base name of the file.
+
+    snap, filenr : Integers, optional
+        The snapshot and file number, if the kind uses them.
+
+    Returns
+    ---------
+
+    path : String
+        The path of the file.
+    """
+
+    if kind not in KINDS:
+        raise ValueError("{0} is not a known kind of file.  Known kinds are "
+                         "{1}".format(kind, sorted(KINDS)))
+
+    return KINDS[kind].format(fbase=fbase, snap=snap, filenr=filenr)
+
+
+def tree_path(treedir, filenr, simulation):
+    """
+    Builds the path of a file of trees for the given simulation.  See
+    ``ReadScripts.read_trees_smallarray()`` for the simulation options.
+    """
+
+    if simulation not in TREE_KINDS:
+        raise ValueError("Invalid simulation option chosen.")
+
+    return format_path(TREE_KINDS[simulation], treedir, filenr=filenr)
+
+
+def _template_regex(kind, fbase):
+    """
+    Returns the directory the files of a kind live in and a regex matching
+    their names.  The snapshot and file number are captured as named groups.
+    """
+
+    template = KINDS[kind].replace("{fbase}", fbase)
+    directory, name_template = os.path.split(template)
+
+    pattern = ""
+    last_idx = 0
+    for match in _FIELD_PATTERN.finditer(name_template):
+        pattern += re.escape(name_template[last_idx:match.start()])
+        if match.group(2) is None:
+            pattern += r"(?P<{0}>\d+)".format(match.group(1))
+        else:
+            pattern += r"(?P<{0}>\d{{{1},}})".format(match.group(1),
+                                                     match.group(2))
+        last_idx = match.end()
+    pattern += re.escape(name_template[last_idx:])
+
+    return directory, re.compile("^{0}$".format(pattern))
+
+
+class LayoutCatalogue(object):
+    """
+    An in-memory catalogue of the files (and their sizes) in each directory.
+
+    Each directory is listed the first time a file within it is queried and
+    every later query is answered from the listing.  The listing is not
+    checked against the disk again, so files written after a directory was
+    listed are only seen once the directory has been dropped with
+    ``forget()`` or listed again with ``refresh=True``.  Directories that
+    don't exist are not recorded.
+
+    Parameters
+    ----------
+
+    max_age : Float, optional
+        If specified, listings older than this (in seconds) are listed again
+        on the next query.
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self.directories = {}
+
+    def scan(self, directory, refresh=False):
+        """
+        Returns the files in a directory, listing it if it hasn't been listed.
+
+        Parameters
+        ----------
+
+        directory : String
+            The directory.
+
+        refresh : Boolean, optional
+            If ``True``, the directory is always listed again.
+
+        Returns
+        ---------
+
+        files : Dictionary
+            Keyed by the name of each file.  Values are the size (in bytes)
+            of each file.  Empty if the directory doesn't exist.
+        """
+
+        directory = os.path.normpath(directory or ".")
+
+        cached = self.directories.get(directory)
+        if cached is not None and not refresh and \
+           (self.max_age is None or time.time() - cached["time"] < self.max_age):
+            return cached["files"]
+
+        files = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        files[entry.name] = entry.stat().st_size
+                    except OSError:
+                        pass
+        except OSError:
+            self.directories.pop(directory, None)
+            return files
+
+        self.directories[directory] = {"time" : time.time(), "files" : files}
+
+        return files
+
+    def stat(self, path):
+        """
+        Returns the size (in bytes) of a file, or ``None`` if it doesn't exist.
+        """
+
+        directory, name = os.path.split(os.path.normpath(path))
+
+        return self.scan(directory).get(name)
+
+    def exists(self, path):
+        """
+        Checks if a file exists.
+        """
+
+        directory, name = os.path.split(os.path.normpath(path))
+
+        return name in self.scan(directory)
+
+    def file_size(self, path):
+        """
+        Returns the size (in bytes) of a file.  Raises ``IOError`` if it
+        doesn't exist.
+        """
+
+        size = self.stat(path)
+        if size is None:
+            raise IOError("The file {0} does not exist.".format(path))
+
+        return size
+
+    def listdir(self, directory, refresh=False):
+        """
+        Returns the (sorted) names of the files in a directory.
+        """
+
+        return sorted(self.scan(directory, refresh))
+
+    def find(self, kind, fbase, refresh=False):
+        """
+        Finds every file of a kind with the given base name.
+
+        Parameters
+        ----------
+
+        kind : String
+            The kind of file, see ``KINDS``.
+
+        fbase : String
+            The base name of the files.
+
+        refresh : Boolean, optional
+            If ``True``, the directory is always listed again.
+
+        Returns
+        ---------
+
+        files : Dictionary
+            Keyed by the snapshot (or the file number, for kinds without a
+            snapshot, or ``(snap, filenr)`` for kinds with both).  Values are
+            the ``(path, size)`` of each file.
+        """
+
+        directory, regex = _template_regex(kind, fbase)
+
+        files = {}
+        for name, size in self.scan(directory, refresh).items():
+            match = regex.match(name)
+            if match is None:
+                continue
+
+            fields = match.groupdict()
+            if "snap" in fields and "filenr" in fields:
+                key = (int(fields["snap"]), int(fields["filenr"]))
+            elif "snap" in fields:
+                key = int(fields["snap"])
+            else:
+                key = int(fields["filenr"])
+
+            files[key] = (os.path.join(directory, name), size)
+
+        return files
+
+    def forget(self, path=None):
+        """
+        Drops the directory of ``path`` (or every directory if not specified)
+        so it is listed again on the next query.
+        """
+
+        if path is None:
+            self.directories = {}
+            return
+
+        directory = os.path.dirname(os.path.normpath(path))
+        self.directories.pop(os.path.normpath(directory or "."), None)
+
+
+# The catalogue shared by every reader in this process.
+default_catalogue = LayoutCatalogue()
+
+
+def exists(path):
+    """
+    Checks if a file exists using the shared catalogue.
+    """
+
+    return default_catalogue.exists(path)
+
+
+def file_size(path):
+    """
+    Returns the size (in bytes) of a file using the shared catalogue.
+    """
+
+    return default_catalogue.file_size(path)
+
+
+def listdir(directory, refresh=False):
+    """
+    Returns the (sorted) names of the files in a directory using the shared
+    catalogue.
+    """
+
+    return default_catalogue.listdir(directory, refresh)
+
+
+def find(kind, fbase, refresh=False):
+    """
+    Finds every file of a kind using the shared catalogue.  See
+    ``LayoutCatalogue.find()``.
+    """
+
+    return default_catalogue.find(kind, fbase, refresh)
+
+
+def forget(path=None):
+    """
+    Drops the directory of a file (or everything) from the shared catalogue.
+    """
+
+    default_catalogue.forget(path)
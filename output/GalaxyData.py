@@ -15,6 +15,8 @@ from __future__ import print_function
 
 import numpy as np
 import os
+import functools
+import itertools
 
 from astropy import units as u
 from astropy import cosmology
@@ -25,6 +27,10 @@ import ReadScripts as rs
 import PlotScripts as ps
 import CollectiveStats as collective
 import GalaxyPlots as galplot
+import ParallelBackend as pb
+import Checkpoints as ckpt
+import Prefetch as prefetch
+import RunParams as runparams
 
 
 def calculate_dustcorrected_MUV(MUV, halomass, dustmass, cosmology, dust_to_gas_ratio,
@@ -218,7 +224,8 @@ def do_2D_binning(data_x, data_y, mean_curr, std_curr, N_curr, bins):
 
 
 def plot_galaxy_properties(rank, size, comm, ini_files, model_tags, 
-                           galaxy_plots, output_dir, output_format):
+                           galaxy_plots, output_dir, output_format,
+                           backend=None):
     """    
     Wrapper function to handle reading in of data + calculating galaxy
     properties, then calling the specified plotting routines.
@@ -232,8 +239,8 @@ def plot_galaxy_properties(rank, size, comm, ini_files, model_tags,
     size : Integer
         The total number of processors executing the pipeline.
 
-    comm : Class ``mpi4py.MPI.Intracomm``
-        The ``mpi4py`` communicator.
+    comm : Class ``mpi4py.MPI.Intracomm`` or ``ParallelBackend.SerialComm``
+        The communicator between the tasks.
 
     ini_files : List of strings 
         ``.ini`` file corresponding to each model that we're plotting.
@@ -252,6 +259,10 @@ def plot_galaxy_properties(rank, size, comm, ini_files, model_tags,
     output_format : String
         The format of the saved figures.
 
+    backend : ``ParallelBackend`` backend, optional
+        The backend that the galaxy files are distributed with.  If not
+        specified, the files are distributed across the tasks of ``comm``.
+
     Returns
     ---------
 
@@ -266,7 +277,8 @@ def plot_galaxy_properties(rank, size, comm, ini_files, model_tags,
             print("Made output directory {0}".format(output_dir))
 
     # First calculate all the properties and statistics we need.
-    galaxy_data = generate_data(rank, size, comm, ini_files, galaxy_plots)
+    galaxy_data = generate_data(rank, size, comm, ini_files, galaxy_plots,
+                                backend=backend)
 
     # Then find what plots we need and plot em!
     if galaxy_plots["nion"]:
@@ -423,7 +435,307 @@ def plot_galaxy_properties(rank, size, comm, ini_files, model_tags,
                                       plot_models_at_snaps=galaxy_plots["plot_models_at_snaps"])
 
 
-def generate_data(rank, size, comm, ini_files, galaxy_plots):
+def init_galaxy_partial(num_snaps, mstar_Nbins, MUV_Nbins):
+    """    
+    Creates the (zeroed) statistics that are accumulated for each galaxy file.
+    Binned statistics are stored as the number of data points, the sum and the
+    sum of squares within each bin (in that order along the first axis).  These
+    are simply added when combining files, the mean and standard deviation are
+    only formed once all files have been processed.
+
+    Parameters
+    ----------
+
+    num_snaps : Integer
+        Number of snapshots the statistics are calculated for.
+
+    mstar_Nbins, MUV_Nbins : Integers
+        Number of stellar mass and UV magnitude bins.
+
+    Returns
+    ---------
+
+    partial : Dictionary
+        Keyed by the name of the statistic.  Values are zeroed numpy arrays.
+    """
+
+    partial = {"sum_nion" : np.zeros(num_snaps),
+               "SMF" : np.zeros((num_snaps, mstar_Nbins)),
+               "UVLF" : np.zeros((num_snaps, MUV_Nbins)),
+               "dustcorrected_UVLF" : np.zeros((num_snaps, MUV_Nbins)),
+               "mstar_fesc" : np.zeros((3, num_snaps, mstar_Nbins)),
+               "mstar_fej" : np.zeros((3, num_snaps, mstar_Nbins)),
+               "mstar_SFR" : np.zeros((3, num_snaps, mstar_Nbins)),
+               "MUV_A1600" : np.zeros((3, num_snaps, MUV_Nbins)),
+               "MUV_dustmass" : np.zeros((3, num_snaps, MUV_Nbins))}
+
+    return partial
+
+
+def calc_binned_sums(data_x, data_y, bins):
+    """    
+    Bins y-data on the x-data and returns the number of data points, the sum
+    and the sum of squares of the y-data within each bin.
+
+    Parameters
+    ----------
+
+    data_x, data_y : Numpy-arrays of floats 
+        Data that we are binning.
+
+    bins : Numpy-array of floats
+        The bins we are binning the y-data on.  Defined in units/properties of
+        the x-data.
+
+    Returns
+    ---------
+
+    sums : 2D numpy-array of floats. Shape is (3, number of bins).
+        The number of data points, the sum and the sum of squares of the
+        y-data in each bin.
+    """
+
+    data_y = np.asarray(data_y, dtype=np.float64)
+
+    N, _ = np.histogram(data_x, bins=bins)
+    sum_y, _ = np.histogram(data_x, bins=bins, weights=data_y)
+    sum_y2, _ = np.histogram(data_x, bins=bins, weights=data_y*data_y)
+
+    return np.array([N, sum_y, sum_y2])
+
+
+def accumulate_galaxy_stats(G, partial, model_params, galaxy_plots):
+    """    
+    Adds the contribution of a set of galaxies to the accumulated statistics.
+
+    Parameters
+    ----------
+
+    G : Numpy structured array with dtype given by ``ReadScripts.ReadGals_SAGE``
+        The galaxies being added.
+
+    partial : Dictionary
+        The statistics being accumulated, created by
+        ``init_galaxy_partial()``.  Updated in place.
+
+    model_params : Dictionary
+        Parameters of the model these galaxies belong to. Created in
+        ``generate_data()``.
+
+    galaxy_plots : Dictionary
+        Controls which of the plots we will make.  If we're not plotting a
+        property we don't need to calculate stuff for it! 
+
+    Returns
+    ---------
+
+    None. ``partial`` is updated in place.
+    """
+
+    hubble_h = model_params["hubble_h"]
+    mstar_bins = model_params["mstar_bins"]
+    MUV_bins = model_params["MUV_bins"]
+
+    # For each snapshot, calculate properties for galaxies that exist.
+    for snapnum in range(model_params["num_snaps"]):
+
+        Gals_exist = np.where((G.GridHistory[:, snapnum] != -1) &
+                              (G.GridStellarMass[:, snapnum] > 0.0) &
+                              (G.LenHistory[:, snapnum] > model_params["halopartcut"]))[0]
+        if len(Gals_exist) == 0:
+            continue
+
+        partial["sum_nion"][snapnum] += np.sum(G.GridNgamma_HI[Gals_exist, snapnum] * \
+                                               G.Gridfesc[Gals_exist, snapnum])
+
+        log_mass = np.log10(G.GridStellarMass[Gals_exist, snapnum] * 1.0e10 / hubble_h)
+        fesc = G.Gridfesc[Gals_exist, snapnum]
+        fej = G.EjectedFraction[Gals_exist, snapnum]
+        SFR = G.GridSFR[Gals_exist, snapnum]
+        MUV = G.GridMUV[Gals_exist, snapnum]
+        halomass = G.GridHaloMass[Gals_exist, snapnum] * 1.0e10 / hubble_h
+        dustmass = (G.GridDustColdGas[Gals_exist, snapnum] +
+                    G.GridDustColdGas[Gals_exist, snapnum]) * 1.0e10 / hubble_h
+
+        # Calculate the mean fesc as a function of stellar mass.
+        if galaxy_plots["mstar_fesc"]:
+            partial["mstar_fesc"][:, snapnum] += calc_binned_sums(log_mass, fesc,
+                                                                  mstar_bins)
+
+        # Calculate the mean ejected fraction as a function of stellar mass.
+        if galaxy_plots["mstar_fej"]:
+            partial["mstar_fej"][:, snapnum] += calc_binned_sums(log_mass, fej,
+                                                                 mstar_bins)
+
+        if galaxy_plots["mstar_SFR"]:
+            partial["mstar_SFR"][:, snapnum] += calc_binned_sums(log_mass, SFR,
+                                                                 mstar_bins)
+
+        SMF_thissnap = np.histogram(log_mass, bins=mstar_bins)
+        partial["SMF"][snapnum] += SMF_thissnap[0]
+
+        if galaxy_plots["UVLF"]:
+            # For the UV Magnitude, galaxies without any UV Luminosity have
+            # their UV Mag set to 999.0.  Filter these out...
+            w_MUV = np.where(MUV < 100.0)[0]
+
+            my_MUV = MUV[w_MUV]
+
+            dustcorrected_MUV = calculate_dustcorrected_MUV(my_MUV, halomass[w_MUV],
+                                                            dustmass[w_MUV],
+                                                            model_params["cosmology"],
+                                                            model_params["dust_to_gas_ratio"],
+                                                            model_params["radius_dust_grains"],
+                                                            model_params["density_dust_grains"],
+                                                            model_params["z_array_full"][snapnum])
+
+            UVLF_thissnap = np.histogram(my_MUV, bins=MUV_bins)
+            partial["UVLF"][snapnum] += UVLF_thissnap[0]
+
+            dustcorrected_UVLF_thissnap = np.histogram(dustcorrected_MUV, bins=MUV_bins)
+            partial["dustcorrected_UVLF"][snapnum] += dustcorrected_UVLF_thissnap[0]
+
+            # To determine the amount of dust extinction (in dex) of each galaxy,
+            # we'll just cheatingly do "dustcorrected_MUV - intrinsic_MUV".
+            A1600 = dustcorrected_MUV - my_MUV
+
+            partial["MUV_A1600"][:, snapnum] += calc_binned_sums(my_MUV, A1600,
+                                                                 MUV_bins)
+
+            # When determining the dustmass, only use those galaxies that have a
+            # valid MUV.
+            my_dustmass = dustmass[w_MUV]
+
+            partial["MUV_dustmass"][:, snapnum] += calc_binned_sums(my_MUV, my_dustmass,
+                                                                    MUV_bins)
+
+
+def process_galaxy_file(work_unit, model_params_allmodels, galaxy_plots):
+    """    
+    Calculates the statistics for a single galaxy file of a single model.  This
+    is the function that is mapped over the work units by the parallel backend.
+
+    Parameters
+    ----------
+
+    work_unit : Tuple of integers
+        The ``(model_number, file_number)`` that we're processing.
+
+    model_params_allmodels : List of dictionaries. Length is number of models.
+        The parameters for each model. Created in ``generate_data()``.
+
+    galaxy_plots : Dictionary
+        Controls which of the plots we will make.  If we're not plotting a
+        property we don't need to calculate stuff for it! 
+
+    Returns
+    ---------
+
+    partial : Dictionary
+        The statistics for this file.  See ``init_galaxy_partial()``.
+    """
+
+    model_number, fnr = work_unit
+    model_params = model_params_allmodels[model_number]
+
+    print("Model {0} File {1}".format(model_number, fnr))
+
+    partial = init_galaxy_partial(model_params["num_snaps"],
+                                  len(model_params["mstar_bins"]) - 1,
+                                  len(model_params["MUV_bins"]) - 1)
+
+    # Stream both the galaxies and the merged ones through in batches so we
+    # never hold the entire file in memory.  The next batches are read on a
+    # background thread while the current one is processed.
+    pool = prefetch.BufferPool(galaxy_plots["prefetch_bytes"])
+    batches = itertools.chain.from_iterable(
+                rs.ReadGals_SAGE_chunked(name, fnr, model_params["num_snaps"],
+                                         max_bytes=galaxy_plots["batch_bytes"],
+                                         pool=pool)
+                for name in [model_params["galaxy_name"],
+                             model_params["merged_name"]])
+
+    for G in prefetch.Prefetcher(batches, galaxy_plots["prefetch_depth"], pool):
+        accumulate_galaxy_stats(G, partial, model_params, galaxy_plots)
+
+    return partial
+
+
+def galaxy_checkpoints(checkpoint_dir, work_units, model_params_allmodels,
+                       galaxy_plots):
+    """    
+    Determines the checkpoint file and settings signature for each galaxy
+    file.  Checkpoints are named by the identity of their inputs so they can be
+    re-used regardless of the order (or number) of models being plotted.
+
+    Parameters
+    ----------
+
+    checkpoint_dir : String
+        Directory the checkpoints are saved in.
+
+    work_units : List of tuples
+        The ``(model_number, file_number)`` of each galaxy file.
+
+    model_params_allmodels : List of dictionaries. Length is number of models.
+        The parameters for each model. Created in ``generate_data()``.
+
+    galaxy_plots : Dictionary
+        Controls which of the plots we will make.  
+
+    Returns
+    ---------
+
+    checkpoints : Dictionary
+        Keyed by work unit. Values are ``(path, signature)`` tuples.  See
+        ``Checkpoints.CheckpointedWorker``.
+
+    unit_keys : Dictionary
+        Keyed by work unit. Values are the key identifying the inputs of each
+        work unit.
+
+    model_keys, model_signatures : Lists of strings. Length is number of models.
+        The key and signature identifying the settings of each model.  The
+        totals of each model are saved under this key.
+    """
+
+    # Only the statistics we calculate affect the results of a file.
+    stat_toggles = dict((key, galaxy_plots[key]) for key in
+                        ["mstar_fesc", "mstar_fej", "mstar_SFR", "UVLF"])
+
+    model_keys = []
+    model_signatures = []
+    for model_params in model_params_allmodels:
+        settings = dict((key, model_params[key]) for key in model_params
+                        if key != "cosmology")
+        cosmology = model_params["cosmology"]
+        settings["cosmology"] = [cosmology.H0.value, cosmology.Om0,
+                                 cosmology.Ob0]
+        settings["stat_toggles"] = stat_toggles
+        model_signatures.append(ckpt.make_signature(settings))
+        model_keys.append(ckpt.make_key(model_signatures[-1]))
+
+    checkpoints = {}
+    unit_keys = {}
+    for model_number, fnr in work_units:
+        model_params = model_params_allmodels[model_number]
+
+        # The galaxies and merged galaxies that ``process_galaxy_file()`` reads.
+        identity = ckpt.file_identity(["{0}_{1}".format(model_params["galaxy_name"], fnr),
+                                       "{0}_{1}".format(model_params["merged_name"], fnr)])
+        signature = ckpt.make_signature([model_signatures[model_number],
+                                         fnr, identity])
+
+        unit_key = ckpt.make_key(signature)
+        unit_keys[(model_number, fnr)] = unit_key
+
+        fname = "{0}/galaxy/{1}.npz".format(checkpoint_dir, unit_key)
+        checkpoints[(model_number, fnr)] = (fname, signature)
+
+    return checkpoints, unit_keys, model_keys, model_signatures
+
+
+def generate_data(rank, size, comm, ini_files, galaxy_plots, backend=None):
     """    
     Reads in the galaxy data for calculate all the require properties for each
     models.
@@ -437,8 +749,8 @@ def generate_data(rank, size, comm, ini_files, galaxy_plots):
     size : Integer
         The total number of processors executing the pipeline.
 
-    comm : Class ``mpi4py.MPI.Intracomm``
-        The ``mpi4py`` communicator.
+    comm : Class ``mpi4py.MPI.Intracomm`` or ``ParallelBackend.SerialComm``
+        The communicator between the tasks.
 
     ini_files : List of strings 
         ``.ini`` file corresponding to each model that we're plotting.
@@ -447,6 +759,18 @@ def generate_data(rank, size, comm, ini_files, galaxy_plots):
         Controls which of the plots we will make.  Keys are the name of each
         plot (e.g., ``SMF``) and the value specifies if we are plotting it. If
         we're not plotting a property we don't need to calculate stuff for it! 
+        If ``galaxy_plots["checkpoint_dir"]`` is not ``None``, the statistics
+        of each file (and the totals of each model) are saved to (and re-used
+        from) this directory.  ``galaxy_plots["batch_bytes"]`` is the memory
+        budget (in bytes) of each batch of galaxies read from a file; if
+        ``None``, each file is read in one go.  Up to
+        ``galaxy_plots["prefetch_depth"]`` batches (holding at most
+        ``galaxy_plots["prefetch_bytes"]`` bytes) are read ahead of the batch
+        being processed.
+
+    backend : ``ParallelBackend`` backend, optional
+        The backend that the galaxy files are distributed with.  If not
+        specified, the files are distributed across the tasks of ``comm``.
 
     Returns
     ---------
@@ -455,6 +779,9 @@ def generate_data(rank, size, comm, ini_files, galaxy_plots):
         All of the calculated properties required to create the plots.
     """
 
+    if backend is None:
+        backend = pb.backend_from_comm(comm)
+
     # Binning parameters for stellar mass. 
     mstar_bin_low = 5.0
     mstar_bin_high = 12.0
@@ -488,70 +815,34 @@ def generate_data(rank, size, comm, ini_files, galaxy_plots):
     cosmology_allmodels = []
     t_bigbang_allmodels = []
 
-    # These are the arrays for the number of ionizing photons at each snapshot.
-    # Note: This is the ESCAPING ionizing photons. 
-    sum_nion_allmodels = []
-
-    # Escape fraction as a function of stellar mass (Mstar). 
-    mean_mstar_fesc_allmodels = []
-    std_mstar_fesc_allmodels = []
-    N_mstar_fesc_allmodels = []
-
-    # Stellar mass function.
-    SMF_allmodels = []
-
-    # Ejected fraction as a function of stellar mass (Mstar). 
-    mean_mstar_fej_allmodels = []
-    std_mstar_fej_allmodels = []
-    N_mstar_fej_allmodels = []
-
-    # Star formation rate as a function of stellar mass (Mstar). 
-    mean_mstar_SFR_allmodels = []
-    std_mstar_SFR_allmodels = []
-    N_mstar_SFR_allmodels = []
+    # The parameters each work unit needs to process a file of the model.
+    model_params_allmodels = []
+    model_volume_allmodels = []
 
-    # UV Magnitude Luminosity Function. 
-    UVLF_allmodels = []
-    dustcorrected_UVLF_allmodels = []
+    # Every (model, file) combination that we need to process.
+    work_units = []
 
-    # Dust extinction (in dex) as a function of absolute UV magnitude.
-    mean_MUV_A1600_allmodels = []
-    std_MUV_A1600_allmodels = []    
-    N_MUV_A1600_allmodels = []    
-
-    # Dust mass as a function of absolute UV magnitude.
-    mean_MUV_dustmass_allmodels = []
-    std_MUV_dustmass_allmodels = []    
-    N_MUV_dustmass_allmodels = []    
-
-    # All outer arrays set up, time to read in the data!
     for model_number, ini_file in enumerate(ini_files):
 
         # Read in the parameters and set some initial variables.
-        SAGE_params = rs.read_SAGE_ini(ini_file)
+        SAGE_params = runparams.load_SAGE_params(ini_file)
 
-        cosmology, t_bigbang = set_cosmology(float(SAGE_params["Hubble_h"]),
-                                             float(SAGE_params["Omega"]),
-                                             float(SAGE_params["BaryonFrac"]))
+        cosmology, t_bigbang = set_cosmology(SAGE_params.Hubble_h,
+                                             SAGE_params.Omega,
+                                             SAGE_params.BaryonFrac)
 
         cosmology_allmodels.append(cosmology)
         t_bigbang_allmodels.append(t_bigbang)
 
-        first_snap = int(SAGE_params["LowSnap"])
-        last_snap = int(SAGE_params["LastSnapShotNr"])
-        GridSize = int(SAGE_params["GridSize"])
-        model_hubble_h = float(SAGE_params["Hubble_h"])
-        model_halopartcut = int(SAGE_params["HaloPartCut"])
-        model_dust_to_gas_ratio = galaxy_plots["dust_to_gas_ratio"][model_number]
-        model_radius_dust_grains = galaxy_plots["radius_dust_grains"][model_number]
-        model_density_dust_grains = galaxy_plots["density_dust_grains"][model_number]
+        first_snap = SAGE_params.LowSnap
+        last_snap = SAGE_params.LastSnapShotNr
 
         # Careful, volume is in Mpc^3.
-        model_volume = pow(float(SAGE_params["BoxSize"]) / \
-                           float(SAGE_params["Hubble_h"]),3)        
+        model_volume = SAGE_params.volume
+        model_volume_allmodels.append(model_volume)
 
         # Load the redshift file and calculate the lookback times. 
-        z_array_full, lookback_array_full = load_redshifts(SAGE_params["FileWithSnapList"],
+        z_array_full, lookback_array_full = load_redshifts(SAGE_params.FileWithSnapList,
                                                            cosmology, t_bigbang)
         z_array_full = np.array(z_array_full[0:last_snap+1])
 
@@ -567,235 +858,133 @@ def generate_data(rank, size, comm, ini_files, galaxy_plots):
         lookback_array_reion_allmodels.append(lookback_array_reion)
 
         # Set up names for the galaxies. 
-        galaxy_name = "{0}/{1}_z{2:.3f}".format(SAGE_params["GalaxyOutputDir"],
-                                                SAGE_params["RunPrefix"],
-                                                z_array_reion[-1]) 
-
-        merged_name = "{0}/{1}_MergedGalaxies".format(SAGE_params["GalaxyOutputDir"],
-                                                      SAGE_params["RunPrefix"])
-
-        # Initialize the ionizing photon array to 0.
-        sum_nion_allmodels.append(np.zeros(len(z_array_full),
-                                           dtype=np.float32))
-
-        # Escape fraction as a function of stellar mass.
-        mean_mstar_fesc_allmodels.append([]) 
-        std_mstar_fesc_allmodels.append([])
-        N_mstar_fesc_allmodels.append([]) 
-        for snap_count in range(len(z_array_full)):
-            mean_mstar_fesc_allmodels[model_number].append(np.zeros(mstar_Nbins,
-                                                                    dtype=np.float32))
-            std_mstar_fesc_allmodels[model_number].append(np.zeros(mstar_Nbins,
-                                                                   dtype=np.float32))
-            N_mstar_fesc_allmodels[model_number].append(np.zeros(mstar_Nbins,
-                                                                 dtype=np.float32))
-
-        # Stellar mass function. 
-        SMF_allmodels.append([])
-        for snap_count in range(len(z_array_full)):
-            SMF_allmodels[model_number].append(np.zeros(mstar_Nbins,
-                                               dtype=np.float32))
-
-        # Ejected fraction as a function of stellar mass.
-        mean_mstar_fej_allmodels.append([]) 
-        std_mstar_fej_allmodels.append([])
-        N_mstar_fej_allmodels.append([]) 
-        for snap_count in range(len(z_array_full)):
-            mean_mstar_fej_allmodels[model_number].append(np.zeros(mstar_Nbins,
-                                                                   dtype=np.float32))
-            std_mstar_fej_allmodels[model_number].append(np.zeros(mstar_Nbins,
-                                                                  dtype=np.float32))
-            N_mstar_fej_allmodels[model_number].append(np.zeros(mstar_Nbins,
-                                                                dtype=np.float32))
-
-        # Star formation rate as a function of stellar mass.
-        mean_mstar_SFR_allmodels.append([]) 
-        std_mstar_SFR_allmodels.append([])
-        N_mstar_SFR_allmodels.append([]) 
-        for snap_count in range(len(z_array_full)):
-            mean_mstar_SFR_allmodels[model_number].append(np.zeros(mstar_Nbins,
-                                                                   dtype=np.float32))
-            std_mstar_SFR_allmodels[model_number].append(np.zeros(mstar_Nbins,
-                                                                  dtype=np.float32))
-            N_mstar_SFR_allmodels[model_number].append(np.zeros(mstar_Nbins,
-                                                                dtype=np.float32))
-
-        # UV Luminosity Function. 
-        UVLF_allmodels.append([])
-        for snap_count in range(len(z_array_full)):
-            UVLF_allmodels[model_number].append(np.zeros(MUV_Nbins,
-                                                dtype=np.float32))
-
-        dustcorrected_UVLF_allmodels.append([])
-        for snap_count in range(len(z_array_full)):
-            dustcorrected_UVLF_allmodels[model_number].append(np.zeros(MUV_Nbins,
-                                                              dtype=np.float32))
-
-        mean_MUV_A1600_allmodels.append([])
-        std_MUV_A1600_allmodels.append([])
-        N_MUV_A1600_allmodels.append([])
-        for snap_count in range(len(z_array_full)):
-            mean_MUV_A1600_allmodels[model_number].append(np.zeros(MUV_Nbins, dtype=np.float32))
-            std_MUV_A1600_allmodels[model_number].append(np.zeros(MUV_Nbins, dtype=np.float32))
-            N_MUV_A1600_allmodels[model_number].append(np.zeros(MUV_Nbins, dtype=np.float32))
-
-        mean_MUV_dustmass_allmodels.append([])
-        std_MUV_dustmass_allmodels.append([])
-        N_MUV_dustmass_allmodels.append([])
-        for snap_count in range(len(z_array_full)):
-            mean_MUV_dustmass_allmodels[model_number].append(np.zeros(MUV_Nbins, dtype=np.float32))
-            std_MUV_dustmass_allmodels[model_number].append(np.zeros(MUV_Nbins, dtype=np.float32))
-            N_MUV_dustmass_allmodels[model_number].append(np.zeros(MUV_Nbins, dtype=np.float32))
+        galaxy_name = SAGE_params.galaxy_fbase(z_array_reion[-1])
+        merged_name = SAGE_params.merged_fbase
+
+        model_params = {"galaxy_name" : galaxy_name,
+                        "merged_name" : merged_name,
+                        "num_snaps" : len(z_array_full),
+                        "z_array_full" : z_array_full,
+                        "cosmology" : cosmology,
+                        "hubble_h" : SAGE_params.Hubble_h,
+                        "halopartcut" : SAGE_params.HaloPartCut,
+                        "dust_to_gas_ratio" : galaxy_plots["dust_to_gas_ratio"][model_number],
+                        "radius_dust_grains" : galaxy_plots["radius_dust_grains"][model_number],
+                        "density_dust_grains" : galaxy_plots["density_dust_grains"][model_number],
+                        "mstar_bins" : mstar_bins,
+                        "MUV_bins" : MUV_bins}
+        model_params_allmodels.append(model_params)
 
         # Check to see if we're only using a subset of the files.
         if galaxy_plots["first_file"] is not None:
             first_file = galaxy_plots["first_file"]
         else:
-            first_file = int(SAGE_params["FirstFile"])
+            first_file = SAGE_params.FirstFile
 
         if galaxy_plots["last_file"] is not None:
             last_file = galaxy_plots["last_file"]
         else:
-            last_file = int(SAGE_params["LastFile"])
-
-        # ========================================================= #
-        # Now go through each file and calculate the stuff we need. #
-        # ========================================================= #
-        # Parallelize over number of files.
-        for fnr in range(first_file + rank, last_file + 1, size):
-
-            print("Rank {0}: Model {1} File {2}".format(rank, model_number,
-                                                        fnr))
-
-            # Read in both the galaxies, the merged ones and combine them into
-            # a single array.
-            GG, Gal_Desc = rs.ReadGals_SAGE(galaxy_name, fnr, len(z_array_full))
-            G_Merged, _ = rs.ReadGals_SAGE(merged_name, fnr, len(z_array_full))
-            G = rs.Join_Arrays(GG, G_Merged, Gal_Desc)
-
-            # For each snapshot, calculate properties for galaxies that exist.
-            for snap_count, snapnum in enumerate(range(len(z_array_full))):
-
-                Gals_exist = np.where((G.GridHistory[:, snapnum] != -1) &
-                                      (G.GridStellarMass[:, snapnum] > 0.0) &
-                                      (G.LenHistory[:, snapnum] > model_halopartcut))[0]
-                if len(Gals_exist) == 0:
-                    continue
-
-                sum_nion_allmodels[model_number][snap_count] += sum(G.GridNgamma_HI[Gals_exist, snapnum] * \
-                                                                    G.Gridfesc[Gals_exist,snapnum])
-
-                log_mass = np.log10(G.GridStellarMass[Gals_exist, snapnum] * 1.0e10 / model_hubble_h)
-                fesc = G.Gridfesc[Gals_exist, snapnum]
-                fej = G.EjectedFraction[Gals_exist, snapnum]
-                SFR = G.GridSFR[Gals_exist, snapnum]
-                MUV = G.GridMUV[Gals_exist, snapnum]
-                halomass = G.GridHaloMass[Gals_exist, snapnum] * 1.0e10 / model_hubble_h
-                dustmass = (G.GridDustColdGas[Gals_exist, snapnum] +
-                            G.GridDustColdGas[Gals_exist, snapnum]) * 1.0e10 / model_hubble_h
-
-                # Calculate the mean fesc as a function of stellar mass.
-                if galaxy_plots["mstar_fesc"]:
-                    mean_mstar_fesc_allmodels[model_number][snap_count], \
-                    std_mstar_fesc_allmodels[model_number][snap_count], \
-                    N_mstar_fesc_allmodels[model_number][snap_count] = \
-                        do_2D_binning(log_mass, fesc,
-                                      mean_mstar_fesc_allmodels[model_number][snap_count],
-                                      std_mstar_fesc_allmodels[model_number][snap_count],
-                                      N_mstar_fesc_allmodels[model_number][snap_count],
-                                      mstar_bins)
-
-                # Calculate the mean ejected fraction as a function of stellar mass.
-                if galaxy_plots["mstar_fej"]:
-                    mean_mstar_fej_allmodels[model_number][snap_count], \
-                    std_mstar_fej_allmodels[model_number][snap_count], \
-                    N_mstar_fej_allmodels[model_number][snap_count] = \
-                        do_2D_binning(log_mass, fej,
-                                      mean_mstar_fej_allmodels[model_number][snap_count],
-                                      std_mstar_fej_allmodels[model_number][snap_count],
-                                      N_mstar_fej_allmodels[model_number][snap_count],
-                                      mstar_bins)
-
-                if galaxy_plots["mstar_SFR"]:
-                    mean_mstar_SFR_allmodels[model_number][snap_count], \
-                    std_mstar_SFR_allmodels[model_number][snap_count], \
-                    N_mstar_SFR_allmodels[model_number][snap_count] = \
-                        do_2D_binning(log_mass, SFR,
-                                      mean_mstar_SFR_allmodels[model_number][snap_count],
-                                      std_mstar_SFR_allmodels[model_number][snap_count],
-                                      N_mstar_SFR_allmodels[model_number][snap_count],
-                                      mstar_bins)
-
-                SMF_thissnap = np.histogram(log_mass, bins=mstar_bins)
-                SMF_allmodels[model_number][snap_count] += SMF_thissnap[0]
-
-                if galaxy_plots["UVLF"]:
-                    # For the UV Magnitude, galaxies without any UV Luminosity have
-                    # their UV Mag set to 999.0.  Filter these out...
-                    w_MUV = np.where(MUV < 100.0)[0]
-
-                    my_MUV = MUV[w_MUV]
-
-                    dustcorrected_MUV = calculate_dustcorrected_MUV(my_MUV, halomass[w_MUV],
-                                                                    dustmass[w_MUV],
-                                                                    cosmology,
-                                                                    model_dust_to_gas_ratio,
-                                                                    model_radius_dust_grains,
-                                                                    model_density_dust_grains,
-                                                                    z_array_full[snapnum]) 
-
-                    UVLF_thissnap = np.histogram(my_MUV, bins=MUV_bins)
-                    UVLF_allmodels[model_number][snap_count] += UVLF_thissnap[0]
-
-                    dustcorrected_UVLF_thissnap = np.histogram(dustcorrected_MUV, bins=MUV_bins)                
-                    dustcorrected_UVLF_allmodels[model_number][snap_count] += dustcorrected_UVLF_thissnap[0]
-
-                    # To determine the amount of dust extinction (in dex) of each galaxy,
-                    # we'll just cheatingly do "dustcorrected_MUV - intrinsic_MUV".
-                    A1600 = dustcorrected_MUV - my_MUV
-
-                    mean_MUV_A1600_allmodels[model_number][snap_count], \
-                    std_MUV_A1600_allmodels[model_number][snap_count], \
-                    N_MUV_A1600_allmodels[model_number][snap_count] = \
-                        do_2D_binning(my_MUV, A1600,
-                                      mean_MUV_A1600_allmodels[model_number][snap_count],
-                                      std_MUV_A1600_allmodels[model_number][snap_count],
-                                      N_MUV_A1600_allmodels[model_number][snap_count],
-                                      MUV_bins)
-
-                    # When determining the dustmass, only use those galaxies that have a
-                    # valid MUV.
-                    my_dustmass = dustmass[w_MUV]
-
-                    mean_MUV_dustmass_allmodels[model_number][snap_count], \
-                    std_MUV_dustmass_allmodels[model_number][snap_count], \
-                    N_MUV_dustmass_allmodels[model_number][snap_count] = \
-                        do_2D_binning(my_MUV, my_dustmass,
-                                      mean_MUV_dustmass_allmodels[model_number][snap_count],
-                                      std_MUV_dustmass_allmodels[model_number][snap_count],
-                                      N_MUV_dustmass_allmodels[model_number][snap_count],
-                                      MUV_bins)
-
-                #if(snap_count > 70):
-                #    print("z {0}: MUV_bins {1}\tUVLF {2}".format(z_array_full[snap_count], MUV_bins, UVLF_thissnap[0]))
-
-                # Snapshot loop.
-            # File Loop.
-        # Model Loop.
+            last_file = SAGE_params.LastFile
+
+        for fnr in range(first_file, last_file + 1):
+            work_units.append((model_number, fnr))
+
+    # ========================================================= #
+    # Now go through each file and calculate the stuff we need. #
+    # ========================================================= #
+    # The backend distributes the files over the tasks/processes. Each file
+    # returns its own statistics which we add to the running totals.
+    totals_allmodels = []
+    for model_number in range(len(ini_files)):
+        totals_allmodels.append(init_galaxy_partial(len(z_array_full_allmodels[model_number]),
+                                                    mstar_Nbins, MUV_Nbins))
+
+    worker = functools.partial(process_galaxy_file,
+                               model_params_allmodels=model_params_allmodels,
+                               galaxy_plots=galaxy_plots)
+
+    # If we're checkpointing, the statistics of each file are saved as soon as
+    # they're calculated.  The totals of each model are also saved, so if
+    # models or files are added we only process the new files and add them to
+    # the existing totals.
+    checkpoint_dir = galaxy_plots["checkpoint_dir"]
+    if checkpoint_dir is None:
+        for (model_number, fnr), partial in backend.map(worker, work_units):
+            collective.merge_partials(totals_allmodels[model_number], partial)
+    else:
+        checkpoints, unit_keys, model_keys, model_signatures = \
+            galaxy_checkpoints(checkpoint_dir, work_units,
+                               model_params_allmodels, galaxy_plots)
+        worker = ckpt.CheckpointedWorker(worker, checkpoints)
+
+        # Totals are summed over the files processed by this task.
+        local_units = backend.local_units(work_units)
+        todo_units = []
+        for model_number in range(len(ini_files)):
+            model_units = [unit for unit in local_units if unit[0] == model_number]
+            model_unit_keys = [unit_keys[unit] for unit in model_units]
+
+            totals, covered = ckpt.load_totals("{0}/galaxy".format(checkpoint_dir),
+                                               model_keys[model_number],
+                                               model_unit_keys,
+                                               model_signatures[model_number])
+            if totals is not None:
+                totals_allmodels[model_number] = totals
+
+            todo_units.extend([unit for unit in model_units
+                               if unit_keys[unit] not in covered])
+
+        for (model_number, fnr), partial in backend.map(worker, todo_units,
+                                                        distribute=False):
+            collective.merge_partials(totals_allmodels[model_number], partial)
+
+        for model_number in range(len(ini_files)):
+            model_unit_keys = [unit_keys[unit] for unit in local_units
+                               if unit[0] == model_number]
+            if len(model_unit_keys) == 0:
+                continue
+            ckpt.save_totals("{0}/galaxy".format(checkpoint_dir),
+                             model_keys[model_number],
+                             totals_allmodels[model_number], model_unit_keys,
+                             model_signatures[model_number])
+
+    # With all files processed, construct the statistics that are plotted.
+    # These are nested lists indexed by ``model_number`` then snapshot.
+    sum_nion_allmodels = []
+    SMF_allmodels = []
+    UVLF_allmodels = []
+    dustcorrected_UVLF_allmodels = []
+
+    binned_stats_allmodels = {}
+    binned_names = ["mstar_fesc", "mstar_fej", "mstar_SFR", "MUV_A1600",
+                    "MUV_dustmass"]
+    for name in binned_names:
+        binned_stats_allmodels[name] = [[], [], []]
+
+    for model_number, totals in enumerate(totals_allmodels):
+
+        model_volume = model_volume_allmodels[model_number]
 
         # Ionizing emissitivty is scaled by the simulation volume (in Mpc^3).
-        sum_nion_allmodels[model_number] /= model_volume
+        sum_nion_allmodels.append((totals["sum_nion"] / model_volume).astype(np.float32))
 
         # Stellar Mass Function is normalized by boxsize and bin width.
-        SMF_allmodels[model_number] = np.divide(SMF_allmodels[model_number],
-                                                model_volume * mstar_bin_width)
+        SMF_allmodels.append((totals["SMF"] / (model_volume * mstar_bin_width)).astype(np.float32))
 
         # As is the UV LF...
-        UVLF_allmodels[model_number] = np.divide(UVLF_allmodels[model_number],
-                                                 model_volume * MUV_bin_width)
+        UVLF_allmodels.append((totals["UVLF"] / (model_volume * MUV_bin_width)).astype(np.float32))
+
+        dustcorrected_UVLF_allmodels.append((totals["dustcorrected_UVLF"] / \
+                                             (model_volume * MUV_bin_width)).astype(np.float32))
 
-        dustcorrected_UVLF_allmodels[model_number] = np.divide(dustcorrected_UVLF_allmodels[model_number],
-                                                               model_volume * MUV_bin_width)
+        for name in binned_names:
+            mean, std = collective.sums_to_mean_std(totals[name][0],
+                                                    totals[name][1],
+                                                    totals[name][2])
+
+            binned_stats_allmodels[name][0].append(list(mean.astype(np.float32)))
+            binned_stats_allmodels[name][1].append(list(std.astype(np.float32)))
+            binned_stats_allmodels[name][2].append(list(totals[name][0].astype(np.float32)))
 
     # Everything has been calculated. Now construct a dictionary that contains
     # all the data (for easy passing) and return it. 
@@ -807,24 +996,14 @@ def generate_data(rank, size, comm, ini_files, galaxy_plots):
                    "t_bigbang_allmodels" : t_bigbang_allmodels,
                    "sum_nion_allmodels" : sum_nion_allmodels,
                    "mstar_bins" : mstar_bins, "mstar_bin_width" : mstar_bin_width,
-                   "mean_mstar_fesc_allmodels" : mean_mstar_fesc_allmodels,
-                   "std_mstar_fesc_allmodels" : std_mstar_fesc_allmodels,
-                   "N_mstar_fesc_allmodels" : N_mstar_fesc_allmodels,
                    "SMF_allmodels" : SMF_allmodels,
-                   "mean_mstar_fej_allmodels" : mean_mstar_fej_allmodels,
-                   "std_mstar_fej_allmodels" : std_mstar_fej_allmodels,
-                   "N_mstar_fej_allmodels" : N_mstar_fej_allmodels,
-                   "mean_mstar_SFR_allmodels" : mean_mstar_SFR_allmodels,
-                   "std_mstar_SFR_allmodels" : std_mstar_SFR_allmodels,
-                   "N_mstar_SFR_allmodels" : N_mstar_SFR_allmodels,
                    "UVLF_allmodels" : UVLF_allmodels,
                    "dustcorrected_UVLF_allmodels" : dustcorrected_UVLF_allmodels,
-                   "mean_MUV_A1600_allmodels" : mean_MUV_A1600_allmodels,
-                   "std_MUV_A1600_allmodels" : std_MUV_A1600_allmodels,
-                   "N_MUV_A1600_allmodels" : N_MUV_A1600_allmodels,
-                   "mean_MUV_dustmass_allmodels" : mean_MUV_dustmass_allmodels,
-                   "std_MUV_dustmass_allmodels" : std_MUV_dustmass_allmodels,
-                   "N_MUV_dustmass_allmodels" : N_MUV_dustmass_allmodels,
                    "MUV_bins" : MUV_bins, "MUV_bin_width" : MUV_bin_width}
 
+    for name in binned_names:
+        galaxy_data["mean_{0}_allmodels".format(name)] = binned_stats_allmodels[name][0]
+        galaxy_data["std_{0}_allmodels".format(name)] = binned_stats_allmodels[name][1]
+        galaxy_data["N_{0}_allmodels".format(name)] = binned_stats_allmodels[name][2]
+
     return galaxy_data
@@ -14,7 +14,7 @@ import PlotScripts as ps
 import CollectiveStats as collective
 import ObservationalData as obs
 
-from mpi4py import MPI
+from ParallelBackend import MPI
 
 
 def plot_nion(z_array_full_allmodels, lookback_array_full_allmodels,
@@ -2,31 +2,181 @@ import numpy as np
 
 import ReadScripts
 
+# Number of grid cells read at once when sampling.
+default_chunk_cells = 2**22
 
-def calc_gal_photoion(GridPos, PhotoField_fname, GridSize, Precision, debug=0):
 
-    photoion = ReadScripts.read_binary_grid(PhotoField_fname, 
-                                            GridSize,
-                                            Precision,
-                                            reshape=False)
+def sample_grid(grid, GridPos, chunk_cells=default_chunk_cells):
+    """
+    Gathers the values of a flat grid at arbitrary cells.
 
-    gal_photoion = photoion[GridPos]
+    The cells are visited in sorted order, reading the grid one chunk at a
+    time, so the grid can be a ``np.memmap`` (or a
+    ``GridCompress.CompressedGrid``) that is never fully read into memory.
+
+    Parameters
+    ----------
+
+    grid : 1D ``np.ndarray``, ``np.memmap`` or ``GridCompress.CompressedGrid``
+        The flat grid.
+
+    GridPos : 1D ``np.ndarray`` of integers
+        The flat cell index of each galaxy.  Negative indices (galaxies that
+        don't exist at this snapshot) are given ``np.nan``.
+
+    chunk_cells : Integer, optional
+        Number of grid cells read at once.
+
+    Returns
+    ---------
+
+    values : 1D ``np.ndarray`` of floats
+        The value of the grid at each cell.
+    """
+
+    GridPos = np.asarray(GridPos, dtype=np.int64)
+    values = np.full(len(GridPos), np.nan)
+
+    valid = np.nonzero(GridPos >= 0)[0]
+    if len(valid) == 0:
+        return values
+
+    # Each cell is read once, no matter how many galaxies are in it.
+    cells, inverse = np.unique(GridPos[valid], return_inverse=True)
+    cell_values = np.empty(len(cells))
+
+    # Only read the chunks of the grid that hold galaxies.
+    chunk_idx = cells // chunk_cells
+    starts = np.nonzero(np.r_[True, chunk_idx[1:] != chunk_idx[:-1]])[0]
+    ends = np.r_[starts[1:], len(cells)]
+
+    for start, end in zip(starts, ends):
+        low_cell = cells[start]
+        high_cell = cells[end-1] + 1
+
+        block = np.asarray(grid[low_cell:high_cell])
+        cell_values[start:end] = block[cells[start:end] - low_cell]
+
+    values[valid] = cell_values[np.ravel(inverse)]
+
+    return values
+
+
+class GridSampler(object):
+    """
+    Samples grids at the cells of galaxies.  Each grid is memory mapped the
+    first time it is sampled and the mapping is kept open, so the same grid
+    (e.g., the reionization redshift grid) can be sampled at every snapshot
+    without re-opening it.
+
+    Parameters
+    ----------
+
+    chunk_cells : Integer, optional
+        Number of grid cells read at once.  See ``sample_grid()``.
+    """
+
+    def __init__(self, chunk_cells=default_chunk_cells):
+        self.chunk_cells = chunk_cells
+        self.grids = {}
+
+    def grid(self, fname, GridSize, Precision):
+        """
+        Returns the (cached) flat memory mapped grid.
+        """
+
+        key = (fname, GridSize, Precision)
+        if key not in self.grids:
+            self.grids[key] = ReadScripts.memmap_binary_grid(fname, GridSize,
+                                                             Precision)
+
+        return self.grids[key]
+
+    def sample(self, GridPos, fname, GridSize, Precision):
+        """
+        Gathers the values of a grid at the cells ``GridPos``. See
+        ``sample_grid()``.
+        """
+
+        return sample_grid(self.grid(fname, GridSize, Precision), GridPos,
+                           self.chunk_cells)
+
+    def close(self, fname=None):
+        """
+        Drops the mapping of ``fname`` (or of every grid if not specified),
+        e.g., once a snapshot's grids are no longer needed.
+        """
+
+        for key in list(self.grids):
+            if fname is None or key[0] == fname:
+                del self.grids[key]
+
+
+def calc_gal_environment(GridPos, fields, GridSize, sampler=None):
+    """
+    Attaches the properties of the environment (e.g., photoionization rate,
+    reionization redshift, ionization fraction and density) of each galaxy.
+
+    Parameters
+    ----------
+
+    GridPos : 1D ``np.ndarray`` of integers
+        The flat cell index of each galaxy (e.g., ``GridHistory`` at a
+        snapshot).
+
+    fields : Dictionary
+        Keyed by the name of each property.  Values are ``(fname, Precision)``
+        of the grid it is sampled from.
+
+    GridSize : Integer
+        Number of cells along one side of the grids.
+
+    sampler : ``GridSampler``, optional
+        The sampler that holds the grid mappings.  Pass the same sampler for
+        every snapshot so grids that are shared (e.g., zreion) are only opened
+        once.
+
+    Returns
+    ---------
+
+    environment : Dictionary
+        Keyed by the name of each property.  Values are the property of each
+        galaxy.
+    """
+
+    if sampler is None:
+        sampler = GridSampler()
+
+    environment = {}
+    for name, (fname, Precision) in fields.items():
+        environment[name] = sampler.sample(GridPos, fname, GridSize, Precision)
+
+    return environment
+
+
+def calc_gal_photoion(GridPos, PhotoField_fname, GridSize, Precision, debug=0,
+                      sampler=None):
+
+    if sampler is None:
+        sampler = GridSampler()
+
+    gal_photoion = sampler.sample(GridPos, PhotoField_fname, GridSize,
+                                  Precision)
 
     if debug:
-        print("There are {0} Cells with a non-zero photion and there are {1} " 
-              "unique Galaxy cells".format(len(photoion[photoion > 1e-16]),
+        photoion = sampler.grid(PhotoField_fname, GridSize, Precision)
+        print("There are {0} Cells with a non-zero photion and there are {1} "
+              "unique Galaxy cells".format(np.count_nonzero(np.asarray(photoion[:]) > 1e-16),
                                            len(np.unique(GridPos))))
     return gal_photoion
 
 
-def calc_gal_zreion(GridPos, zreion_fname, GridSize, Precision, debug=0):
-
-    zreion = ReadScripts.read_binary_grid(zreion_fname,
-                                          GridSize,
-                                          Precision,
-                                          reshape=False)
+def calc_gal_zreion(GridPos, zreion_fname, GridSize, Precision, debug=0,
+                    sampler=None):
 
-    gal_zreion = zreion[GridPos]
+    if sampler is None:
+        sampler = GridSampler()
 
-    return gal_zreion 
+    gal_zreion = sampler.sample(GridPos, zreion_fname, GridSize, Precision)
 
+    return gal_zreion
@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+"""
+This file contains a compressed container for the binary grids (e.g.,
+ionization and density grids).
+
+The cells of a grid (in the same order as the raw binary grid) are split into
+fixed size chunks and each chunk is compressed on its own with ``zlib`` or
+``lzma``.  A chunk index at the end of the file gives the location of every
+chunk, so any range of cells can be read without decompressing the rest of the
+grid.  Three kinds of chunks are used:
+
+- ``CHUNK_CONSTANT``, every cell has the same value (e.g., fully ionized or
+  fully neutral regions).  Only the value is stored.
+- ``CHUNK_SATURATED``, most cells are exactly 0 or 1 (as is typical for the
+  ionization grids).  A byte per cell records whether it is 0, 1 or partial,
+  followed by the values of the partial cells only.
+- ``CHUNK_PLAIN``, the raw cells.
+
+``ReadScripts.read_binary_grid()`` and ``ReadScripts.memmap_binary_grid()``
+read compressed grids transparently, so they can simply replace the raw grids.
+
+File layout:
+
+.. code::
+
+    header  : magic, version, precision, codec, GridSize, chunk_cells,
+              num_chunks, index_offset
+    chunks  : the compressed payload of each chunk
+    index   : (offset, nbytes, kind, value) for each chunk
+
+To compress some grids:
+
+.. code::
+
+    $ python GridCompress.py <GridSize> <precision> [--lzma] [--replace] <grid> [<grid> ...]
+
+which saves each as ``<grid>.cmp`` or, with ``--replace``, replaces the raw
+grid.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import zlib
+import lzma
+import struct
+
+import numpy as np
+
+import FileLayout as layout
+
+MAGIC = b"RSGC"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sIiiqqqq")
+
+CHUNK_PLAIN = 0
+CHUNK_CONSTANT = 1
+CHUNK_SATURATED = 2
+
+_INDEX_DTYPE = np.dtype([("offset", "<i8"), ("nbytes", "<i8"),
+                         ("kind", "<i4"), ("value", "<f8")])
+
+# Codec ids stored in the header, mapped to ``(compress, decompress)``.
+CODECS = {"zlib" : (1, zlib.compress, zlib.decompress),
+          "lzma" : (2, lzma.compress, lzma.decompress)}
+
+# The saturated encoding is used if at least this fraction of a chunk is
+# exactly 0 or 1.
+saturated_min_frac = 0.5
+
+default_chunk_cells = 2**20
+
+
+def _precision_dtype(precision):
+    """
+    The data type of each cell for the precision values used by
+    ``ReadScripts.read_binary_grid()``.
+    """
+
+    formats = {0 : np.int32, 1 : np.float32, 2 : np.float64}
+    if precision not in formats:
+        raise ValueError("Only 0, 1, 2 (corresponding to integers, float or "
+                         "doubles respectively) are currently supported.")
+
+    return np.dtype(formats[precision])
+
+
+def is_compressed_grid(filepath):
+    """
+    Checks if a grid file is a compressed grid (rather than a raw grid).
+    """
+
+    try:
+        with open(filepath, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except (IOError, OSError):
+        return False
+
+
+def _encode_chunk(chunk, compress, saturated):
+    """
+    Encodes a single chunk of cells.  Returns ``(kind, value, payload)``.
+    """
+
+    first = chunk[0]
+    if np.all(chunk == first):
+        return CHUNK_CONSTANT, float(first), b""
+
+    if saturated:
+        zeros = (chunk == 0)
+        ones = (chunk == 1)
+        partial = ~(zeros | ones)
+        if len(chunk) - np.count_nonzero(partial) >= \
+           saturated_min_frac * len(chunk):
+            codes = np.full(len(chunk), 2, dtype=np.uint8)
+            codes[zeros] = 0
+            codes[ones] = 1
+
+            payload = codes.tobytes() + chunk[partial].tobytes()
+            return CHUNK_SATURATED, 0.0, compress(payload)
+
+    return CHUNK_PLAIN, 0.0, compress(chunk.tobytes())
+
+
+def compress_grid(filepath, GridSize, precision, output_path=None,
+                  codec="zlib", saturated=True,
+                  chunk_cells=default_chunk_cells):
+    """
+    Compresses a raw binary grid, one chunk at a time.
+
+    Parameters
+    ----------
+
+    filepath, GridSize, precision : See ``ReadScripts.read_binary_grid()``.
+
+    output_path : String, optional
+        Path the compressed grid is saved to.  Defaults to ``<filepath>.cmp``.
+
+    codec : String, optional
+        ``"zlib"`` or ``"lzma"``.
+
+    saturated : Boolean, optional
+        If ``True``, chunks where most cells are exactly 0 or 1 (e.g., of the
+        ionization grids) use the saturated encoding.
+
+    chunk_cells : Integer, optional
+        Number of cells in each chunk.  This sets the granularity of random
+        access and the memory used when compressing.
+
+    Returns
+    ---------
+
+    output_path : String
+        Path the compressed grid was saved to.
+    """
+
+    if codec not in CODECS:
+        raise ValueError("The codec must be one of {0}. You specified {1}"
+                         .format(sorted(CODECS), codec))
+    codec_id, compress, _ = CODECS[codec]
+
+    readformat = _precision_dtype(precision)
+    num_cells = GridSize**3
+
+    filesize = os.stat(filepath).st_size
+    if filesize != num_cells*readformat.itemsize:
+        raise ValueError("The size of file {0} is {1} bytes whereas we "
+                         "expected it to be {2} bytes"
+                         .format(filepath, filesize,
+                                 num_cells*readformat.itemsize))
+
+    if output_path is None:
+        output_path = "{0}.cmp".format(filepath)
+
+    grid = np.memmap(filepath, dtype=readformat, mode="r", shape=(num_cells,))
+
+    num_chunks = (num_cells + chunk_cells - 1) // chunk_cells
+    index = np.zeros(num_chunks, dtype=_INDEX_DTYPE)
+
+    # Written to a temporary name then moved into place so ``output_path``
+    # can be the input grid.
+    tmp_path = "{0}.{1}.tmp".format(output_path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+
+        for chunk_idx in range(num_chunks):
+            low_idx = chunk_idx*chunk_cells
+            chunk = np.asarray(grid[low_idx:low_idx+chunk_cells])
+
+            kind, value, payload = _encode_chunk(chunk, compress, saturated)
+
+            index[chunk_idx] = (f.tell(), len(payload), kind, value)
+            f.write(payload)
+
+        index_offset = f.tell()
+        f.write(index.tobytes())
+
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, precision, codec_id, GridSize,
+                             chunk_cells, num_chunks, index_offset))
+
+    del grid
+    os.replace(tmp_path, output_path)
+    layout.forget(output_path)
+
+    return output_path
+
+
+class CompressedGrid(object):
+    """
+    Random access to the cells of a compressed grid.  Slicing (with a step of
+    1) returns the cells as a ``np.ndarray``, so this can be used in place of
+    the ``np.memmap`` of a raw grid (see ``ReadScripts.memmap_binary_grid()``).
+
+    Parameters
+    ----------
+
+    filepath : String
+        Location of the compressed grid.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+        with open(filepath, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise ValueError("{0} is not a compressed grid."
+                                 .format(filepath))
+
+            magic, version, self.precision, codec_id, self.GridSize, \
+            self.chunk_cells, num_chunks, index_offset = \
+                _HEADER.unpack(header)
+
+            if magic != MAGIC:
+                raise ValueError("{0} is not a compressed grid."
+                                 .format(filepath))
+            if version != VERSION:
+                raise ValueError("Compressed grid {0} has version {1} but "
+                                 "only version {2} is supported."
+                                 .format(filepath, version, VERSION))
+
+            f.seek(index_offset)
+            self.index = np.frombuffer(f.read(num_chunks*_INDEX_DTYPE.itemsize),
+                                       dtype=_INDEX_DTYPE)
+
+        self.decompress = None
+        for name in CODECS:
+            if CODECS[name][0] == codec_id:
+                self.decompress = CODECS[name][2]
+        if self.decompress is None:
+            raise ValueError("Compressed grid {0} uses an unknown codec {1}."
+                             .format(filepath, codec_id))
+
+        self.dtype = _precision_dtype(self.precision)
+        self.num_cells = self.GridSize**3
+
+        # The most recently decompressed chunk. Consecutive reads usually
+        # overlap the same chunk.
+        self._cached_idx = None
+        self._cached_chunk = None
+
+    def __len__(self):
+        return self.num_cells
+
+    def read_chunk(self, chunk_idx):
+        """
+        Decompresses a single chunk.
+
+        Parameters
+        ----------
+
+        chunk_idx : Integer
+            The chunk to read.
+
+        Returns
+        ---------
+
+        chunk : 1D ``np.ndarray``
+            The cells of the chunk.
+        """
+
+        if chunk_idx == self._cached_idx:
+            return self._cached_chunk
+
+        offset, nbytes, kind, value = self.index[chunk_idx]
+        num_cells = min(self.chunk_cells,
+                        self.num_cells - chunk_idx*self.chunk_cells)
+
+        if kind == CHUNK_CONSTANT:
+            chunk = np.full(num_cells, value, dtype=self.dtype)
+        else:
+            with open(self.filepath, "rb") as f:
+                f.seek(offset)
+                payload = self.decompress(f.read(nbytes))
+
+            if kind == CHUNK_PLAIN:
+                chunk = np.frombuffer(payload, dtype=self.dtype)
+            else:
+                codes = np.frombuffer(payload[:num_cells], dtype=np.uint8)
+                chunk = codes.astype(self.dtype)
+                chunk[codes == 2] = np.frombuffer(payload[num_cells:],
+                                                  dtype=self.dtype)
+
+        self._cached_idx = chunk_idx
+        self._cached_chunk = chunk
+
+        return chunk
+
+    def read(self, low_idx, high_idx, out=None):
+        """
+        Reads a range of cells.
+
+        Parameters
+        ----------
+
+        low_idx, high_idx : Integers
+            The first and one past the last cell to read.
+
+        out : 1D ``np.ndarray``, optional
+            If specified, the cells are written into this array (converting
+            them to its data type).
+
+        Returns
+        ---------
+
+        cells : 1D ``np.ndarray``
+            The cells, ``out`` if it was specified.
+        """
+
+        if out is None:
+            out = np.empty(max(high_idx - low_idx, 0), dtype=self.dtype)
+
+        first_chunk = low_idx // self.chunk_cells
+        for chunk_idx in range(first_chunk, (high_idx - 1) // self.chunk_cells + 1):
+            chunk_low = chunk_idx*self.chunk_cells
+
+            low = max(low_idx, chunk_low)
+            high = min(high_idx, chunk_low + self.chunk_cells)
+
+            out[low-low_idx:high-low_idx] = \
+                self.read_chunk(chunk_idx)[low-chunk_low:high-chunk_low]
+
+        return out
+
+    def __getitem__(self, key):
+
+        if not isinstance(key, slice):
+            raise TypeError("Compressed grids can only be sliced.")
+
+        low_idx, high_idx, step = key.indices(self.num_cells)
+        if step != 1:
+            raise ValueError("Compressed grids can only be sliced with a step "
+                             "of 1.")
+
+        return self.read(low_idx, high_idx)
+
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+
+    codec = "zlib"
+    if "--lzma" in args:
+        args.remove("--lzma")
+        codec = "lzma"
+
+    replace = False
+    if "--replace" in args:
+        args.remove("--replace")
+        replace = True
+
+    if len(args) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    GridSize = int(args[0])
+    precision = int(args[1])
+
+    for filepath in args[2:]:
+        if replace:
+            output_path = filepath
+        else:
+            output_path = None
+
+        output_path = compress_grid(filepath, GridSize, precision,
+                                    output_path=output_path, codec=codec)
+
+        print("Saved {0} ({1:.1f}% of the raw size)"
+              .format(output_path, 100.0 * os.stat(output_path).st_size /
+                      (GridSize**3 * _precision_dtype(precision).itemsize)))
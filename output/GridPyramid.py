@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+This file contains the builder for reduced resolution copies (a "pyramid") of
+the binary grids, used for quick-look plots.
+
+Level ``L`` of a grid has ``GridSize / 2^L`` cells along each side; each of its
+cells is the mean (or, e.g., for the ionization grids, the maximum) of the
+``2^L x 2^L x 2^L`` block of cells it covers.  Every level is written next to
+the original grid (see ``ReadScripts.grid_level_path()``) in the same format
+and precision, so it can be read with
+
+.. code::
+
+    grid = ReadScripts.read_binary_grid(path, GridSize, precision, level=L)
+
+Every level is built in a single, streaming pass over the original grid.  The
+grids are stored in Fortran order, so a block of ``2^L`` planes along the last
+axis is contiguous on disk and a whole number of planes of every level can be
+built from each chunk that is read.
+
+To build the levels of some grids:
+
+.. code::
+
+    $ python GridPyramid.py <GridSize> <precision> [--max] <grid> [<grid> ...]
+
+where ``--max`` also builds the max-pooled levels (e.g., for ionization
+grids).
+"""
+
+from __future__ import print_function
+
+import sys
+import numpy as np
+
+import ReadScripts as rs
+import FileLayout as layout
+
+# Levels built by default, i.e., 1/2, 1/4 and 1/8 of the original resolution.
+default_levels = [1, 2, 3]
+
+
+def _pool_block(block, factor, method):
+    """
+    Reduces a ``(planes, GridSize, GridSize)`` block of planes by ``factor``
+    along every axis.
+    """
+
+    planes, GridSize = block.shape[0], block.shape[1]
+    block = block.reshape(planes // factor, factor,
+                          GridSize // factor, factor,
+                          GridSize // factor, factor)
+
+    if method == "mean":
+        return block.mean(axis=(1, 3, 5), dtype=np.float64)
+    elif method == "max":
+        return block.max(axis=(1, 3, 5))
+
+    raise ValueError("The pyramid method must be 'mean' or 'max'. You "
+                     "specified {0}".format(method))
+
+
+def build_grid_pyramid(filepath, GridSize, precision, levels=default_levels,
+                       methods=["mean"], chunk_cells=2**24):
+    """
+    Builds the reduced resolution levels of a binary grid.
+
+    Parameters
+    ----------
+
+    filepath, GridSize, precision : See ``ReadScripts.read_binary_grid()``.
+
+    levels : List of integers, optional
+        The levels to build.  Level ``L`` has ``GridSize / 2^L`` cells along a
+        side, so ``GridSize`` must be divisible by ``2^max(levels)``.
+
+    methods : List of strings, optional
+        How the cells are combined, ``"mean"`` and/or ``"max"``.
+
+    chunk_cells : Integer, optional
+        Approximate number of cells of the original grid read at once.
+
+    Returns
+    ---------
+
+    level_paths : List of strings
+        The paths of the levels that were written.
+    """
+
+    if precision == 0:
+        raise ValueError("Pyramids can only be built for floating point "
+                         "grids.")
+
+    readformat, _ = rs.check_binary_grid(filepath, GridSize, precision)
+
+    block_planes = 2**max(levels)
+    if GridSize % block_planes != 0:
+        raise ValueError("To build level {0} the grid size must be divisible "
+                         "by {1}. The grid size is {2}."
+                         .format(max(levels), block_planes, GridSize))
+
+    # Read a whole number of blocks of planes at a time.
+    plane_cells = GridSize*GridSize
+    chunk_planes = max(1, chunk_cells // (plane_cells*block_planes)) * \
+                   block_planes
+
+    grid = rs.memmap_binary_grid(filepath, GridSize, precision)
+
+    outputs = {}
+    level_paths = []
+    for level in levels:
+        for method in methods:
+            path = rs.grid_level_path(filepath, level, method)
+            outputs[(level, method)] = open(path, "wb")
+            level_paths.append(path)
+
+    try:
+        for low_plane in range(0, GridSize, chunk_planes):
+            high_plane = min(low_plane + chunk_planes, GridSize)
+
+            # Fortran order, so in C order the axes are reversed.
+            block = np.asarray(grid[low_plane*plane_cells:
+                                    high_plane*plane_cells])
+            block = block.reshape(high_plane - low_plane, GridSize, GridSize)
+
+            for (level, method), output in outputs.items():
+                pooled = _pool_block(block, 2**level, method)
+                pooled.astype(readformat, copy=False).tofile(output)
+    finally:
+        for output in outputs.values():
+            output.close()
+
+        # The catalogue may hold the size of an older version of each level.
+        for path in level_paths:
+            layout.forget(path)
+
+    return level_paths
+
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+
+    methods = ["mean"]
+    if "--max" in args:
+        args.remove("--max")
+        methods.append("max")
+
+    if len(args) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    GridSize = int(args[0])
+    precision = int(args[1])
+
+    for filepath in args[2:]:
+        for path in build_grid_pyramid(filepath, GridSize, precision,
+                                       methods=methods):
+            print("Saved {0}".format(path))
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+"""
+This file contains a streaming reduction engine for the cubic grids produced
+by ``RSAGE`` (e.g., ionization, density and ionizing photon grids).
+
+Several aligned grids are walked together in fixed-size chunks and every
+requested reduction (e.g., the volume and mass weighted ionized fractions, the
+total number of ionizing photons) is updated from the same chunk.  Grids on
+disk are memory mapped, so only a single chunk of each grid is ever held in
+memory regardless of ``GridSize``.
+
+Reductions are requested as a dictionary mapping the name of each result to a
+``(kind, options)`` tuple, e.g.,
+
+.. code::
+
+    reductions = {"volume_frac" : ("mean", {"grid" : "XHII"}),
+                  "mass_frac" : ("weighted_mean", {"grid" : "XHII",
+                                                   "weight" : "density"}),
+                  "nion" : ("sum", {"grid" : "nion"})}
+
+Grids can also be split into a contiguous block of cells for each task (see
+``task_cell_range()``) and the results of each task combined with
+``comm.Reduce()``.  Hence the "histogram2d" kind gives a 2D histogram of two
+grids (e.g., the density and ionization of each cell) using memory set by the
+number of bins rather than the number of cells.
+
+The available kinds are held in the ``REDUCTIONS`` registry.  New kinds can
+be added using ``register_reduction()``.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+
+import ReadScripts as rs
+
+# Number of cells processed at once. 2^20 cells of a double precision grid is
+# 8MB per grid.
+default_chunk_cells = 2**20
+
+# Registry of the reduction kinds. Keys are the kind name, values are
+# ``(init, update, finalize)`` functions. See ``register_reduction()``.
+REDUCTIONS = {}
+
+
+def register_reduction(kind, init, update, finalize):
+    """
+    Adds a reduction kind to the ``REDUCTIONS`` registry.
+
+    Parameters
+    ----------
+
+    kind : String
+        The name used to request the reduction.
+
+    init : Function
+        Called as ``init(**options)`` and returns the initial state.
+
+    update : Function
+        Called as ``update(state, chunks, **options)`` for each chunk and
+        returns the updated state.  ``chunks`` is a dictionary with the
+        current chunk of each grid as a flat ``np.float64`` array.
+
+    finalize : Function
+        Called as ``finalize(state, **options)`` and returns the result.
+
+    Returns
+    ---------
+
+    None.
+    """
+
+    REDUCTIONS[kind] = (init, update, finalize)
+
+
+def _init_zero(**options):
+    return 0.0
+
+
+def _init_pair(**options):
+    return np.zeros(2)
+
+
+def _update_sum(state, chunks, grid, **options):
+    return state + np.sum(chunks[grid])
+
+
+def _update_mean(state, chunks, grid, **options):
+    state[0] += np.sum(chunks[grid])
+    state[1] += len(chunks[grid])
+    return state
+
+
+def _update_weighted_mean(state, chunks, grid, weight, **options):
+    state[0] += np.dot(chunks[grid], chunks[weight])
+    state[1] += np.sum(chunks[weight])
+    return state
+
+
+def _finalize_ratio(state, **options):
+    if state[1] == 0:
+        return 0.0
+    return state[0] / state[1]
+
+
+def _finalize_identity(state, **options):
+    return state
+
+
+def _init_min(**options):
+    return np.inf
+
+
+def _init_max(**options):
+    return -np.inf
+
+
+def _update_min(state, chunks, grid, **options):
+    return min(state, np.min(chunks[grid]))
+
+
+def _update_max(state, chunks, grid, **options):
+    return max(state, np.max(chunks[grid]))
+
+
+def _init_histogram(bins, **options):
+    return np.zeros(len(bins) - 1)
+
+
+def _update_histogram(state, chunks, grid, bins, weight=None, **options):
+    if weight is None:
+        weights = None
+    else:
+        weights = chunks[weight]
+    state += np.histogram(chunks[grid], bins=bins, weights=weights)[0]
+    return state
+
+
+def _transform(values, log):
+    if not log:
+        return values
+    # Empty cells give -inf, which (along with any NaNs) are ignored.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.log10(values)
+
+
+def _init_range(**options):
+    return np.array([np.inf, -np.inf])
+
+
+def _update_range(state, chunks, grid, log=False, **options):
+    values = _transform(chunks[grid], log)
+    values = values[np.isfinite(values)]
+    if len(values) > 0:
+        state[0] = min(state[0], np.min(values))
+        state[1] = max(state[1], np.max(values))
+    return state
+
+
+def _init_histogram2d(bins, **options):
+    return np.zeros((len(bins[0]) - 1, len(bins[1]) - 1))
+
+
+def _update_histogram2d(state, chunks, x, y, bins, log_x=False, log_y=False,
+                        weight=None, **options):
+    x_values = _transform(chunks[x], log_x)
+    y_values = _transform(chunks[y], log_y)
+    finite = np.isfinite(x_values) & np.isfinite(y_values)
+
+    if weight is None:
+        weights = None
+    else:
+        weights = chunks[weight][finite]
+    state += np.histogram2d(x_values[finite], y_values[finite], bins=bins,
+                            weights=weights)[0]
+    return state
+
+
+register_reduction("sum", _init_zero, _update_sum, _finalize_identity)
+register_reduction("mean", _init_pair, _update_mean, _finalize_ratio)
+register_reduction("weighted_mean", _init_pair, _update_weighted_mean,
+                   _finalize_ratio)
+register_reduction("min", _init_min, _update_min, _finalize_identity)
+register_reduction("max", _init_max, _update_max, _finalize_identity)
+register_reduction("histogram", _init_histogram, _update_histogram,
+                   _finalize_identity)
+register_reduction("range", _init_range, _update_range, _finalize_identity)
+register_reduction("histogram2d", _init_histogram2d, _update_histogram2d,
+                   _finalize_identity)
+
+
+def _flat_grid(source, GridSize):
+    """
+    Returns a flat (1D) view of a grid.  ``source`` is either an array or a
+    ``(path, precision)`` tuple that is memory mapped.
+    """
+
+    if isinstance(source, tuple):
+        path, precision = source
+        return rs.memmap_binary_grid(path, GridSize, precision)
+
+    # Reductions over several grids pair up the cells by position, so every
+    # grid must be flattened in the same order.  Use the order of the grid
+    # files, so the grids from ``ReadScripts.read_binary_grid()`` (and the
+    # memory mapped files) aren't copied.
+    return np.ravel(source, order="F")
+
+
+def task_cell_range(num_cells, rank, size):
+    """
+    Splits the cells of a grid into a contiguous block for each task.
+
+    Parameters
+    ----------
+
+    num_cells : Integer
+        Total number of cells in the grid.
+
+    rank, size : Integers
+        The rank of this task and the total number of tasks.
+
+    Returns
+    ---------
+
+    cell_range : Tuple of integers
+        The first and one past the last cell handled by this task.  Can be
+        passed to ``reduce_grids()``.
+    """
+
+    return (rank*num_cells // size, (rank+1)*num_cells // size)
+
+
+def reduce_grids(sources, reductions, GridSize=None,
+                 chunk_cells=default_chunk_cells, cell_range=None):
+    """
+    Evaluates a number of reductions over one or more aligned grids in a
+    single, chunked pass.
+
+    Parameters
+    ----------
+
+    sources : Dictionary
+        Keyed by grid name (e.g., ``"XHII"``).  Values are either the grid as
+        an array, or a ``(path, precision)`` tuple of a binary grid on disk
+        (see ``ReadScripts.read_binary_grid()`` for the precision values).
+
+    reductions : Dictionary
+        Keyed by the name of each result.  Values are ``(kind, options)``
+        tuples where ``kind`` is a key of ``REDUCTIONS`` and ``options`` is a
+        dictionary of the grid name(s) and any other settings the kind takes.
+
+    GridSize : Integer, optional
+        Number of cells along one side of the grids.  Required if any of the
+        grids are read from disk.
+
+    chunk_cells : Integer, optional
+        Number of cells of each grid processed at once.  This sets the peak
+        memory used.
+
+    cell_range : Tuple of integers, optional
+        If specified, only the (flat) cells ``cell_range[0], ...,
+        cell_range[1]-1`` are reduced.  Used to split a grid across tasks, see
+        ``task_cell_range()``.
+
+    Returns
+    ---------
+
+    results : Dictionary
+        Keyed by the name of each result.
+    """
+
+    grids = {}
+    for name in sources:
+        grids[name] = _flat_grid(sources[name], GridSize)
+
+    num_cells = None
+    for name in grids:
+        if num_cells is None:
+            num_cells = len(grids[name])
+        elif len(grids[name]) != num_cells:
+            raise ValueError("All grids must have the same number of cells. "
+                             "Grid {0} has {1} cells whereas we expected {2}."
+                             .format(name, len(grids[name]), num_cells))
+
+    states = {}
+    for result_name, (kind, options) in reductions.items():
+        if kind not in REDUCTIONS:
+            raise ValueError("Reduction {0} is not registered. The registered "
+                             "reductions are {1}".format(kind,
+                                                         sorted(REDUCTIONS)))
+        states[result_name] = REDUCTIONS[kind][0](**options)
+
+    if cell_range is None:
+        cell_range = (0, num_cells)
+
+    for low_idx in range(cell_range[0], cell_range[1], chunk_cells):
+        high_idx = min(low_idx + chunk_cells, cell_range[1])
+
+        chunks = {}
+        for name in grids:
+            chunks[name] = np.asarray(grids[name][low_idx:high_idx],
+                                      dtype=np.float64)
+
+        for result_name, (kind, options) in reductions.items():
+            states[result_name] = REDUCTIONS[kind][1](states[result_name],
+                                                      chunks, **options)
+
+    results = {}
+    for result_name, (kind, options) in reductions.items():
+        results[result_name] = REDUCTIONS[kind][2](states[result_name],
+                                                   **options)
+
+    return results
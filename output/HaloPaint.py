@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+This file contains the functions for painting halos onto a grid, e.g., the
+ionizing photons of the ``Simfast21`` halos (see
+``myresults.bin_Simfast_halos()``).
+
+Each halo is given a luminosity drawn from the mean and standard deviation of
+the (log10) luminosity in its halo mass bin, then deposited onto the grid
+using either nearest grid point (NGP) or cloud in cell (CIC) assignment.
+
+The halo catalogue is memory mapped and processed in chunks.  For each chunk,
+the luminosities are drawn in bulk from a seeded ``np.random.Generator`` and
+the contributions to each cell are summed with ``np.bincount``, so only the
+grid and a single chunk of halos are held in memory.
+
+Cell indices are ``x*GridSize^2 + y*GridSize + z`` (i.e., the painted grid is
+in C order).
+"""
+
+from __future__ import print_function
+
+import numpy as np
+
+# The structure of each halo in the ``Simfast21`` catalogues. The x, y, z
+# positions are in units of grid cells (but are still floats).
+Simfast_halo_dtype = np.dtype([("Halo_Mass", np.float32),
+                               ("Halo_x", np.float32),
+                               ("Halo_y", np.float32),
+                               ("Halo_z", np.float32)], align=True)
+
+default_chunk_halos = 2**22
+
+
+def read_simfast_halos(fname, chunk_halos=default_chunk_halos):
+    """
+    Reads a ``Simfast21`` halo catalogue in chunks.
+
+    The catalogue is a ``long`` with the number of halos followed by an entry
+    for each halo (see ``Simfast_halo_dtype``).
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the catalogue.
+
+    chunk_halos : Integer, optional
+        Number of halos in each chunk.
+
+    Returns
+    ---------
+
+    Generator yielding structured ``np.ndarray`` of the halos in each chunk.
+    """
+
+    N_halos = int(np.fromfile(fname, count=1, dtype=np.int64)[0])
+    if N_halos == 0:
+        return
+
+    halos = np.memmap(fname, dtype=Simfast_halo_dtype, mode="r",
+                      offset=np.dtype(np.int64).itemsize, shape=(N_halos,))
+
+    for low_idx in range(0, N_halos, chunk_halos):
+        yield np.array(halos[low_idx:low_idx+chunk_halos])
+
+
+def halo_cells(x, y, z, GridSize, scheme="ngp", periodic=False):
+    """
+    Determines the cells that halos are deposited onto and their weights.
+
+    Parameters
+    ----------
+
+    x, y, z : 1D ``np.ndarray`` of floats
+        The positions of the halos in units of grid cells.
+
+    GridSize : Integer
+        Number of cells along one side of the grid.
+
+    scheme : String, optional
+        ``"ngp"`` deposits each halo onto the cell containing it.  ``"cic"``
+        shares it between the 8 cells whose centres surround it.
+
+    periodic : Boolean, optional
+        If ``True``, positions outside the box are wrapped.  Otherwise they are
+        clamped onto the edge cells (NGP only; CIC is always periodic).
+
+    Returns
+    ---------
+
+    cells : ``np.ndarray`` of integers
+        The flat cell index of each halo (NGP, shape ``(num_halos,)``) or of
+        the 8 cells of each halo (CIC, shape ``(num_halos, 8)``).
+
+    weights : ``np.ndarray`` of floats or ``None``
+        The fraction of each halo deposited onto each cell. ``None`` for NGP.
+    """
+
+    positions = [np.asarray(x, dtype=np.float64),
+                 np.asarray(y, dtype=np.float64),
+                 np.asarray(z, dtype=np.float64)]
+
+    if scheme == "ngp":
+        idx = []
+        for pos in positions:
+            if periodic:
+                grid_idx = np.mod(np.floor(pos).astype(np.int64), GridSize)
+            else:
+                # Truncate towards zero then clamp, as ``Simfast21`` places
+                # some halos just outside the box.
+                grid_idx = np.clip(pos.astype(np.int64), 0, GridSize - 1)
+            idx.append(grid_idx)
+
+        cells = (idx[0]*GridSize + idx[1])*GridSize + idx[2]
+
+        return cells, None
+
+    elif scheme == "cic":
+        low_idx = []
+        high_frac = []
+        for pos in positions:
+            # Cell ``i`` has its centre at ``i + 0.5``.
+            shifted = pos - 0.5
+            low = np.floor(shifted)
+            high_frac.append(shifted - low)
+            low_idx.append(low.astype(np.int64))
+
+        num_halos = len(positions[0])
+        cells = np.empty((num_halos, 8), dtype=np.int64)
+        weights = np.empty((num_halos, 8))
+
+        corner = 0
+        for dx in (0, 1):
+            for dy in (0, 1):
+                for dz in (0, 1):
+                    offsets = (dx, dy, dz)
+
+                    cell = np.zeros(num_halos, dtype=np.int64)
+                    weight = np.ones(num_halos)
+                    for axis in range(3):
+                        grid_idx = np.mod(low_idx[axis] + offsets[axis],
+                                          GridSize)
+                        cell = cell*GridSize + grid_idx
+
+                        if offsets[axis]:
+                            weight *= high_frac[axis]
+                        else:
+                            weight *= 1.0 - high_frac[axis]
+
+                    cells[:, corner] = cell
+                    weights[:, corner] = weight
+                    corner += 1
+
+        return cells, weights
+
+    raise ValueError("The painting scheme must be 'ngp' or 'cic'. You "
+                     "specified {0}".format(scheme))
+
+
+def sample_log_luminosity(log_mass, fit_mvir, fit_mean, fit_std, rng):
+    """
+    Draws the (log10) luminosity of each halo from the fits of its halo mass
+    bin.
+
+    Parameters
+    ----------
+
+    log_mass : 1D ``np.ndarray`` of floats
+        The log10 mass of each halo.
+
+    fit_mvir, fit_mean, fit_std : 1D ``np.ndarray`` of floats
+        The (log10) halo mass bins and the mean and standard deviation of the
+        log10 luminosity in each.
+
+    rng : ``np.random.Generator``
+        The generator the luminosities are drawn with.
+
+    Returns
+    ---------
+
+    log_luminosity : 1D ``np.ndarray`` of floats
+        The log10 luminosity of each halo. ``np.nan`` for halos whose mass
+        bin isn't covered by the fits.
+    """
+
+    mass_bin = np.digitize(log_mass, fit_mvir)
+    mass_bin[mass_bin == len(fit_mvir)] = len(fit_mvir) - 1
+
+    mean = fit_mean[mass_bin]
+    std = fit_std[mass_bin]
+
+    # Draw for every halo so the stream doesn't depend on which are covered.
+    log_luminosity = mean + std*rng.standard_normal(len(log_mass))
+    log_luminosity[np.isnan(mean) | np.isnan(std)] = np.nan
+
+    return log_luminosity
+
+
+def deposit(grid, cells, values):
+    """
+    Adds ``values`` onto the flat ``grid`` at ``cells``.  Contributions to
+    the same cell are summed with ``np.bincount`` over the unique cells, so
+    the temporary arrays are only as large as the chunk.
+    """
+
+    unique_cells, inverse = np.unique(cells, return_inverse=True)
+    grid[unique_cells] += np.bincount(np.ravel(inverse), weights=values,
+                                      minlength=len(unique_cells))
+
+
+def paint_simfast_halos(fname, fit_mvir, fit_mean, fit_std, GridSize,
+                        scheme="ngp", periodic=False, seed=None,
+                        norm=1.0e50, chunk_halos=default_chunk_halos):
+    """
+    Paints the luminosity of the halos in a ``Simfast21`` catalogue onto a
+    grid.
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the halo catalogue.  See ``read_simfast_halos()``.
+
+    fit_mvir, fit_mean, fit_std : 1D ``np.ndarray`` of floats
+        See ``sample_log_luminosity()``.
+
+    GridSize : Integer
+        Number of cells along one side of the grid.
+
+    scheme, periodic : String and Boolean, optional
+        See ``halo_cells()``.
+
+    seed : Integer or list of integers, optional
+        Seed of the generator the luminosities are drawn with.  See
+        ``np.random.default_rng()``.
+
+    norm : Float, optional
+        The luminosities are divided by this value.
+
+    chunk_halos : Integer, optional
+        Number of halos processed at once.
+
+    Returns
+    ---------
+
+    grid : 1D ``np.ndarray`` of floats. Length is ``GridSize**3``.
+        The summed luminosity (divided by ``norm``) in each cell.
+
+    num_halos, num_no_fit : Integers
+        The total number of halos and the number whose mass wasn't covered
+        by the fits (and hence weren't painted).
+    """
+
+    rng = np.random.default_rng(seed)
+
+    fit_mvir = np.asarray(fit_mvir)
+    fit_mean = np.asarray(fit_mean)
+    fit_std = np.asarray(fit_std)
+
+    grid = np.zeros(GridSize**3)
+
+    num_halos = 0
+    num_no_fit = 0
+    for halos in read_simfast_halos(fname, chunk_halos):
+
+        log_luminosity = sample_log_luminosity(np.log10(halos["Halo_Mass"]),
+                                               fit_mvir, fit_mean, fit_std,
+                                               rng)
+        covered = np.isfinite(log_luminosity)
+
+        num_halos += len(halos)
+        num_no_fit += len(halos) - np.count_nonzero(covered)
+
+        luminosity = np.power(10.0, log_luminosity[covered]) / norm
+        cells, weights = halo_cells(halos["Halo_x"][covered],
+                                    halos["Halo_y"][covered],
+                                    halos["Halo_z"][covered], GridSize,
+                                    scheme, periodic)
+
+        if weights is None:
+            deposit(grid, cells, luminosity)
+        else:
+            deposit(grid, cells.ravel(),
+                    (weights * luminosity[:, np.newaxis]).ravel())
+
+    return grid, num_halos, num_no_fit
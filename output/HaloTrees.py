@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+"""
+This file contains a toolkit for walking LHalo trees (as read by
+``ReadScripts.read_trees_smallarray()``) without following the pointers halo
+by halo.
+
+The ``Descendant``, ``FirstProgenitor``, ``NextProgenitor``,
+``FirstHaloInFOFgroup`` and ``NextHaloInFOFgroup`` pointers of LHalo trees are
+indices within each tree.  ``build_tree_index()`` converts them (once per file)
+into indices within the file and into CSR-style arrays:
+
+- The progenitors of halo ``i`` are ``progenitors[progenitor_offsets[i]:
+  progenitor_offsets[i+1]]``, in ``NextProgenitor`` order (so the first is
+  the ``FirstProgenitor``).
+- The members of FoF group ``g`` are ``fof_members[fof_offsets[g]:
+  fof_offsets[g+1]]``, in ``NextHaloInFOFgroup`` order (so the first is the
+  central ``FirstHaloInFOFgroup``).
+
+The operations on top of the index (main branches, progenitor counts, mass
+accretion histories and FoF aggregation) work on every tree of the file at
+once.  Pointer chains are ranked with pointer jumping, so the number of
+vectorised passes grows with the logarithm of the chain length rather than
+the number of halos.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+
+import ReadScripts
+
+
+def tree_offsets(HalosPerTree):
+    """
+    Returns the index of the first halo of each tree within the file.
+    """
+
+    HalosPerTree = np.asarray(HalosPerTree, dtype=np.int64)
+
+    return np.concatenate(([0], np.cumsum(HalosPerTree)[:-1]))
+
+
+def _globalise(pointers, offsets):
+    """
+    Converts tree-local pointers into indices within the file.  Pointers of
+    ``-1`` (no such halo) are kept.
+    """
+
+    pointers = np.asarray(pointers, dtype=np.int64)
+
+    return np.where(pointers >= 0, pointers + offsets, -1)
+
+
+def _rank_chains(next_ptr):
+    """
+    Finds the head of, and the position within, the linked list each element
+    belongs to.
+
+    Parameters
+    ----------
+
+    next_ptr : 1D ``np.ndarray`` of integers
+        The next element of each list.  ``-1`` terminates the list.
+
+    Returns
+    ---------
+
+    head : 1D ``np.ndarray`` of integers
+        The first element of the list each element belongs to.
+
+    rank : 1D ``np.ndarray`` of integers
+        Position of each element within its list (the head has rank 0).
+    """
+
+    num_elements = len(next_ptr)
+
+    prev_ptr = np.full(num_elements, -1, dtype=np.int64)
+    has_next = np.nonzero(next_ptr >= 0)[0]
+    prev_ptr[next_ptr[has_next]] = has_next
+
+    rank = (prev_ptr >= 0).astype(np.int64)
+    head = np.where(prev_ptr >= 0, prev_ptr, np.arange(num_elements))
+    jump = prev_ptr.copy()
+
+    # Pointer jumping. After each pass, ``jump`` points twice as far back.
+    active = np.nonzero(jump >= 0)[0]
+    while len(active) > 0:
+        target = jump[active]
+
+        rank[active] += rank[target]
+        head[active] = head[target]
+        jump[active] = jump[target]
+
+        active = active[jump[active] >= 0]
+
+    return head, rank
+
+
+def _csr(groups, rank, num_groups):
+    """
+    Sorts elements by (group, rank) and returns the CSR offsets and the sorted
+    elements.  Elements with ``groups == -1`` are excluded.
+    """
+
+    members = np.nonzero(groups >= 0)[0]
+    order = np.lexsort((rank[members], groups[members]))
+    members = members[order]
+
+    counts = np.bincount(groups[members], minlength=num_groups)
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    return offsets, members
+
+
+def build_tree_index(Halos, HalosPerTree):
+    """
+    Builds the traversal index of a file of trees.
+
+    Parameters
+    ----------
+
+    Halos : Structured ``np.ndarray`` with the LHalo data-type.
+        The halos of the file, e.g., from ``ReadScripts.read_trees_smallarray()``.
+
+    HalosPerTree : 1D ``np.ndarray`` of integers
+        Number of halos within each tree of the file.
+
+    Returns
+    ---------
+
+    index : Dictionary
+        ``tree`` : Tree number of each halo.
+        ``descendant``, ``first_progenitor``, ``next_progenitor``,
+        ``first_in_fof``, ``next_in_fof`` : The pointers as indices within the
+        file (``-1`` if there is no such halo).
+        ``progenitor_offsets``, ``progenitors`` : The progenitors of each halo
+        (CSR, see the module docstring).
+        ``fof_group``, ``fof_heads``, ``fof_offsets``, ``fof_members`` : The
+        FoF group each halo belongs to, the central of each group and the
+        members of each group (CSR, see the module docstring).
+    """
+
+    HalosPerTree = np.asarray(HalosPerTree, dtype=np.int64)
+    num_halos = len(Halos)
+
+    if np.sum(HalosPerTree) != num_halos:
+        raise ValueError("The trees hold {0} halos but {1} halos were "
+                         "passed.".format(np.sum(HalosPerTree), num_halos))
+
+    tree = np.repeat(np.arange(len(HalosPerTree)), HalosPerTree)
+    offsets = tree_offsets(HalosPerTree)[tree]
+
+    index = {"tree" : tree}
+    for key, field in [("descendant", "Descendant"),
+                       ("first_progenitor", "FirstProgenitor"),
+                       ("next_progenitor", "NextProgenitor"),
+                       ("first_in_fof", "FirstHaloInFOFgroup"),
+                       ("next_in_fof", "NextHaloInFOFgroup")]:
+        index[key] = _globalise(Halos[field], offsets)
+
+    # Progenitors are the chains that start at a ``FirstProgenitor``.  The
+    # halo the chain belongs to is the one that points to its head.
+    head, rank = _rank_chains(index["next_progenitor"])
+
+    head_owner = np.full(num_halos, -1, dtype=np.int64)
+    has_progenitor = np.nonzero(index["first_progenitor"] >= 0)[0]
+    head_owner[index["first_progenitor"][has_progenitor]] = has_progenitor
+
+    index["progenitor_offsets"], index["progenitors"] = \
+        _csr(head_owner[head], rank, num_halos)
+
+    # FoF groups are the chains that start at the ``FirstHaloInFOFgroup``.
+    head, rank = _rank_chains(index["next_in_fof"])
+
+    fof_heads, fof_group = np.unique(head, return_inverse=True)
+    fof_group = np.ravel(fof_group)
+
+    index["fof_group"] = fof_group
+    index["fof_heads"] = fof_heads
+    index["fof_offsets"], index["fof_members"] = \
+        _csr(fof_group, rank, len(fof_heads))
+
+    return index
+
+
+def read_tree_index(treedir, file_idx, simulation):
+    """
+    Reads a file of trees and builds its traversal index.  See
+    ``ReadScripts.read_trees_smallarray()`` for the parameters.
+
+    Returns
+    ---------
+
+    Halos : Structured ``np.ndarray`` with the LHalo data-type.
+        The halos of the file.
+
+    index : Dictionary
+        The traversal index, see ``build_tree_index()``.
+    """
+
+    Halos, HalosPerTree = ReadScripts.read_trees_smallarray(treedir, file_idx,
+                                                            simulation)
+
+    return Halos, build_tree_index(Halos, HalosPerTree)
+
+
+def progenitor_counts(index):
+    """
+    Returns the number of (direct) progenitors of each halo.
+    """
+
+    return np.diff(index["progenitor_offsets"])
+
+
+def find_roots(index):
+    """
+    Returns the halos that don't have a descendant, i.e., the end of each
+    branch.
+    """
+
+    return np.nonzero(index["descendant"] < 0)[0]
+
+
+def main_branches(index, roots=None):
+    """
+    Extracts the main branch (following ``FirstProgenitor``) of many halos at
+    once.
+
+    Parameters
+    ----------
+
+    index : Dictionary
+        The traversal index, see ``build_tree_index()``.
+
+    roots : 1D ``np.ndarray`` of integers, optional
+        The halos the branches start from.  If not specified, every halo
+        without a descendant is used (see ``find_roots()``).
+
+    Returns
+    ---------
+
+    branches : 2D ``np.ndarray`` of integers. Shape is (number of roots,
+               length of the longest branch).
+        The halos along each branch, starting from the root.  Padded with
+        ``-1``.
+    """
+
+    if roots is None:
+        roots = find_roots(index)
+
+    roots = np.asarray(roots, dtype=np.int64)
+    first_progenitor = index["first_progenitor"]
+
+    branches = []
+    current = roots
+    while np.any(current >= 0):
+        branches.append(current)
+
+        valid = current >= 0
+        current = np.where(valid, first_progenitor[np.where(valid, current, 0)],
+                           -1)
+
+    if len(branches) == 0:
+        return np.empty((len(roots), 0), dtype=np.int64)
+
+    return np.stack(branches, axis=1)
+
+
+def mass_accretion_histories(Halos, index, roots=None, mass_field="Mvir"):
+    """
+    Calculates the mass accretion history (the mass along the main branch)
+    of many halos at once.
+
+    Parameters
+    ----------
+
+    Halos : Structured ``np.ndarray`` with the LHalo data-type.
+        The halos of the file.
+
+    index : Dictionary
+        The traversal index, see ``build_tree_index()``.
+
+    roots : 1D ``np.ndarray`` of integers, optional
+        See ``main_branches()``.
+
+    mass_field : String, optional
+        The field of ``Halos`` used for the mass.
+
+    Returns
+    ---------
+
+    snapnum : 2D ``np.ndarray`` of integers. Shape is (number of roots,
+              length of the longest branch).
+        The snapshot of each halo along each branch.  Padded with ``-1``.
+
+    mass : 2D ``np.ndarray`` of floats.  Same shape as ``snapnum``.
+        The mass of each halo along each branch.  Padded with ``np.nan``.
+    """
+
+    branches = main_branches(index, roots)
+    valid = branches >= 0
+    safe = np.where(valid, branches, 0)
+
+    snapnum = np.where(valid, Halos["SnapNum"][safe], -1)
+    mass = np.where(valid, Halos[mass_field][safe].astype(np.float64), np.nan)
+
+    return snapnum, mass
+
+
+def fof_aggregate(index, values, op="sum"):
+    """
+    Aggregates a property over the members of every FoF group at once.
+
+    Parameters
+    ----------
+
+    index : Dictionary
+        The traversal index, see ``build_tree_index()``.
+
+    values : 1D ``np.ndarray``
+        The property of each halo.
+
+    op : String, optional
+        ``"sum"``, ``"max"``, ``"min"`` or ``"count"``.
+
+    Returns
+    ---------
+
+    aggregate : 1D ``np.ndarray``.  Length is the number of FoF groups.
+        The aggregated property of each group, ordered as ``index["fof_heads"]``.
+    """
+
+    offsets = index["fof_offsets"]
+
+    if op == "count":
+        return np.diff(offsets)
+
+    ufuncs = {"sum" : np.add, "max" : np.maximum, "min" : np.minimum}
+    if op not in ufuncs:
+        raise ValueError("The FoF aggregation must be one of 'sum', 'max', "
+                         "'min' or 'count'. You specified {0}".format(op))
+
+    if len(offsets) == 1:
+        return np.asarray(values)[:0]
+
+    # Every group has at least one member (its head) so the offsets are
+    # strictly increasing and ``reduceat`` is safe.
+    return ufuncs[op].reduceat(np.asarray(values)[index["fof_members"]],
+                               offsets[:-1])
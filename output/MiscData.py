@@ -6,9 +6,11 @@ Version: 0.1
 
 from __future__ import print_function
 
-import os
+import json
 from natsort import natsorted
 
+import FileLayout as layout
+
 def get_ini_from_dir(directory, alpha_vals = None, beta_vals = None):
 
     SAGE_ini = []
@@ -26,7 +28,9 @@ def get_ini_from_dir(directory, alpha_vals = None, beta_vals = None):
             string = "beta{0:.2f}".format(val)
             beta_vals_strings.append(string)
 
-    for my_file in os.listdir(directory):
+    # The ``.ini`` files may have been written by this process (e.g., by
+    # ``change_params``) after the directory was listed.
+    for my_file in layout.listdir(directory, refresh=True):
         if "SAGE" in my_file:
             if alpha_vals is not None and beta_vals is not None:
                 if not any(val in my_file for val in alpha_vals_strings) or \
@@ -66,3 +70,74 @@ def get_ini_from_dir(directory, alpha_vals = None, beta_vals = None):
     cifog_ini = natsorted(cifog_ini) 
 
     return SAGE_ini, cifog_ini
+
+
+def load_sweep_manifest(fname):
+    """
+    Loads the manifest written by ``utils/change_params.make_sweep()``.
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the manifest.
+
+    Returns
+    ---------
+
+    manifest : Dictionary
+        The templates of the sweep and, in ``runs``, the run id, updated
+        fields and paths (``SAGE_ini``, ``cifog_ini``, ``slurm`` and
+        ``run_directory``) of each run.
+    """
+
+    with open(fname, "r") as f:
+        manifest = json.load(f)
+
+    return manifest
+
+
+def get_ini_from_manifest(fname, select=None):
+    """
+    Finds the ``.ini`` files of the runs in a sweep without listing any
+    directories.
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the manifest, see ``load_sweep_manifest()``.
+
+    select : Dictionary, optional
+        Only the runs whose updated fields have these values are used, e.g.,
+        ``{"alpha" : [0.2, 0.3]}``.  Values can be a single value or a list.
+
+    Returns
+    ---------
+
+    SAGE_ini, cifog_ini : Lists of strings
+        The ``.ini`` files of each run, in the order they were created.
+    """
+
+    manifest = load_sweep_manifest(fname)
+
+    SAGE_ini = []
+    cifog_ini = []
+    for run in manifest["runs"]:
+        fields = dict(run["SAGE_params"])
+        fields.update(run["cifog_params"])
+
+        if select is not None:
+            keep = True
+            for name, values in select.items():
+                if not isinstance(values, (list, tuple)):
+                    values = [values]
+                if fields.get(name) not in values:
+                    keep = False
+            if not keep:
+                continue
+
+        SAGE_ini.append(run["SAGE_ini"])
+        cifog_ini.append(run["cifog_ini"])
+
+    return SAGE_ini, cifog_ini
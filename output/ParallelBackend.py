@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+"""
+This file contains the parallel backends used by the plotting pipeline.  The
+pipeline was originally written against ``mpi4py`` and hard-codes the
+``rank/size/comm`` round-robin pattern.  The backends here let the same driver
+code run on a workstation or CI machine where ``mpirun`` is unavailable.
+
+Three backends are provided:
+
+- ``MPIBackend``, work units are distributed round-robin across the ranks of
+  ``MPI.COMM_WORLD``, exactly as the drivers did before.
+- ``ProcessPoolBackend``, a single "rank" that spreads its work units over
+  every local core using ``concurrent.futures.ProcessPoolExecutor``.
+- ``SerialBackend``, a single rank that processes every work unit in turn.
+
+Every backend exposes ``rank``, ``size`` and a ``comm`` that quacks like an
+``mpi4py.MPI.Intracomm`` (for the non-MPI backends this is ``SerialComm``).
+Hence the existing ``comm.Reduce()``/``comm.bcast()`` calls scattered through
+the pipeline work unchanged on any backend.
+
+The backend can be selected by passing a name to ``get_backend()`` or by
+setting the ``RSAGE_BACKEND`` environment variable to ``mpi``, ``pool`` or
+``serial``.  If neither is set, MPI is used when running under ``mpirun``
+with more than one task, otherwise a process pool is used.
+"""
+
+from __future__ import print_function
+
+import os
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import Prefetch as prefetch
+
+try:
+    from mpi4py import MPI
+    HAVE_MPI = True
+except ImportError:
+    HAVE_MPI = False
+
+
+class _SerialMPI(object):
+    """
+    Stand-in for the ``mpi4py.MPI`` namespace when ``mpi4py`` is not installed.
+    Only the datatypes and operations used by the pipeline are defined. With a
+    single task every reduction is the identity so the values are just tags.
+    """
+
+    INT = "INT"
+    FLOAT = "FLOAT"
+    DOUBLE = "DOUBLE"
+
+    SUM = "SUM"
+    PROD = "PROD"
+    MIN = "MIN"
+    MAX = "MAX"
+
+    COMM_WORLD = None
+
+
+if not HAVE_MPI:
+    MPI = _SerialMPI
+
+
+def _get_buffer(buf):
+    """
+    Strips the (optional) ``mpi4py`` datatype from a buffer specification,
+    e.g., ``[array, MPI.DOUBLE]`` becomes ``array``.
+    """
+
+    if isinstance(buf, (list, tuple)):
+        return buf[0]
+
+    return buf
+
+
+class SerialComm(object):
+    """
+    A single-task communicator with the subset of the ``mpi4py.MPI.Intracomm``
+    interface used by the pipeline.  With one task every collective operation
+    simply hands the local contribution back.
+    """
+
+    def Get_rank(self):
+        return 0
+
+    def Get_size(self):
+        return 1
+
+    def Barrier(self):
+        pass
+
+    barrier = Barrier
+
+    def bcast(self, obj, root=0):
+        return obj
+
+    def reduce(self, sendobj, op=None, root=0):
+        return sendobj
+
+    def allreduce(self, sendobj, op=None):
+        return sendobj
+
+    def gather(self, sendobj, root=0):
+        return [sendobj]
+
+    def allgather(self, sendobj):
+        return [sendobj]
+
+    def Reduce(self, sendbuf, recvbuf, op=None, root=0):
+        recv = _get_buffer(recvbuf)
+        if recv is not None:
+            recv[...] = _get_buffer(sendbuf)
+
+    def Allreduce(self, sendbuf, recvbuf, op=None):
+        self.Reduce(sendbuf, recvbuf, op)
+
+    def Alltoall(self, sendbuf, recvbuf):
+        _get_buffer(recvbuf)[...] = _get_buffer(sendbuf)
+
+    def send(self, obj, dest, tag=0):
+        raise RuntimeError("SerialComm only has a single task; there is no "
+                           "task {0} to send to.".format(dest))
+
+    def recv(self, source=0, tag=0):
+        raise RuntimeError("SerialComm only has a single task; there is no "
+                           "task {0} to receive from.".format(source))
+
+
+def _reduce_nested(reduce_func, data):
+    """
+    Applies ``reduce_func`` to every array/scalar within (possibly nested)
+    lists and dictionaries, preserving the structure.
+    """
+
+    if isinstance(data, dict):
+        return dict((key, _reduce_nested(reduce_func, data[key]))
+                    for key in sorted(data.keys()))
+
+    if isinstance(data, (list, tuple)):
+        return [_reduce_nested(reduce_func, val) for val in data]
+
+    return reduce_func(data)
+
+
+class SerialBackend(object):
+    """
+    Processes every work unit on this process, one after the other.
+
+    Attributes
+    ----------
+
+    name : String
+        Name of the backend.
+
+    comm : ``SerialComm`` or ``mpi4py.MPI.Intracomm``
+        Communicator between the backend tasks.
+
+    rank, size : Integers
+        The rank of this task and the total number of tasks.
+
+    num_workers : Integer
+        The number of processes this task uses to work through its work units.
+    """
+
+    name = "serial"
+
+    def __init__(self):
+        self.comm = SerialComm()
+        self.rank = 0
+        self.size = 1
+        self.num_workers = 1
+
+    def local_units(self, work_units):
+        """
+        Returns the work units that are processed by this task.
+        """
+
+        return list(work_units)
+
+    def map(self, func, work_units, distribute=True, loader=None,
+            prefetch_depth=2, prefetch_bytes=None):
+        """
+        Applies ``func`` to each of the work units owned by this task.
+
+        Parameters
+        ----------
+
+        func : Function
+            Called as ``func(work_unit)`` (or ``func(work_unit, data)`` if
+            ``loader`` is specified).  For the process pool backend this must
+            be picklable (i.e., a module level function or a
+            ``functools.partial`` of one).
+
+        work_units : List
+            Every work unit across all tasks.  Each task only processes its own
+            subset, given by ``local_units()``.
+
+        distribute : Boolean, optional
+            If ``False``, ``work_units`` have already been split across the
+            tasks (e.g., using ``local_units()``) and this task processes all
+            of them.
+
+        loader : Function, optional
+            Called as ``loader(work_unit, pool)`` and returns the data (e.g.,
+            the grids read from disk) that is passed to ``func``.  The data of
+            the upcoming work units is loaded on a background thread while
+            the current one is processed.  See ``Prefetch.prefetch_units()``.
+
+        prefetch_depth : Integer, optional
+            The number of work units that are loaded ahead of time.
+
+        prefetch_bytes : Integer, optional
+            Cap on the memory held by the loaded work units.
+
+        Returns
+        ---------
+
+        Generator yielding ``(work_unit, result)`` tuples for the work units of
+        this task, in the order they appear in ``work_units``.
+        """
+
+        if distribute:
+            work_units = self.local_units(work_units)
+
+        if loader is None:
+            for unit in work_units:
+                yield unit, func(unit)
+            return
+
+        for unit, data in prefetch.prefetch_units(loader, work_units,
+                                                  prefetch_depth,
+                                                  prefetch_bytes):
+            yield unit, func(unit, data)
+
+    def reduce(self, data, op="sum", root=0):
+        """
+        Reduces ``data`` across all tasks onto the ``root`` task.
+
+        Parameters
+        ----------
+
+        data : Scalar, ``np.ndarray`` or nested lists/dictionaries of these.
+            The local contribution of this task.
+
+        op : String, optional
+            The reduction to perform. One of ``"sum"``, ``"min"`` or ``"max"``.
+
+        root : Integer, optional
+            The task that receives the result.
+
+        Returns
+        ---------
+
+        For the ``root`` task, ``data`` reduced over all tasks with the same
+        structure as the input.  For all other tasks, ``None``.
+        """
+
+        return data
+
+    def allreduce(self, data, op="sum"):
+        """
+        As ``reduce()`` except every task receives the result.
+        """
+
+        return data
+
+    def bcast(self, data, root=0):
+        return data
+
+    def gather(self, data, root=0):
+        return [data]
+
+    def barrier(self):
+        pass
+
+
+class ProcessPoolBackend(SerialBackend):
+    """
+    A single task that spreads its work units over the local cores using a
+    ``concurrent.futures.ProcessPoolExecutor``.
+
+    Where possible the worker processes are forked so they inherit the module
+    level state set up by the driver (e.g., ``AllVars.Set_Constants()``), just
+    as every MPI task runs the driver set up itself.
+    """
+
+    name = "pool"
+
+    def __init__(self, max_workers=None):
+        super(ProcessPoolBackend, self).__init__()
+
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.num_workers = max_workers
+
+    def map(self, func, work_units, distribute=True, loader=None,
+            prefetch_depth=2, prefetch_bytes=None):
+
+        if distribute:
+            work_units = self.local_units(work_units)
+        else:
+            work_units = list(work_units)
+
+        # No point paying for the process start up for a single work unit.
+        if self.num_workers == 1 or len(work_units) < 2:
+            for result in SerialBackend.map(self, func, work_units, False,
+                                            loader, prefetch_depth,
+                                            prefetch_bytes):
+                yield result
+            return
+
+        # Each process reads its own work units.  With many processes the
+        # reads of one already overlap with the computation of the others.
+        if loader is not None:
+            func = functools.partial(_load_and_call, func, loader)
+
+        num_workers = min(self.num_workers, len(work_units))
+        if "fork" in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context("fork")
+        else:
+            mp_context = None
+
+        with ProcessPoolExecutor(max_workers=num_workers,
+                                 mp_context=mp_context) as executor:
+            for unit, result in zip(work_units, executor.map(func, work_units)):
+                yield unit, result
+
+
+def _load_and_call(func, loader, work_unit):
+    """
+    Loads the data of a work unit then processes it.  Used by the process pool
+    backend in place of the background read-ahead.
+    """
+
+    return func(work_unit, loader(work_unit, None))
+
+
+class MPIBackend(SerialBackend):
+    """
+    Distributes work units round-robin across the ranks of an ``mpi4py``
+    communicator.
+    """
+
+    name = "mpi"
+
+    def __init__(self, comm=None):
+
+        if not HAVE_MPI:
+            raise RuntimeError("The MPI backend requires mpi4py to be "
+                               "installed.")
+
+        if comm is None:
+            comm = MPI.COMM_WORLD
+
+        self.comm = comm
+        self.rank = comm.Get_rank()
+        self.size = comm.Get_size()
+        self.num_workers = 1
+
+    def local_units(self, work_units):
+        return list(work_units)[self.rank::self.size]
+
+    def _reduce_single(self, data, op, root, all_tasks):
+
+        mpi_op = {"sum" : MPI.SUM, "min" : MPI.MIN, "max" : MPI.MAX}[op]
+
+        # Numeric arrays keep their data-type (mpi4py infers the MPI type), so
+        # every backend returns the same types.  Other arrays are pickled.
+        if isinstance(data, np.ndarray) and data.dtype.kind in "iufc":
+            send = np.ascontiguousarray(data)
+            if all_tasks:
+                recv = np.empty_like(send)
+                self.comm.Allreduce(send, recv, op=mpi_op)
+            else:
+                recv = np.empty_like(send) if self.rank == root else None
+                self.comm.Reduce(send, recv, op=mpi_op, root=root)
+            return recv
+
+        if all_tasks:
+            return self.comm.allreduce(data, op=mpi_op)
+        return self.comm.reduce(data, op=mpi_op, root=root)
+
+    def reduce(self, data, op="sum", root=0):
+
+        result = _reduce_nested(lambda val: self._reduce_single(val, op, root,
+                                                                False), data)
+        if self.rank == root:
+            return result
+        return None
+
+    def allreduce(self, data, op="sum"):
+        return _reduce_nested(lambda val: self._reduce_single(val, op, 0, True),
+                              data)
+
+    def bcast(self, data, root=0):
+        return self.comm.bcast(data, root=root)
+
+    def gather(self, data, root=0):
+        return self.comm.gather(data, root=root)
+
+    def barrier(self):
+        self.comm.Barrier()
+
+
+def get_backend(name=None, max_workers=None):
+    """
+    Selects the parallel backend.
+
+    Parameters
+    ----------
+
+    name : String, optional
+        One of ``"mpi"``, ``"pool"`` or ``"serial"``.  If not specified, the
+        ``RSAGE_BACKEND`` environment variable is checked.  If that is also not
+        set, MPI is used if we're running with more than one MPI task,
+        otherwise a process pool over the local cores.
+
+    max_workers : Integer, optional
+        Number of processes used by the process pool backend.  Defaults to the
+        number of local cores.
+
+    Returns
+    ---------
+
+    backend : ``SerialBackend``, ``ProcessPoolBackend`` or ``MPIBackend``
+        The selected backend.
+    """
+
+    if name is None:
+        name = os.environ.get("RSAGE_BACKEND")
+
+    if name is None:
+        if HAVE_MPI and MPI.COMM_WORLD.Get_size() > 1:
+            name = "mpi"
+        else:
+            name = "pool"
+
+    name = name.lower()
+    if name == "mpi":
+        return MPIBackend()
+    elif name == "pool":
+        return ProcessPoolBackend(max_workers)
+    elif name == "serial":
+        return SerialBackend()
+
+    raise ValueError("Parallel backend must be one of 'mpi', 'pool' or "
+                     "'serial'. You specified {0}".format(name))
+
+
+def backend_from_comm(comm):
+    """
+    Wraps an existing communicator in the matching backend.  Used by functions
+    that are still passed a bare ``comm``.
+    """
+
+    if comm is None or isinstance(comm, SerialComm):
+        return SerialBackend()
+
+    return MPIBackend(comm)
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+"""
+This file contains a store for the time series of power spectra, P(k, z), of
+each model, along with vectorised queries over it.
+
+A store is a dictionary of dense arrays.  For a single model, ``k``, ``P21``,
+``PHII`` (and optionally their errors ``P21_err`` and ``PHII_err``) have shape
+``(num_snaps, num_k)`` and the redshift ``z`` and neutral fraction ``XHI``
+have shape ``(num_snaps,)``.  Stores of several models are stacked along a new
+leading axis with ``stack_pspec_stores()``; models with fewer snapshots or
+wavenumber bins are padded with ``np.nan``.
+
+Every query works on single model and stacked stores alike, returning the
+result for all snapshots (and models) at once:
+
+- ``power_at_k()``, the power at fixed wavenumbers, either from the nearest
+  bin or linearly interpolated between bins.
+- ``power_at_XHI()``, the spectra at the snapshots closest to fixed neutral
+  fractions.
+- ``scale_slope()``, the slope of the power between a large and small scale.
+
+A store is saved to (and loaded from) a single ``.npz`` file with
+``save_pspec_store()`` and ``load_pspec_store()``.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+
+# The arrays that have a wavenumber axis.
+SPECTRA_KEYS = ["k", "P21", "PHII", "P21_err", "PHII_err"]
+
+# The arrays with one value per snapshot.
+SNAPSHOT_KEYS = ["z", "XHI"]
+
+
+def _pad_rows(rows, num_cols=None):
+    """
+    Stacks a list of 1D arrays (of possibly different lengths) into a 2D
+    array, padding the short rows with ``np.nan``.
+    """
+
+    if num_cols is None:
+        num_cols = max([len(row) for row in rows] + [0])
+
+    stacked = np.full((len(rows), num_cols), np.nan)
+    for row_idx, row in enumerate(rows):
+        stacked[row_idx, :len(row)] = row
+
+    return stacked
+
+
+def build_pspec_store(k, P21, PHII, z=None, XHI=None, P21_err=None,
+                      PHII_err=None):
+    """
+    Builds the power spectrum store of a single model.
+
+    Parameters
+    ----------
+
+    k : 2D nested list of floats. Outer length is number of snapshots, inner
+        is number of wavenumber bins.
+        Wavenumber the spectra are binned on (units of h/Mpc).
+
+    P21, PHII : 2D nested lists of floats. Dimensions are identical to ``k``.
+        The 21cm and HII power spectra at each snapshot.
+
+    z, XHI : Lists of floats, optional. Length is number of snapshots.
+        The redshift and neutral fraction at each snapshot.
+
+    P21_err, PHII_err : 2D nested lists of floats, optional. Dimensions are
+                        identical to ``k``.
+        The errors on the power spectra.
+
+    Returns
+    ---------
+
+    store : Dictionary
+        The dense arrays. Quantities that weren't specified are ``None``.
+    """
+
+    spectra = {"k" : k, "P21" : P21, "PHII" : PHII, "P21_err" : P21_err,
+               "PHII_err" : PHII_err}
+    num_k = max([len(row) for row in k] + [0])
+
+    store = {}
+    for key in SPECTRA_KEYS:
+        if spectra[key] is None:
+            store[key] = None
+        else:
+            store[key] = _pad_rows(spectra[key], num_k)
+
+    for key, values in zip(SNAPSHOT_KEYS, [z, XHI]):
+        if values is None:
+            store[key] = None
+        else:
+            store[key] = np.array(values, dtype=np.float64)[:len(k)]
+
+    return store
+
+
+def stack_pspec_stores(stores):
+    """
+    Stacks the stores of several models along a new leading axis.
+
+    Parameters
+    ----------
+
+    stores : List of dictionaries
+        The store of each model, created with ``build_pspec_store()``.
+
+    Returns
+    ---------
+
+    store : Dictionary
+        The stacked arrays, padded with ``np.nan``.  Quantities that are
+        missing from any of the models are ``None``.  ``num_snaps`` holds the
+        number of snapshots of each model.
+    """
+
+    num_snaps = np.array([len(store["k"]) for store in stores], dtype=np.int64)
+    max_snaps = max(list(num_snaps) + [0])
+    max_k = max([store["k"].shape[1] for store in stores if store["k"].size] +
+                [0])
+
+    stacked = {"num_snaps" : num_snaps}
+    for key in SPECTRA_KEYS + SNAPSHOT_KEYS:
+        if any(store[key] is None for store in stores):
+            stacked[key] = None
+            continue
+
+        if key in SPECTRA_KEYS:
+            values = np.full((len(stores), max_snaps, max_k), np.nan)
+            for model_number, store in enumerate(stores):
+                rows, cols = store[key].shape
+                values[model_number, :rows, :cols] = store[key]
+        else:
+            values = _pad_rows([store[key] for store in stores], max_snaps)
+
+        stacked[key] = values
+
+    return stacked
+
+
+def save_pspec_store(fname, store):
+    """
+    Saves a store (of a single model or stacked) to a single ``.npz`` file.
+    """
+
+    arrays = dict((key, value) for key, value in store.items()
+                  if value is not None)
+    np.savez(fname, **arrays)
+
+
+def load_pspec_store(fname):
+    """
+    Loads a store saved with ``save_pspec_store()``.
+    """
+
+    with np.load(fname) as data:
+        store = dict((key, data[key]) for key in data.files)
+
+    for key in SPECTRA_KEYS + SNAPSHOT_KEYS:
+        store.setdefault(key, None)
+
+    return store
+
+
+def nearest_k_idx(k, k_values):
+    """
+    Finds the wavenumber bin closest to each of ``k_values`` at every snapshot.
+
+    Parameters
+    ----------
+
+    k : ``np.ndarray`` of floats. Shape is ``(..., num_k)``.
+        The wavenumber bins.
+
+    k_values : List of floats.
+        The wavenumbers we want.
+
+    Returns
+    ---------
+
+    idx : ``np.ndarray`` of integers. Shape is ``(..., len(k_values))``.
+        Index of the closest bin.
+    """
+
+    k_values = np.atleast_1d(np.asarray(k_values, dtype=np.float64))
+
+    dist = np.abs(k[..., np.newaxis] - k_values)
+    dist[np.isnan(dist)] = np.inf
+
+    return np.argmin(dist, axis=-2)
+
+
+def power_at_k(store, k_values, quantity="P21", interpolate=False):
+    """
+    Finds the power at fixed wavenumbers at every snapshot (and model).
+
+    Parameters
+    ----------
+
+    store : Dictionary
+        The store, see ``build_pspec_store()`` or ``stack_pspec_stores()``.
+
+    k_values : List of floats.
+        The wavenumbers (in h/Mpc) we want the power at.
+
+    quantity : String, optional
+        The spectrum to query, e.g., ``"P21"``, ``"PHII"`` or ``"P21_err"``.
+
+    interpolate : Boolean, optional
+        If ``True``, the power is linearly interpolated between the two bins
+        either side of each wavenumber (and the end bins are extrapolated).
+        Otherwise the power of the closest bin is used.
+
+    Returns
+    ---------
+
+    k_found : ``np.ndarray`` of floats. Shape is ``(..., num_snaps,
+              len(k_values))``.
+        The wavenumber of the closest bin, or ``k_values`` if interpolating.
+
+    power : ``np.ndarray`` of floats. Same shape as ``k_found``.
+        The power at each wavenumber.
+    """
+
+    k = store["k"]
+    spectrum = store[quantity]
+    k_values = np.atleast_1d(np.asarray(k_values, dtype=np.float64))
+
+    if not interpolate:
+        idx = nearest_k_idx(k, k_values)
+        k_found = np.take_along_axis(k, idx, axis=-1)
+        power = np.take_along_axis(spectrum, idx, axis=-1)
+
+        return k_found, power
+
+    # The bins are increasing so the number of valid bins below each
+    # wavenumber gives the upper bin to interpolate between.
+    num_valid = np.sum(np.isfinite(k), axis=-1)[..., np.newaxis]
+    upper = np.sum(k[..., np.newaxis] < k_values, axis=-2)
+    upper = np.clip(upper, 1, np.maximum(num_valid - 1, 1))
+    lower = upper - 1
+
+    k_low = np.take_along_axis(k, lower, axis=-1)
+    k_high = np.take_along_axis(k, upper, axis=-1)
+    power_low = np.take_along_axis(spectrum, lower, axis=-1)
+    power_high = np.take_along_axis(spectrum, upper, axis=-1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        frac = (k_values - k_low) / (k_high - k_low)
+    power = power_low + frac*(power_high - power_low)
+
+    k_found = np.broadcast_to(k_values, power.shape).copy()
+    k_found[np.isnan(power)] = np.nan
+
+    return k_found, power
+
+
+def power_at_XHI(store, XHI_values, quantity="P21"):
+    """
+    Finds the spectra at the snapshots with neutral fraction closest to fixed
+    values.
+
+    Parameters
+    ----------
+
+    store : Dictionary
+        The store, see ``build_pspec_store()`` or ``stack_pspec_stores()``.
+        Must hold the neutral fraction ``XHI``.
+
+    XHI_values : List of floats.
+        The neutral fractions we want the spectra at.
+
+    quantity : String, optional
+        The spectrum to return.
+
+    Returns
+    ---------
+
+    snap_idx : ``np.ndarray`` of integers. Shape is ``(..., len(XHI_values))``.
+        The snapshot closest to each neutral fraction.
+
+    k, spectra : ``np.ndarray`` of floats. Shape is ``(...,
+                 len(XHI_values), num_k)``.
+        The wavenumber bins and spectra at those snapshots.
+    """
+
+    if store["XHI"] is None:
+        raise ValueError("The store doesn't have the neutral fractions.")
+
+    XHI_values = np.atleast_1d(np.asarray(XHI_values, dtype=np.float64))
+
+    dist = np.abs(store["XHI"][..., np.newaxis] - XHI_values)
+    dist[np.isnan(dist)] = np.inf
+    snap_idx = np.argmin(dist, axis=-2)
+
+    gather_idx = snap_idx[..., np.newaxis]
+    k = np.take_along_axis(store["k"], gather_idx, axis=-2)
+    spectra = np.take_along_axis(store[quantity], gather_idx, axis=-2)
+
+    return snap_idx, k, spectra
+
+
+def scale_slope(store, small_scale_def, large_scale_def, quantity="P21",
+                interpolate=False):
+    """
+    Calculates the slope of the power between a large and small scale at every
+    snapshot (and model).
+
+    Parameters
+    ----------
+
+    store : Dictionary
+        The store, see ``build_pspec_store()`` or ``stack_pspec_stores()``.
+
+    small_scale_def, large_scale_def : Floats.
+        The wavenumbers (in h/Mpc) of the small and large scale.
+
+    quantity : String, optional
+        The spectrum to use.
+
+    interpolate : Boolean, optional
+        See ``power_at_k()``.
+
+    Returns
+    ---------
+
+    slope : ``np.ndarray`` of floats. Shape is ``(..., num_snaps)``.
+        The change in power divided by the change in wavenumber.
+    """
+
+    k_found, power = power_at_k(store, [small_scale_def, large_scale_def],
+                                quantity, interpolate)
+
+    return (power[..., 1] - power[..., 0]) / (k_found[..., 1] - k_found[..., 0])
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+"""
+This file contains the background read-ahead used by the plotting pipeline.
+While one work unit (e.g., a batch of galaxies or the grids of a snapshot) is
+being processed, the next ones are read on a background thread so the file
+I/O overlaps with the computation.
+
+The data is read into buffers from a ``BufferPool``.  Buffers are handed back
+to the pool once the consumer has finished with an item, so the same memory
+is re-used for every item rather than allocating fresh arrays for each read.
+The pool also caps the total memory held by items that are queued or being
+processed.
+"""
+
+from __future__ import print_function
+
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+
+class BufferPool(object):
+    """
+    A pool of re-usable byte buffers with an (optional) cap on the total size
+    of the buffers that are handed out at any one time.
+
+    Parameters
+    ----------
+
+    max_bytes : Integer, optional
+        The memory budget of the buffers that are handed out at once.
+        ``wait_for_space()`` blocks while this is exceeded.  If not specified,
+        there is no cap.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+
+        self._free = []
+        self._in_use = {}
+        self._bytes_in_use = 0
+        self._cond = threading.Condition()
+
+    def get(self, nbytes):
+        """
+        Hands out a buffer.
+
+        Parameters
+        ----------
+
+        nbytes : Integer
+            The number of bytes required.
+
+        Returns
+        ---------
+
+        buf : ``np.ndarray`` of ``np.uint8``
+            A buffer of exactly ``nbytes``.  Views of this buffer (e.g., using
+            ``buf.view(dtype)``) can be passed to ``release()``.
+        """
+
+        with self._cond:
+            # Re-use the smallest free buffer that is large enough.
+            base = None
+            for idx, free_buf in enumerate(self._free):
+                if free_buf.nbytes >= nbytes and \
+                   (base is None or free_buf.nbytes < base.nbytes):
+                    base = free_buf
+                    base_idx = idx
+
+            if base is None:
+                base = np.empty(nbytes, dtype=np.uint8)
+            else:
+                del self._free[base_idx]
+
+            self._in_use[id(base)] = base
+            self._bytes_in_use += base.nbytes
+
+        return base[:nbytes]
+
+    def wait_for_space(self):
+        """
+        Blocks until the buffers in use are within the memory budget.  Called
+        before reading each item, so an item is never split by the wait and at
+        most one item beyond the budget is held at a time.
+        """
+
+        with self._cond:
+            while self.max_bytes is not None and \
+                  self._bytes_in_use >= self.max_bytes:
+                self._cond.wait()
+
+    def release(self, arr):
+        """
+        Returns the buffer that ``arr`` was created from to the pool.  Arrays
+        that did not come from this pool are ignored.
+        """
+
+        base = arr
+        while isinstance(base, np.ndarray) and base.base is not None:
+            base = base.base
+
+        with self._cond:
+            base = self._in_use.pop(id(base), None)
+            if base is None:
+                return
+
+            self._bytes_in_use -= base.nbytes
+            self._free.append(base)
+            self._cond.notify_all()
+
+    def release_all(self, data):
+        """
+        Releases every array within (possibly nested) lists, tuples and
+        dictionaries.
+        """
+
+        if isinstance(data, dict):
+            for key in data:
+                self.release_all(data[key])
+        elif isinstance(data, (list, tuple)):
+            for val in data:
+                self.release_all(val)
+        elif isinstance(data, np.ndarray):
+            self.release(data)
+
+
+class _Raised(object):
+    """
+    Passes an exception raised by the background thread to the consumer.
+    """
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+_END = object()
+
+
+class Prefetcher(object):
+    """
+    Iterates over ``items`` with the items produced on a background thread up
+    to ``depth`` items ahead of the consumer.
+
+    An item is only valid until the consumer asks for the next one; its arrays
+    are then released back to ``pool``.
+
+    Parameters
+    ----------
+
+    items : Iterable
+        Produces the items, e.g., a generator that reads files.  It is only
+        iterated over on the background thread.
+
+    depth : Integer, optional
+        The maximum number of items that are read ahead.  If 0, items are
+        produced on the calling thread without any read-ahead.
+
+    pool : ``BufferPool``, optional
+        The pool the arrays of each item are allocated from.
+    """
+
+    def __init__(self, items, depth=2, pool=None):
+        self.items = items
+        self.depth = depth
+        self.pool = pool
+
+        self._stop = threading.Event()
+
+    def _produce(self, out_queue):
+
+        try:
+            items = iter(self.items)
+            while True:
+                if self.pool is not None:
+                    self.pool.wait_for_space()
+                if self._stop.is_set():
+                    return
+
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+
+                # Don't block forever if the consumer has stopped.
+                while not self._stop.is_set():
+                    try:
+                        out_queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if self._stop.is_set():
+                    return
+        except Exception as exc:
+            out_queue.put(_Raised(exc))
+            return
+
+        out_queue.put(_END)
+
+    def _release(self, item):
+        if self.pool is not None:
+            self.pool.release_all(item)
+
+    def __iter__(self):
+
+        if self.depth == 0:
+            for item in self.items:
+                yield item
+                self._release(item)
+            return
+
+        out_queue = queue.Queue(maxsize=self.depth)
+        thread = threading.Thread(target=self._produce, args=(out_queue,))
+        thread.daemon = True
+        thread.start()
+
+        item = None
+        try:
+            while True:
+                item = out_queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, _Raised):
+                    raise item.exc
+
+                yield item
+                self._release(item)
+                item = None
+        finally:
+            # If the consumer stopped early, free the producer (which may be
+            # waiting on the pool for the memory held by the current item).
+            self._stop.set()
+            if item is not None:
+                self._release(item)
+            while thread.is_alive():
+                try:
+                    self._release(out_queue.get(timeout=0.1))
+                except queue.Empty:
+                    pass
+            thread.join()
+
+
+def prefetch_units(loader, work_units, depth=2, max_bytes=None):
+    """
+    Loads the data of each work unit ahead of time on a background thread.
+
+    Parameters
+    ----------
+
+    loader : Function
+        Called as ``loader(work_unit, pool)`` and returns the data of the work
+        unit.  Arrays should be allocated from ``pool`` (e.g., by passing it
+        to ``ReadScripts.read_binary_grid()``) so they are re-used.
+
+    work_units : List
+        The work units, in the order they are processed.
+
+    depth : Integer, optional
+        The maximum number of work units that are read ahead.
+
+    max_bytes : Integer, optional
+        Cap on the memory held by the loaded work units.
+
+    Returns
+    ---------
+
+    Generator yielding ``(work_unit, data)`` tuples.  ``data`` is only valid
+    until the next work unit is requested.
+    """
+
+    pool = BufferPool(max_bytes)
+    items = ((unit, loader(unit, pool)) for unit in work_units)
+
+    for unit, data in Prefetcher(items, depth, pool):
+        yield unit, data
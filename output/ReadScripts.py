@@ -6,6 +6,9 @@ import os
 import numpy as np
 import math
 
+import GridCompress as gridcompress
+import FileLayout as layout
+
 
 def Read_SAGE_header(model_name, fnr):
 
@@ -178,7 +181,22 @@ def get_num_subfind_halos(fname):
 
     return N_groups_allfile
 
-def ReadGals_SAGE(DirName, fnr, MAXSNAPS, comm=None):
+def get_galaxy_dtype(MAXSNAPS):
+    """
+    Returns the ``numpy`` dtype of the galaxies written by ``SAGE``.
+
+    Parameters
+    ----------
+
+    MAXSNAPS : Integer
+        The number of snapshots tracked by each galaxy. 
+
+    Returns
+    ---------
+
+    Gal_Desc : ``np.dtype``
+        The (aligned) structure of a single galaxy.
+    """
 
     Galdesc_full = [ 
          ('TreeNr', np.int32),
@@ -213,9 +231,148 @@ def ReadGals_SAGE(DirName, fnr, MAXSNAPS, comm=None):
     names = [Galdesc_full[i][0] for i in range(len(Galdesc_full))]
     formats = [Galdesc_full[i][1] for i in range(len(Galdesc_full))] 
     Gal_Desc = np.dtype({'names':names, 'formats':formats}, align=True)  
+
+    return Gal_Desc
+
+
+def ReadGals_SAGE(DirName, fnr, MAXSNAPS, comm=None):
+
+    Gal_Desc = get_galaxy_dtype(MAXSNAPS)
  
     return (Read_SAGE_Objects(DirName, Gal_Desc, 1, 0, fnr, comm), Gal_Desc)
 
+
+def read_SAGE_objects_chunked(fname, Object_Desc, max_bytes=None,
+                              by_tree=False, pool=None):
+    """
+    Reads the objects (e.g., galaxies) of a ``SAGE`` file in batches, so that
+    only a bounded amount of memory is needed regardless of the size of the
+    file.
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the file.
+
+    Object_Desc : ``np.dtype``
+        The structure of a single object, e.g., from ``get_galaxy_dtype()``.
+
+    max_bytes : Integer, optional
+        The (approximate) memory budget of a single batch in bytes.  If not
+        specified, the entire file is read as a single batch.
+
+    by_tree : Boolean, optional
+        If ``True``, batches only contain whole trees (using ``GalsPerTree``
+        from the header).  A single tree larger than ``max_bytes`` is read
+        as its own batch.  Otherwise batches contain a fixed number of
+        objects.
+
+    pool : ``Prefetch.BufferPool``, optional
+        If specified, each batch is read into a buffer from this pool rather
+        than a newly allocated array.  The batch should be released back to
+        the pool once it's no longer needed.
+
+    Returns
+    ---------
+
+    Generator yielding ``np.recarray`` batches of the objects, in the order
+    they appear in the file.
+    """
+
+    if not os.path.isfile(fname):
+        print("File\t%s  \tdoes not exist!  Skipping..." % (fname))
+        raise RuntimeError
+
+    with open(fname, "rb") as fin:
+
+        # Skip the header values (starting with Nsubsteps) to get to the tree
+        # information.
+        fin.seek(4, os.SEEK_CUR)
+        Nsnap = np.fromfile(fin, np.dtype(np.int32), 1)
+        fin.seek(8 * (int(Nsnap) + 6) + 4, os.SEEK_CUR)
+
+        Ntrees = np.fromfile(fin, np.dtype(np.int32), 1)[0]
+        NtotHalos = np.fromfile(fin, np.dtype(np.int32), 1)[0]
+        GalsPerTree = np.fromfile(fin, np.dtype((np.int32, Ntrees)), 1)[0]
+
+        if max_bytes is None:
+            batch_size = NtotHalos
+        else:
+            batch_size = max(int(max_bytes // Object_Desc.itemsize), 1)
+
+        # Determine how many objects are in each batch.
+        if by_tree and Ntrees > 0:
+            batch_counts = []
+            count = 0
+            for tree_count in GalsPerTree:
+                if count > 0 and count + tree_count > batch_size:
+                    batch_counts.append(count)
+                    count = 0
+                count += tree_count
+            batch_counts.append(count)
+        else:
+            num_full = NtotHalos // batch_size
+            batch_counts = [batch_size] * num_full
+            if NtotHalos - num_full * batch_size > 0:
+                batch_counts.append(NtotHalos - num_full * batch_size)
+
+        for count in batch_counts:
+            if count == 0:
+                continue
+            if pool is None:
+                G = np.fromfile(fin, Object_Desc, count)
+            else:
+                G = pool.get(count * Object_Desc.itemsize)
+                if fin.readinto(memoryview(G)) != G.nbytes:
+                    pool.release(G)
+                    raise ValueError("File {0} is shorter than its header "
+                                     "specifies.".format(fname))
+                G = G.view(Object_Desc)
+            yield G.view(np.recarray)
+
+
+def ReadGals_SAGE_chunked(DirName, fnr, MAXSNAPS, max_bytes=None,
+                          by_tree=False, pool=None):
+    """
+    As ``ReadGals_SAGE()`` except the galaxies are read in batches.  See
+    ``read_SAGE_objects_chunked()`` for details.
+
+    Parameters
+    ----------
+
+    DirName : String
+        Base name of the galaxy files.  The file number is appended as
+        ``<DirName>_<fnr>``.
+
+    fnr : Integer
+        The file number being read.
+
+    MAXSNAPS : Integer
+        The number of snapshots tracked by each galaxy. 
+
+    max_bytes : Integer, optional
+        The (approximate) memory budget of a single batch in bytes.  If not
+        specified, the entire file is read as a single batch.
+
+    by_tree : Boolean, optional
+        If ``True``, batches only contain whole trees.
+
+    pool : ``Prefetch.BufferPool``, optional
+        If specified, each batch is read into a buffer from this pool.
+
+    Returns
+    ---------
+
+    Generator yielding ``np.recarray`` batches of galaxies.
+    """
+
+    Gal_Desc = get_galaxy_dtype(MAXSNAPS)
+    fname = "{0}_{1}".format(DirName, fnr)
+
+    return read_SAGE_objects_chunked(fname, Gal_Desc, max_bytes, by_tree,
+                                     pool)
+
 def Join_Arrays(Array1, Array2, Desc):
 
     G = np.empty(len(Array1) + len(Array2), Desc) # Create an empty array with enough space to hold both arrays.
@@ -228,31 +385,35 @@ def Join_Arrays(Array1, Array2, Desc):
     return G
 
 
-def read_binary_grid(filepath, GridSize, precision, reshape=True):
-    '''
-    Reads a cubic, Cartesian grid that was stored in binary.
-    NOTE: Assumes the grid has equal number of cells in each dimension.
+def check_binary_grid(filepath, GridSize, precision):
+    """
+    Determines the data type of a binary grid and checks that the file has the
+    expected size.
 
     Parameters
     ----------
-    filepath : string
-        Location of the grid file
-    GridSize : integer
-        Number of cells along one dimension.  Grid is assumed to be saved in the form N*N*N. 
-    precision : integer
-        Denotes the precision of the data being read in.
-        0 : Integer (4 bytes)
-        1 : Float (4 bytes)
-        2 : Double (8 bytes)
-    reshape : boolean
-        Controls whether the array should be reshaped into a cubic array of shape (GridSize, GridSize, GridSize) or kepts as a 1D array.
-        Default: True.
+
+    filepath, GridSize, precision : See ``read_binary_grid()``.
 
     Returns
-    -------
-    grid : `np.darray'
-	The read in grid as a numpy object.  Shape will be N*N*N.
-    '''
+    ---------
+
+    readformat : ``numpy`` data type
+        The data type of each cell.
+
+    expected_size : Integer
+        The size of the (uncompressed) grid in bytes.
+    """
+
+    # Compressed grids record their own size and precision.
+    if gridcompress.is_compressed_grid(filepath):
+        grid = gridcompress.CompressedGrid(filepath)
+        if grid.GridSize != GridSize or grid.precision != precision:
+            raise ValueError("Compressed grid {0} has a grid size of {1} and "
+                             "precision {2} whereas we expected {3} and {4}."
+                             .format(filepath, grid.GridSize, grid.precision,
+                                     GridSize, precision))
+        return grid.dtype.type, GridSize**3 * grid.dtype.itemsize
 
     ## Set the format the input file is in. ##
     readformat = 'None'
@@ -270,7 +431,7 @@ def read_binary_grid(filepath, GridSize, precision, reshape=True):
         raise ValueError("Only 0, 1, 2 (corresponding to integers, float or doubles respectively) are currently supported.")
 
     ## Check that the file is the correct size. ##
-    filesize = os.stat(filepath).st_size
+    filesize = layout.file_size(filepath)
     expected_size = GridSize*GridSize*GridSize*byte_size   
 
     if(expected_size != filesize):
@@ -278,11 +439,178 @@ def read_binary_grid(filepath, GridSize, precision, reshape=True):
               "{2} bytes".format(filepath, filesize, expected_size)) 
         raise ValueError("Mismatch between size of file and expected size.")
 
-    fd = open(filepath, 'rb')
-    grid = np.fromfile(fd, count = GridSize**3, dtype = readformat) 
+    return readformat, expected_size
+
+
+def memmap_binary_grid(filepath, GridSize, precision):
+    """
+    Memory maps a cubic, Cartesian grid that was stored in binary.  Cells are
+    only read from disk when they're accessed, so the grid can be processed in
+    chunks without holding it in memory.
+
+    Parameters
+    ----------
+
+    filepath, GridSize, precision : See ``read_binary_grid()``.
+
+    Returns
+    ---------
+
+    grid : ``np.memmap`` or ``GridCompress.CompressedGrid``
+        Read-only, flat (1D) array of the ``GridSize**3`` cells in the order
+        they are stored on disk.  For compressed grids, an object that
+        decompresses the cells as they're sliced.
+    """
+
+    readformat, _ = check_binary_grid(filepath, GridSize, precision)
+
+    if gridcompress.is_compressed_grid(filepath):
+        return gridcompress.CompressedGrid(filepath)
+
+    return np.memmap(filepath, dtype=readformat, mode="r",
+                     shape=(GridSize**3,))
+
+
+def grid_level_path(filepath, level, method="mean"):
+    """
+    The path of a reduced resolution level of a binary grid.  The levels are
+    built by ``GridPyramid.build_grid_pyramid()``.
+
+    Parameters
+    ----------
+
+    filepath : String
+        Location of the (full resolution) grid file.
+
+    level : Integer
+        The level has ``GridSize / 2^level`` cells along each side.
+
+    method : String, optional
+        How the cells of the level were combined, ``"mean"`` or ``"max"``.
+
+    Returns
+    ---------
+
+    level_path : String
+        Location of the level.
+    """
+
+    return "{0}.L{1}_{2}".format(filepath, level, method)
+
+
+def read_binary_grid(filepath, GridSize, precision, reshape=True, pool=None,
+                     dtype=None, level=0, level_method="mean"):
+    '''
+    Reads a cubic, Cartesian grid that was stored in binary.
+    NOTE: Assumes the grid has equal number of cells in each dimension.
+    Grids may be raw or compressed by `GridCompress.py'; either is read transparently.
+
+    Parameters
+    ----------
+    filepath : string
+        Location of the grid file
+    GridSize : integer
+        Number of cells along one dimension.  Grid is assumed to be saved in the form N*N*N. 
+    precision : integer
+        Denotes the precision of the data being read in.
+        0 : Integer (4 bytes)
+        1 : Float (4 bytes)
+        2 : Double (8 bytes)
+    reshape : boolean
+        Controls whether the array should be reshaped into a cubic array of shape (GridSize, GridSize, GridSize) or kepts as a 1D array.
+        Default: True.
+    pool : `Prefetch.BufferPool', optional
+        If specified, the grid is read into a buffer from this pool rather than a newly allocated array.
+        The grid should be released back to the pool once it's no longer needed.
+    dtype : `numpy' data type, optional
+        If specified (and different to the precision of the file), the grid is converted to this type as it is read.
+        The file is read in chunks so a full grid of the file's precision is never held in memory.
+    level : integer, optional
+        If non-zero, the reduced resolution copy of the grid with GridSize / 2^level cells along each side is read instead.
+        These are built by `GridPyramid.py'.  GridSize is still the size of the full resolution grid.
+    level_method : string, optional
+        Whether to read the mean ("mean") or max ("max") pooled copy of the grid.  Only used if level is non-zero.
+
+    Returns
+    -------
+    grid : `np.darray'
+	The read in grid as a numpy object.  Shape will be N*N*N.
+    '''
+
+    if level > 0:
+        if GridSize % 2**level != 0:
+            raise ValueError("The grid size {0} is not divisible by 2^{1} so "
+                             "there is no level {1}.".format(GridSize, level))
+
+        filepath = grid_level_path(filepath, level, level_method)
+        GridSize = GridSize // 2**level
+
+        if not layout.exists(filepath):
+            raise IOError("The level {0} grid {1} does not exist. Build it "
+                          "with GridPyramid.py first.".format(level, filepath))
+
+    readformat, expected_size = check_binary_grid(filepath, GridSize, precision)
+
+    # Compressed grids (see `GridCompress.py') are decompressed straight into
+    # the output array.
+    if gridcompress.is_compressed_grid(filepath):
+        if dtype is None:
+            dtype = readformat
+        dtype = np.dtype(dtype)
+
+        if pool is None:
+            grid = np.empty(GridSize**3, dtype=dtype)
+        else:
+            grid = pool.get(GridSize**3 * dtype.itemsize).view(dtype)
+
+        gridcompress.CompressedGrid(filepath).read(0, GridSize**3, out=grid)
+        if (reshape == True):
+            grid = np.reshape(grid, (GridSize, GridSize, GridSize), order="F") 
+        return grid
+
+    if dtype is not None and np.dtype(dtype) != np.dtype(readformat):
+        grid = _read_binary_grid_converted(filepath, GridSize, readformat,
+                                           dtype, pool)
+        if (reshape == True):
+            grid = np.reshape(grid, (GridSize, GridSize, GridSize), order="F") 
+        return grid
+
+    with open(filepath, 'rb') as fd:
+        if pool is None:
+            grid = np.fromfile(fd, count = GridSize**3, dtype = readformat) 
+        else:
+            grid = pool.get(expected_size)
+            if fd.readinto(memoryview(grid)) != expected_size:
+                pool.release(grid)
+                raise ValueError("File {0} is shorter than the expected {1} "
+                                 "bytes.".format(filepath, expected_size))
+            grid = grid.view(readformat)
     if (reshape == True):
         grid = np.reshape(grid, (GridSize, GridSize, GridSize), order="F") 
-    fd.close()
+
+    return grid
+
+
+def _read_binary_grid_converted(filepath, GridSize, readformat, dtype, pool,
+                                chunk_cells=2**22):
+    """
+    Reads a binary grid in chunks, converting each chunk to ``dtype``.  Used by
+    ``read_binary_grid()``.
+    """
+
+    num_cells = GridSize**3
+    dtype = np.dtype(dtype)
+
+    if pool is None:
+        grid = np.empty(num_cells, dtype=dtype)
+    else:
+        grid = pool.get(num_cells * dtype.itemsize).view(dtype)
+
+    with open(filepath, 'rb') as fd:
+        for low_idx in range(0, num_cells, chunk_cells):
+            count = min(chunk_cells, num_cells - low_idx)
+            grid[low_idx:low_idx+count] = np.fromfile(fd, count=count,
+                                                      dtype=readformat)
 
     return grid
 
@@ -342,12 +670,7 @@ def read_trees_smallarray(treedir, file_idx, simulation):
     formats = [Halo_Desc_full[i][1] for i in range(len(Halo_Desc_full))]
     Halo_Desc = np.dtype({'names':names, 'formats':formats}, align=True)
 
-    if (simulation == 0 or simulation == 1 or simulation == 4):
-        fname = "{0}/subgroup_trees_{1:03d}.dat".format(treedir, file_idx)
-    elif (simulation == 2 or simulation == 3):
-        fname = "{0}/lhalotree.bin.{1}".format(treedir, file_idx)
-    else:
-        raise ValueError("Invalid simulation option chosen.")
+    fname = layout.tree_path(treedir, file_idx, simulation)
 
     print("Reading for file {0}".format(fname)) 
     fin = open(fname, 'rb')  # Open the file
@@ -408,29 +731,62 @@ def load_data(fname):
     else:               
         return data['arr_0']
 
-def read_SAGE_ini(fname):
-    """    
-    Reads the ``SAGE`` ``.ini`` file into a dictionary containing the parameter
-    values.
+# The parsed ``.ini`` files, keyed by (absolute path, parser).  Values are the
+# (modification time, size) of the file when it was parsed and the result.
+_ini_cache = {}
+
+
+def cached_ini(fname, parser):
+    """
+    Parses a file once.  The result is reused until the modification time or
+    size of the file changes, so scanning many ``.ini`` files (or reading the
+    same one from many places) only parses each once.
 
     Parameters
     ----------
 
     fname : String
-        Path to the ``SAGE`` ``.ini`` file.         
+        Path to the file.
+
+    parser : Function
+        Called as ``parser(fname)`` when the file needs to be parsed.
 
     Returns
     ---------
 
-    SAGE_dict : Dictionary
-        Dictionary keyed by the ``SAGE`` parameter field names and containing 
-        the values from the ``.ini`` file. 
+    parsed : Whatever ``parser`` returns.
+        The cached result.  It is shared between callers so it must not be
+        modified.
 
     Errors 
     ---------
 
-    RuntimeError
-        Raised if the specified ``SAGE`` ``.ini`` file not found.
+    FileNotFoundError
+        Raised if the file does not exist.
+    """
+
+    stat = os.stat(fname)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = (os.path.abspath(fname), parser)
+
+    if key not in _ini_cache or _ini_cache[key][0] != signature:
+        _ini_cache[key] = (signature, parser(fname))
+
+    return _ini_cache[key][1]
+
+
+def clear_ini_cache():
+    """
+    Drops every cached ``.ini`` file.
+    """
+
+    _ini_cache.clear()
+
+
+def _parse_SAGE_ini(fname):
+    """
+    Parses the ``SAGE`` ``.ini`` file.  Use ``read_SAGE_ini()``, which caches
+    the result and resolves the ``'None'`` fields.
     """
 
     SAGE_fields = ["RunPrefix", "OutputDir", "GridOutputDir",
@@ -465,23 +821,53 @@ def read_SAGE_ini(fname):
     old_SAGE_fields = ["FileNameGalaxies"]
 
     SAGE_dict = {}
- 
-    try:
-        with open (fname, "r") as SAGE_file:
-            data = SAGE_file.readlines() 
-
-            for line in range(len(data)):
-                stripped = data[line].strip()
-                try:
-                    first_char = stripped[0]
-                except IndexError:
-                    continue
-                if first_char == ";" or first_char == "%" or first_char == "-": 
-                    continue
-                split = stripped.split()
-                if split[0] in SAGE_fields or split[0] in old_SAGE_fields:
-                    SAGE_dict[split[0]] = split[1]
 
+    with open (fname, "r") as SAGE_file:
+        data = SAGE_file.readlines() 
+
+        for line in range(len(data)):
+            stripped = data[line].strip()
+            try:
+                first_char = stripped[0]
+            except IndexError:
+                continue
+            if first_char == ";" or first_char == "%" or first_char == "-": 
+                continue
+            split = stripped.split()
+            if split[0] in SAGE_fields or split[0] in old_SAGE_fields:
+                SAGE_dict[split[0]] = split[1]
+
+    return SAGE_dict
+
+
+def read_SAGE_ini(fname):
+    """    
+    Reads the ``SAGE`` ``.ini`` file into a dictionary containing the parameter
+    values.  The file is only parsed once (see ``cached_ini()``), each call
+    returns a new dictionary.
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the ``SAGE`` ``.ini`` file.         
+
+    Returns
+    ---------
+
+    SAGE_dict : Dictionary
+        Dictionary keyed by the ``SAGE`` parameter field names and containing 
+        the values from the ``.ini`` file. 
+
+    Errors 
+    ---------
+
+    RuntimeError
+        Raised if the specified ``SAGE`` ``.ini`` file not found.
+    """
+
+    try:
+        SAGE_dict = dict(cached_ini(fname, _parse_SAGE_ini))
     except FileNotFoundError:
         print("Could not file SAGE ini file {0}".format(fname))
         raise FileNotFoundError
@@ -544,44 +930,10 @@ def update_none_field(parameter_dict, field_name, ini_type):
 
     return updated_name
 
-def read_cifog_ini(fname, SAGE_params=None):
-    """    
-    Reads the ``cifog`` ``.ini`` file into a dictionary containing the parameter
-    values.  ``cifog`` also contains a number of header fields which must be
-    present in the ``.ini`` file which this function also reads into a separate
-    dictionary. 
-
-    Within the ``cifog`` ``.ini`` file, we support the use of special ``'None'`` variables.
-    Specifying this means that ``RSAGE`` automatically determined the parameter value.
-    For these, they depend upon parameters defined in the ``SAGE`` ``.ini`` file and hence
-    the ``SAGE_params`` parameter must be passed.
-
-    Parameters
-    ----------
-
-    fname : String
-        Path to the ``cifog`` ``.ini`` file.         
-
-    SAGE_params : Dictionary, see ``read_SAGE_ini()`` for full field names
-        Parameters form the ``SAGE`` ``.ini`` file read by ``read_SAGE_ini()``. Necessary
-        if any fields in the ``cifog`` ``.ini`` file are ``'None'``.
-
-    Returns
-    ---------
-
-    cifog_dict: Dictionary
-        Dictionary keyed by the ``cifog`` parameter field names and containing 
-        the values from the ``.ini`` file. 
-
-    cifog_headers: Dictionary
-        Dictionary keyed by the ``cifog`` parameter field that comes **after**
-        the header.  The value is the header name. 
-
-    Errors 
-    ---------
-
-    RuntimeError
-        Raised if the specified ``cifog`` ``.ini`` file not found.
+def _parse_cifog_ini(fname):
+    """
+    Parses the ``cifog`` ``.ini`` file.  Use ``read_cifog_ini()``, which caches
+    the result and resolves the ``'None'`` fields.
     """
 
     cifog_fields = ["calcIonHistory", "numSnapshots", "stopSnapshot",
@@ -614,37 +966,86 @@ def read_cifog_ini(fname, SAGE_params=None):
 
     cifog_dict = {}
     cifog_headers = {} 
+    header_name = None
 
-    try:
-        with open (fname, "r") as cifog_file:
-            data = cifog_file.readlines() 
+    with open (fname, "r") as cifog_file:
+        data = cifog_file.readlines() 
+
+        for line in range(len(data)):
+            stripped = data[line].strip()
+            try:
+                first_char = stripped[0]
+            except IndexError:
+                continue
 
-            for line in range(len(data)):
-                stripped = data[line].strip()
-                try:
-                    first_char = stripped[0]
-                except IndexError:
-                    continue
+            if first_char == ";" or first_char == "%" or first_char == "-": 
+                continue
 
-                if first_char == ";" or first_char == "%" or first_char == "-": 
-                    continue
+            split = stripped.split()
 
-                split = stripped.split()
+            if split[0] in cifog_fields:
+                cifog_dict[split[0]] = split[2]
 
-                if split[0] in cifog_fields:
-                    cifog_dict[split[0]] = split[2]
+                if header_name:
+                    cifog_headers[split[0]] = header_name
+                    header_name = None
 
-                    if header_name:
-                        cifog_headers[split[0]] = header_name
-                        header_name = None
+            if first_char == "[":
+                header_name = stripped
+
+    return cifog_dict, cifog_headers
 
-                if first_char == "[":
-                    header_name = stripped
 
+def read_cifog_ini(fname, SAGE_params=None):
+    """    
+    Reads the ``cifog`` ``.ini`` file into a dictionary containing the parameter
+    values.  ``cifog`` also contains a number of header fields which must be
+    present in the ``.ini`` file which this function also reads into a separate
+    dictionary.  The file is only parsed once (see ``cached_ini()``), each call
+    returns new dictionaries.
+
+    Within the ``cifog`` ``.ini`` file, we support the use of special ``'None'`` variables.
+    Specifying this means that ``RSAGE`` automatically determined the parameter value.
+    For these, they depend upon parameters defined in the ``SAGE`` ``.ini`` file and hence
+    the ``SAGE_params`` parameter must be passed.
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the ``cifog`` ``.ini`` file.         
+
+    SAGE_params : Dictionary, see ``read_SAGE_ini()`` for full field names
+        Parameters form the ``SAGE`` ``.ini`` file read by ``read_SAGE_ini()``. Necessary
+        if any fields in the ``cifog`` ``.ini`` file are ``'None'``.
+
+    Returns
+    ---------
+
+    cifog_dict: Dictionary
+        Dictionary keyed by the ``cifog`` parameter field names and containing 
+        the values from the ``.ini`` file. 
+
+    cifog_headers: Dictionary
+        Dictionary keyed by the ``cifog`` parameter field that comes **after**
+        the header.  The value is the header name. 
+
+    Errors 
+    ---------
+
+    RuntimeError
+        Raised if the specified ``cifog`` ``.ini`` file not found.
+    """
+
+    try:
+        cifog_dict, cifog_headers = cached_ini(fname, _parse_cifog_ini)
     except FileNotFoundError:
         print("Could not file cifog ini file {0}".format(fname))
         raise ValueError 
 
+    cifog_dict = dict(cifog_dict)
+    cifog_headers = dict(cifog_headers)
+
 
     # For some fields, they are kept as `None` in the `.ini` file and automatically
     # updated by RSAGE.  Hence for these we need to update them. 
@@ -15,10 +15,12 @@ from __future__ import print_function
 
 import numpy as np
 from numpy.fft import fftn, ifftn
+import scipy.fft as sfft
 import scipy.integrate as integrate
 import os
 import time
 import random
+import functools
 
 import AllVars as av
 import ReadScripts as rs
@@ -26,6 +28,14 @@ import PlotScripts as ps
 import CollectiveStats as collective
 import GalaxyData as gd 
 import ReionPlots as reionplot
+import ParallelBackend as pb
+import Checkpoints as ckpt
+import GridReduce as gridreduce
+import DistributedFFT as dfft
+import ReionRedshift as reionredshift
+import PowerSpecStore as pspecstore
+import FileLayout as layout
+import RunParams as runparams
 
 
 def calc_duration(z_array_reion_allmodels, lookback_array_reion_allmodels,
@@ -125,7 +135,7 @@ def T_naught(z, h, OM, OB):
     return T0
 
 
-def calc_ps(XHII, density, boxsize):
+def calc_ps(XHII, density, boxsize, single_precision=False):
     """
     Calculates the 21cm and XHI power spectrum. 
 
@@ -139,6 +149,11 @@ def calc_ps(XHII, density, boxsize):
         Grid that contains the overdensity (rho/<rho>) of dark matter in each
         cell. 
 
+    single_precision: Boolean. Optional.
+        If True, the brightness field and the FFTs are computed in single
+        precision (float32/complex64), halving the memory of the temporaries.
+        The binned sums are still accumulated in double precision. 
+
     Returns
     -------
     kmid_bins: 1-Dimensional array of floats. 
@@ -161,6 +176,9 @@ def calc_ps(XHII, density, boxsize):
     The 21cm power spectrum (and associated error) is in units of Mpc^3/h^3/(2*pi). 
     """
 
+    if single_precision:
+        return calc_ps_single(XHII, density, boxsize)
+
     GridSize = np.shape(XHII)[0]
 
     meanion = np.mean(XHII)
@@ -177,13 +195,76 @@ def calc_ps(XHII, density, boxsize):
             kmid_bins_XHII, pspec_XHII, p_err_XHII)
 
 
+def calc_ps_single(XHII, density, boxsize):
+    """
+    As ``calc_ps()`` except the brightness field and FFTs are computed in
+    single precision.  Each temporary is created in place where possible and
+    the modes are binned one slab at a time, so no double precision grid is
+    ever created.
+    """
+
+    GridSize = np.shape(XHII)[0]
+
+    XHII = np.asarray(XHII, dtype=np.float32)
+    density = np.asarray(density, dtype=np.float32)
+
+    Tb = np.subtract(np.float32(1.0), XHII)
+    Tb *= density
+
+    # ``scipy.fft`` keeps single precision inputs in single precision.
+    modes = sfft.ifftn(Tb, overwrite_x=True)
+    del Tb
+
+    kmid_bins, powerspec, p_err = \
+        av.powerspec_from_sums(*av.powerspec_slab_sums(modes, GridSize),
+                               ngrid=GridSize, boxsize=boxsize)
+    del modes
+
+    modes = sfft.ifftn(XHII)
+    kmid_bins_XHII, pspec_XHII, p_err_XHII = \
+        av.powerspec_from_sums(*av.powerspec_slab_sums(modes, GridSize),
+                               ngrid=GridSize, boxsize=boxsize)
+
+    return (kmid_bins, powerspec, p_err,
+            kmid_bins_XHII, pspec_XHII, p_err_XHII)
+
+
+def compare_ps_precision(XHII, density, boxsize):
+    """
+    Validates the single precision power spectra against the double
+    precision ones.
+
+    Parameters
+    ---------
+    XHII, density, boxsize: See ``calc_ps()``.
+
+    Returns
+    -------
+    kmid_bins: 1-Dimensional array of floats. 
+        The middle of each wavenumber bin. 
+
+    rel_diff_21cm, rel_diff_XHII: 1-Dimensional arrays of floats.
+        The relative difference, (single - double) / double, of the 21cm and
+        HII power spectra in each k bin.
+    """
+
+    double_ps = calc_ps(XHII, density, boxsize)
+    single_ps = calc_ps(XHII, density, boxsize, single_precision=True)
+
+    rel_diff_21cm = (single_ps[1] - double_ps[1]) / double_ps[1]
+    rel_diff_XHII = (single_ps[4] - double_ps[4]) / double_ps[4]
+
+    return double_ps[0], rel_diff_21cm, rel_diff_XHII
+
+
 def determine_ps_fixed_XHI(rank, size, comm,
                            z_array_reion_allmodels, cosmology_allmodels,
                            mass_frac_allmodels, XHII_fbase_allmodels,
                            XHII_precision_allmodels, density_fbase_allmodels,
                            density_precision_allmodels, GridSize_allmodels,
                            boxsize_allmodels, first_snap_allmodels,
-                           fixed_XHI_values):
+                           fixed_XHI_values, single_precision=False,
+                           distributed_fft=False):
     """    
     Calculates the 21cm and HII power spectra at fixed HI fractions.
 
@@ -238,6 +319,16 @@ def determine_ps_fixed_XHI(rank, size, comm,
         The neutral hydrogen fractions we're calculating the power spectra at.
         Defined by the user in ``paper_plots.py``.
 
+    single_precision : Boolean, optional
+        If ``True``, the grids are read and the power spectra calculated in
+        single precision.  See ``calc_ps()``.
+
+    distributed_fft : Boolean, optional
+        If ``True``, every rank works on each power spectrum together, reading
+        a slab of the grids and using a distributed FFT (see
+        ``DistributedFFT``).  Otherwise each power spectrum is calculated by a
+        single rank that reads the full grids.
+
     Returns
     ---------
 
@@ -271,10 +362,15 @@ def determine_ps_fixed_XHI(rank, size, comm,
 
     # Now every rank knows what snapshot indices correspond to the fixed HI
     # values. We run 'classic' MPI loop. 
+    if distributed_fft:
+        idx_range = range(num_models*num_fractions)
+    else:
+        idx_range = range(rank, num_models*num_fractions, size)
+
     k = []
     P21 = []
     PHII = []
-    for idx in range(rank, num_models*num_fractions, size): 
+    for idx in idx_range:
         # Determine what model this corresponds to.
         model_number = int(idx / num_fractions)
         model_cosmo = cosmology_allmodels[model_number]
@@ -289,26 +385,47 @@ def determine_ps_fixed_XHI(rank, size, comm,
         snapnum += first_snap_allmodels[model_number]
         cifog_snapnum = snapnum + 1
 
-        # Load the XHII and density fields and calculate!
-        XHII_path = "{0}_{1:03d}".format(XHII_fbase_allmodels[model_number],
-                                         cifog_snapnum)
-        XHII = rs.read_binary_grid(XHII_path, GridSize_allmodels[model_number],
-                                   XHII_precision_allmodels[model_number]) 
-
-        density_path = "{0}{1:03d}.dens.dat".format(density_fbase_allmodels[model_number],
-                                                    snapnum)
-        density = rs.read_binary_grid(density_path,
-                                      GridSize_allmodels[model_number],
-                                      density_precision_allmodels[model_number])
+        if single_precision:
+            grid_dtype = np.float32
+        else:
+            grid_dtype = None
 
+        # Load the XHII and density fields and calculate!
+        XHII_path = layout.format_path("XHII", XHII_fbase_allmodels[model_number],
+                                       snap=cifog_snapnum)
+        density_path = layout.format_path("density",
+                                          density_fbase_allmodels[model_number],
+                                          snap=snapnum)
 
         T0 = T_naught(redshift, model_cosmo.H(0).value/100.0,
                       model_cosmo.Om0, model_cosmo.Ob0)
 
-        # Be careful, passing the boxsize at Mpc/h.
-        tmp_k, tmp_PowSpec, tmp_Error, \
-        tmp_k_XHII, tmp_Pspec_HII, tmp_Error_XHII = calc_ps(XHII, density,
-                                                             model_boxsize)
+        if distributed_fft:
+            # Be careful, passing the boxsize at Mpc/h.
+            tmp_k, tmp_PowSpec, tmp_Error, \
+            tmp_k_XHII, tmp_Pspec_HII, tmp_Error_XHII = \
+                dfft.calc_ps_distributed((XHII_path,
+                                          XHII_precision_allmodels[model_number]),
+                                         (density_path,
+                                          density_precision_allmodels[model_number]),
+                                         GridSize_allmodels[model_number],
+                                         model_boxsize, comm, single_precision)
+        else:
+            XHII = rs.read_binary_grid(XHII_path,
+                                       GridSize_allmodels[model_number],
+                                       XHII_precision_allmodels[model_number],
+                                       dtype=grid_dtype) 
+
+            density = rs.read_binary_grid(density_path,
+                                          GridSize_allmodels[model_number],
+                                          density_precision_allmodels[model_number],
+                                          dtype=grid_dtype)
+
+            # Be careful, passing the boxsize at Mpc/h.
+            tmp_k, tmp_PowSpec, tmp_Error, \
+            tmp_k_XHII, tmp_Pspec_HII, tmp_Error_XHII = calc_ps(XHII, density,
+                                                                 model_boxsize,
+                                                                 single_precision)
 
         k.append(tmp_k)
         P21.append(tmp_PowSpec * T0*T0 * tmp_k**3 * 4.0*np.pi)
@@ -316,6 +433,24 @@ def determine_ps_fixed_XHI(rank, size, comm,
 
     comm.Barrier()
 
+    # With the distributed FFT every rank already has all the power spectra.
+    if distributed_fft:
+        if rank != 0:
+            return None, None, None
+
+        k_master = []
+        P21_master = []
+        PHII_master = []
+        for model_number in range(num_models):
+            low_idx = model_number*num_fractions
+            high_idx = low_idx + num_fractions
+
+            k_master.append(k[low_idx:high_idx])
+            P21_master.append(P21[low_idx:high_idx])
+            PHII_master.append(PHII[low_idx:high_idx])
+
+        return k_master, P21_master, PHII_master
+
     # Now at this point each rank has a subset of the power spectra.
     # What we want to do is go through each index again and pass all of these
     # back onto the master rank.
@@ -383,6 +518,113 @@ def determine_ps_fixed_XHI(rank, size, comm,
         return None, None, None
 
 
+def _tau_integrand(z, h, OM):
+    """
+    The integrand of the Thomson optical depth for a fully ionized universe.
+    """
+
+    H = av.Hubble_Param(z, h, OM) / (av.pc_to_m * 1.0e6 / 1.0e3)
+    return (((1 + z)**2) / H)
+
+
+@functools.lru_cache(maxsize=None)
+def _tau_integral(z_low, z_high, h, OM):
+    """
+    Integrates ``_tau_integrand()`` from ``z_low`` to ``z_high``.  Memoised,
+    so the low redshift piece is only integrated once for each cosmology.
+    """
+
+    return integrate.quad(_tau_integrand, z_low, z_high, args=(h, OM,))[0]
+
+
+def calc_tau_stacked(z_array, mass_frac, h, OM, OB, helium):
+    """
+    Calculates the Thomson integrated optical depth of many models at once.
+
+    Parameters
+    ----------
+
+    z_array : 1D or 2D ``np.ndarray`` of floats
+        The redshift of each snapshot, in decreasing order.  Either shared by
+        every model or of shape ``(num_models, num_snaps)``.
+
+    mass_frac : 2D ``np.ndarray`` of floats. Shape is ``(num_models,
+                num_snaps)``.
+        The mass weighted neutral fraction at each snapshot for each model.
+
+    h, OM, OB, helium : 1D ``np.ndarray`` of floats. Length is number of
+                        models.
+        The Hubble parameter, matter and baryon densities and helium fraction
+        of each model.
+
+    Returns
+    ---------
+
+    tau : 2D ``np.ndarray`` of floats. Shape is ``(num_models, num_snaps)``.
+        The Thomson optical depth at each snapshot for each model.
+    """
+
+    z_array = np.asarray(z_array, dtype=np.float64)
+    mass_frac = np.atleast_2d(np.asarray(mass_frac, dtype=np.float64))
+    h = np.asarray(h, dtype=np.float64)
+    OM = np.asarray(OM, dtype=np.float64)
+    OB = np.asarray(OB, dtype=np.float64)
+    helium = np.asarray(helium, dtype=np.float64)
+
+    num_models = len(mass_frac)
+
+    if z_array.ndim == 1:
+        z_lowest = np.full(num_models, z_array[-1])
+    else:
+        z_lowest = z_array[:, -1]
+
+    single_helium = 1 + helium/(4 * (1-helium))
+    double_helium = 1 + 2*helium/(4 * (1-helium))
+
+    # The optical depth from z = 0 to 4 and then z = 4 to the lowest z of each
+    # model.  Models share these if they have the same cosmology.
+    tau_lowz = np.empty(num_models)
+    for model_number in range(num_models):
+        tau_04 = _tau_integral(0.0, 4.0, h[model_number], OM[model_number])
+        tau_04 *= double_helium[model_number]
+
+        tau_46 = _tau_integral(4.0, z_lowest[model_number], h[model_number],
+                               OM[model_number])
+        tau_46 *= single_helium[model_number]
+
+        tau_lowz[model_number] = tau_04 + tau_46
+
+    # Hubble Parameter in Mpc/s/Mpc, tabulated once for each distinct
+    # cosmology if the snapshots are shared.
+    if z_array.ndim == 1:
+        z = z_array[np.newaxis, :-1]
+        dz = z_array[np.newaxis, :-1] - z_array[np.newaxis, 1:]
+
+        cosmo_params, cosmo_idx = np.unique(np.column_stack([h, OM]), axis=0,
+                                            return_inverse=True)
+        H_table = av.Hubble_Param(z, cosmo_params[:, 0:1],
+                                  cosmo_params[:, 1:2]) / \
+                  (av.pc_to_m * 1.0e6 / 1.0e3)
+        H = H_table[np.ravel(cosmo_idx)]
+    else:
+        z = z_array[:, :-1]
+        dz = z_array[:, :-1] - z_array[:, 1:]
+        H = av.Hubble_Param(z, h[:, np.newaxis], OM[:, np.newaxis]) / \
+            (av.pc_to_m * 1.0e6 / 1.0e3)
+
+    numerator = ((1 + z) **2) * (1.0 - mass_frac[:, :-1])
+    increments = (numerator / H) * dz * single_helium[:, np.newaxis]
+
+    # Accumulate from low z to high z, starting at the low z piece.
+    terms = np.concatenate([tau_lowz[:, np.newaxis], increments[:, ::-1]],
+                           axis=1)
+    tau = np.cumsum(terms, axis=1)[:, ::-1]
+
+    tau *= (av.n_HI(0, h, OB, helium) * av.c_in_ms * av.Sigmat)[:, np.newaxis]
+
+    return tau
+
+
 def calc_tau(z_array_reion_allmodels, cosmology_allmodels, helium_allmodels,
              mass_frac_allmodels):
     """
@@ -414,50 +656,38 @@ def calc_tau(z_array_reion_allmodels, cosmology_allmodels, helium_allmodels,
         The Thomson optical depth at each snapshot for each model.
     """
 
-    def integrand(z, h, OM):
-        H = av.Hubble_Param(z, h, OM) / (av.pc_to_m * 1.0e6 / 1.0e3)
-        return (((1 + z)**2) / H)
-
-    tau = []
-    for model_number in range(len(mass_frac_allmodels)):
-
-        # Set up some things for the model cosmology etc.
-        model_mass_frac = mass_frac_allmodels[model_number]
-        model_helium = helium_allmodels[model_number]
-        model_h = cosmology_allmodels[model_number].H(0).value/100.0
-        model_OM = cosmology_allmodels[model_number].Om0
-        model_OB = cosmology_allmodels[model_number].Ob0
-        model_z = z_array_reion_allmodels[model_number]
-
-        model_tau = np.zeros(len(model_mass_frac))
-
-        # First determine optical depth for redshift 0 to 4.
-        tau_04 = integrate.quad(integrand, 0, 4, args=(model_h, model_OM,))[0] 
-        tau_04 *= (1 + 2*model_helium/(4 * (1-model_helium)))
-
-        # Then determine optical depth from z = 4 to lowest z of model.
-        tau_46 = integrate.quad(integrand, 4, model_z[-1], args=(model_h, model_OM,))[0]
-        tau_46 *= (1 + model_helium/(4* (1-model_helium)))
-
-        tau_06 = tau_04 + tau_46
+    num_models = len(mass_frac_allmodels)
 
-        model_tau[-1] = tau_06
+    # Models with the same number of snapshots are stacked and calculated
+    # together.
+    groups = {}
+    for model_number in range(num_models):
+        num_snaps = len(mass_frac_allmodels[model_number])
+        groups.setdefault(num_snaps, []).append(model_number)
 
-        # Then loop down through snapshots (low z to high z) and calculate tau.
-        for snapnum in np.arange(len(model_mass_frac) - 2, -1, -1):
+    tau = [None] * num_models
+    for model_numbers in groups.values():
+        z_array = np.array([z_array_reion_allmodels[model_number]
+                            for model_number in model_numbers])
+        # If every model has the same snapshots, only tabulate them once.
+        if np.all(z_array == z_array[0]):
+            z_array = z_array[0]
 
-            this_z = model_z[snapnum]
-            prev_z = model_z[snapnum + 1]
+        mass_frac = np.array([mass_frac_allmodels[model_number]
+                              for model_number in model_numbers])
 
-            # Hubble Parameter in Mpc/s/Mpc.
-            H = av.Hubble_Param(this_z, model_h, model_OM) / (av.pc_to_m * 1.0e6 / 1.0e3)
-            numerator = ((1 + this_z) **2) *  (1.0 - model_mass_frac[snapnum])
-         
-            model_tau[snapnum] = model_tau[snapnum+1] + (( numerator / H) * (this_z - prev_z) * (1 + model_helium/(4 * (1-model_helium)))) 
+        cosmologies = [cosmology_allmodels[model_number]
+                       for model_number in model_numbers]
+        h = [cosmology.H(0).value/100.0 for cosmology in cosmologies]
+        OM = [cosmology.Om0 for cosmology in cosmologies]
+        OB = [cosmology.Ob0 for cosmology in cosmologies]
+        helium = [helium_allmodels[model_number]
+                  for model_number in model_numbers]
 
-        model_tau *= av.n_HI(0, model_h, model_OB, model_helium) * av.c_in_ms * av.Sigmat
+        group_tau = calc_tau_stacked(z_array, mass_frac, h, OM, OB, helium)
 
-        tau.append(model_tau)
+        for idx, model_number in enumerate(model_numbers):
+            tau[model_number] = group_tau[idx]
 
     return tau
 
@@ -720,9 +950,74 @@ def calculate_bubble_MC(XHII, output_file, N=1e5):
     MC_walk(XHII, XHII_indices, phase, int(N), Ncell, output_file)
 
 
+def build_missing_zreion(rank, size, comm, reion_data):
+    """
+    Builds the reionization redshift grid of any model where it doesn't exist
+    from the ionization grids.  Uses the same threshold as ``RSAGE`` (see
+    ``ReionRedshift``) and splits the cells across the tasks.
+
+    Parameters
+    ----------
+
+    rank : Integer
+        This processor rank.
+
+    size : Integer
+        The total number of processors executing the pipeline.
+
+    comm : Class ``mpi4py.MPI.Intracomm``
+        The ``mpi4py`` communicator.
+
+    reion_data : Dictionary
+        The data from ``generate_data()``.
+
+    Returns
+    ---------
+
+    None.  The grids are saved to the paths in
+    ``reion_data["zreion_path_allmodels"]``.
+    """
+
+    for model_number, zreion_path in enumerate(reion_data["zreion_path_allmodels"]):
+
+        # Only check on one rank so every rank agrees.
+        if rank == 0:
+            missing = not layout.exists(zreion_path)
+        else:
+            missing = None
+        missing = comm.bcast(missing, root=0)
+
+        if not missing:
+            continue
+
+        GridSize = reion_data["GridSize_allmodels"][model_number]
+
+        if rank == 0:
+            print("The zreion grid {0} does not exist. Building it from the "
+                  "ionization grids.".format(zreion_path))
+            np.memmap(zreion_path, dtype=np.float64, mode="w+",
+                      shape=(GridSize**3,)).flush()
+        comm.Barrier()
+
+        XHII_series = \
+            reionredshift.zreion_snapshot_series(reion_data["XHII_fbase_allmodels"][model_number],
+                                                 reion_data["z_array_reion_allmodels"][model_number],
+                                                 reion_data["first_snap_allmodels"][model_number])
+
+        cell_range = gridreduce.task_cell_range(GridSize**3, rank, size)
+        reionredshift.build_zreion_grids(XHII_series, GridSize,
+                                         reion_data["XHII_precision_allmodels"][model_number],
+                                         output_fnames=[zreion_path],
+                                         cell_range=cell_range)
+        comm.Barrier()
+
+        # The grid was created after its directory was listed above.
+        layout.forget(zreion_path)
+
+
 def zreion_dens_cross(density_fbase_allmodels, density_precision_allmodels,
                       zreion_path_allmodels, GridSize_allmodels,
-                      boxsize_allmodels, last_snap_allmodels):
+                      boxsize_allmodels, last_snap_allmodels, comm=None):
     """
     Determines the size of ionized regions using MC walks.
 
@@ -748,6 +1043,12 @@ def zreion_dens_cross(density_fbase_allmodels, density_precision_allmodels,
     last_snap_allmodels : List of integers. Length is number of models.
         The snapshot where ``cifog`` ends calculations for each model.
 
+    comm : Class ``mpi4py.MPI.Intracomm``, optional
+        If specified, the grids are read in slabs and the cross correlation
+        is calculated using a distributed FFT over every task of ``comm`` (see
+        ``DistributedFFT``).  Every task must then call this function and
+        every task receives the results.
+
     Returns
     ---------
 
@@ -765,26 +1066,28 @@ def zreion_dens_cross(density_fbase_allmodels, density_precision_allmodels,
 
     for model_number in range(len(zreion_path_allmodels)):
 
-        reshape = True
-        density_path = "{0}{1:03d}.dens.dat".format(density_fbase_allmodels[model_number],
-                                                    last_snap_allmodels[model_number])
-
-        density = rs.read_binary_grid(density_path,
-                                      GridSize_allmodels[model_number],
-                                      density_precision_allmodels[model_number],
-                                      reshape)
-
-        density = density/np.mean(density) - 1.0
-
+        density_path = layout.format_path("density",
+                                          density_fbase_allmodels[model_number],
+                                          snap=last_snap_allmodels[model_number])
         precision = 2
-        zreion = rs.read_binary_grid(zreion_path_allmodels[model_number],
-                                     GridSize_allmodels[model_number],
-                                     precision, reshape)
 
-        zreion = zreion/np.mean(zreion) - 1.0
-
-        kmid_bins, cross_pspec, pspec_zreion, pspec_dens = \
-            av.calc_cross_corr(zreion, density, boxsize_allmodels[model_number]) 
+        if comm is not None:
+            kmid_bins, cross_pspec, pspec_zreion, pspec_dens = \
+                dfft.calc_cross_corr_distributed((zreion_path_allmodels[model_number],
+                                                  precision),
+                                                 (density_path,
+                                                  density_precision_allmodels[model_number]),
+                                                 GridSize_allmodels[model_number],
+                                                 boxsize_allmodels[model_number],
+                                                 comm, overdensity=True)
+        else:
+            kmid_bins, cross_pspec, pspec_zreion, pspec_dens = \
+                _serial_zreion_dens_cross(density_path,
+                                          density_precision_allmodels[model_number],
+                                          zreion_path_allmodels[model_number],
+                                          precision,
+                                          GridSize_allmodels[model_number],
+                                          boxsize_allmodels[model_number])
 
         crosscorr = cross_pspec / (pspec_zreion * pspec_dens)**0.5
         bias = (pspec_zreion / pspec_dens)**0.5
@@ -798,6 +1101,140 @@ def zreion_dens_cross(density_fbase_allmodels, density_precision_allmodels,
            bias_allmodels
 
 
+def _serial_zreion_dens_cross(density_path, density_precision, zreion_path,
+                              zreion_precision, GridSize, boxsize):
+    """
+    Reads the full density and zreion grids and calculates their cross
+    correlation on this task.  See ``zreion_dens_cross()``.
+    """
+
+    reshape = True
+    density = rs.read_binary_grid(density_path, GridSize, density_precision,
+                                  reshape)
+
+    density = density/np.mean(density) - 1.0
+
+    zreion = rs.read_binary_grid(zreion_path, GridSize, zreion_precision,
+                                 reshape)
+
+    zreion = zreion/np.mean(zreion) - 1.0
+
+    return av.calc_cross_corr(zreion, density, boxsize)
+
+
+def grid_histograms_2d(rank, size, comm, sources_allmodels,
+                       GridSize_allmodels, log_x=False, log_y=False,
+                       num_bins=100):
+    """
+    Bins the cells of a pair of grids into a 2D histogram for each model, e.g.,
+    the density against the ionization of each cell.
+
+    The grids are streamed in chunks (see ``GridReduce``) with the cells split
+    across the tasks, so the memory used is set by the number of bins rather
+    than the number of cells.  Two passes are made over the grids, the first
+    finds the range of the values (common to every model) and the second bins
+    them.
+
+    Parameters
+    ----------
+
+    rank : Integer
+        This processor rank.
+
+    size : Integer
+        The total number of processors executing the pipeline.
+
+    comm : Class ``mpi4py.MPI.Intracomm``
+        The ``mpi4py`` communicator.
+
+    sources_allmodels : List of dictionaries. Length is number of models.
+        The grids binned for each model.  The ``"x"`` and ``"y"`` keys are the
+        ``(path, precision)`` tuples of the grids along each axis.
+
+    GridSize_allmodels : List of integers. Length is number of models.
+        The number of grid cells (along a box size) for each model.
+
+    log_x, log_y : Booleans, optional
+        If ``True``, the log10 of the grid values are binned.  Empty cells are
+        ignored.
+
+    num_bins : Integer, optional
+        The number of bins along each axis.
+
+    Returns
+    ---------
+
+    For all non-zero ranks, the returns are:
+        None, None, None.
+
+    x_edges, y_edges : 1D ``np.ndarray`` of floats
+        The bin edges along each axis.
+
+    hist_allmodels : 3D ``np.ndarray`` of floats. Outer length is number of
+                     models, then the number of x and y bins.
+        The number of cells in each bin for each model.
+    """
+
+    num_models = len(sources_allmodels)
+
+    # First find the range of each axis across every model and task.
+    reductions = {"x" : ("range", {"grid" : "x", "log" : log_x}),
+                  "y" : ("range", {"grid" : "y", "log" : log_y})}
+
+    local_extrema = np.array([-np.inf, -np.inf, -np.inf, -np.inf])
+    for model_number in range(num_models):
+        GridSize = GridSize_allmodels[model_number]
+        cell_range = gridreduce.task_cell_range(GridSize**3, rank, size)
+
+        results = gridreduce.reduce_grids(sources_allmodels[model_number],
+                                          reductions, GridSize,
+                                          cell_range=cell_range)
+
+        # Negate the minimums so everything is reduced with a max.
+        local_extrema = np.maximum(local_extrema,
+                                   [-results["x"][0], results["x"][1],
+                                    -results["y"][0], results["y"][1]])
+
+    extrema = np.zeros(4)
+    comm.Allreduce(local_extrema, extrema, op=pb.MPI.MAX)
+
+    edges = []
+    for low, high in [(-extrema[0], extrema[1]), (-extrema[2], extrema[3])]:
+        if not np.isfinite(low):
+            low, high = 0.0, 1.0
+        if low == high:
+            low -= 0.5
+            high += 0.5
+        edges.append(np.linspace(low, high, num_bins+1))
+    x_edges, y_edges = edges
+
+    # Then bin the cells of each model.
+    reductions = {"hist" : ("histogram2d", {"x" : "x", "y" : "y",
+                                            "bins" : (x_edges, y_edges),
+                                            "log_x" : log_x,
+                                            "log_y" : log_y})}
+
+    local_hist = np.zeros((num_models, num_bins, num_bins))
+    for model_number in range(num_models):
+        GridSize = GridSize_allmodels[model_number]
+        cell_range = gridreduce.task_cell_range(GridSize**3, rank, size)
+
+        local_hist[model_number] = \
+            gridreduce.reduce_grids(sources_allmodels[model_number],
+                                    reductions, GridSize,
+                                    cell_range=cell_range)["hist"]
+
+    if rank == 0:
+        hist_allmodels = np.zeros_like(local_hist)
+    else:
+        hist_allmodels = None
+    comm.Reduce(local_hist, hist_allmodels, op=pb.MPI.SUM, root=0)
+
+    if rank != 0:
+        return None, None, None
+
+    return x_edges, y_edges, hist_allmodels
+
 def calc_scale_power(k_allmodels, P21_allmodels, PHII_allmodels,
                      z_array_reion_allmodels, small_scale_def, large_scale_def,
                      small_scale_err, large_scale_err, calc_beta=False,
@@ -851,149 +1288,62 @@ def calc_scale_power(k_allmodels, P21_allmodels, PHII_allmodels,
 
     num_models = len(k_allmodels)
 
-    k_small_scale = []
-    k_large_scale = []
-
-    P21_small_scale = []
-    P21_large_scale = []
-
-    PHII_small_scale = []
-    PHII_large_scale = []
-
-    P21_small_scale_err_low = []
-    P21_small_scale_err_up = []
-
-    P21_large_scale_err_low = []
-    P21_large_scale_err_up = []
-
+    # Stack the spectra of every model and snapshot so the scales are found
+    # in one go.
+    stores = []
     for model_number in range(num_models):
+        stores.append(pspecstore.build_pspec_store(k_allmodels[model_number],
+                                                   P21_allmodels[model_number],
+                                                   PHII_allmodels[model_number],
+                                                   z_array_reion_allmodels[model_number]))
+    store = pspecstore.stack_pspec_stores(stores)
+    num_snaps = store["num_snaps"]
 
-        k_small_scale.append([])
-        k_large_scale.append([])
-
-        P21_small_scale.append([])
-        P21_large_scale.append([])
-
-        P21_small_scale_err_low.append([])
-        P21_small_scale_err_up.append([])
-
-        P21_large_scale_err_low.append([])
-        P21_large_scale_err_up.append([])
-
-        PHII_small_scale.append([])
-        PHII_large_scale.append([]) 
-
-        k_this_model = np.array(k_allmodels[model_number])
-        P21_this_model = np.array(P21_allmodels[model_number])
-        PHII_this_model = np.array(PHII_allmodels[model_number])
-
-        # For all the snapshots find the values at the specified scales.
-        for snap_idx in range(len(k_this_model)):
-            small_idx = (np.abs(k_this_model[snap_idx] - small_scale_def)).argmin()
-            large_idx = (np.abs(k_this_model[snap_idx] - large_scale_def)).argmin()
+    k_scales, P21_scales = pspecstore.power_at_k(store, [small_scale_def,
+                                                         large_scale_def],
+                                                 "P21")
+    _, PHII_scales = pspecstore.power_at_k(store, [small_scale_def,
+                                                   large_scale_def], "PHII")
 
-            # Then grab the relevant values at those scales.
-            k_small = k_this_model[snap_idx][small_idx]
-            k_large = k_this_model[snap_idx][large_idx]
+    def split_models(values):
+        return [list(values[model_number, :num_snaps[model_number]])
+                for model_number in range(num_models)]
 
-            P21_small = P21_this_model[snap_idx][small_idx]
-            P21_large = P21_this_model[snap_idx][large_idx]
+    k_small_scale = split_models(k_scales[..., 0])
+    k_large_scale = split_models(k_scales[..., 1])
 
-            PHII_small = PHII_this_model[snap_idx][small_idx]
-            PHII_large = PHII_this_model[snap_idx][large_idx]
+    P21_small_scale = split_models(P21_scales[..., 0])
+    P21_large_scale = split_models(P21_scales[..., 1])
 
-            # Then append!
-            k_small_scale[model_number].append(k_small)
-            P21_small_scale[model_number].append(P21_small)
-            PHII_small_scale[model_number].append(PHII_small)
-
-            k_large_scale[model_number].append(k_large)
-            P21_large_scale[model_number].append(P21_large)
-            PHII_large_scale[model_number].append(PHII_large)
-
-            # If we're calculating errors, find the region we should shade.
-            # We only have the errors between z = 8-10 so if not in this range,
-            # append nan. 
-            if small_scale_err:
-                if z_array_reion_allmodels[model_number][snap_idx] < 8.0 or \
-                   z_array_reion_allmodels[model_number][snap_idx] > 10.0:
-
-                    P21_small_scale_err_low[model_number].append(P21_small)
-                    P21_small_scale_err_up[model_number].append(P21_small)
-
-                    P21_large_scale_err_low[model_number].append(P21_large)
-                    P21_large_scale_err_up[model_number].append(P21_large)
-
-                else:
-                    P21_small_scale_err_low[model_number].append(P21_small - \
-                                                                 small_scale_err) 
-                    P21_small_scale_err_up[model_number].append(P21_small + \
-                                                                small_scale_err)
-     
-                    P21_large_scale_err_low[model_number].append(P21_large - \
-                                                                 large_scale_err) 
-                    P21_large_scale_err_up[model_number].append(P21_large + \
-                                                                large_scale_err) 
+    PHII_small_scale = split_models(PHII_scales[..., 0])
+    PHII_large_scale = split_models(PHII_scales[..., 1])
 
     # If we want to calculate the slope between large-scale and small-scale
     # power, do it!
     if calc_beta:
 
-        P21_beta = []
-        PHII_beta = []
-
-        P21_beta_error = []
-
-
-        for model_number in range(num_models):
-
-            P21_beta.append([])
-            PHII_beta.append([])
-
-            P21_beta_error.append([])
+        dk = k_scales[..., 1] - k_scales[..., 0]
 
-            k_large_scale_this_model = k_large_scale[model_number]
-            k_small_scale_this_model = k_small_scale[model_number]
+        P21_beta = split_models((P21_scales[..., 1] - P21_scales[..., 0]) / dk)
+        PHII_beta = split_models((PHII_scales[..., 1] - PHII_scales[..., 0]) / dk)
 
-            P21_small_scale_this_model = P21_small_scale[model_number]
-            P21_large_scale_this_model = P21_large_scale[model_number]
+        # If there's no error defined, skip this calculation.
+        if not small_scale_err or not large_scale_err:
+            P21_beta_error = None
+        else:
+            # Assume that there's no uncertainty in the k-values. Then
+            # delta(Slope) is sqrt(large scale error^2 + small scale
+            # error^2) divided by the difference in scales.  Error can only
+            # be positive...
+            P21_beta_error = split_models(np.abs(np.sqrt(large_scale_err**2 + \
+                                                         small_scale_err**2) / dk))
 
-            PHII_small_scale_this_model = PHII_small_scale[model_number]
-            PHII_large_scale_this_model = PHII_large_scale[model_number]
+        if debug:
+            for model_number in range(num_models):
+                for snap_idx in range(num_snaps[model_number]):
+                    P21_small_snap = P21_small_scale[model_number][snap_idx]
+                    P21_large_snap = P21_large_scale[model_number][snap_idx]
 
-            for snap_idx in range(len(P21_small_scale_this_model)):
-
-                k_large_snap = k_large_scale_this_model[snap_idx]
-                k_small_snap = k_small_scale_this_model[snap_idx]
-
-                P21_large_snap = P21_large_scale_this_model[snap_idx]
-                P21_small_snap = P21_small_scale_this_model[snap_idx]
-
-                PHII_large_snap = PHII_large_scale_this_model[snap_idx]
-                PHII_small_snap = PHII_small_scale_this_model[snap_idx]
-
-                P21_beta_snap = (P21_large_snap - P21_small_snap) / \
-                                (k_large_snap - k_small_snap)
-
-                PHII_beta_snap = (PHII_large_snap - PHII_small_snap) / \
-                                 (k_large_snap - k_small_snap)
-
-
-                # If there's no error defined, skip this calculation. 
-                if not small_scale_err or not large_scale_err:
-                    P21_beta_error = None
-                    continue
-
-                # Assume that there's no uncertainty in the k-values. Then
-                # delta(Slope) is sqrt(large scale error^2 + small scale
-                # error^2) divided by the difference in scales.
-                P21_error_snap = np.sqrt(large_scale_err**2 + \
-                                         small_scale_err**2) / \
-                                 (k_large_snap - k_small_snap)
-                # Error can only be positive...
-                P21_error_snap = np.abs(P21_error_snap)
-                
-                if debug:
                     print("")
                     print("Snap {0}".format(snap_idx))
                     print("P21_small {0}\tP21_small_err {1}\tFrac "
@@ -1002,15 +1352,12 @@ def calc_scale_power(k_allmodels, P21_allmodels, PHII_allmodels,
                     print("P21_large {0}\tP21_large_err {1}\tFrac "
                           "{2}".format(P21_large_snap, large_scale_err,
                                        large_scale_err / P21_large_snap))
-                    print("P21_beta {0}\tP21_beta_error {1}".format(P21_beta_snap,
-                                                                    P21_error_snap))
+                    if P21_beta_error is not None:
+                        print("P21_beta {0}\tP21_beta_error "
+                              "{1}".format(P21_beta[model_number][snap_idx],
+                                           P21_beta_error[model_number][snap_idx]))
                     print("")
 
-                P21_beta[model_number].append(P21_beta_snap)
-                PHII_beta[model_number].append(PHII_beta_snap)
-
-                P21_beta_error[model_number].append(P21_error_snap)
-
     # Throw everything into a dict for easy passing.
     scale_dict = {"k_small_scale" : k_small_scale,
                   "k_large_scale" : k_large_scale, 
@@ -1028,7 +1375,8 @@ def calc_scale_power(k_allmodels, P21_allmodels, PHII_allmodels,
  
 
 def plot_reion_properties(rank, size, comm, reion_ini_files, gal_ini_files,
-                          model_tags, reion_plots, output_dir, output_format):
+                          model_tags, reion_plots, output_dir, output_format,
+                          backend=None):
     """    
     Wrapper function to handle reading in of data + calculating reionization 
     properties, then calling the specified plotting routines.
@@ -1042,8 +1390,8 @@ def plot_reion_properties(rank, size, comm, reion_ini_files, gal_ini_files,
     size : Integer
         The total number of processors executing the pipeline.
 
-    comm : Class ``mpi4py.MPI.Intracomm``
-        The ``mpi4py`` communicator.
+    comm : Class ``mpi4py.MPI.Intracomm`` or ``ParallelBackend.SerialComm``
+        The communicator between the tasks.
 
     reion_ini_files, gal_ini_files : List of strings 
         ``.ini`` file corresponding to each model that we're plotting.  We need
@@ -1063,6 +1411,10 @@ def plot_reion_properties(rank, size, comm, reion_ini_files, gal_ini_files,
     output_format : String
         The format of the saved figures.
 
+    backend : ``ParallelBackend`` backend, optional
+        The backend that the snapshots are distributed with.  If not
+        specified, the snapshots are distributed across the tasks of ``comm``.
+
     Returns
     ---------
 
@@ -1083,7 +1435,7 @@ def plot_reion_properties(rank, size, comm, reion_ini_files, gal_ini_files,
     # First calculate all the properties and statistics we need.
     reion_data = generate_data(rank, size, comm, reion_ini_files,
                                gal_ini_files, reion_plots, output_dir,
-                               model_tags, output_format)
+                               model_tags, output_format, backend=backend)
 
     # Gather all the fractions onto the master process.
     # This will be used for many different plots. 
@@ -1147,7 +1499,9 @@ def plot_reion_properties(rank, size, comm, reion_ini_files, gal_ini_files,
                                               reion_data["GridSize_allmodels"],
                                               reion_data["boxsize_allmodels"],
                                               reion_data["first_snap_allmodels"],
-                                              reion_plots["fixed_XHI_values"])
+                                              reion_plots["fixed_XHI_values"],
+                                              reion_plots["ps_single_precision"],
+                                              reion_plots["distributed_fft"])
 
         if rank == 0:
             print("Plotting PS at fixed neutral fraction.")
@@ -1309,7 +1663,7 @@ def plot_reion_properties(rank, size, comm, reion_ini_files, gal_ini_files,
                                   reion_plots["cut_slice"],
                                   reion_plots["cut_thickness"],
                                   model_tags, output_dir, "slices_XHI",
-                                  output_format)
+                                  output_format, reion_plots["grid_level"])
 
 
     if reion_plots["bubble_size"] and rank == 0:
@@ -1322,46 +1676,427 @@ def plot_reion_properties(rank, size, comm, reion_ini_files, gal_ini_files,
                                         reion_plots["fixed_XHI_values"],
                                         model_tags, output_dir)
 
-    if reion_plots["zreion_dens_cross"] and rank == 0:
-        print("Calculating the zreion-density cross correlation.")
+    if (reion_plots["zreion_dens_cross"] or \
+        reion_plots["dens_zreion_contours"]) and reion_plots["build_zreion"]:
+        build_missing_zreion(rank, size, comm, reion_data)
+
+    # With the distributed FFT every rank calculates the cross correlation
+    # together.
+    if reion_plots["zreion_dens_cross"] and \
+       (rank == 0 or reion_plots["distributed_fft"]):
+        if rank == 0:
+            print("Calculating the zreion-density cross correlation.")
+
+        if reion_plots["distributed_fft"]:
+            cross_comm = comm
+        else:
+            cross_comm = None
+
         k, crosspspec, crosscorr, bias = \
             zreion_dens_cross(reion_data["density_fbase_allmodels"],
                               reion_data["density_precision_allmodels"],
                               reion_data["zreion_path_allmodels"],
                               reion_data["GridSize_allmodels"],
                               reion_data["boxsize_allmodels"],
-                              reion_data["last_snap_allmodels"])
+                              reion_data["last_snap_allmodels"],
+                              cross_comm)
 
-        reionplot.plot_zreion_dens_cross(k, crosscorr, bias, model_tags,
-                                         output_dir, "zreion_dens_crosscorr",
-                                         output_format)
+        if rank == 0:
+            reionplot.plot_zreion_dens_cross(k, crosscorr, bias, model_tags,
+                                             output_dir,
+                                             "zreion_dens_crosscorr",
+                                             output_format)
 
-    if reion_plots["dens_ion_contours"] and rank == 0:
-        print("Plotting contours of density-ionization.")
-        reionplot.plot_dens_reion_contours(master_mass_frac,
-                                           reion_data["XHII_fbase_allmodels"],
-                                           reion_data["XHII_precision_allmodels"],
-                                           reion_data["density_fbase_allmodels"],
-                                           reion_data["density_precision_allmodels"],
-                                           reion_data["GridSize_allmodels"],
-                                           reion_data["first_snap_allmodels"],
-                                           reion_plots["fixed_XHI_values"],
-                                           model_tags, output_dir,
-                                           "dens_ion_contours", output_format)
-
-    if reion_plots["dens_zreion_contours"] and rank == 0:
-        print("Plotting contours of density-zreion.")
-        reionplot.plot_dens_zreion_contours(reion_data["density_fbase_allmodels"],
-                                            reion_data["density_precision_allmodels"],
-                                            reion_data["zreion_path_allmodels"],
-                                            reion_data["GridSize_allmodels"],
-                                            reion_data["last_snap_allmodels"],
-                                            model_tags, output_dir,
-                                            "dens_zreion_contours", output_format)
+    if reion_plots["dens_ion_contours"]:
+        if rank == 0:
+            print("Plotting contours of density-ionization.")
+
+        histograms_allfrac = []
+        for frac_val in reion_plots["fixed_XHI_values"]:
+            sources_allmodels = []
+            for model_number in range(len(master_mass_frac)):
+
+                # First find the snapshot that corresponds to this XHI value.
+                snap_idx = (np.abs(master_mass_frac[model_number] - frac_val)).argmin()
+
+                # Add 1 for the cifog files.
+                snapnum = snap_idx + reion_data["first_snap_allmodels"][model_number]
+                cifog_snapnum = snapnum + 1
+
+                XHII_path = layout.format_path("XHII",
+                                               reion_data["XHII_fbase_allmodels"][model_number],
+                                               snap=cifog_snapnum)
+                density_path = layout.format_path("density",
+                                                  reion_data["density_fbase_allmodels"][model_number],
+                                                  snap=snapnum)
+
+                sources_allmodels.append({"x" : (density_path,
+                                                 reion_data["density_precision_allmodels"][model_number]),
+                                          "y" : (XHII_path,
+                                                 reion_data["XHII_precision_allmodels"][model_number])})
+
+            histograms_allfrac.append(grid_histograms_2d(rank, size, comm,
+                                                         sources_allmodels,
+                                                         reion_data["GridSize_allmodels"],
+                                                         log_x=True))
+
+        if rank == 0:
+            reionplot.plot_dens_reion_contours(histograms_allfrac,
+                                               reion_plots["fixed_XHI_values"],
+                                               model_tags, output_dir,
+                                               "dens_ion_contours",
+                                               output_format)
+
+    if reion_plots["dens_zreion_contours"]:
+        if rank == 0:
+            print("Plotting contours of density-zreion.")
+
+        sources_allmodels = []
+        for model_number in range(len(reion_data["zreion_path_allmodels"])):
+            density_path = layout.format_path("density",
+                                              reion_data["density_fbase_allmodels"][model_number],
+                                              snap=reion_data["last_snap_allmodels"][model_number])
+
+            # The zreion grids are always double precision.
+            sources_allmodels.append({"x" : (density_path,
+                                             reion_data["density_precision_allmodels"][model_number]),
+                                      "y" : (reion_data["zreion_path_allmodels"][model_number],
+                                             2)})
+
+        x_edges, y_edges, hist_allmodels = \
+            grid_histograms_2d(rank, size, comm, sources_allmodels,
+                               reion_data["GridSize_allmodels"], log_x=True)
+
+        if rank == 0:
+            reionplot.plot_dens_zreion_contours(x_edges, y_edges,
+                                                hist_allmodels, model_tags,
+                                                output_dir,
+                                                "dens_zreion_contours",
+                                                output_format)
+
+def reion_grid_sources(snapnum, snap_params, reion_plots):
+    """    
+    Determines the grids that are read to process a single snapshot of a
+    single model.
+
+    Parameters
+    ----------
+
+    snapnum : Integer
+        The (absolute) snapshot number.
+
+    snap_params : Dictionary
+        Parameters of the model this snapshot belongs to. Created in
+        ``generate_data()``.
+
+    reion_plots : Dictionary
+        Controls which of the plots we will make.  The ionizing photon grid
+        is only needed if we're plotting it.
+
+    Returns
+    ---------
+
+    sources : Dictionary
+        Keyed by ``XHII``, ``density`` and (if required) ``nion``.  Values are
+        the ``(path, precision)`` of each grid.
+    """
+
+    # cifog numbering is weird and is shifted by +1.
+    # E.g., nion file 027 is used to produce XHII file 028.
+    cifog_snapnum = snapnum + 1
+
+    XHII_path = layout.format_path("XHII", snap_params["XHII_fbase"],
+                                   snap=cifog_snapnum)
+    density_path = layout.format_path("density", snap_params["density_fbase"],
+                                      snap=snapnum)
+
+    sources = {"XHII" : (XHII_path, snap_params["XHII_precision"]),
+               "density" : (density_path, snap_params["density_precision"])}
+
+    if reion_plots["nion"]:
+        nion_path = layout.format_path("nion", snap_params["nion_fbase"],
+                                       snap=snapnum)
+        sources["nion"] = (nion_path, snap_params["nion_precision"])
+
+    return sources
+
+
+def need_full_grids(reion_plots):
+    """    
+    Checks if any of the per-snapshot calculations need the entire ionization
+    and density grids in memory.  If not, the grids are streamed from disk.
+    """
+
+    return reion_plots["single_slice"] or reion_plots["single_ps"] or \
+           reion_plots["ps_scales"] or reion_plots["ps_scales_beta"] or \
+           reion_plots["bubble_size"]
+
+
+def load_reion_grids(snapnum, pool=None, snap_params=None, reion_plots=None):
+    """    
+    Reads the grids required to process a single snapshot of a single model.
+    This is the loader that the parallel backend uses to read the next
+    snapshots while the current one is being processed.
+
+    Parameters
+    ----------
+
+    snapnum : Integer
+        The (absolute) snapshot number we're reading.
+
+    pool : ``Prefetch.BufferPool``, optional
+        If specified, the grids are read into buffers from this pool.
+
+    snap_params : Dictionary
+        Parameters of the model this snapshot belongs to. Created in
+        ``generate_data()``.
+
+    reion_plots : Dictionary
+        Controls which of the plots we will make.  
+
+    Returns
+    ---------
+
+    grids : Dictionary or ``None``
+        The ionization (``XHII``), density (``density``) and, if required,
+        ionizing photon (``nion``) grids.  ``None`` if none of the
+        calculations need the entire grids; in this case the grids are
+        streamed by ``process_reion_snapshot()``.  If
+        ``reion_plots["grid_level"]`` is non-zero, only the reduced resolution
+        ionization and density grids are read (see ``GridPyramid``).
+    """
+
+    if not need_full_grids(reion_plots):
+        return None
+
+    sources = reion_grid_sources(snapnum, snap_params, reion_plots)
+
+    # The reduced resolution grids are only used for the plots. The scalars
+    # are still streamed from the full resolution grids.
+    level = reion_plots["grid_level"]
+    if level > 0:
+        sources = {"XHII" : sources["XHII"], "density" : sources["density"]}
+
+    # In single precision mode the grids are converted as they're read.
+    if reion_plots["ps_single_precision"]:
+        grid_dtype = np.float32
+    else:
+        grid_dtype = None
+
+    grids = {}
+    for name, (path, precision) in sources.items():
+        grids[name] = rs.read_binary_grid(path, snap_params["GridSize"],
+                                          precision, pool=pool,
+                                          dtype=grid_dtype, level=level)
+
+    return grids
+
+
+def process_reion_snapshot(snapnum, grids=None, snap_params=None,
+                           reion_plots=None, output_dir=None,
+                           output_format=None):
+    """    
+    Calculates the reionization properties of a single snapshot of a single
+    model.  This is the function that is mapped over the snapshots by the
+    parallel backend.
+
+    Parameters
+    ----------
+
+    snapnum : Integer
+        The (absolute) snapshot number we're processing.
+
+    grids : Dictionary, optional
+        The grids of this snapshot, read by ``load_reion_grids()``.  If not
+        specified, they are read here.
+
+    snap_params : Dictionary
+        Parameters of the model this snapshot belongs to. Created in
+        ``generate_data()``.
+
+    reion_plots : Dictionary
+        Controls which of the plots we will make.  If we're not plotting a
+        property we don't need to calculate stuff for it! 
+
+    output_dir : String
+        Directory where the plots are saved. Used to save MC data.
+
+    output_format : String
+        The format of the saved figures.
+
+    Returns
+    ---------
+
+    snap_data : Dictionary
+        The volume and mass weighted neutral fractions, the number of ionizing
+        photons and (if required) the wavenumber bins, 21cm and HII power
+        spectra.  The spectra are ``None`` if they were not calculated.
+    """
+
+    z_array_reion = snap_params["z_array_reion"]
+    cosmology = snap_params["cosmology"]
+    GridSize = snap_params["GridSize"]
+    boxsize = snap_params["boxsize"]
+    model_tag = snap_params["model_tag"]
+
+    snap_data = {"volume_frac" : 0.0, "mass_frac" : 0.0, "nion" : 0.0,
+                 "k" : None, "P21" : None, "PHII" : None}
+
+    # Where this snapshot slices into the global arrays.
+    snap_idx = snapnum - snap_params["first_snap"]
+
+    if grids is None:
+        grids = load_reion_grids(snapnum, snap_params=snap_params,
+                                 reion_plots=reion_plots)
+
+    # All the scalars are calculated in a single, chunked pass over the grids.
+    # If we don't need the entire grids (or only have reduced resolution
+    # copies of them) they're streamed straight from disk.
+    level = reion_plots["grid_level"]
+    if grids is None or level > 0:
+        sources = reion_grid_sources(snapnum, snap_params, reion_plots)
+    else:
+        sources = grids
+
+    if grids is not None:
+        XHII = grids["XHII"]
+        density = grids["density"]
+
+    # For the mass fraction, weight it by the density and normalize.
+    reductions = {"XHII_volume" : ("mean", {"grid" : "XHII"}),
+                  "XHII_mass" : ("weighted_mean", {"grid" : "XHII",
+                                                   "weight" : "density"})}
+
+    # Only need ionizing photons if we're plotting it.
+    if reion_plots["nion"]:
+        reductions["nion"] = ("sum", {"grid" : "nion"})
+
+    results = gridreduce.reduce_grids(sources, reductions, GridSize)
+
+    # Be aware we track everything using the neutral HI fraction.
+    volume_frac = 1.0 - results["XHII_volume"]
+    mass_frac = 1.0 - results["XHII_mass"]
+
+    snap_data["volume_frac"] = volume_frac
+    snap_data["mass_frac"] = mass_frac
+
+    if reion_plots["nion"]:
+        snap_data["nion"] = results["nion"]
+
+    # If we're plotting a single slice, we have the ionized cells open
+    # so let's plot it now!
+    if reion_plots["single_slice"]:
+        # The cut is specified at full resolution.
+        reionplot.plot_single_slice(z_array_reion[snap_idx], snap_idx,
+                                    XHII, mass_frac, len(XHII), boxsize,  
+                                    reion_plots["cut_slice"] // 2**level,
+                                    max(1, reion_plots["cut_thickness"] // 2**level),
+                                    model_tag, output_dir, output_format)
+
+    # If we're plotting the power spectra in scale space need to
+    # calculate them at every single snapshot.
+    if reion_plots["ps_scales"] or reion_plots["ps_scales_beta"] or \
+       reion_plots["single_ps"]:
+        T0 = T_naught(z_array_reion[snap_idx], cosmology.H(0).value/100.0,
+                      cosmology.Om0, cosmology.Ob0)
+
+        # Be aware, using boxsize in Mpc/h.
+        tmp_k, tmp_PowSpec, tmp_Error, \
+        tmp_k_XHII, tmp_Pspec_HII, tmp_Error_XHII = calc_ps(XHII, density,
+                                                            boxsize,
+                                                            reion_plots["ps_single_precision"])
+
+        factor = T0*T0 * tmp_k**3 * 4.0*np.pi
+        snap_data["k"] = tmp_k
+        snap_data["P21"] = tmp_PowSpec * factor
+        snap_data["PHII"] = tmp_Pspec_HII * tmp_k**3 * 4.0*np.pi
+
+        if reion_plots["single_ps"]:
+            reionplot.plot_single_ps(tmp_k, tmp_PowSpec * factor,
+                                     snap_idx, mass_frac,
+                                     reion_plots["small_scale_def"],
+                                     reion_plots["large_scale_def"],
+                                     model_tag, output_dir, output_format)
+
+    if reion_plots["bubble_size"] and \
+       (mass_frac < 0.95 and mass_frac > 0.05):
+
+        # Only calculate the MC if the file doesn't exist.
+        MC_path = "{0}/MC/{1}_z_{2:.3f}.txt".format(output_dir, model_tag,
+                                                    z_array_reion[snap_idx]) 
+        if (os.path.exists(MC_path) == False):
+            calculate_bubble_MC(XHII, MC_path)
+
+    return snap_data
+
+
+def reion_checkpoints(checkpoint_dir, snapnums, snap_params, reion_plots):
+    """    
+    Determines the checkpoint file and settings signature for each snapshot of
+    a single model.  Checkpoints are named by the identity of their inputs so
+    they can be re-used regardless of the order (or number) of models being
+    plotted.
+
+    Parameters
+    ----------
+
+    checkpoint_dir : String
+        Directory the checkpoints are saved in.
+
+    snapnums : List of integers
+        The snapshots that we're processing.
+
+    snap_params : Dictionary
+        Parameters of the model. Created in ``generate_data()``.
+
+    reion_plots : Dictionary
+        Controls which of the plots we will make.  
+
+    Returns
+    ---------
+
+    checkpoints : Dictionary
+        Keyed by snapshot number. Values are ``(path, signature)`` tuples.  See
+        ``Checkpoints.CheckpointedWorker``.
+    """
+
+    # The plots made by ``process_reion_snapshot()`` are saved when the
+    # snapshot is first processed so they don't need to be in the signature.
+    settings = dict((key, snap_params[key]) for key in snap_params
+                    if key not in ["cosmology", "model_tag", "z_array_reion",
+                                   "first_snap"])
+    cosmology = snap_params["cosmology"]
+    settings["cosmology"] = [cosmology.H0.value, cosmology.Om0, cosmology.Ob0]
+    settings["nion"] = reion_plots["nion"]
+    settings["calc_ps"] = reion_plots["ps_scales"] or \
+                          reion_plots["ps_scales_beta"] or \
+                          reion_plots["single_ps"]
+    settings["ps_single_precision"] = reion_plots["ps_single_precision"]
+    settings["grid_level"] = reion_plots["grid_level"]
+
+    checkpoints = {}
+    for snapnum in snapnums:
+
+        # The grids that ``process_reion_snapshot()`` reads.
+        sources = reion_grid_sources(snapnum, snap_params, reion_plots)
+        fnames = [sources[name][0] for name in sorted(sources)]
+
+        # The temperature of the 21cm power spectrum depends on redshift.
+        z_snap = snap_params["z_array_reion"][snapnum - snap_params["first_snap"]]
+
+        signature = ckpt.make_signature([settings, snapnum, z_snap,
+                                         ckpt.file_identity(fnames)])
+
+        fname = "{0}/reion/{1}.npz".format(checkpoint_dir,
+                                           ckpt.make_key(signature))
+        checkpoints[snapnum] = (fname, signature)
+
+    return checkpoints
 
 
 def generate_data(rank, size, comm, reion_ini_files, gal_ini_files,
-                  reion_plots, output_dir, model_tags, output_format):
+                  reion_plots, output_dir, model_tags, output_format,
+                  backend=None):
     """    
     Reads in the galaxy data for calculate all the require properties for each
     models.
@@ -1375,8 +2110,8 @@ def generate_data(rank, size, comm, reion_ini_files, gal_ini_files,
     size : Integer
         The total number of processors executing the pipeline.
 
-    comm : Class ``mpi4py.MPI.Intracomm``
-        The ``mpi4py`` communicator.
+    comm : Class ``mpi4py.MPI.Intracomm`` or ``ParallelBackend.SerialComm``
+        The communicator between the tasks.
 
     reion_ini_files, gal_ini_files : List of strings 
         ``.ini`` file corresponding to each model that we're plotting.  We need
@@ -1386,6 +2121,11 @@ def generate_data(rank, size, comm, reion_ini_files, gal_ini_files,
         Controls which of the plots we will make.  Keys are the name of each
         plot (e.g., ``reion``) and the value specifies if we are plotting it. If
         we're not plotting a property we don't need to calculate stuff for it! 
+        If ``reion_plots["checkpoint_dir"]`` is not ``None``, the results of
+        each snapshot are saved to (and re-used from) this directory.  The
+        grids of up to ``reion_plots["prefetch_depth"]`` snapshots (holding
+        at most ``reion_plots["prefetch_bytes"]`` bytes) are read ahead of
+        the snapshot being processed.
 
     output_dir : String
         Directory where the plots are saved. Used to save MC data.
@@ -1394,6 +2134,13 @@ def generate_data(rank, size, comm, reion_ini_files, gal_ini_files,
         String that will appear on the legend of the plot for each model. Used
         to save MC data with a unique name.
 
+    output_format : String
+        The format of the saved figures.
+
+    backend : ``ParallelBackend`` backend, optional
+        The backend that the snapshots are distributed with.  If not
+        specified, the snapshots are distributed across the tasks of ``comm``.
+
     Returns
     ---------
 
@@ -1402,6 +2149,9 @@ def generate_data(rank, size, comm, reion_ini_files, gal_ini_files,
         plots.
     """
 
+    if backend is None:
+        backend = pb.backend_from_comm(comm)
+
     if rank == 0:
         print("Generating reionization data for a total of {0} "
               "models and saving plots in directory {1}" \
@@ -1458,43 +2208,39 @@ def generate_data(rank, size, comm, reion_ini_files, gal_ini_files,
             print("Model {0}".format(model_number))
 
         # Read in the parameters and set some initial variables.
-        SAGE_params = rs.read_SAGE_ini(gal_ini_file)
-        cifog_params, _ = rs.read_cifog_ini(reion_ini_file, SAGE_params)
+        SAGE_params, cifog_params = runparams.load_run(gal_ini_file,
+                                                       reion_ini_file)
 
-        cosmology, t_bigbang = gd.set_cosmology(float(SAGE_params["Hubble_h"]),
-                                                float(SAGE_params["Omega"]),
-                                                float(cifog_params["omega_b"]))
+        cosmology, t_bigbang = gd.set_cosmology(SAGE_params.Hubble_h,
+                                                SAGE_params.Omega,
+                                                cifog_params.omega_b)
 
         cosmology_allmodels.append(cosmology)
         t_bigbang_allmodels.append(t_bigbang)
 
-        first_snap = int(SAGE_params["LowSnap"])
+        first_snap = SAGE_params.LowSnap
         first_snap_allmodels.append(first_snap)
 
-        last_snap = int(SAGE_params["LastSnapShotNr"])
+        last_snap = SAGE_params.LastSnapShotNr
         last_snap_allmodels.append(last_snap)
 
-        GridSize = int(SAGE_params["GridSize"])
+        GridSize = SAGE_params.GridSize
         GridSize_allmodels.append(GridSize)
 
         # Careful, cifog uses Mpc/h.
-        boxsize = float(SAGE_params["BoxSize"])
+        boxsize = SAGE_params.BoxSize
         boxsize_allmodels.append(boxsize)
         # However we use the volume as Mpc^3.
-        model_volume = pow(float(SAGE_params["BoxSize"]) / \
-                           float(SAGE_params["Hubble_h"]),3)
+        model_volume = SAGE_params.volume
 
-        helium = float(cifog_params["Y"])
+        helium = cifog_params.Y
         helium_allmodels.append(helium)
 
-        nion_factor = float(cifog_params["nion_factor"])
+        nion_factor = cifog_params.nion_factor
         nion_factor_allmodels.append(nion_factor) 
 
-        model_hubble_h = float(SAGE_params["Hubble_h"])
-        model_halopartcut = int(SAGE_params["HaloPartCut"])
-
         # Load the redshift file and calculate the lookback times. 
-        z_array_full, lookback_array_full = gd.load_redshifts(SAGE_params["FileWithSnapList"],
+        z_array_full, lookback_array_full = gd.load_redshifts(SAGE_params.FileWithSnapList,
                                                               cosmology, t_bigbang)
         z_array_reion = np.array(z_array_full[first_snap:last_snap])
         lookback_array_reion = np.array(lookback_array_full[first_snap:last_snap])
@@ -1504,26 +2250,23 @@ def generate_data(rank, size, comm, reion_ini_files, gal_ini_files,
 
         # Determine the base file names for the ionization, ionizing photons
         # and density fields. 
-        XHII_fbase = cifog_params["output_XHII_file"]
+        XHII_fbase = cifog_params.XHII_fbase
         XHII_fbase_allmodels.append(XHII_fbase)
 
-        density_fbase = cifog_params["inputIgmDensityFile"]
+        density_fbase = cifog_params.density_fbase
         density_fbase_allmodels.append(density_fbase)
 
-        zreion_path = "{0}/{1}".format(SAGE_params["PhotoionDir"],
-                                       SAGE_params["ReionRedshiftName"])
+        zreion_path = SAGE_params.zreion_path
         zreion_path_allmodels.append(zreion_path)
 
-        nion_fbase = cifog_params["inputNionFile"]
+        nion_fbase = cifog_params.nion_fbase
 
         # cifog uses 0 for floating point and 1 for double precision.
         # I use 0 for integer, 1 for floating point and 2 for double precision.
-        density_precision = int(cifog_params["densityFilesAreInDoublePrecision"])
-        density_precision += 1
+        density_precision = cifog_params.density_precision
         density_precision_allmodels.append(density_precision)
 
-        nion_precision = int(cifog_params["nionFilesAreInDoublePrecision"])
-        nion_precision += 1
+        nion_precision = cifog_params.nion_precision
 
         # The ionization fields are assumed to have double precision.
         XHII_precision = 2
@@ -1539,83 +2282,60 @@ def generate_data(rank, size, comm, reion_ini_files, gal_ini_files,
         P21_allmodels.append([])
         PHII_allmodels.append([])
 
-        # All arrays done, now loop over snapshots and read in.
-        for snapnum in range(first_snap + rank, last_snap, size):
+        # All arrays done, now loop over snapshots and read in. The backend
+        # distributes the snapshots round-robin across the tasks (which
+        # ``gather_ps()`` relies upon) and each returns its own results.
+        snap_params = {"z_array_reion" : z_array_reion,
+                       "cosmology" : cosmology,
+                       "first_snap" : first_snap,
+                       "GridSize" : GridSize,
+                       "boxsize" : boxsize,
+                       "XHII_fbase" : XHII_fbase,
+                       "XHII_precision" : XHII_precision,
+                       "density_fbase" : density_fbase,
+                       "density_precision" : density_precision,
+                       "nion_fbase" : nion_fbase,
+                       "nion_precision" : nion_precision,
+                       "model_tag" : model_tags[model_number]}
+
+        worker = functools.partial(process_reion_snapshot,
+                                   snap_params=snap_params,
+                                   reion_plots=reion_plots,
+                                   output_dir=output_dir,
+                                   output_format=output_format)
+
+        # The grids of the next snapshots are read while the current one is
+        # processed.
+        loader = functools.partial(load_reion_grids, snap_params=snap_params,
+                                   reion_plots=reion_plots)
+
+        # If we're checkpointing, the results of each snapshot are saved as
+        # soon as they're calculated.  A restarted run (or one with extra
+        # models) then only processes the snapshots that are missing.
+        if reion_plots["checkpoint_dir"] is not None:
+            checkpoints = reion_checkpoints(reion_plots["checkpoint_dir"],
+                                            range(first_snap, last_snap),
+                                            snap_params, reion_plots)
+            worker = ckpt.CheckpointedWorker(worker, checkpoints)
+            loader = ckpt.CheckpointedLoader(loader, checkpoints)
+
+        for snapnum, snap_data in backend.map(worker, range(first_snap, last_snap),
+                                              loader=loader,
+                                              prefetch_depth=reion_plots["prefetch_depth"],
+                                              prefetch_bytes=reion_plots["prefetch_bytes"]):
 
             # Where this snapshot slices into the global arrays.
             snap_idx = snapnum - first_snap
 
-            # cifog numbering is weird and is shifted by +1.
-            # E.g., nion file 027 is used to produce XHII file 028.
-            cifog_snapnum = snapnum + 1
-
-            XHII_path = "{0}_{1:03d}".format(XHII_fbase, cifog_snapnum)
-            XHII = rs.read_binary_grid(XHII_path, GridSize, XHII_precision) 
-
-            density_path = "{0}{1:03d}.dens.dat".format(density_fbase, snapnum)
-            density = rs.read_binary_grid(density_path, GridSize,
-                                          density_precision)
-
-            # Be aware we track everything using the neutral HI fraction.
-            # For the mass fraction, weight it by the density and normalize.
-            volume_frac = 1.0 - np.mean(XHII)
-            mass_frac = 1.0 - np.sum(XHII * density / np.sum(density))
-
-            volume_frac_allmodels[model_number][snap_idx] = volume_frac
-            mass_frac_allmodels[model_number][snap_idx] = mass_frac
-
-            # Only need ionizing photons if we're plotting it.
-            if reion_plots["nion"]:
-                nion_path = "{0}_{1:03d}".format(nion_fbase, snapnum)
-                nion = rs.read_binary_grid(nion_path, GridSize, nion_precision)
-
-                nion_allmodels[model_number][snap_idx] = np.sum(nion)
-
-            # If we're plotting a single slice, we have the ionized cells open
-            # so let's plot it now!
-            if reion_plots["single_slice"]:
-                reionplot.plot_single_slice(z_array_reion[snap_idx], snap_idx,
-                                            XHII, mass_frac, GridSize, boxsize,  
-                                            reion_plots["cut_slice"],
-                                            reion_plots["cut_thickness"],
-                                            model_tags[model_number],
-                                            output_dir, output_format)
-
-            # If we're plotting the power spectra in scale space need to
-            # calculate them at every single snapshot.
-            if reion_plots["ps_scales"] or reion_plots["ps_scales_beta"] or \
-               reion_plots["single_ps"]:
-                T0 = T_naught(z_array_reion[snap_idx], cosmology.H(0).value/100.0,
-                              cosmology.Om0, cosmology.Ob0)
-
-                # Be aware, using boxsize in Mpc/h.
-                tmp_k, tmp_PowSpec, tmp_Error, \
-                tmp_k_XHII, tmp_Pspec_HII, tmp_Error_XHII = calc_ps(XHII, density,
-                                                                    boxsize)
-
-                factor = T0*T0 * tmp_k**3 * 4.0*np.pi
-                k_allmodels[model_number].append(tmp_k)
-                P21_allmodels[model_number].append(tmp_PowSpec * factor) 
-                PHII_allmodels[model_number].append(tmp_Pspec_HII * tmp_k**3 * 4.0*np.pi)
-
-                if reion_plots["single_ps"]:
-                    reionplot.plot_single_ps(tmp_k, tmp_PowSpec * factor,
-                                             snap_idx, mass_frac,
-                                             reion_plots["small_scale_def"],
-                                             reion_plots["large_scale_def"],
-                                             model_tags[model_number],
-                                             output_dir, output_format)
-
-            if reion_plots["bubble_size"] and \
-               (mass_frac < 0.95 and mass_frac > 0.05):
-
-                # Only calculate the MC if the file doesn't exist.
-                MC_path = "{0}/MC/{1}_z_{2:.3f}.txt".format(output_dir,
-                                                            model_tags[model_number],
-                                                            z_array_reion[snap_idx]) 
-                if (os.path.exists(MC_path) == False):
-                    calculate_bubble_MC(XHII, MC_path)
-            
+            volume_frac_allmodels[model_number][snap_idx] = snap_data["volume_frac"]
+            mass_frac_allmodels[model_number][snap_idx] = snap_data["mass_frac"]
+            nion_allmodels[model_number][snap_idx] = snap_data["nion"]
+
+            if snap_data["k"] is not None:
+                k_allmodels[model_number].append(snap_data["k"])
+                P21_allmodels[model_number].append(snap_data["P21"])
+                PHII_allmodels[model_number].append(snap_data["PHII"])
+
         # Snapshot Loop.
 
         # Ionizing emissitivty is scaled by the simulation volume (in Mpc^3).
@@ -16,8 +16,9 @@ import ReadScripts as rs
 import PlotScripts as ps
 import CollectiveStats as collective
 import ObservationalData as Obs
+import FileLayout as layout
 
-from mpi4py import MPI
+from ParallelBackend import MPI
 
 def plot_single_slice(z, snapnum, XHII, mass_frac, GridSize, boxsize, 
                       cut_slice, cut_thickness, model_tag, output_dir,
@@ -1287,7 +1288,7 @@ def plot_slices_XHI(z_array_reion_allmodels, cosmology_allmodels,
                     XHII_precision_allmodels, GridSize_allmodels,
                     boxsize_allmodels, first_snap_allmodels,
                     fixed_XHI_values, cut_slice, cut_thickness, model_tags,
-                    output_dir, output_tag, output_format):
+                    output_dir, output_tag, output_format, grid_level=0):
     """
     Plots slices of the ionization fields for each model at fixed neutral
     hydrogen fractions.
@@ -1351,6 +1352,12 @@ def plot_slices_XHI(z_array_reion_allmodels, cosmology_allmodels,
     output_format : String
         Format the plot is saved in.
 
+    grid_level : Integer, optional
+        If non-zero, the reduced resolution ionization grids with ``GridSize /
+        2^grid_level`` cells along a side are plotted (see ``GridPyramid``).
+        ``cut_slice`` and ``cut_thickness`` are still given at full
+        resolution.
+
     Returns
     ---------
 
@@ -1389,10 +1396,11 @@ def plot_slices_XHI(z_array_reion_allmodels, cosmology_allmodels,
             # These are cifog files so need to add 1.
             cifog_snapnum = snap_idx + first_snap_allmodels[model_number] + 1
 
-            XHII_path = "{0}_{1:03d}".format(XHII_fbase_allmodels[model_number],
-                                             cifog_snapnum)
+            XHII_path = layout.format_path("XHII", XHII_fbase_allmodels[model_number],
+                                           snap=cifog_snapnum)
             XHII = rs.read_binary_grid(XHII_path, GridSize_allmodels[model_number],
-                                       XHII_precision_allmodels[model_number])
+                                       XHII_precision_allmodels[model_number],
+                                       level=grid_level)
 
             # Set this up to get nice plotting.
             ionized_cells = np.log10(1 - XHII)
@@ -1406,6 +1414,10 @@ def plot_slices_XHI(z_array_reion_allmodels, cosmology_allmodels,
             thickness_cut = int(np.ceil(cut_thickness * model_boxsize/mod0_boxsize * \
                                         model_gridsize / mod0_gridsize))
 
+            # Then shrink the cut to the resolution of the grid we read.
+            index_cut = index_cut // 2**grid_level
+            thickness_cut = max(1, thickness_cut // 2**grid_level)
+
             im = this_ax.imshow(ionized_cells[:,:,index_cut:index_cut+thickness_cut].mean(axis=-1),
                                 interpolation="none", origin="low",
                                 extent = [0.0, model_boxsize, 0.0, model_boxsize],
@@ -1661,161 +1673,143 @@ def plot_zreion_dens_cross(k, crosscorr, bias, model_tags, output_dir,
     plt.close()
 
 
-def plot_dens_reion_contours(mass_frac_allmodels, XHII_fbase_allmodels,
-                             XHII_precision_allmodels, density_fbase_allmodels,
-                             density_precision_allmodels, GridSize_allmodels,
-                             first_snap_allmodels, fixed_XHI_values,
-                             model_tags, output_dir, output_tag,
-                             output_format):
+def histogram_contour_levels(hist, sigmas):
     """
-    Plots contours of density-ionization.
+    Determines the contour levels of a 2D histogram that enclose a given
+    fraction of the samples.
 
     Parameters
     ----------
 
-    mass_frac_allmodels : 2D nested list of floats. Dimensions equal to
-                          ``z_array_reion_allmodels``.
-        The mass weighted neutral fraction at each snapshot for each model.
+    hist : 2D ``np.ndarray`` of floats
+        The (possibly smoothed) number of samples in each bin.
 
-    XHII_fbase_allmodels : List of strings. Length is number of models.
-        The base filename for the ionization fields for each model.
+    sigmas : List of floats
+        The contours are drawn at the levels enclosing the same fraction of
+        samples as these sigmas of a 2D Gaussian, ``1 - exp(-sigma^2 / 2)``.
 
-    XHII_precision_allmodels : List of integers. Length is number of models.
-        The precision of the ionization fields for each model.
-        1 : Float, 2 : Double.
+    Returns
+    ---------
 
-    density_fbase_allmodels : List of strings. Length is number of models.
-        The base filename for the density fields for each model.
+    levels : 1D ``np.ndarray`` of floats
+        The histogram value of each contour, in increasing order.
+    """
 
-    density_precision_allmodels : List of integers. Length is number of models.
-        The precision of the density fields for each model.
-        1 : Float, 2 : Double.
+    counts = np.sort(hist.ravel())[::-1]
+    cumulative = np.cumsum(counts)
+    cumulative /= cumulative[-1]
 
-    GridSize_allmodels : List of integers. Length is number of models.
-        The number of grid cells (along a box size) for each model.
+    levels = []
+    for sigma in sigmas:
+        enclosed = 1.0 - np.exp(-0.5 * sigma**2)
+        idx = min(np.searchsorted(cumulative, enclosed), len(counts) - 1)
+        levels.append(counts[idx])
 
-    first_snap_allmodels : List of integers. Length is number of models.
-        The snapshot where ``cifog`` starts calculations for each model.
+    # ``contour`` requires strictly increasing levels.
+    return np.unique(levels)
 
-    fixed_XHI_values : List of floats.
-        The neutral hydrogen fractions we're calculating the contours at.
-        Defined by the user in ``paper_plots.py``.
 
-    model_tags : List of strings. Length is number of models.
-        Legend entry for each model.
+def plot_histogram_contours(x_edges, y_edges, hist_allmodels, x_label,
+                            y_label, model_tags, output_file,
+                            sigmas=[1, 2, 3], smooth=1.0):
+    """
+    Plots the contours of 2D histograms (see
+    ``ReionData.grid_histograms_2d()``), one set of contours per model.
 
-    output_dir : String
-        Directory where the plot is saved.
+    Parameters
+    ----------
 
-    output_tag : String.
-        Tag added to the name of the output file.
+    x_edges, y_edges : 1D ``np.ndarray`` of floats
+        The bin edges along each axis.
 
-    output_format : String
-        Format the plot is saved in.
+    hist_allmodels : 3D ``np.ndarray`` of floats. Outer length is number of
+                     models, then the number of x and y bins.
+        The number of cells in each bin for each model.
 
-    Returns
-    ---------
+    x_label, y_label : Strings
+        The axis labels.
 
-    None. The figure is saved as "<output_dir>/<output_tag>.<output_format>".
-    """
-    from chainconsumer import ChainConsumer
+    model_tags : List of strings. Length is number of models.
+        Legend entry for each model.
 
-    num_models = len(mass_frac_allmodels)
-    num_frac = len(fixed_XHI_values)
+    output_file : String
+        Path the plot is saved to.
 
-    # When we load in the data, want to keep it as a 1D array.
-    reshape = False
+    sigmas : List of floats, optional
+        The levels contours are drawn at.  See ``histogram_contour_levels()``.
 
-    for frac_number, frac_val in enumerate(fixed_XHI_values):
+    smooth : Float, optional
+        Width (in bins) of the Gaussian the histograms are smoothed with
+        before the contours are drawn.  If 0, no smoothing is done.
 
-        c = ChainConsumer()
+    Returns
+    ---------
 
-        for model_number in range(num_models):
+    None. The figure is saved as ``output_file``.
+    """
 
-            model_gridsize = GridSize_allmodels[model_number]
+    from scipy import ndimage
+    from matplotlib.lines import Line2D
 
-            XHII_fbase = XHII_fbase_allmodels[model_number]
-            XHII_precision = XHII_precision_allmodels[model_number]
+    fig1 = plt.figure()
+    ax1 = fig1.add_subplot(111)
 
-            density_fbase = density_fbase_allmodels[model_number]
-            density_precision = density_precision_allmodels[model_number]
+    x_mid = 0.5 * (x_edges[1:] + x_edges[:-1])
+    y_mid = 0.5 * (y_edges[1:] + y_edges[:-1])
 
-            # First find the snapshot that corresponds to this XHI value.
-            snap_idx = (np.abs(mass_frac_allmodels[model_number] - frac_val)).argmin()
+    handles = []
+    for model_number in range(len(hist_allmodels)):
 
-            # Add 1 for the cifog files. 
-            snapnum = snap_idx + first_snap_allmodels[model_number]
-            cifog_snapnum = snapnum + 1 
+        hist = hist_allmodels[model_number]
+        if smooth > 0:
+            hist = ndimage.gaussian_filter(hist, smooth)
 
-            XHII_path = "{0}_{1:03d}".format(XHII_fbase, cifog_snapnum)
-            XHII = rs.read_binary_grid(XHII_path, model_gridsize,
-                                       XHII_precision, reshape)
-            XHI = 1.0 - XHII
+        if np.sum(hist) == 0:
+            continue
 
-            #w_partial = np.where((XHII > 0.0) & (XHII < 1.0))[0]
-            #print("Model {0}\tXHI = {1}".format(model_number, frac_val))
-            #print("Min partial ionization {0}\tMax partial ionization "
-            #      "{1}".format(min(XHII[w_partial]), max(XHII[w_partial])))
+        levels = histogram_contour_levels(hist, sigmas)
 
-            density_path = "{0}{1:03d}.dens.dat".format(density_fbase, snapnum)
-            density = rs.read_binary_grid(density_path, model_gridsize,
-                                          density_precision, reshape)
+        # The histograms are indexed as [x, y] whereas ``contour`` expects
+        # [y, x].
+        ax1.contour(x_mid, y_mid, hist.T, levels=levels,
+                    colors=ps.colors[model_number])
 
-            data = np.empty((len(density), 2))
-            data[:,0] = np.log10(density)
-            data[:,1] = XHII
+        handles.append(Line2D([], [], color=ps.colors[model_number],
+                              label=model_tags[model_number]))
 
-            x_param = r"$\mathbf{\log_{10}\delta}$"
-            y_param = r"$\mathbf{\chi_\mathrm{HI}}$"
-            c.add_chain(data, parameters=[x_param, y_param], 
-                        name=model_tags[model_number])
+    ax1.set_xlabel(x_label, size = ps.global_labelsize)
+    ax1.set_ylabel(y_label, size = ps.global_labelsize)
 
-        #c.configure(plot_hists=False)
+    leg = ax1.legend(handles=handles, loc='upper right', numpoints=1,
+                     labelspacing=0.1)
+    leg.draw_frame(False)  # Don't want a box frame
+    for t in leg.get_texts():  # Reduce the size of the text
+        t.set_fontsize(ps.global_legendsize-2)
 
-        fig1 = c.plotter.plot(figsize="column")
+    fig1.tight_layout()
 
-        final_tag = "{0}_XHI{1}".format(output_tag, frac_val)
+    fig1.savefig(output_file)
+    print('Saved file to {0}'.format(output_file))
 
-        outputFile = "{0}/{1}.{2}".format(output_dir,
-                                          final_tag, 
-                                          output_format)
-        fig1.savefig(outputFile)
-        print('Saved file to {0}'.format(outputFile))
+    plt.close()
 
 
-def plot_dens_zreion_contours(density_fbase_allmodels,
-                              density_precision_allmodels,
-                              zreion_path_allmodels, GridSize_allmodels,
-                              last_snap_allmodels, model_tags, output_dir,
-                              output_tag, output_format):
+def plot_dens_reion_contours(histograms_allfrac, fixed_XHI_values, model_tags,
+                             output_dir, output_tag, output_format):
     """
-    Plots contours of density-zreion.
+    Plots contours of density-ionization.
 
     Parameters
     ----------
 
-    density_fbase_allmodels : List of strings. Length is number of models.
-        The base filename for the density fields for each model.
+    histograms_allfrac : List of tuples. Length is number of fixed XHI values.
+        The ``(x_edges, y_edges, hist_allmodels)`` tuple of the log10 density
+        against ionization histograms at each fixed XHI value.  See
+        ``ReionData.grid_histograms_2d()``.
 
-    density_precision_allmodels : List of integers. Length is number of models.
-        The precision of the density fields for each model.
-        1 : Float, 2 : Double.
-
-    zreion_path_allmodels : List of strings. Length is number of models.
-        The path to the zreion file for each model. 
-
-    XHII_fbase_allmodels : List of strings. Length is number of models.
-        The base filename for the ionization fields for each model.
-
-    XHII_precision_allmodels : List of integers. Length is number of models.
-        The precision of the ionization fields for each model.
-        1 : Float, 2 : Double.
-
-    GridSize_allmodels : List of integers. Length is number of models.
-        The number of grid cells (along a box size) for each model.
-
-    last_snap_allmodels : List of integers. Length is number of models.
-        The snapshot where ``cifog`` ends calculations for each model.
+    fixed_XHI_values : List of floats.
+        The neutral hydrogen fractions we're calculating the contours at.
+        Defined by the user in ``paper_plots.py``.
 
     model_tags : List of strings. Length is number of models.
         Legend entry for each model.
@@ -1835,60 +1829,63 @@ def plot_dens_zreion_contours(density_fbase_allmodels,
     None. The figure is saved as "<output_dir>/<output_tag>.<output_format>".
     """
 
-    from chainconsumer import ChainConsumer
-    c = ChainConsumer()
+    x_param = r"$\mathbf{\log_{10}\delta}$"
+    y_param = r"$\mathbf{\chi_\mathrm{HI}}$"
 
-    num_models = len(density_fbase_allmodels)
-    reshape = False
+    for frac_number, frac_val in enumerate(fixed_XHI_values):
 
-    for model_number in range(num_models):
+        x_edges, y_edges, hist_allmodels = histograms_allfrac[frac_number]
 
-        model_gridsize = GridSize_allmodels[model_number]
+        final_tag = "{0}_XHI{1}".format(output_tag, frac_val)
 
-        density_fbase = density_fbase_allmodels[model_number]
-        density_precision = density_precision_allmodels[model_number]
-        density_snap = last_snap_allmodels[model_number]
+        outputFile = "{0}/{1}.{2}".format(output_dir,
+                                          final_tag, 
+                                          output_format)
 
-        density_path = "{0}{1:03d}.dens.dat".format(density_fbase, density_snap)
-        density = rs.read_binary_grid(density_path, model_gridsize,
-                                      density_precision, reshape)
+        plot_histogram_contours(x_edges, y_edges, hist_allmodels, x_param,
+                                y_param, model_tags, outputFile,
+                                sigmas=[1, 2])
 
-        precision = 2
-        zreion = rs.read_binary_grid(zreion_path_allmodels[model_number],
-                                     GridSize_allmodels[model_number],
-                                     precision, reshape)
 
-        data = np.empty((len(density), 2))
-        data[:,0] = np.log10(density)
-        data[:,1] = zreion 
+def plot_dens_zreion_contours(x_edges, y_edges, hist_allmodels, model_tags,
+                              output_dir, output_tag, output_format):
+    """
+    Plots contours of density-zreion.
 
-        x_param = r"$\mathbf{\log_{10}\delta}$"
-        y_param = r"$\mathbf{z_\mathrm{reion}}$"
-        c.add_chain(data, parameters=[x_param, y_param], 
-                    name=model_tags[model_number])
+    Parameters
+    ----------
 
-    c.configure(sigmas=[0, 1, 2, 3])
+    x_edges, y_edges, hist_allmodels : See
+                                       ``ReionData.grid_histograms_2d()``.
+        The log10 density against zreion histograms for each model.
 
-    fig1 = c.plotter.plot(figsize="column")
+    model_tags : List of strings. Length is number of models.
+        Legend entry for each model.
 
-    #ax = fig.get_axes()
+    output_dir : String
+        Directory where the plot is saved.
 
-    '''        
-    ax1 = ax[2]
+    output_tag : String.
+        Tag added to the name of the output file.
 
-    ax1.set_xlabel(
-                   size = ps.global_labelsize)
+    output_format : String
+        Format the plot is saved in.
+
+    Returns
+    ---------
+
+    None. The figure is saved as "<output_dir>/<output_tag>.<output_format>".
+    """
+
+    x_param = r"$\mathbf{\log_{10}\delta}$"
+    y_param = r"$\mathbf{z_\mathrm{reion}}$"
 
-    ax1.set_ylabel(
-                   size = ps.global_labelsize)
-    '''
-    #fig1.tight_layout()
     outputFile = "{0}/{1}.{2}".format(output_dir,
                                       output_tag, 
                                       output_format)
 
-    fig1.savefig(outputFile)
-    print('Saved file to {0}'.format(outputFile))
+    plot_histogram_contours(x_edges, y_edges, hist_allmodels, x_param,
+                            y_param, model_tags, outputFile)
 
 
 def plot_ps_beta(P21_beta, P21_beta_error,
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+This file contains a builder for the reionization redshift (zreion) grids,
+the redshift at which each cell was first ionized.
+
+``RSAGE`` writes a single zreion grid (``ReionRedshiftName``) as it runs, using
+a fixed ionization threshold of 0.9 (see ``src/reion_redshift.c``).  Here the
+grids are instead built from the ionization grids that ``cifog`` saves at each
+snapshot, so they can be made for runs where the grid is missing or for other
+thresholds.
+
+The ionization grids are walked once, in snapshot order, and the grid of every
+requested threshold is updated from the same read.  Each ionization grid is
+memory mapped and processed in chunks, so only the zreion grids themselves are
+ever held (or, if they are written to disk, only a single chunk of them).
+
+Cells are marked as ionized at the first snapshot where their ionization
+fraction exceeds the threshold.  Optionally, the redshift is interpolated
+linearly between that snapshot and the one before.  Cells that never pass the
+threshold are given a value of -1, matching ``src/reion_redshift.c``.
+
+To build the grids of a model:
+
+.. code::
+
+    $ python ReionRedshift.py <cifog_ini> <SAGE_ini> <output_fbase> [threshold ...]
+
+which saves the grid of each threshold (0.9 if none are specified) as
+``<output_fbase>_<threshold>``.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import numpy as np
+
+import ReadScripts as rs
+import GridReduce as gridreduce
+import FileLayout as layout
+
+
+def zreion_snapshot_series(XHII_fbase, z_array_reion, first_snap):
+    """
+    Lists the ionization grids of a model in snapshot order.
+
+    Parameters
+    ----------
+
+    XHII_fbase : String
+        The base filename for the ionization fields.
+
+    z_array_reion : List of floats
+        The redshift of each snapshot, starting at ``first_snap``.
+
+    first_snap : Integer
+        The snapshot where ``cifog`` starts calculations.
+
+    Returns
+    ---------
+
+    XHII_series : List of tuples
+        The ``(path, redshift)`` of the ionization grid at each snapshot.
+    """
+
+    XHII_series = []
+    for snap_idx, redshift in enumerate(z_array_reion):
+        # Add 1 for the cifog files.
+        cifog_snapnum = first_snap + snap_idx + 1
+
+        XHII_path = layout.format_path("XHII", XHII_fbase, snap=cifog_snapnum)
+        XHII_series.append((XHII_path, redshift))
+
+    return XHII_series
+
+
+def build_zreion_grids(XHII_series, GridSize, precision, thresholds=[0.9],
+                       interpolate=False, output_fnames=None, cell_range=None,
+                       chunk_cells=gridreduce.default_chunk_cells):
+    """
+    Builds the reionization redshift grid for a number of ionization
+    thresholds.
+
+    Parameters
+    ----------
+
+    XHII_series : List of tuples
+        The ``(path, redshift)`` of the ionization grid at each snapshot, in
+        snapshot order.  See ``zreion_snapshot_series()``.
+
+    GridSize : Integer
+        Number of cells along one side of the grids.
+
+    precision : Integer
+        The precision of the ionization grids.  See
+        ``ReadScripts.read_binary_grid()``.
+
+    thresholds : List of floats, optional
+        A cell is ionized once its ionization fraction exceeds the threshold.
+
+    interpolate : Boolean, optional
+        If ``True``, the redshift a cell passes the threshold is linearly
+        interpolated (in ionization fraction) between the snapshot it first
+        exceeds the threshold and the previous snapshot.  Otherwise the
+        redshift of the first snapshot exceeding it is used.
+
+    output_fnames : List of strings, optional
+        If specified, the grid of each threshold is written (as doubles, in the
+        same cell order as the ionization grids) to these files rather than
+        held in memory.
+
+    cell_range : Tuple of integers, optional
+        If specified, only these (flat) cells are built.  Used to split the
+        grids across tasks, see ``GridReduce.task_cell_range()``.  The output
+        files must then already exist.
+
+    chunk_cells : Integer, optional
+        Number of cells processed at once.
+
+    Returns
+    ---------
+
+    zreion_grids : List of 1D ``np.ndarray`` (or ``np.memmap``) of floats
+        The flat reionization redshift grid of each threshold.
+    """
+
+    num_cells = GridSize**3
+    if cell_range is None:
+        cell_range = (0, num_cells)
+
+    zreion_grids = []
+    for thresh_idx in range(len(thresholds)):
+        if output_fnames is None:
+            zreion = np.empty(num_cells)
+        else:
+            fname = output_fnames[thresh_idx]
+            if os.path.exists(fname):
+                mode = "r+"
+            else:
+                mode = "w+"
+            zreion = np.memmap(fname, dtype=np.float64, mode=mode,
+                               shape=(num_cells,))
+
+        for low_idx in range(cell_range[0], cell_range[1], chunk_cells):
+            high_idx = min(low_idx + chunk_cells, cell_range[1])
+            zreion[low_idx:high_idx] = -1.0
+
+        zreion_grids.append(zreion)
+
+    prev_grid = None
+    prev_redshift = None
+    for XHII_path, redshift in XHII_series:
+
+        XHII_grid = rs.memmap_binary_grid(XHII_path, GridSize, precision)
+
+        for low_idx in range(cell_range[0], cell_range[1], chunk_cells):
+            high_idx = min(low_idx + chunk_cells, cell_range[1])
+
+            XHII = np.asarray(XHII_grid[low_idx:high_idx], dtype=np.float64)
+            if interpolate and prev_grid is not None:
+                prev_XHII = np.asarray(prev_grid[low_idx:high_idx],
+                                       dtype=np.float64)
+
+            for thresh_idx, threshold in enumerate(thresholds):
+                zreion = zreion_grids[thresh_idx][low_idx:high_idx]
+
+                # Cells that haven't been ionized before were below the
+                # threshold at the previous snapshot, so the interpolation
+                # never divides by zero.
+                newly_ionized = (zreion < 0.0) & (XHII > threshold)
+                if not np.any(newly_ionized):
+                    continue
+
+                if interpolate and prev_grid is not None:
+                    prev = prev_XHII[newly_ionized]
+                    frac = (threshold - prev) / (XHII[newly_ionized] - prev)
+                    zreion[newly_ionized] = prev_redshift + \
+                                            frac*(redshift - prev_redshift)
+                else:
+                    zreion[newly_ionized] = redshift
+
+        prev_grid = XHII_grid
+        prev_redshift = redshift
+
+    for zreion in zreion_grids:
+        if isinstance(zreion, np.memmap):
+            zreion.flush()
+
+    return zreion_grids
+
+
+if __name__ == "__main__":
+
+    import AllVars as av
+    import GalaxyData as gd
+
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(1)
+
+    av.Set_Constants()
+
+    SAGE_params = rs.read_SAGE_ini(sys.argv[2])
+    cifog_params, _ = rs.read_cifog_ini(sys.argv[1], SAGE_params)
+
+    thresholds = [float(val) for val in sys.argv[4:]]
+    if len(thresholds) == 0:
+        thresholds = [0.9]
+
+    cosmology, t_bigbang = gd.set_cosmology(float(SAGE_params["Hubble_h"]),
+                                            float(SAGE_params["Omega"]),
+                                            float(cifog_params["omega_b"]))
+    z_array_full, _ = gd.load_redshifts(SAGE_params["FileWithSnapList"],
+                                        cosmology, t_bigbang)
+
+    first_snap = int(SAGE_params["LowSnap"])
+    last_snap = int(SAGE_params["LastSnapShotNr"])
+
+    XHII_series = zreion_snapshot_series(cifog_params["output_XHII_file"],
+                                         z_array_full[first_snap:last_snap],
+                                         first_snap)
+
+    output_fnames = ["{0}_{1}".format(sys.argv[3], threshold)
+                     for threshold in thresholds]
+
+    # The ionization fields are assumed to have double precision.
+    build_zreion_grids(XHII_series, int(SAGE_params["GridSize"]), 2,
+                       thresholds, output_fnames=output_fnames)
+
+    for fname in output_fnames:
+        print("Saved {0}".format(fname))
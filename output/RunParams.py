@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+"""
+This file contains typed, immutable views of the ``SAGE`` and ``cifog``
+``.ini`` files of a run.
+
+``ReadScripts.read_SAGE_ini()`` and ``ReadScripts.read_cifog_ini()`` return
+the raw strings of each field, leaving every caller to cast them (e.g.,
+``int(SAGE_params["GridSize"])``).  ``load_SAGE_params()`` and
+``load_cifog_params()`` cast each field once (paths and names stay strings,
+switches, counts and snapshots become integers and everything else becomes a
+float) and add the paths derived from
+them (e.g., the base name of the ionization grids).  The parameters are
+available both as attributes and by key::
+
+    SAGE_params, cifog_params = runparams.load_run(SAGE_ini, cifog_ini)
+    GridSize = SAGE_params.GridSize
+    XHII_fbase = cifog_params.XHII_fbase
+
+Each file is only parsed once (and each object only built once) until its
+modification time or size changes, see ``ReadScripts.cached_ini()``.
+"""
+
+from __future__ import print_function
+
+import os
+
+import ReadScripts as rs
+
+# Fields that hold paths or names and are never cast to numbers.
+SAGE_string_fields = ["RunPrefix", "OutputDir", "GridOutputDir",
+                      "GalaxyOutputDir", "TreeName", "TreeExtension",
+                      "SimulationDir", "FileWithSnapList", "PhotoionDir",
+                      "PhotoionName", "ReionRedshiftName", "FileNameGalaxies"]
+
+cifog_string_fields = ["redshiftFile", "inputIgmDensityFile",
+                       "inputIgmDensitySuffix", "inputIgmClumpFile",
+                       "inputSourcesFile", "inputNionFile",
+                       "output_XHII_file", "output_photHI_file",
+                       "output_restart_file", "photHI_bg_file",
+                       "recombinationTable", "inputSourcesHeIFile",
+                       "inputNionHeIFile", "inputSourcesHeIIFile",
+                       "inputNionHeIIFile", "output_XHeII_file",
+                       "output_XHeIII_file"]
+
+# Fields that are cast to integers.  Every other field is cast to a float, so
+# the type of a field doesn't depend on how its value was written (e.g.,
+# ``BoxSize = 500`` is still a float).
+SAGE_int_fields = ["FirstFile", "LastFile", "LastSnapShotNr",
+                   "self_consistent", "ReionizationOn", "SupernovaRecipeOn",
+                   "DiskInstabilityOn", "SFprescription", "AGNrecipeOn",
+                   "QuasarRecipeOn", "IRA", "RescaleSN", "IMF", "LowSnap",
+                   "HighSnap", "GridSize", "PhotonPrescription", "HaloPartCut",
+                   "fescPrescription", "calcUVmag"]
+
+cifog_int_fields = ["calcIonHistory", "numSnapshots", "stopSnapshot",
+                    "useDefaultMeanDensity", "useIonizeSphereModel",
+                    "useWebModel", "photHImodel", "calcMeanFreePath",
+                    "constantRecombinations", "calcRecombinations",
+                    "solveForHelium", "gridsize",
+                    "densityFilesAreInDoublePrecision",
+                    "nionFilesAreInDoublePrecision", "inputFilesAreComoving",
+                    "inputFilesAreSimulation", "SimulationLowSnap",
+                    "SimulationHighSnap", "densityInOverdensity",
+                    "write_photHI_file"]
+
+# The typed parameters, keyed by the kind and absolute path of the ``.ini``
+# file.  Each entry holds the (modification time, size) of the file(s) it was
+# built from and is replaced once they change.
+_params_cache = {}
+
+
+def cast_value(value, integer=False):
+    """
+    Casts the string value of a field to a float (or an integer if
+    ``integer`` is set).  Values that are neither (e.g., ``'None'``) are kept
+    as strings.
+    """
+
+    try:
+        if integer:
+            return int(float(value))
+        return float(value)
+    except ValueError:
+        return value
+
+
+class IniParams(object):
+    """
+    The typed, read-only parameters of an ``.ini`` file.  Fields are accessed
+    as attributes or by key.
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the ``.ini`` file.
+
+    raw : Dictionary
+        The string value of each field, e.g., from
+        ``ReadScripts.read_SAGE_ini()``.
+
+    string_fields : List of strings
+        The fields that are kept as strings.
+
+    int_fields : List of strings
+        The fields that are cast to integers.  All others are cast to floats.
+    """
+
+    def __init__(self, fname, raw, string_fields, int_fields):
+
+        values = {}
+        for field, value in raw.items():
+            if field in string_fields:
+                values[field] = value
+            else:
+                values[field] = cast_value(value, field in int_fields)
+
+        object.__setattr__(self, "fname", fname)
+        object.__setattr__(self, "_raw", dict(raw))
+        object.__setattr__(self, "_values", values)
+
+    def __getattr__(self, field):
+        # Only called for missing attributes, e.g., before ``_values`` is set
+        # when copying.
+        if field.startswith("_"):
+            raise AttributeError(field)
+
+        try:
+            return self._values[field]
+        except KeyError:
+            raise AttributeError("{0} has no field {1}".format(self.fname,
+                                                               field))
+
+    def __getitem__(self, field):
+        return self._values[field]
+
+    def __contains__(self, field):
+        return field in self._values
+
+    def __setattr__(self, field, value):
+        raise AttributeError("The parameters are read-only. Use as_dict() for "
+                             "a copy that can be modified.")
+
+    def get(self, field, default=None):
+        return self._values.get(field, default)
+
+    def keys(self):
+        return self._values.keys()
+
+    def as_dict(self):
+        """
+        Returns a (modifiable) copy of the string value of each field, i.e.,
+        what ``ReadScripts.read_SAGE_ini()``/``read_cifog_ini()`` return.
+        """
+
+        return dict(self._raw)
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__, self.fname)
+
+
+class SAGEParams(IniParams):
+    """
+    The typed parameters of a ``SAGE`` ``.ini`` file.  See ``IniParams``.
+    """
+
+    def __init__(self, fname, raw):
+        IniParams.__init__(self, fname, raw, SAGE_string_fields,
+                           SAGE_int_fields)
+
+    @property
+    def galaxy_dir(self):
+        return self.GalaxyOutputDir
+
+    @property
+    def grid_dir(self):
+        return self.GridOutputDir
+
+    @property
+    def zreion_path(self):
+        """
+        Path to the reionization redshift grid.
+        """
+        return "{0}/{1}".format(self.PhotoionDir, self.ReionRedshiftName)
+
+    @property
+    def photHI_fbase(self):
+        """
+        Base name of the photoionization rate grids.
+        """
+        return "{0}/{1}".format(self.PhotoionDir, self.PhotoionName)
+
+    @property
+    def merged_fbase(self):
+        """
+        Base name of the files of merged galaxies.
+        """
+        return "{0}/{1}_MergedGalaxies".format(self.GalaxyOutputDir,
+                                               self.RunPrefix)
+
+    def galaxy_fbase(self, redshift):
+        """
+        Base name of the galaxy files at ``redshift``.
+        """
+        return "{0}/{1}_z{2:.3f}".format(self.GalaxyOutputDir, self.RunPrefix,
+                                         redshift)
+
+    @property
+    def volume(self):
+        """
+        Volume of the box (Mpc^3).
+        """
+        return pow(self.BoxSize / self.Hubble_h, 3)
+
+
+class CifogParams(IniParams):
+    """
+    The typed parameters of a ``cifog`` ``.ini`` file.  See ``IniParams``.
+    The headers of the file are in ``headers``.
+    """
+
+    def __init__(self, fname, raw, headers):
+        IniParams.__init__(self, fname, raw, cifog_string_fields,
+                           cifog_int_fields)
+        object.__setattr__(self, "headers", dict(headers))
+
+    @property
+    def XHII_fbase(self):
+        return self.output_XHII_file
+
+    @property
+    def photHI_fbase(self):
+        return self.output_photHI_file
+
+    @property
+    def restart_fbase(self):
+        return self.output_restart_file
+
+    @property
+    def density_fbase(self):
+        return self.inputIgmDensityFile
+
+    @property
+    def nion_fbase(self):
+        return self.inputNionFile
+
+    # cifog uses 0 for floating point and 1 for double precision.
+    # The readers use 0 for integer, 1 for floating point and 2 for double.
+    @property
+    def density_precision(self):
+        return self.densityFilesAreInDoublePrecision + 1
+
+    @property
+    def nion_precision(self):
+        return self.nionFilesAreInDoublePrecision + 1
+
+
+def _signature(fname):
+    """
+    Returns the (modification time, size) of a file.
+    """
+
+    stat = os.stat(fname)
+
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _cached_params(key, signature, build):
+    """
+    Returns the cached parameters under ``key`` if they were built from files
+    with the same ``signature``.  Otherwise builds them with ``build()`` and
+    replaces the entry.
+    """
+
+    cached = _params_cache.get(key)
+    if cached is None or cached[0] != signature:
+        cached = (signature, build())
+        _params_cache[key] = cached
+
+    return cached[1]
+
+
+def load_SAGE_params(fname):
+    """
+    Reads the ``SAGE`` ``.ini`` file into typed parameters.
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the ``SAGE`` ``.ini`` file.
+
+    Returns
+    ---------
+
+    SAGE_params : ``SAGEParams``
+        The parameters.  The same object is returned until the file changes.
+    """
+
+    key = ("SAGE", os.path.abspath(fname))
+
+    return _cached_params(key, _signature(fname),
+                          lambda: SAGEParams(fname, rs.read_SAGE_ini(fname)))
+
+
+def load_cifog_params(fname, SAGE_params=None):
+    """
+    Reads the ``cifog`` ``.ini`` file into typed parameters.
+
+    Parameters
+    ----------
+
+    fname : String
+        Path to the ``cifog`` ``.ini`` file.
+
+    SAGE_params : ``SAGEParams``, optional
+        Necessary if any fields in the ``cifog`` ``.ini`` file are ``'None'``.
+        See ``ReadScripts.read_cifog_ini()``.
+
+    Returns
+    ---------
+
+    cifog_params : ``CifogParams``
+        The parameters.  The same object is returned until the file(s) change.
+    """
+
+    if SAGE_params is None:
+        key = ("cifog", os.path.abspath(fname), None)
+        signature = (_signature(fname), None)
+        SAGE_raw = None
+    else:
+        key = ("cifog", os.path.abspath(fname),
+               os.path.abspath(SAGE_params.fname))
+        signature = (_signature(fname), _signature(SAGE_params.fname))
+        SAGE_raw = SAGE_params.as_dict()
+
+    def build():
+        raw, headers = rs.read_cifog_ini(fname, SAGE_raw)
+        return CifogParams(fname, raw, headers)
+
+    return _cached_params(key, signature, build)
+
+
+def load_run(SAGE_ini, cifog_ini):
+    """
+    Reads the ``SAGE`` and ``cifog`` ``.ini`` files of a run.
+
+    Returns
+    ---------
+
+    SAGE_params : ``SAGEParams``
+        See ``load_SAGE_params()``.
+
+    cifog_params : ``CifogParams``
+        See ``load_cifog_params()``.
+    """
+
+    SAGE_params = load_SAGE_params(SAGE_ini)
+    cifog_params = load_cifog_params(cifog_ini, SAGE_params)
+
+    return SAGE_params, cifog_params
+
+
+def clear_cache():
+    """
+    Drops every cached parameter object and parsed ``.ini`` file.
+    """
+
+    _params_cache.clear()
+    rs.clear_ini_cache()
@@ -0,0 +1,543 @@
+#!/usr/bin/env python
+"""
+This file contains the builder for the (alpha, beta) parameter scan surfaces,
+i.e., the optical depth, duration and completion of reionization over a grid
+of ``fesc`` models.
+
+The contour plots (``ReionPlots.plot_tau_contours()`` and
+``ReionPlots.plot_duration_contours()``) only need the mass weighted neutral
+fraction at each snapshot of each model.  Rather than running
+``ReionData.generate_data()`` (which reads every grid of every model for all
+of the reionization plots), the neutral fractions are kept in a persistent
+summary store with one file per model.  Each snapshot is tagged with the
+identity (path, size and modification time) of the grids it was calculated
+from, so only snapshots that are missing (or whose grids were re-written) are
+recalculated.  These are spread across all tasks in a single pass and each
+grid is streamed from disk (see ``GridReduce.reduce_grids()``).
+
+Once the store is warm, building the surfaces only reads the ``.ini`` files,
+stats the grids and loads one small file per model.
+
+To build the surfaces of the models in a directory:
+
+.. code::
+
+    $ python ScanSummary.py <ini_dir> <summary_dir> [<output_file>]
+
+which saves the surfaces to ``<output_file>`` (``<summary_dir>/scan_surfaces.npz``
+by default).
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import numpy as np
+
+import GalaxyData as gd
+import GridReduce as gridreduce
+import RunParams as runparams
+import Checkpoints as ckpt
+import ParallelBackend as pb
+import ReionData as reiondata
+import ReionPlots as reionplot
+
+# Bump if the contents of the summary files change.
+SUMMARY_VERSION = 1
+
+
+def scan_model_params(gal_ini_file, reion_ini_file):
+    """
+    Reads the parameters of a single model that are needed for its summary.
+
+    Parameters
+    ----------
+
+    gal_ini_file, reion_ini_file : Strings
+        The ``SAGE`` and ``cifog`` ``.ini`` files of the model.
+
+    Returns
+    ---------
+
+    params : Dictionary
+        The cosmology, snapshot redshifts and lookback times, helium fraction
+        and the grids of the model.
+    """
+
+    SAGE_params, cifog_params = runparams.load_run(gal_ini_file,
+                                                   reion_ini_file)
+
+    cosmology, t_bigbang = gd.set_cosmology(SAGE_params.Hubble_h,
+                                            SAGE_params.Omega,
+                                            cifog_params.omega_b)
+
+    first_snap = SAGE_params.LowSnap
+    last_snap = SAGE_params.LastSnapShotNr
+
+    z_array_full, lookback_array_full = gd.load_redshifts(SAGE_params.FileWithSnapList,
+                                                          cosmology, t_bigbang)
+
+    params = {"cosmology" : cosmology,
+              "helium" : float(cifog_params.Y),
+              "first_snap" : first_snap,
+              "last_snap" : last_snap,
+              "z_array_reion" : np.array(z_array_full[first_snap:last_snap]),
+              "lookback_array_reion" : np.array(lookback_array_full[first_snap:last_snap]),
+              "GridSize" : SAGE_params.GridSize,
+              "XHII_fbase" : cifog_params.XHII_fbase,
+              # The ionization fields are assumed to have double precision.
+              "XHII_precision" : 2,
+              "density_fbase" : cifog_params.density_fbase,
+              "density_precision" : cifog_params.density_precision,
+              "nion_fbase" : None,
+              "nion_precision" : None}
+
+    return params
+
+
+def snapshot_units(params):
+    """
+    Lists the grids of each snapshot of a model.
+
+    Parameters
+    ----------
+
+    params : Dictionary
+        Parameters of the model. Created by ``scan_model_params()``.
+
+    Returns
+    ---------
+
+    units : List of tuples
+        For each snapshot, the ``(XHII_path, XHII_precision, density_path,
+        density_precision, GridSize)`` passed to ``snapshot_fractions()``.
+
+    snap_keys : List of strings
+        For each snapshot, a key describing the identity of its grids.
+    """
+
+    units = []
+    snap_keys = []
+    for snapnum in range(params["first_snap"], params["last_snap"]):
+        sources = reiondata.reion_grid_sources(snapnum, params, {"nion" : 0})
+
+        XHII_path, XHII_precision = sources["XHII"]
+        density_path, density_precision = sources["density"]
+
+        units.append((XHII_path, XHII_precision, density_path,
+                      density_precision, params["GridSize"]))
+        snap_keys.append(ckpt.make_key(ckpt.file_identity([XHII_path,
+                                                           density_path])))
+
+    return units, snap_keys
+
+
+def snapshot_fractions(unit):
+    """
+    Calculates the volume and mass weighted neutral fractions of a single
+    snapshot, streaming the grids from disk.
+
+    Parameters
+    ----------
+
+    unit : Tuple
+        The ``(XHII_path, XHII_precision, density_path, density_precision,
+        GridSize)`` of the snapshot.  See ``snapshot_units()``.
+
+    Returns
+    ---------
+
+    volume_frac, mass_frac : Floats
+        The neutral fractions.
+    """
+
+    XHII_path, XHII_precision, density_path, density_precision, GridSize = unit
+
+    sources = {"XHII" : (XHII_path, XHII_precision),
+               "density" : (density_path, density_precision)}
+    reductions = {"XHII_volume" : ("mean", {"grid" : "XHII"}),
+                  "XHII_mass" : ("weighted_mean", {"grid" : "XHII",
+                                                   "weight" : "density"})}
+
+    results = gridreduce.reduce_grids(sources, reductions, GridSize)
+
+    return 1.0 - results["XHII_volume"], 1.0 - results["XHII_mass"]
+
+
+def summary_path(summary_dir, params):
+    """
+    The summary file of a model.  Named by the grids it covers so that the same
+    model shares its summary across scans.
+    """
+
+    model_key = ckpt.make_key([os.path.abspath(params["XHII_fbase"]),
+                               os.path.abspath(params["density_fbase"]),
+                               params["first_snap"], params["last_snap"]])
+
+    return "{0}/scan/{1}.npz".format(summary_dir, model_key)
+
+
+def summary_signature(params):
+    """
+    The settings signature of a model's summary file.
+    """
+
+    return ckpt.make_signature({"version" : SUMMARY_VERSION,
+                                "GridSize" : params["GridSize"],
+                                "XHII_precision" : params["XHII_precision"],
+                                "density_precision" : params["density_precision"]})
+
+
+def load_model_summary(summary_dir, params, snap_keys):
+    """
+    Loads the neutral fractions of a model from its summary file.
+
+    Parameters
+    ----------
+
+    summary_dir : String
+        Directory the summaries are saved in.
+
+    params : Dictionary
+        Parameters of the model. Created by ``scan_model_params()``.
+
+    snap_keys : List of strings
+        The current identity of the grids of each snapshot. See
+        ``snapshot_units()``.
+
+    Returns
+    ---------
+
+    volume_frac, mass_frac : 1D ``np.ndarray`` of floats
+        The neutral fractions at each snapshot. ``np.nan`` for snapshots that
+        are missing.
+
+    missing : List of integers
+        The snapshots (indexed from ``first_snap``) that must be calculated.
+    """
+
+    num_snaps = len(snap_keys)
+    volume_frac = np.full(num_snaps, np.nan)
+    mass_frac = np.full(num_snaps, np.nan)
+
+    summary = ckpt.load_partial(summary_path(summary_dir, params),
+                                summary_signature(params))
+
+    if summary is not None and len(summary["snap_keys"]) == num_snaps:
+        valid = np.asarray(summary["snap_keys"]) == np.asarray(snap_keys)
+        volume_frac[valid] = summary["volume_frac"][valid]
+        mass_frac[valid] = summary["mass_frac"][valid]
+
+    missing = list(np.nonzero(np.isnan(mass_frac))[0])
+
+    return volume_frac, mass_frac, missing
+
+
+def scan_summaries(rank, size, comm, gal_ini_files, reion_ini_files,
+                   summary_dir, backend=None):
+    """
+    Gets the neutral fraction at each snapshot of every model, calculating
+    (in parallel) only the snapshots that are not already in the summary
+    store.
+
+    Parameters
+    ----------
+
+    rank : Integer
+        This processor rank.
+
+    size : Integer
+        The total number of processors executing the pipeline.
+
+    comm : Class ``mpi4py.MPI.Intracomm`` or ``ParallelBackend.SerialComm``
+        The communicator between the tasks.
+
+    gal_ini_files, reion_ini_files : List of strings
+        ``.ini`` files of each model, e.g., from ``MiscData.get_ini_from_dir()``.
+
+    summary_dir : String
+        Directory the summaries are saved in.
+
+    backend : ``ParallelBackend`` backend, optional
+        The backend that the missing snapshots are distributed with.  If not
+        specified, they are distributed across the tasks of ``comm``.
+
+    Returns
+    ---------
+
+    summaries : Dictionary or ``None``
+        Lists (one entry per model) of the model parameters (see
+        ``scan_model_params()``) and the volume and mass weighted neutral
+        fractions at each snapshot.  ``None`` for all tasks except rank 0.
+    """
+
+    if backend is None:
+        backend = pb.backend_from_comm(comm)
+
+    # Rank 0 finds what's missing and shares the work out.
+    work_units = None
+    if rank == 0:
+        params_allmodels = []
+        snap_keys_allmodels = []
+        volume_frac_allmodels = []
+        mass_frac_allmodels = []
+
+        work_units = []
+        for model_number, (gal_ini_file, reion_ini_file) in \
+                enumerate(zip(gal_ini_files, reion_ini_files)):
+
+            params = scan_model_params(gal_ini_file, reion_ini_file)
+            units, snap_keys = snapshot_units(params)
+
+            volume_frac, mass_frac, missing = load_model_summary(summary_dir,
+                                                                 params,
+                                                                 snap_keys)
+
+            params_allmodels.append(params)
+            snap_keys_allmodels.append(snap_keys)
+            volume_frac_allmodels.append(volume_frac)
+            mass_frac_allmodels.append(mass_frac)
+
+            for snap_idx in missing:
+                work_units.append((model_number, snap_idx, units[snap_idx]))
+
+        print("Parameter scan of {0} models has {1} snapshots to calculate."
+              .format(len(params_allmodels), len(work_units)))
+
+    work_units = backend.bcast(work_units, root=0)
+
+    local_results = []
+    if len(work_units) > 0:
+        units = [unit for _, _, unit in work_units]
+        for unit, fractions in backend.map(snapshot_fractions, units):
+            local_results.append((unit, fractions))
+
+    all_results = backend.gather(local_results, root=0)
+
+    if rank != 0:
+        return None
+
+    # Work units are unique so map the results back by their grids.
+    fractions_by_unit = {}
+    for task_results in all_results:
+        for unit, fractions in task_results:
+            fractions_by_unit[unit] = fractions
+
+    updated_models = set()
+    for model_number, snap_idx, unit in work_units:
+        volume_frac, mass_frac = fractions_by_unit[unit]
+        volume_frac_allmodels[model_number][snap_idx] = volume_frac
+        mass_frac_allmodels[model_number][snap_idx] = mass_frac
+        updated_models.add(model_number)
+
+    for model_number in sorted(updated_models):
+        params = params_allmodels[model_number]
+        summary = {"volume_frac" : volume_frac_allmodels[model_number],
+                   "mass_frac" : mass_frac_allmodels[model_number],
+                   "snap_keys" : np.array(snap_keys_allmodels[model_number])}
+        ckpt.save_partial(summary_path(summary_dir, params), summary,
+                          summary_signature(params))
+
+    summaries = {"params_allmodels" : params_allmodels,
+                 "volume_frac_allmodels" : volume_frac_allmodels,
+                 "mass_frac_allmodels" : mass_frac_allmodels}
+
+    return summaries
+
+
+def model_alpha_beta(ini_file):
+    """
+    Parses the ``alpha`` and ``beta`` values of a model from the name of its
+    ``.ini`` file (see ``MiscData.get_ini_from_dir()``).  ``np.nan`` if they
+    are not in the name.
+    """
+
+    fname = os.path.basename(ini_file)
+
+    values = []
+    for name in ["alpha", "beta"]:
+        match = re.search(r"{0}(\d+\.\d+)".format(name), fname)
+        if match is None:
+            values.append(np.nan)
+        else:
+            values.append(float(match.group(1)))
+
+    return values
+
+
+def scan_surfaces(summaries, gal_ini_files, duration_definition):
+    """
+    Calculates the optical depth, duration and completion of reionization of
+    every model and arranges them on the (alpha, beta) grid.
+
+    Parameters
+    ----------
+
+    summaries : Dictionary
+        Created by ``scan_summaries()``.
+
+    gal_ini_files : List of strings
+        ``SAGE`` ``.ini`` file of each model.  The alpha and beta values are
+        parsed from their names.
+
+    duration_definition : List of floats with length 3.
+        The neutral fractions that define reionization.  See
+        ``ReionData.calc_duration()``.
+
+    Returns
+    ---------
+
+    surfaces : Dictionary
+        ``tau_highz``, ``duration_t`` and ``reion_completed`` of each model (in
+        the order of ``gal_ini_files``, as taken by the ``ReionPlots`` contour
+        functions), the sorted unique ``alpha`` and ``beta`` values and the
+        ``tau``, ``duration`` (in Myr) and ``completed`` surfaces with shape
+        ``(len(alpha), len(beta))``.  Surface cells without a model are
+        ``np.nan``.
+    """
+
+    params_allmodels = summaries["params_allmodels"]
+    mass_frac_allmodels = summaries["mass_frac_allmodels"]
+
+    z_array_reion_allmodels = [params["z_array_reion"]
+                               for params in params_allmodels]
+    lookback_array_reion_allmodels = [params["lookback_array_reion"]
+                                      for params in params_allmodels]
+    cosmology_allmodels = [params["cosmology"] for params in params_allmodels]
+    helium_allmodels = [params["helium"] for params in params_allmodels]
+
+    # Every model is done in a single vectorised call.
+    tau_allmodels = reiondata.calc_tau(z_array_reion_allmodels,
+                                       cosmology_allmodels, helium_allmodels,
+                                       mass_frac_allmodels)
+    tau_highz = [tau[0] for tau in tau_allmodels]
+
+    duration_z, duration_t, reion_completed = \
+        reiondata.calc_duration(z_array_reion_allmodels,
+                                lookback_array_reion_allmodels,
+                                mass_frac_allmodels, duration_definition)
+
+    alpha_beta = np.array([model_alpha_beta(ini_file)
+                           for ini_file in gal_ini_files]).reshape(-1, 2)
+    alpha = np.unique(alpha_beta[:, 0][np.isfinite(alpha_beta[:, 0])])
+    beta = np.unique(alpha_beta[:, 1][np.isfinite(alpha_beta[:, 1])])
+
+    tau = np.full((len(alpha), len(beta)), np.nan)
+    duration = np.full((len(alpha), len(beta)), np.nan)
+    completed = np.full((len(alpha), len(beta)), np.nan)
+
+    for model_number, (alpha_val, beta_val) in enumerate(alpha_beta):
+        if not (np.isfinite(alpha_val) and np.isfinite(beta_val)):
+            continue
+
+        alpha_idx = np.searchsorted(alpha, alpha_val)
+        beta_idx = np.searchsorted(beta, beta_val)
+
+        tau[alpha_idx, beta_idx] = tau_highz[model_number]
+        duration[alpha_idx, beta_idx] = duration_t[model_number][-1] - \
+                                        duration_t[model_number][0]
+        completed[alpha_idx, beta_idx] = reion_completed[model_number]
+
+    surfaces = {"tau_highz" : tau_highz,
+                "duration_t" : duration_t,
+                "reion_completed" : reion_completed,
+                "alpha" : alpha,
+                "beta" : beta,
+                "tau" : tau,
+                "duration" : duration,
+                "completed" : completed}
+
+    return surfaces
+
+
+def plot_scan_contours(rank, size, comm, gal_ini_files, reion_ini_files,
+                       alpha_beta_limits, duration_definition, summary_dir,
+                       output_dir, output_format, backend=None):
+    """
+    Plots the contours of constant optical depth and reionization duration
+    over the (alpha, beta) parameter scan using the summary store.
+
+    Parameters
+    ----------
+
+    rank, size, comm, gal_ini_files, reion_ini_files, summary_dir, backend :
+        See ``scan_summaries()``.
+
+    alpha_beta_limits : 2x3 list of floats.
+        Defines the minimum, maximum and step size of the alpha and beta
+        values.  See ``ReionPlots.plot_tau_contours()``.
+
+    duration_definition : List of floats with length 3.
+        The neutral fractions that define reionization.
+
+    output_dir : String
+        Directory where the plots are saved.
+
+    output_format : String
+        The format of the saved figures.
+
+    Returns
+    ---------
+
+    surfaces : Dictionary or ``None``
+        See ``scan_surfaces()``. ``None`` for all tasks except rank 0.
+    """
+
+    summaries = scan_summaries(rank, size, comm, gal_ini_files,
+                               reion_ini_files, summary_dir, backend=backend)
+    if rank != 0:
+        return None
+
+    surfaces = scan_surfaces(summaries, gal_ini_files, duration_definition)
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    print("Plotting contours of constant tau.")
+    reionplot.plot_tau_contours(surfaces["tau_highz"],
+                                surfaces["reion_completed"],
+                                alpha_beta_limits, output_dir,
+                                "tau_contours", output_format)
+
+    print("Plotting contours of constant reionization duration.")
+    reionplot.plot_duration_contours(surfaces["duration_t"],
+                                     surfaces["reion_completed"],
+                                     alpha_beta_limits, output_dir,
+                                     "duration_contours", output_format)
+
+    return surfaces
+
+
+if __name__ == "__main__":
+
+    import AllVars as av
+    import MiscData as misc
+
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    av.Set_Constants()
+
+    backend = pb.get_backend()
+
+    ini_dir = sys.argv[1]
+    summary_dir = sys.argv[2]
+    if len(sys.argv) > 3:
+        output_file = sys.argv[3]
+    else:
+        output_file = "{0}/scan_surfaces.npz".format(summary_dir)
+
+    gal_ini_files, reion_ini_files = misc.get_ini_from_dir(ini_dir)
+
+    summaries = scan_summaries(backend.rank, backend.size, backend.comm,
+                               gal_ini_files, reion_ini_files, summary_dir,
+                               backend=backend)
+
+    if backend.rank == 0:
+        surfaces = scan_surfaces(summaries, gal_ini_files, [0.90, 0.50, 0.01])
+        np.savez(output_file, alpha=surfaces["alpha"], beta=surfaces["beta"],
+                 tau=surfaces["tau"], duration=surfaces["duration"],
+                 completed=surfaces["completed"])
+        print("Saved {0}".format(output_file))
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 from __future__ import print_function
 
+import functools
+
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')
@@ -20,70 +22,168 @@ def get_jeans_mass(hubble_h, omega_m):
     return jeans_mass
 
 
+def _analytic_fit_array(a, a_0, a_r):
+    """
+    Evaluates the analytic fit for an array of scale factors.  Each of the
+    three regimes (before reionization begins, during reionization and after
+    reionization) is evaluated on its own mask.
+    """
+
+    f = np.empty(a.shape)
+
+    before = a < a_0
+    during = (a > a_0) & (a < a_r)
+    after = ~(before | during)
+
+    scale_factor = a[before]
+    f[before] = 3.0 * scale_factor / ((2+alpha)*(5+2*alpha)) \
+                * pow(scale_factor / a_0, alpha)
+
+    scale_factor = a[during]
+    f[during] = 3.0 / scale_factor * (a_0*a_0* (1 / (2+alpha) - 2*pow(scale_factor / a_0, -0.5) / (5 + 2*alpha)) \
+                                      +scale_factor*scale_factor / 10.0 \
+                                      -a_0*a_0 / 10.0 * (5 - 4*pow(scale_factor / a_0, -0.5)))
+
+    scale_factor = a[after]
+    f[after] = 3.0 / scale_factor * (a_0*a_0* (1 / (2+alpha) - 2*pow(scale_factor / a_0, -0.5) / (5 + 2*alpha)) \
+                                     +a_r*a_r / 10.0 * (5 - 4*pow(scale_factor / a_0, -0.5)) \
+                                     -a_0*a_0 / 10.0 * (5 - 4*pow(scale_factor / a_0, -0.5)) \
+                                     +scale_factor*a_r / 3.0 \
+                                     -a_r*a_r / 3.0 * (3 - 2*pow(scale_factor / a_r, -0.5)))
+
+    return f
+
+
 def get_analytic_fit(Redshift, z_0, z_r):
 
     a_0 = 1.0 / (1.0 + z_0)  # Analytic function uses redshift. 
     a_r = 1.0 / (1.0 + z_r)
-    a = 1.0 / (1.0 + Redshift)
-    try:
-        f = np.empty(len(a))
-    except TypeError:
-        is_array = False 
-    else:
-        is_array = True 
-
-    if is_array:
-        for count, scale_factor in enumerate(a):
-            if scale_factor < a_0:
-                f[count] = 3.0 * scale_factor / ((2+alpha)*(5+2*alpha)) \
-                           * pow(scale_factor / a_0, alpha)
-            elif scale_factor > a_0 and scale_factor < a_r:
-                f[count] = 3.0 / scale_factor * (a_0*a_0* (1 / (2+alpha) - 2*pow(scale_factor / a_0, -0.5) / (5 + 2*alpha)) \
-                                                +scale_factor*scale_factor / 10.0 \
-                                                -a_0*a_0 / 10.0 * (5 - 4*pow(scale_factor / a_0, -0.5))) 
-                                                 
-            else:
-                f[count] = 3.0 / scale_factor * (a_0*a_0* (1 / (2+alpha) - 2*pow(scale_factor / a_0, -0.5) / (5 + 2*alpha)) \
-                                                +a_r*a_r / 10.0 * (5 - 4*pow(scale_factor / a_0, -0.5)) \
-                                                -a_0*a_0 / 10.0 * (5 - 4*pow(scale_factor / a_0, -0.5)) \
-                                                +scale_factor*a_r / 3.0 \
-                                                -a_r*a_r / 3.0 * (3 - 2*pow(scale_factor / a_r, -0.5))) 
-
-    else:
-        scale_factor = a 
-        if scale_factor < a_0:
-            f = 3.0 * scale_factor / ((2+alpha)*(5+2*alpha)) \
-                       * pow(scale_factor / a_0, alpha)
-        elif scale_factor > a_0 and scale_factor < a_r:
-            f = 3.0 / scale_factor * (a_0*a_0* (1 / (2+alpha) - 2*pow(scale_factor / a_0, -0.5) / (5 + 2*alpha)) \
-                                            +scale_factor*scale_factor / 10.0 \
-                                            -a_0*a_0 / 10.0 * (5 - 4*pow(scale_factor / a_0, -0.5))) 
-                                             
-        else:
-            f = 3.0 / scale_factor * (a_0*a_0* (1 / (2+alpha) - 2*pow(scale_factor / a_0, -0.5) / (5 + 2*alpha)) \
-                                            +a_r*a_r / 10.0 * (5 - 4*pow(scale_factor / a_0, -0.5)) \
-                                            -a_0*a_0 / 10.0 * (5 - 4*pow(scale_factor / a_0, -0.5)) \
-                                            +scale_factor*a_r / 3.0 \
-                                            -a_r*a_r / 3.0 * (3 - 2*pow(scale_factor / a_r, -0.5))) 
+    a = 1.0 / (1.0 + np.asarray(Redshift, dtype=np.float64))
 
-    return f
+    f = _analytic_fit_array(np.atleast_1d(a), a_0, a_r)
 
-def get_filter_mass(Redshift, z_0, z_r):
+    if a.ndim == 0:
+        return f[0]
 
-    jeans_mass = get_jeans_mass(AllVars.Hubble_h, AllVars.Omega_m) 
-    
-    f = get_analytic_fit(Redshift, z_0, z_r)
+    return f.reshape(a.shape)
 
-    filter_mass = np.log10(jeans_mass * pow(f, 1.5))
 
-    '''
-    for count, z in enumerate(Redshift):
-        print("For redshift {0:.2f} filter mass is {1:.4e}".format(z, filter_mass[count])) 
-    '''
+@functools.lru_cache(maxsize=None)
+def _filter_mass_table(Redshift, z_0, z_r, hubble_h, omega_m):
+    """
+    Memoised filtering mass for a tuple of redshifts, a reionization history
+    and a cosmology.
+    """
+
+    jeans_mass = get_jeans_mass(hubble_h, omega_m)
+
+    f = get_analytic_fit(np.array(Redshift), z_0, z_r)
+
+    filter_mass = np.log10(jeans_mass * pow(f, 1.5))
+    filter_mass.flags.writeable = False
 
     return filter_mass
 
 
+def get_filter_mass(Redshift, z_0, z_r, hubble_h=None, omega_m=None):
+    """
+    Calculates the (log10) filtering mass at each redshift.  The result is
+    memoised per redshifts, (z_0, z_r) and cosmology so calling this for every
+    file is free after the first.
+
+    Parameters
+    ----------
+
+    Redshift : Float or ``np.ndarray`` of floats
+        The redshifts we want the filtering mass at.
+
+    z_0, z_r : Floats
+        The redshift reionization begins and ends.
+
+    hubble_h, omega_m : Floats, optional
+        The cosmology.  If not specified, the values in ``AllVars`` are used.
+
+    Returns
+    ---------
+
+    filter_mass : Float or ``np.ndarray`` of floats. Same shape as
+                  ``Redshift``.
+        The log10 filtering mass (Msun).
+    """
+
+    if hubble_h is None:
+        hubble_h = AllVars.Hubble_h
+    if omega_m is None:
+        omega_m = AllVars.Omega_m
+
+    Redshift = np.asarray(Redshift, dtype=np.float64)
+    filter_mass = _filter_mass_table(tuple(Redshift.ravel()), float(z_0),
+                                     float(z_r), float(hubble_h),
+                                     float(omega_m))
+
+    if Redshift.ndim == 0:
+        return filter_mass[0]
+
+    return filter_mass.reshape(Redshift.shape)
+
+
+def get_reionmod(HaloMass, FilterMass):
+    """
+    Calculates the reionization modifier (the suppression of the baryon
+    fraction) of halos, broadcasting the halo masses against the filtering
+    masses.
+
+    Parameters
+    ----------
+
+    HaloMass : ``np.ndarray`` of floats
+        The log10 halo mass (Msun).
+
+    FilterMass : Float or ``np.ndarray`` of floats
+        The log10 filtering mass (Msun).  Must broadcast against ``HaloMass``.
+
+    Returns
+    ---------
+
+    reionmod : ``np.ndarray`` of floats
+        The reionization modifier, between 0 and 1.
+    """
+
+    return 1.0 / pow(1.0 + 0.26*pow(10.0, np.subtract(FilterMass, HaloMass)), 3.0)
+
+
+def get_reionmod_block(HaloMass, Redshift, z_0, z_r, hubble_h=None,
+                       omega_m=None):
+    """
+    Calculates the reionization modifier for a block of galaxies over a number
+    of snapshots in one call.
+
+    Parameters
+    ----------
+
+    HaloMass : 2D ``np.ndarray`` of floats. Shape is (number of galaxies,
+               number of snapshots).
+        The log10 halo mass (Msun) of each galaxy at each snapshot.
+
+    Redshift : 1D ``np.ndarray`` of floats. Length is number of snapshots.
+        The redshift of each snapshot.
+
+    z_0, z_r, hubble_h, omega_m : Floats
+        See ``get_filter_mass()``.
+
+    Returns
+    ---------
+
+    reionmod : 2D ``np.ndarray`` of floats. Same shape as ``HaloMass``.
+        The reionization modifier of each galaxy at each snapshot.
+    """
+
+    filter_mass = get_filter_mass(np.asarray(Redshift, dtype=np.float64),
+                                  z_0, z_r, hubble_h, omega_m)
+
+    return get_reionmod(HaloMass, filter_mass[np.newaxis, :])
+
+
 def plot_reionmod(HaloMass, FilterMass, Redshift, fb):
 
     plot_redshift = [10, 9, 8, 7, 6]
@@ -95,7 +195,7 @@ def plot_reionmod(HaloMass, FilterMass, Redshift, fb):
     for count, z in enumerate(plot_redshift):
         z_idx = np.abs(Redshift - z).argmin()
         
-        reionmod = 1 / pow(1 + 0.26*pow(10, FilterMass[z_idx] - HaloMass), 3.0)
+        reionmod = get_reionmod(HaloMass, FilterMass[z_idx])
  
         label = "z = {0:d}".format(z)       
         ax1.plot(HaloMass, reionmod, color = PlotScripts.colors[count], 
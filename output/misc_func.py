@@ -13,8 +13,8 @@ import scipy.integrate as integrate
 from scipy import stats
 
 import PlotScripts
-import ReadScripts
 import AllVars
+import GridReduce
 
 
 def calculate_HI_frac(XHII, density):
@@ -43,7 +43,13 @@ def calculate_HI_frac(XHII, density):
     Density is unitless (overdensity, rho/<rho>).    
     """
 
-    HI = 1.0 - np.sum(XHII * density / np.sum(density))
+    # Weight by the density in a single chunked pass, without creating any
+    # temporary grids.
+    XHII_mass = GridReduce.reduce_grids({"XHII" : XHII, "density" : density},
+                                        {"XHII_mass" : ("weighted_mean",
+                                                        {"grid" : "XHII",
+                                                         "weight" : "density"})})
+    HI = 1.0 - XHII_mass["XHII_mass"]
        
     print("")
     print("Mass averaged HI fraction is {0:.4f}".format(HI))
@@ -61,18 +67,19 @@ def determine_close_idx(fname_HII, fname_density, SnapList, GridSize,
             HII_fname = "{0}_{1:03d}".format(fname_HII[model_number], 
                                               SnapList[model_number][snapnum])
 
-            HII = ReadScripts.read_binary_grid(HII_fname,
-                                               GridSize[model_number],
-                                               precision[model_number])
-
             density_fname = "{0}{1:03d}.dens.dat".format(fname_density[model_number], 
                                                          SnapList[model_number][snapnum])
- 
-            density = ReadScripts.read_binary_grid(density_fname,
-                                                   GridSize[model_number],
-                                                   precision[model_number])
 
-            HI_frac = calculate_HI_frac(HII, density)
+            # Only need the mass weighted fraction so stream the grids from
+            # disk rather than reading them in full.
+            sources = {"XHII" : (HII_fname, precision[model_number]),
+                       "density" : (density_fname, precision[model_number])}
+            XHII_mass = GridReduce.reduce_grids(sources,
+                                                {"XHII_mass" : ("weighted_mean",
+                                                                {"grid" : "XHII",
+                                                                 "weight" : "density"})},
+                                                GridSize[model_number])
+            HI_frac = 1.0 - XHII_mass["XHII_mass"]
             XHII_fraction[model_number][snapnum] = HI_frac
 
     SnapList = []
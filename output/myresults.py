@@ -5,6 +5,7 @@ matplotlib.use('Agg')
 
 import os
 import heapq
+import functools
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
@@ -24,22 +25,28 @@ from matplotlib.colors import LogNorm
 from mpl_toolkits.axes_grid1 import AxesGrid
 from astropy import units as u
 from astropy import cosmology
+from scipy import stats
 
 import matplotlib.ticker as mtick
 import PlotScripts
 import ReadScripts
 import AllVars
-import GalaxyPhotoion as photo
+import GalaxyReion as photo
 import ObservationalData as Obs
 import gnedin_analytic as ga
+import HaloPaint as paint
+import BinnedStats as bstats
+import FileLayout as layout
 
-from mpi4py import MPI
+import ParallelBackend as pb
+from ParallelBackend import MPI
 
 import sys
 
-comm = MPI.COMM_WORLD
-rank = comm.Get_rank()
-size = comm.Get_size()
+backend = pb.get_backend()
+comm = backend.comm
+rank = backend.rank
+size = backend.size
 
 AllVars.Set_Params_Kali()
 AllVars.Set_Constants()
@@ -77,6 +84,17 @@ def raise_list_power(my_list, n):
 def raise_power_list(my_list, n):
     return [pow(n, x) for x in my_list]
 
+# Fits of the UV continuum slope beta from Bouwens (2015) ApJ 793, 115.  Each
+# row is (z_low, z_high, dB_faint, dB_bright, B, offset).  For z = 5 and 6
+# Bouwens uses a piece-wise linear relationship (with a different slope either
+# side of MUV = -18.8) and a linear relationship for higher redshift.
+beta_fits = np.array([[4.5, 5.5, -0.08, -0.17, -2.05, 18.8], # z = 5 fits.
+                      [5.5, 6.5, -0.08, -0.24, -2.22, 18.8], # z = 6 fits.
+                      [6.5, 7.5, -0.20, -0.20, -2.05, 19.5], # z = 7 fits.
+                      [7.5, 8.5, -0.15, -0.15, -2.13, 19.5], # z = 8 fits.
+                      [8.5, 9.5, -0.16, -0.16, -2.19, 19.5], # z = 9 fits.
+                      [9.5, 10.5, -0.16, -0.16, -2.16, 19.5]]) # z = 10 fits.
+
 def calculate_beta(MUV, z):
     ''' 
     Calculation of the dust attenuation parameter Beta. Fit values are from Bouwens (2015) ApJ 793, 115.
@@ -84,54 +102,33 @@ def calculate_beta(MUV, z):
 
     Parameters
     ----------
-        MUV : `float'
-        A value of the absolute magnitude in the UV (generally M1600) in the AB magnitude system.
+        MUV : `float' or array of floats.
+        The absolute magnitude(s) in the UV (generally M1600) in the AB magnitude system.
 
     z : `float' 
         Redshift the attenuation is calculated at.
 
     Returns
     ------
-    beta : `float'
+    beta : `float' or array of floats with the same shape as MUV.
         Value of the UV continuum paramaeter beta. 
     '''
 
-    if (z >= 4.5 and z < 5.5): # z = 5 fits.
-        if (MUV > -18.8):
-            dB = -0.08
-        else:
-            dB = -0.17
-        B = -2.05
-        offset = 18.8
-    elif (z >= 5.5 and z < 6.5): # z = 6 fits.
-        if (MUV > -18.8):
-            dB = -0.08
-        else:
-            dB = -0.24
-        B = -2.22
-        offset = 18.8
-
-    elif (z >= 6.5 and z < 7.5): # z = 7 fits.
-        dB = -0.20
-        B = -2.05
-        offset = 19.5
-    elif (z >= 7.5 and z < 8.5): # z = 8 fits.
-        dB = -0.15
-        B = -2.13
-        offset = 19.5
-    elif (z >= 8.5 and z < 9.5): # z = 9 fits.
-        dB = -0.16
-        B = -2.19
-        offset = 19.5
-    elif (z >= 9.5 and z < 10.5): # z = 10 fits.
-        dB = -0.16
-        B = -2.16
-        offset = 19.5
+    fit_idx = np.where((beta_fits[:,0] <= z) & (z < beta_fits[:,1]))[0]
+    if len(fit_idx) == 0:
+        raise ValueError("The beta fits only cover 4.5 <= z < 10.5. You specified z = {0}".format(z))
+
+    z_low, z_high, dB_faint, dB_bright, B, offset = beta_fits[fit_idx[0]]
+
+    MUV = np.asarray(MUV, dtype = np.float64)
+    dB = np.where(MUV > -18.8, dB_faint, dB_bright)
 
     beta = dB * (MUV + offset) + B
 
+    if beta.ndim == 0:
+        return float(beta)
     return beta
-        
+
 def multiply(array):
     '''
     Performs element wise multiplication.
@@ -2386,7 +2383,7 @@ def plot_mvir_Ngamma(SnapList, mean_mvir_Ngamma, std_mvir_Ngamma, N_Ngamma, mode
         plt.close()
 
 
-def bin_Simfast_halos(RedshiftList, SnapList, halopath, fitpath, fesc_prescription, fesc_normalization, GridSize, output_tag):
+def bin_Simfast_halos(RedshiftList, SnapList, halopath, fitpath, fesc_prescription, fesc_normalization, GridSize, output_tag, seed=0):
    
     for model_number in range(0, len(fesc_prescription)):
         for halo_z_idx in range(0, len(RedshiftList)):
@@ -2404,67 +2401,15 @@ def bin_Simfast_halos(RedshiftList, SnapList, halopath, fitpath, fesc_prescripti
             fit_mvir, fit_mean, fit_std, fit_N = np.loadtxt(f, unpack = True)
             f.close()
 
-            ## Here we read in the halos created by Simfast21 ##
-            # The data file has the structure:
-                # long int N_halos
-                # Then an entry for each halo:
-                    # float Mass
-                    # float x, y, z positions.
-                # NOTE: The x,y,z positions are the grid indices but are still floats (because Simfast21 is weird like that).
-
-            Halodesc_full = [ 
-                 ('Halo_Mass', np.float32),
-                 ('Halo_x', np.float32),
-                 ('Halo_y', np.float32),
-                 ('Halo_z', np.float32)
-                ]
-
-            names = [Halodesc_full[i][0] for i in range(len(Halodesc_full))]
-            formats = [Halodesc_full[i][1] for i in range(len(Halodesc_full))]
-            Halo_Desc = np.dtype({'names':names, 'formats':formats}, align=True)
-
-            fname = "%s/halonl_z%.3f_N%d_L100.0.dat.catalog" %(halopath, RedshiftList[halo_z_idx], GridSize)
-            f = open(fname, 'rb')
-            N_Halos = np.fromfile(f, count = 1, dtype = np.long)    
-            Halos = np.fromfile(f, count = N_Halos, dtype = Halo_Desc)  
-
-            binned_nion = np.zeros((GridSize*GridSize*GridSize), dtype = float32) # This grid will contain the ionizing photons that results from the binning.
-            binned_Halo_Mass = np.digitize(np.log10(Halos['Halo_Mass']), fit_mvir) # Places the Simfast21 halos into the correct halo mass bins defined by the Mvir-Ngamma results.
-            binned_Halo_Mass[binned_Halo_Mass == len(fit_mvir)] = len(fit_mvir) - 1 # Fixes up the edge case.
-
-            ## Fore each Halo we now assign it an ionizing flux. ##
-            # This flux is determined by drawing a random number from a normal distribution with mean and standard deviation given by the Mvir-Ngamma results.
+            ## Here we paint the halos created by Simfast21 onto the grid. ##
+            # Each halo is assigned an ionizing flux drawn from a normal distribution with mean and standard deviation given by the Mvir-Ngamma results.
             # NOTE: Remember the Mvir-Ngamma results are in units of log10(s^-1).
-            fit_nan = 0
-            for i in range(0, N_Halos):
-                if(np.isnan(fit_mean[binned_Halo_Mass[i]]) == True or np.isnan(fit_std[binned_Halo_Mass[i]]) == True): # This halo had mass that was not covered by the Mvir-Ngamma fits.
-                    fit_nan += 1
-                    continue
-                nion_halo = np.random.normal(fit_mean[binned_Halo_Mass[i]], fit_std[binned_Halo_Mass[i]])
-
-                ## Because of how Simfast21 does their binning, we have some cases where the Halos are technically outside the box. Just fix them up. ##
-                x_grid = int(Halos['Halo_x'][i])
-                if x_grid >= GridSize:
-                    x_grid = GridSize - 1
-                if x_grid < 0:
-                    x_grid = 0
-
-                y_grid = int(Halos['Halo_y'][i])
-                if y_grid >= GridSize:
-                    y_grid = GridSize - 1
-                if y_grid < 0:
-                    y_grid = 0
-                    
-                z_grid = int(Halos['Halo_z'][i])
-                if z_grid >= GridSize:
-                    z_grid = GridSize - 1
-                if z_grid < 0:
-                    z_grid = 0
-                
-                idx = x_grid * GridSize*GridSize + y_grid * GridSize + z_grid
-                binned_nion[idx]  += pow(10, nion_halo)/1.0e50 
-#            print"We had %d halos (out of %d, so %.4f fraction) that had halo mass that was not covered by the Mvir-Ngamma results." %(fit_nan, N_Halos, float(fit_nan)/float(N_Halos))
- #           print "There were %d cells with a non-zero ionizing flux." %(len(binned_nion[binned_nion != 0]))
+            # The halos are processed in chunks, see ``HaloPaint.paint_simfast_halos``.
+            fname = "%s/halonl_z%.3f_N%d_L100.0.dat.catalog" %(halopath, RedshiftList[halo_z_idx], GridSize)
+            # Each grid draws from its own generator, seeded by ``seed``, the model and the redshift, so the same ``seed`` always gives the same grids.
+            grid_seed = None if seed is None else [seed, model_number, halo_z_idx]
+            binned_nion, N_Halos, fit_nan = paint.paint_simfast_halos(fname, fit_mvir, fit_mean, fit_std, GridSize, seed=grid_seed) # This grid will contain the ionizing photons that results from the binning.
+            print("We had {0} halos (out of {1}) that had halo mass that was not covered by the Mvir-Ngamma results.".format(fit_nan, N_Halos))
 
             binned_nion = binned_nion.reshape((GridSize,GridSize,GridSize))
             cut_slice = 0
@@ -2489,13 +2434,13 @@ def bin_Simfast_halos(RedshiftList, SnapList, halopath, fitpath, fesc_prescripti
     
             ax2 = plt.subplot(212)
 
-            w = np.where((Halos['Halo_z'][:] > cut_slice) & (Halos['Halo_z'][:] <= cut_slice + cut_width))[0]
+            for Halos in paint.read_simfast_halos(fname):
+                w = np.where((Halos['Halo_z'][:] > cut_slice) & (Halos['Halo_z'][:] <= cut_slice + cut_width))[0]
 
-            x_plot = Halos['Halo_x'] * float(AllVars.BoxSize)/float(GridSize)
-            y_plot = Halos['Halo_y'] * float(AllVars.BoxSize)/float(GridSize)
-            z_plot = Halos['Halo_z'][w] * float(AllVars.BoxSize)/float(GridSize)
-            
-            ax2.scatter(x_plot[w], y_plot[w], s = 2, alpha = 0.5)
+                x_plot = Halos['Halo_x'] * float(AllVars.BoxSize)/float(GridSize)
+                y_plot = Halos['Halo_y'] * float(AllVars.BoxSize)/float(GridSize)
+
+                ax2.scatter(x_plot[w], y_plot[w], s = 2, alpha = 0.5, color = 'C0')
 
             ax2.set_xlabel(r'$\mathrm{x}  (h^{-1}Mpc)$')
             ax2.set_ylabel(r'$\mathrm{y}  (h^{-1}Mpc)$')
@@ -3733,6 +3678,43 @@ def Calculate_HaloPartStellarMass(halo_part, stellar_mass, bound_low, bound_high
     return np.log10(mass), np.log10(mass_std)
 
 ##
+@functools.lru_cache(maxsize=None)
+def UV_extinction_table(z, beta_std = 0.34, M_UV_low = -24.0, M_UV_high = -16.0, M_UV_width = 0.1):
+    '''
+    Tabulates the mean UV extinction A1600 as a function of UV magnitude at a given redshift.  Cached, so each redshift is only tabulated once.
+
+    The extinction is A1600 = 4.43 + 1.99*beta (Meurer et al. 1999) where beta is normally distributed about the Bouwens (2015) fit with standard deviation ``beta_std``.
+    Negative extinctions don't make sense so are clipped to 0.  The mean of this clipped normal distribution is calculated analytically.
+
+    Parameters
+    ----------
+    z : float
+    Redshift we are calculating the extinction at.
+    beta_std : float, optional
+    Scatter in beta.
+    M_UV_low, M_UV_high, M_UV_width : floats, optional
+    Defines the UV magnitude bins of the table.
+
+    Returns
+    -------
+    M_UV_bins, A_mean : arrays
+    The UV magnitude bins and the mean extinction in each.
+    '''
+
+    M_UV_bins = np.arange(M_UV_low, M_UV_high, M_UV_width)
+    beta = calculate_beta(M_UV_bins, z) # Fits the beta parameter for the current redshift/UV bin. 
+
+    # E[max(A, 0)] for A normally distributed with this mean and standard deviation.
+    A_mu = 4.43 + 1.99*beta
+    A_sigma = 1.99*beta_std
+    A_mean = A_mu * stats.norm.cdf(A_mu / A_sigma) + A_sigma * stats.norm.pdf(A_mu / A_sigma)
+
+    M_UV_bins.flags.writeable = False
+    A_mean.flags.writeable = False
+
+    return M_UV_bins, A_mean
+
+
 def calculate_UV_extinction(z, L, M):
     '''
     Calculates the observed UV magnitude after dust extinction is accounted for.
@@ -3755,24 +3737,14 @@ def calculate_UV_extinction(z, L, M):
     Magnitudes are in the AB system.
     '''
 
-    M_UV_bins = np.arange(-24, -16, 0.1)
-    A_mean = np.zeros((len(MUV_bins))) # A_mean is the average UV extinction for a given UV bin.    
-
-    for j in range(0, len(M_UV_bins)):
-        beta = calculate_beta(M_UV_bins[j], AllVars.SnapZ[current_snap]) # Fits the beta parameter for the current redshift/UV bin. 
-        dist = np.random.normal(beta, 0.34, 10000) # Generates a normal distribution with mean beta and standard deviation of 0.34.
-        A = 4.43 + 1.99*dist 
-        A[A < 0] = 0 # Negative extinctions don't make sense.
-            
-        A_Mean[j] = np.mean(A)
+    M_UV_bins, A_mean = UV_extinction_table(float(z))
 
-    indices = np.digitize(M, M_UV_bins) # Bins the simulation magnitude into the MUV bins. Note that digitize defines an index i if bin[i-1] <= x < bin[i] whereas I prefer bin[i] <= x < bin[i+1]
-    dust = A_Mean[indices]
-    flux = AllVars.Luminosity_to_Flux(L, 10.0) # Calculate the flux from a distance of 10 parsec, units of log10(erg s^-1 A^-1 cm^-2). 
+    dust = np.interp(M, M_UV_bins, A_mean) # The mean extinction of each galaxy's UV magnitude.
+    flux = AllVars.luminosity_to_flux(L, 10.0) # Calculate the flux from a distance of 10 parsec, units of log10(erg s^-1 A^-1 cm^-2). 
     flux_observed = flux - 0.4*dust
     
-    f_nu = ALlVars.spectralflux_wavelength_to_frequency(10**flux_observed, 1600) # Spectral flux desnity in Janksy.
-    M_UV_obs(-2.5 * np.log10(f_nu) + 8.90) # AB Magnitude from http://www.astro.ljmu.ac.uk/~ikb/convert-units/node2.html
+    f_nu = AllVars.spectralflux_wavelength_to_frequency(10**flux_observed, 1600) # Spectral flux desnity in Janksy.
+    M_UV_obs = -2.5 * np.log10(f_nu) + 8.90 # AB Magnitude from http://www.astro.ljmu.ac.uk/~ikb/convert-units/node2.html
 
     return M_UV_obs
 
@@ -3996,59 +3968,15 @@ if __name__ == '__main__':
     ## Arrays for functions of stellar mass. ##
     SMF = [] # Stellar Mass Function.
 
-    mean_fesc_galaxy_array = [] # Mean escape fraction as a function of stellar mass.
-    std_fesc_galaxy_array = [] # Same as above but standard devation.
-
-    N_galaxy_array = [] # Number of galaxies as a function of stellar mass.
-
-    mean_BHmass_galaxy_array = [] # Black hole mass as a function of stellar mass.
-    std_BHmass_galaxy_array = [] # Same as above but standard deviation.
-
     mergers_galaxy_array = [] # Number of mergers as a function of halo mass. 
 
-    mean_dust_galaxy_array = [] # Mean dust mass as a function of stellar mass. 
-    std_dust_galaxy_array = [] # Same as above but standard deviation. 
-
-    mean_sfr_galaxy_array = []  # Mean star formation rate as a
-                                 # function of stellar mass
-    std_sfr_galaxy_array = []  # Same as above but standard deviation.  
-
-    mean_ssfr_galaxy_array = []  # Mean specific star formation rate as a
-                                 # function of stellar mass
-    std_ssfr_galaxy_array = []  # Same as above but standard deviation.  
-
-    mean_Ngamma_galaxy_array = []  # Mean number of ionizing photons emitted as
-                                   # a function of stellar mass.
-    std_Ngamma_galaxy_array = []  # Same as above but standard deviation.
-
-    mean_photo_galaxy_array = []  # Mean photoionization rate.
-    std_photo_galaxy_array = []  # Std photoionization rate. 
-
-    mean_reionmod_galaxy_array = []  # Mean reionization modifier using RSAGE. 
-    std_reionmod_galaxy_array = []  # Std. 
-
-    mean_gnedin_reionmod_galaxy_array = []  # Mean reionization modifier using Gnedin analytic prescription. 
-    std_gnedin_reionmod_galaxy_array = []  # Std. 
-
     ## Arrays for functions of halo mass. ##
-    mean_ejected_halo_array = [] # Mean ejected fractions as a function of halo mass.
-    std_ejected_halo_array = [] # Same as above but standard deviation.
-    mean_fesc_halo_array = [] # Mean escape fraction as a function of halo mass.
-    std_fesc_halo_array = [] # Same as above but standard deviation.
     mean_Ngamma_halo_array = [] # Mean number of ionizing photons THAT ESCAPE as a function of halo mass.
     std_Ngamma_halo_array = [] # Same as above but standard deviation.
-    N_halo_array = [] # Number of galaxies as a function of halo mass.
 
     mergers_halo_array = [] # Number of mergers as a function of halo mass. 
 
-    mean_quasar_activity_array = [] # Mean fraction of galaxies that have quasar actvitity as a function of halo mas.
-    std_quasar_activity_array = [] # Same as above but standard deviation.
-
-    mean_reionmod_halo_array = [] # Mean reionization modifier as a function of halo mass.
-    std_reionmod_halo_array = [] # Same as above but for standard deviation. 
-
-    mean_dust_halo_array = [] # Mean dust mass as a function of halo mass. 
-    std_dust_halo_array = [] # Same as above but standard deviation. 
+    ## The binned statistics (functions of stellar mass, halo mass and fej) are accumulated by ``galaxy_stats`` (see below). ##
 
     ## Arrays for functions of redshift. ##
     sum_Ngamma_z_array = [] # Total number of ionizing photons THAT ESCAPE as a functio of redshift. 
@@ -4076,65 +4004,20 @@ if __name__ == '__main__':
     Ngamma_global = []
     mass_global = []
     fesc_global = []
-
-    ## Arrays as a function of fej ##
-    mean_Ngamma_fej = []
-    std_Ngamma_fej = []
-    N_fej = []
     
     ## Now the outer arrays have been defined, set up the next nest level for the number of models. ##
 
     for model_number in range(0,number_models):
         ## Galaxy Arrays ##
         SMF.append([])
-        mean_fesc_galaxy_array.append([])
-        std_fesc_galaxy_array.append([])
-        N_galaxy_array.append([])
-        mean_BHmass_galaxy_array.append([])
-        std_BHmass_galaxy_array.append([])
         mergers_galaxy_array.append([]) 
 
-        mean_dust_galaxy_array.append([])
-        std_dust_galaxy_array.append([])
-
-        mean_sfr_galaxy_array.append([])
-        std_sfr_galaxy_array.append([])
-
-        mean_ssfr_galaxy_array.append([])
-        std_ssfr_galaxy_array.append([])
-
-        mean_Ngamma_galaxy_array.append([])
-        std_Ngamma_galaxy_array.append([])
-
-        mean_photo_galaxy_array.append([])
-        std_photo_galaxy_array.append([]) 
-
-        mean_reionmod_galaxy_array.append([])
-        std_reionmod_galaxy_array.append([])
-
-        mean_gnedin_reionmod_galaxy_array.append([])
-        std_gnedin_reionmod_galaxy_array.append([])
-
         ## Halo arrays. ##
-        mean_ejected_halo_array.append([])
-        std_ejected_halo_array.append([])
-        mean_fesc_halo_array.append([])
-        std_fesc_halo_array.append([])
         mean_Ngamma_halo_array.append([])
         std_Ngamma_halo_array.append([])
-        N_halo_array.append([])
 
         mergers_halo_array.append([]) 
 
-        mean_quasar_activity_array.append([])
-        std_quasar_activity_array.append([])
-
-        mean_reionmod_halo_array.append([])
-        std_reionmod_halo_array.append([])
-
-        mean_dust_halo_array.append([])
-        std_dust_halo_array.append([])
-
         ## Redshift arrays. ##
         sum_Ngamma_z_array.append([])
         mean_fesc_z_array.append([])
@@ -4162,11 +4045,6 @@ if __name__ == '__main__':
         mass_global.append([])
         fesc_global.append([])
 
-        ## Arrays as a function of fej ##
-        mean_Ngamma_fej.append([]) 
-        std_Ngamma_fej.append([]) 
-        N_fej.append([]) 
-
         ## And then finally set up the inner most arrays ##
         ## NOTE: We do the counts as float so we can keep consistency when we're calling MPI operations (just use MPI.FLOAT rather than deciding if we need to use MPI.INT)
 
@@ -4176,54 +4054,14 @@ if __name__ == '__main__':
  
             ## Functions of stellar mass arrays. ##
             SMF[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-            mean_fesc_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-            std_fesc_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32))
-            N_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-            mean_BHmass_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-            std_BHmass_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
             mergers_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32))
 
-            mean_dust_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-            std_dust_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-
-            mean_sfr_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-            std_sfr_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-
-            mean_ssfr_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-            std_ssfr_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-
-            mean_Ngamma_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-            std_Ngamma_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-
-            mean_photo_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32))
-            std_photo_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-
-            mean_reionmod_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32))
-            std_reionmod_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-
-            mean_gnedin_reionmod_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32))
-            std_gnedin_reionmod_galaxy_array[model_number].append(np.zeros((NB_gal), dtype = np.float32)) 
-
             ## Function of halo mass arrays. ##
-            mean_ejected_halo_array[model_number].append(np.zeros((NB), dtype = np.float32)) 
-            std_ejected_halo_array[model_number].append(np.zeros((NB), dtype = np.float32)) 
-            mean_fesc_halo_array[model_number].append(np.zeros((NB), dtype = np.float32)) 
-            std_fesc_halo_array[model_number].append(np.zeros((NB), dtype = np.float32))
             mean_Ngamma_halo_array[model_number].append(np.zeros((NB), dtype = np.float32)) 
             std_Ngamma_halo_array[model_number].append(np.zeros((NB), dtype = np.float32))
-            N_halo_array[model_number].append(np.zeros((NB), dtype = np.float32))
 
             mergers_halo_array[model_number].append(np.zeros((NB), dtype = np.float32)) 
  
-            mean_quasar_activity_array[model_number].append(np.zeros((NB), dtype = np.float32)) 
-            std_quasar_activity_array[model_number].append(np.zeros((NB), dtype = np.float32)) 
-    
-            mean_reionmod_halo_array[model_number].append(np.zeros((NB), dtype = np.float32))
-            std_reionmod_halo_array[model_number].append(np.zeros((NB), dtype = np.float32))
-
-            mean_dust_halo_array[model_number].append(np.zeros((NB), dtype = np.float32)) 
-            std_dust_halo_array[model_number].append(np.zeros((NB), dtype = np.float32)) 
- 
             ## Function of Redshift arrays. ##
             sum_Ngamma_z_array[model_number].append(0.0) 
             mean_fesc_z_array[model_number].append(0.0) 
@@ -4246,15 +4084,33 @@ if __name__ == '__main__':
             mean_ejected_z[model_number].append(0.0)
             std_ejected_z[model_number].append(0.0)
 
-            
             Ngamma_global[model_number].append([])
             mass_global[model_number].append([])
             fesc_global[model_number].append([])
 
-            ## Arrays as a function of fej. ##            
-            mean_Ngamma_fej[model_number].append(np.zeros((NB_fej), dtype = np.float32)) 
-            std_Ngamma_fej[model_number].append(np.zeros((NB_fej), dtype = np.float32)) 
-            N_fej[model_number].append(np.zeros((NB_fej), dtype = np.float32)) 
+    ## The statistics that are binned across stellar mass, halo mass or fej. ##
+    ## Each is declared as (name, binning axis, x field, y field, transform, selection); the fields are filled for each snapshot in the galaxy loop. ##
+    binning_axes = {"stellar_mass" : bstats.make_axis(bin_width, m_gal_low, m_gal_high),
+                    "halo_mass" : bstats.make_axis(bin_width, m_low, m_high),
+                    "fej" : bstats.make_axis(fej_bin_width, fej_low, fej_high)}
+
+    stats_registry = [bstats.statistic("fesc_galaxy", "stellar_mass", "mass_gal", "fesc"), # Escape fraction.
+                      bstats.statistic("BHmass_galaxy", "stellar_mass", "mass_gal", "mass_BH"), # Black hole mass.
+                      bstats.statistic("dust_galaxy", "stellar_mass", "mass_gal", "dust_mass", transform=np.log10, selection="has_dust"), # Total dust mass of centrals with dust.
+                      bstats.statistic("sfr_galaxy", "stellar_mass", "mass_gal", "SFR", transform=np.log10, selection="has_SFR"), # Star formation rate.
+                      bstats.statistic("ssfr_galaxy", "stellar_mass", "mass_gal", "sSFR", selection="has_SFR"), # Specific star formation rate.
+                      bstats.statistic("Ngamma_galaxy", "stellar_mass", "mass_gal", "Ngamma"), # Number of ionizing photons that escape.
+                      bstats.statistic("photo_galaxy", "stellar_mass", "mass_gal", "photHI"), # Photoionization rate.
+                      bstats.statistic("reionmod_galaxy", "stellar_mass", "mass_gal", "reionmod", selection="has_reionmod"), # RSAGE reionization modifier.
+                      bstats.statistic("gnedin_reionmod_galaxy", "stellar_mass", "mass_gal", "gnedin_reionmod"), # Gnedin reionization modifier.
+                      bstats.statistic("ejected_halo", "halo_mass", "mass_central", "ejected_fraction"), # Ejected fraction.
+                      bstats.statistic("quasar_activity", "halo_mass", "mass_central", "quasar_activity"), # Quasar activity.
+                      bstats.statistic("fesc_halo", "halo_mass", "mass_central", "fesc"), # Escape fraction.
+                      bstats.statistic("reionmod_halo", "halo_mass", "mass_central", "reionmod", selection="has_reionmod"), # RSAGE reionization modifier.
+                      bstats.statistic("dust_halo", "halo_mass", "mass_central", "dust_mass", transform=np.log10, selection="has_dust"), # Total dust mass of centrals with dust.
+                      bstats.statistic("Ngamma_fej", "fej", "ejected_fraction", "Ngamma")] # Number of ionizing photons that escape as a function of fej.
+
+    galaxy_stats = bstats.BinnedStatistics(binning_axes, stats_registry, [len(SnapList[model_number]) for model_number in range(number_models)])
 
     ######################################################################   
     #################### ALL ARRAYS SETUP ################################
@@ -4262,6 +4118,8 @@ if __name__ == '__main__':
 
     ## Now it's (finally) time to read in all the data and do the actual work. ##
 
+    grid_sampler = photo.GridSampler() # Keeps the photoionization/zreion grids mapped across files and snapshots.
+
     for model_number in range(number_models):
 
         if(simulation_norm[model_number] == 1):
@@ -4296,6 +4154,16 @@ if __name__ == '__main__':
                 NumSubsteps = number_substeps[current_model_number]
                 do_observed_LF = calculate_observed_LF[current_model_number]
 
+                ## The Gnedin (analytic) reionization modifier of every galaxy at every snapshot, in one vectorised call for this file. ##
+                gnedin_z_0 = 8.0
+                gnedin_z_r = 7.0
+                fof_mass_block = G.GridFoFMass[:, SnapList[current_model_number]]
+                has_fof_mass = fof_mass_block > 0.0 # Galaxy slots that don't exist at a snapshot have no FoF mass.
+                gnedin_reionmod_block = ga.get_reionmod_block(np.log10(np.where(has_fof_mass, fof_mass_block, 1.0) * 1.0e10 / AllVars.Hubble_h),
+                                                              np.array(AllVars.SnapZ)[SnapList[current_model_number]],
+                                                              gnedin_z_0, gnedin_z_r)
+                gnedin_reionmod_block[~has_fof_mass] = 0.0 # The limit of the modifier as the halo mass goes to 0.
+
                 for snapshot_idx in range(0, len(SnapList[current_model_number])): # Now let's calculate stats for each required redshift.                
                     current_snap = SnapList[current_model_number][snapshot_idx] # Get rid of some clutter.
 
@@ -4316,7 +4184,6 @@ if __name__ == '__main__':
 
                     SFR_gal = np.log10(G.GridSFR[w_SFR,current_snap])
 
-                    sSFR_gal = SFR_gal - mass_SFR_gal  
                     halo_part_count = G.LenHistory[w_gal, current_snap]
                     metallicity_gal = G.GridZ[w_gal, current_snap]  
                     metallicity_tremonti_gal = np.log10(G.GridZ[w_gal, current_snap] / 0.02) + 9.0 # Using the Tremonti relationship for metallicity.
@@ -4360,31 +4227,26 @@ if __name__ == '__main__':
                     M_UV = AllVars.Luminosity_to_ABMag(L_UV, 1600)
 
                     if (do_observed_LF == 1): # Calculate the UV extinction if requested. 
-                        M_UV_obs = calculate_UV_extinction(AllVars.SnapZ[current_snap], L_UV, M_UV[snap_idx])
+                        M_UV_obs = calculate_UV_extinction(AllVars.SnapZ[current_snap], L_UV, M_UV)
                       
                     galaxy_halo_mass_mean_local, galaxy_halo_mass_std_local = Calculate_HaloPartStellarMass(halo_part_count, mass_gal, stellar_mass_halolen_lower[current_model_number], stellar_mass_halolen_upper[current_model_number]) # This is the average stellar mass for galaxies whose halos have the specified number of particles.
                     galaxy_halo_mass_mean[current_model_number][snapshot_idx] += pow(10, galaxy_halo_mass_mean_local) / (LastFile[current_model_number] + 1) # Adds to the average of the mean.
 
         
-                    photofield_path = "{0}_{1:03d}".format(photo_array[current_model_number], 
-                                                           current_snap) 
-                    #photo_gal = photo.calc_gal_photoion(G.GridHistory[w_gal, current_snap],
-                    #                                    photofield_path,
-                    #                                    GridSize_array[current_model_number],
-                    #                                    precision_array[current_model_number]) 
-
-                    #zreion_path = "{0}".format(zreion_array[current_model_number])
-                    #zreion_gal = photo.calc_gal_zreion(G.GridHistory[w_gal, current_snap],
-                    #                                   zreion_path,
-                    #                                   GridSize_array[current_model_number],
-                    #                                   precision_array[current_model_number]) 
-
-                    z_0 = 8.0
-                    z_r = 7.0
-                    gnedin_mfilt = ga.get_filter_mass(np.array(AllVars.SnapZ[current_snap]),
-                                                      z_0, z_r)
-
-                    gnedin_reionmod_gal = 1.0 / pow(1.0 + 0.26*pow(10, gnedin_mfilt - mass_central), 3.0)
+                    photofield_path = layout.format_path("photHI", photo_array[current_model_number], snap=current_snap)
+                    zreion_path = "{0}".format(zreion_array[current_model_number])
+
+                    # Sample the environment of every galaxy in one go.
+                    environment = photo.calc_gal_environment(G.GridHistory[w_gal, current_snap],
+                                                             {"photHI" : (photofield_path, precision_array[current_model_number]),
+                                                              "zreion" : (zreion_path, precision_array[current_model_number])},
+                                                             GridSize_array[current_model_number],
+                                                             grid_sampler)
+                    photo_gal = environment["photHI"]
+                    zreion_gal = environment["zreion"]
+                    grid_sampler.close(photofield_path) # Only the zreion grid is needed again.
+
+                    gnedin_reionmod_gal = gnedin_reionmod_block[w_gal, snapshot_idx]
 
                     ###########################################                     
                     ######## BASE PROPERTIES CALCULATED #######
@@ -4399,188 +4261,36 @@ if __name__ == '__main__':
                     (counts_local, bin_edges, bin_middle) = AllVars.Calculate_Histogram(mass_gal, bin_width, 0, m_gal_low, m_gal_high) # Bin the Stellar Mass 
                     SMF[current_model_number][snapshot_idx] += counts_local 
 
-                    ## Escape Fraction ##                    
-
-                    (mean_fesc_galaxy_local, std_fesc_galaxy_local, N_local, sum_fesc_galaxy, bin_middle) = AllVars.Calculate_2D_Mean(mass_gal, fesc, bin_width, m_gal_low, m_gal_high)
-                    (mean_fesc_galaxy_array[current_model_number][snapshot_idx], std_fesc_galaxy_array[current_model_number][snapshot_idx]) = update_cumulative_stats(mean_fesc_galaxy_array[current_model_number][snapshot_idx], std_fesc_galaxy_array[current_model_number][snapshot_idx], N_galaxy_array[current_model_number][snapshot_idx], mean_fesc_galaxy_local, std_fesc_galaxy_local, N_local) 
- 
-                    ## Black Hole Mass ##
-
-                    (mean_BHmass_galaxy_local, std_BHmass_galaxy_local, N_local, sum_BHmass_galaxy, bin_middle) = AllVars.Calculate_2D_Mean(mass_gal, mass_BH, bin_width, m_gal_low, m_gal_high) 
-                    (mean_BHmass_galaxy_array[current_model_number][snapshot_idx], std_BHmass_galaxy_array[current_model_number][snapshot_idx]) = update_cumulative_stats(mean_BHmass_galaxy_array[current_model_number][snapshot_idx], std_BHmass_galaxy_array[current_model_number][snapshot_idx], N_galaxy_array[current_model_number][snapshot_idx], mean_BHmass_galaxy_local, std_BHmass_galaxy_local, N_local) 
-                     
-                    ## Total Dust Mass ##
-                    (mean_dust_galaxy_local, std_dust_galaxy_local, N_local,
-                     sum_dust_galaxy, bin_middle) = AllVars.Calculate_2D_Mean(
-                                                    mass_gal_dust, total_dust_gal,
-                                                    bin_width, m_gal_low,
-                                                    m_gal_high) 
-
-                    (mean_dust_galaxy_array[current_model_number][snapshot_idx],
-                     std_dust_galaxy_array[current_model_number][snapshot_idx]) = \
-                    update_cumulative_stats(mean_dust_galaxy_array[current_model_number][snapshot_idx],
-                                            std_dust_galaxy_array[current_model_number][snapshot_idx],
-                                            N_galaxy_array[current_model_number][snapshot_idx],
-                                            mean_dust_galaxy_local,
-                                            std_dust_galaxy_local,
-                                            N_local) 
-
-
-                    ## Star Formation Rate ##
-                    (mean_sfr_galaxy_local, std_sfr_galaxy_local, N_local,
-                     sum_sfr_galaxy, bin_middle) = AllVars.Calculate_2D_Mean(
-                                                    mass_SFR_gal, SFR_gal,
-                                                    bin_width, m_gal_low,
-                                                    m_gal_high) 
-
-                    (mean_sfr_galaxy_array[current_model_number][snapshot_idx],
-                     std_sfr_galaxy_array[current_model_number][snapshot_idx]) = \
-                    update_cumulative_stats(mean_sfr_galaxy_array[current_model_number][snapshot_idx],
-                                            std_sfr_galaxy_array[current_model_number][snapshot_idx],
-                                            N_galaxy_array[current_model_number][snapshot_idx],
-                                            mean_sfr_galaxy_local,
-                                            std_sfr_galaxy_local,
-                                            N_local) 
-
-                    ## Specific Star Formation Rate ##
-                    (mean_ssfr_galaxy_local, std_ssfr_galaxy_local, N_local,
-                     sum_ssfr_galaxy, bin_middle) = AllVars.Calculate_2D_Mean(
-                                                    mass_SFR_gal, sSFR_gal,
-                                                    bin_width, m_gal_low,
-                                                    m_gal_high) 
-
-                    (mean_ssfr_galaxy_array[current_model_number][snapshot_idx],
-                     std_ssfr_galaxy_array[current_model_number][snapshot_idx]) = \
-                    update_cumulative_stats(mean_ssfr_galaxy_array[current_model_number][snapshot_idx],
-                                            std_ssfr_galaxy_array[current_model_number][snapshot_idx],
-                                            N_galaxy_array[current_model_number][snapshot_idx],
-                                            mean_ssfr_galaxy_local,
-                                            std_ssfr_galaxy_local,
-                                            N_local) 
-
-                    ## Number of Ionizing Photons ##
-                    (mean_Ngamma_galaxy_local, std_Ngamma_galaxy_local, N_local,
-                     sum_Ngamma_galaxy_local, bin_middle) = AllVars.Calculate_2D_Mean(
-                                                    mass_gal, Ngamma_gal,
-                                                    bin_width, m_gal_low,
-                                                    m_gal_high) 
-
-                    (mean_Ngamma_galaxy_array[current_model_number][snapshot_idx],
-                     std_Ngamma_galaxy_array[current_model_number][snapshot_idx]) = \
-                    update_cumulative_stats(mean_Ngamma_galaxy_array[current_model_number][snapshot_idx],
-                                            std_Ngamma_galaxy_array[current_model_number][snapshot_idx],
-                                            N_galaxy_array[current_model_number][snapshot_idx],
-                                            mean_Ngamma_galaxy_local,
-                                            std_Ngamma_galaxy_local,
-                                            N_local) 
-          
-                    ## Photoionization rate ##
-
-                    '''
-                    (mean_photo_galaxy_local, std_photo_galaxy_local, N_local,
-                     sum_photo_galaxy_local, bin_middle) = AllVars.Calculate_2D_Mean(
-                                                    mass_gal, photo_gal,
-                                                    bin_width, m_gal_low,
-                                                    m_gal_high) 
-
-                    (mean_photo_galaxy_array[current_model_number][snapshot_idx],
-                     std_photo_galaxy_array[current_model_number][snapshot_idx]) = \
-                    update_cumulative_stats(mean_photo_galaxy_array[current_model_number][snapshot_idx],
-                                            std_photo_galaxy_array[current_model_number][snapshot_idx],
-                                            N_galaxy_array[current_model_number][snapshot_idx],
-                                            mean_photo_galaxy_local,
-                                            std_photo_galaxy_local,
-                                            N_local) 
-                    '''
-
-
-                    ## RSAGE Reionization Modifier ##
-
-                    (mean_reionmod_galaxy_local, std_reionmod_galaxy_local, N_local,
-                     sum_reionmod_galaxy_local, bin_middle) = AllVars.Calculate_2D_Mean(
-                                                    mass_reionmod_gal, reionmod,
-                                                    bin_width, m_gal_low,
-                                                    m_gal_high) 
-
-                    (mean_reionmod_galaxy_array[current_model_number][snapshot_idx],
-                     std_reionmod_galaxy_array[current_model_number][snapshot_idx]) = \
-                    update_cumulative_stats(mean_reionmod_galaxy_array[current_model_number][snapshot_idx],
-                                            std_reionmod_galaxy_array[current_model_number][snapshot_idx],
-                                            N_galaxy_array[current_model_number][snapshot_idx],
-                                            mean_reionmod_galaxy_local,
-                                            std_reionmod_galaxy_local,
-                                            N_local) 
-
-                    ## Gnedin Reionization Modifier ##
-
-                    (mean_gnedin_reionmod_galaxy_local, std_gnedin_reionmod_galaxy_local, N_local,
-                     sum_gnedin_reionmod_galaxy_local, bin_middle) = AllVars.Calculate_2D_Mean(
-                                                    mass_gal, gnedin_reionmod_gal,
-                                                    bin_width, m_gal_low,
-                                                    m_gal_high) 
-
-                    (mean_gnedin_reionmod_galaxy_array[current_model_number][snapshot_idx],
-                     std_gnedin_reionmod_galaxy_array[current_model_number][snapshot_idx]) = \
-                    update_cumulative_stats(mean_gnedin_reionmod_galaxy_array[current_model_number][snapshot_idx],
-                                            std_gnedin_reionmod_galaxy_array[current_model_number][snapshot_idx],
-                                            N_galaxy_array[current_model_number][snapshot_idx],
-                                            mean_gnedin_reionmod_galaxy_local,
-                                            std_gnedin_reionmod_galaxy_local,
-                                            N_local)
-
-                    N_galaxy_array[current_model_number][snapshot_idx] += N_local 
-
-                    ### Functions of Halos/Halo Mass ###
-
-                    ## Ejected Fraction ##
-
-                    (mean_ejected_halo_local, std_ejected_halo_local, N_local, sum_ejected_halo, bin_middle) = AllVars.Calculate_2D_Mean(mass_central, ejected_fraction, bin_width, m_low, m_high) 
-                    (mean_ejected_halo_array[current_model_number][snapshot_idx], std_ejected_halo_array[current_model_number][snapshot_idx]) = update_cumulative_stats(mean_ejected_halo_array[current_model_number][snapshot_idx], std_ejected_halo_array[current_model_number][snapshot_idx], N_halo_array[current_model_number][snapshot_idx], mean_ejected_halo_local, std_ejected_halo_local, N_local) # Then update the running total.
-
-                    ## Quasar Fraction ##
-
-                    (mean_quasar_activity_local, std_quasar_activity_local,N_local, sum_quasar_activity_halo, bin_middle) = AllVars.Calculate_2D_Mean(mass_central, G.QuasarActivity[w_gal, current_snap], bin_width, m_low, m_high) 
-                    (mean_quasar_activity_array[current_model_number][snapshot_idx], std_quasar_activity_array[current_model_number][snapshot_idx]) = update_cumulative_stats(mean_quasar_activity_array[current_model_number][snapshot_idx], std_quasar_activity_array[current_model_number][snapshot_idx], N_halo_array[current_model_number][snapshot_idx], mean_quasar_activity_local, std_quasar_activity_local, N_local) # Then update the running total.
-                   
-                    ## fesc Value ##
-
-                    (mean_fesc_halo_local, std_fesc_halo_local, N_local, sum_fesc_halo, bin_middle) = AllVars.Calculate_2D_Mean(mass_central, fesc, bin_width, m_low, m_high) 
-                    (mean_fesc_halo_array[current_model_number][snapshot_idx], std_fesc_halo_array[current_model_number][snapshot_idx]) = update_cumulative_stats(mean_fesc_halo_array[current_model_number][snapshot_idx], std_fesc_halo_array[current_model_number][snapshot_idx], N_halo_array[current_model_number][snapshot_idx], mean_fesc_halo_local, std_fesc_halo_local, N_local) # Then update the running total. 
-
-                    ## Ngamma ##
-
-                    #(mean_Ngamma_halo_local, std_Ngamma_halo_local, N_local, sum_Ngamma_halo, bin_middle) \
-                    #= AllVars.Calculate_2D_Mean(mass_central, ionizing_photons, bin_width, m_low, m_high)  
-
-                    #mean_Ngamma_halo_local = np.divide(mean_Ngamma_halo_local, 1.0e50) ## Divide out a constant to keep the numbers manageable.
-                    #std_Ngamma_halo_local = np.divide(std_Ngamma_halo_local, 1.0e50)
-
-                    #(mean_Ngamma_halo_array[current_model_number][snapshot_idx], std_Ngamma_halo_array[current_model_number][snapshot_idx]) = update_cumulative_stats(mean_Ngamma_halo_array[current_model_number][snapshot_idx], std_Ngamma_halo_array[current_model_number][snapshot_idx], N_halo_array[current_model_number][snapshot_idx], mean_Ngamma_halo_local, std_Ngamma_halo_local, N_local) # Then update the running total. 
-
-                    ## Reionization Modifier ##
-
-                    (mean_reionmod_halo_local, std_reionmod_halo_local, N_local, sum_reionmod_halo, bin_middle) = AllVars.Calculate_2D_Mean(mass_reionmod_central, reionmod, bin_width, m_low, m_high) 
-                    (mean_reionmod_halo_array[current_model_number][snapshot_idx], std_reionmod_halo_array[current_model_number][snapshot_idx]) = update_cumulative_stats(mean_reionmod_halo_array[current_model_number][snapshot_idx], std_reionmod_halo_array[current_model_number][snapshot_idx], N_halo_array[current_model_number][snapshot_idx], mean_reionmod_halo_local, std_reionmod_halo_local, N_local) # Then update the running total. 
-        
-                    ## Total Dust Mass ##
-
-                    (mean_dust_halo_local, std_dust_halo_local, N_local,
-                     sum_dust_halo, bin_middle) = AllVars.Calculate_2D_Mean(
-                                                    mass_centralgal_dust, total_dust_gal,
-                                                    bin_width, m_low,
-                                                    m_high) 
-
-                    (mean_dust_halo_array[current_model_number][snapshot_idx],
-                     std_dust_halo_array[current_model_number][snapshot_idx]) = \
-                    update_cumulative_stats(mean_dust_halo_array[current_model_number][snapshot_idx],
-                                            std_dust_halo_array[current_model_number][snapshot_idx],
-                                            N_halo_array[current_model_number][snapshot_idx],
-                                            mean_dust_halo_local,
-                                            std_dust_halo_local,
-                                            N_local) 
-
-                                
-                    N_halo_array[current_model_number][snapshot_idx] += N_local                         
+                    ## Binned statistics ##
+                    # Every statistic in ``stats_registry`` is accumulated in one go.  Fields are per galaxy in ``w_gal``.
+                    SFR_all_gal = G.GridSFR[w_gal, current_snap]
+                    dust_mass_gal = (G.GridDustColdGas[w_gal, current_snap]
+                                     +G.GridDustHotGas[w_gal, current_snap]
+                                     +G.GridDustEjectedMass[w_gal, current_snap]) * 1.0e10 / AllVars.Hubble_h
+                    reionmod_all_gal = G.GridReionMod[w_gal, current_snap]
+
+                    has_SFR_gal = SFR_all_gal > 0.0
+                    sSFR_all_gal = np.full(len(SFR_all_gal), np.nan) # Only galaxies with star formation have a (log) sSFR.
+                    sSFR_all_gal[has_SFR_gal] = np.log10(SFR_all_gal[has_SFR_gal]) - mass_gal[has_SFR_gal]
+
+                    stats_fields = {"mass_gal" : mass_gal,
+                                    "mass_central" : mass_central,
+                                    "fesc" : fesc,
+                                    "mass_BH" : mass_BH,
+                                    "dust_mass" : dust_mass_gal,
+                                    "SFR" : SFR_all_gal,
+                                    "sSFR" : sSFR_all_gal,
+                                    "Ngamma" : Ngamma_gal,
+                                    "photHI" : photo_gal,
+                                    "reionmod" : reionmod_all_gal,
+                                    "gnedin_reionmod" : gnedin_reionmod_gal,
+                                    "ejected_fraction" : ejected_fraction,
+                                    "quasar_activity" : G.QuasarActivity[w_gal, current_snap],
+                                    "has_SFR" : has_SFR_gal,
+                                    "has_dust" : (dust_mass_gal > 0.0) & (G.GridType[w_gal, current_snap] == 0),
+                                    "has_reionmod" : reionmod_all_gal > -1} # Some satellite galaxies that don't have HotGas and hence won't be stripped. As a result reionmod = -1 for these. Ignore them.
+
+                    galaxy_stats.accumulate(current_model_number, snapshot_idx, stats_fields)
 
                     ### Functions of redshift ###
 
@@ -4611,29 +4321,34 @@ if __name__ == '__main__':
                     mass_global[current_model_number][snapshot_idx].append(mass_gal)
                     fesc_global[current_model_number][snapshot_idx].append(fesc)
 
-                    #### Arrays that are function of fej ##
-                    (mean_Ngamma_fej_local, std_Ngamma_fej_local, N_local,
-                     sum_Ngamma_fej_local, bin_middle) = AllVars.Calculate_2D_Mean(
-                                      ejected_fraction, Ngamma_gal,
-                                      fej_bin_width, fej_low, fej_high) 
-
-                    (mean_Ngamma_fej[current_model_number][snapshot_idx],
-                     std_Ngamma_fej[current_model_number][snapshot_idx]) = \
-                    update_cumulative_stats(mean_Ngamma_fej[current_model_number][snapshot_idx],
-                                            std_Ngamma_fej[current_model_number][snapshot_idx],
-                                            N_fej[current_model_number][snapshot_idx],
-                                            mean_Ngamma_fej_local,
-                                            std_Ngamma_fej_local,
-                                            N_local) 
-
-                    N_fej[current_model_number][snapshot_idx] += N_local
-
 
                 done_model[current_model_number] = 1
                 if (current_model_number < number_models):                
                     keep_files =  same_files[current_model_number] # Decide if we want to keep the files loaded or throw them out. 
                     current_model_number += 1 # Update the inner loop model number.
 
+    ## Sum the binned statistics across tasks (in one call) then unpack them for the plotting functions. ##
+    ## Only rank 0 holds the totals so pooling them again within the plotting functions leaves them unchanged. ##
+    galaxy_stats.reduce(comm)
+
+    (mean_fesc_galaxy_array, std_fesc_galaxy_array, N_galaxy_array) = galaxy_stats.nested("fesc_galaxy")
+    (mean_BHmass_galaxy_array, std_BHmass_galaxy_array, _) = galaxy_stats.nested("BHmass_galaxy")
+    (mean_dust_galaxy_array, std_dust_galaxy_array, _) = galaxy_stats.nested("dust_galaxy")
+    (mean_sfr_galaxy_array, std_sfr_galaxy_array, _) = galaxy_stats.nested("sfr_galaxy")
+    (mean_ssfr_galaxy_array, std_ssfr_galaxy_array, _) = galaxy_stats.nested("ssfr_galaxy")
+    (mean_Ngamma_galaxy_array, std_Ngamma_galaxy_array, _) = galaxy_stats.nested("Ngamma_galaxy")
+    (mean_photo_galaxy_array, std_photo_galaxy_array, _) = galaxy_stats.nested("photo_galaxy")
+    (mean_reionmod_galaxy_array, std_reionmod_galaxy_array, _) = galaxy_stats.nested("reionmod_galaxy")
+    (mean_gnedin_reionmod_galaxy_array, std_gnedin_reionmod_galaxy_array, _) = galaxy_stats.nested("gnedin_reionmod_galaxy")
+
+    (mean_ejected_halo_array, std_ejected_halo_array, N_halo_array) = galaxy_stats.nested("ejected_halo")
+    (mean_quasar_activity_array, std_quasar_activity_array, _) = galaxy_stats.nested("quasar_activity")
+    (mean_fesc_halo_array, std_fesc_halo_array, _) = galaxy_stats.nested("fesc_halo")
+    (mean_reionmod_halo_array, std_reionmod_halo_array, _) = galaxy_stats.nested("reionmod_halo")
+    (mean_dust_halo_array, std_dust_halo_array, _) = galaxy_stats.nested("dust_halo")
+
+    (mean_Ngamma_fej, std_Ngamma_fej, N_fej) = galaxy_stats.nested("Ngamma_fej")
+
     #StellarMassFunction(PlotSnapList, SMF, simulation_norm, FirstFile,
     #                    LastFile, NumFile, galaxy_halo_mass_mean, model_tags,
     #                    1, paper_plots, "wtf")
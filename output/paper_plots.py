@@ -21,13 +21,18 @@ import ReionData as reiondata
 import MiscData as misc
 import AllVars as av
 import PlotScripts as ps
+import ParallelBackend as pb
+import ScanSummary as scan
 
 import numpy as np
-from mpi4py import MPI
 
-comm = MPI.COMM_WORLD
-rank = comm.Get_rank()
-size = comm.Get_size()
+# Runs with MPI if launched through ``mpirun``, otherwise uses a pool over all
+# local cores. Set the ``RSAGE_BACKEND`` environment variable to force one of
+# ``mpi``, ``pool`` or ``serial``.
+backend = pb.get_backend()
+comm = backend.comm
+rank = backend.rank
+size = backend.size
 
 output_format = "png"
 
@@ -45,6 +50,19 @@ if __name__ == "__main__":
     # Format all plots are saved as.
     output_format = "png"
 
+    # While one galaxy batch/reionization snapshot is processed, up to
+    # ``prefetch_depth`` more are read on a background thread.  The memory held
+    # by these is capped at ``prefetch_bytes`` (``None`` for no cap).  Set
+    # ``prefetch_depth = 0`` to read synchronously.
+    prefetch_depth = 2
+    prefetch_bytes = 2 * 1024**3
+
+    # If not ``None``, the results of each galaxy file and reionization snapshot
+    # are saved in this directory. Re-running after a crash (or wall time), or
+    # after adding models/files, will only process the files/snapshots that
+    # are missing.
+    checkpoint_dir = None
+
     # Plotting is driven entirely through specifying the .ini files.
     # For this reason, the directories specified by the .ini files (e.g.,
     # `OutputDir`)  **MUST** be absolute paths, **NOT** relative.
@@ -334,6 +352,11 @@ if __name__ == "__main__":
     first_file = None
     last_file = None
 
+    # Galaxies are read in batches of (approximately) this many bytes, which
+    # caps the memory used by each task. Set to ``None`` to read each file in
+    # one go.
+    batch_bytes = 512 * 1024**2
+
     dust_to_gas_ratio = [1.0, 1.0, 1.0]
     radius_dust_grains = [5.0e-6, 5.0e-6, 5.0e-6]
     density_dust_grains = [2.25, 2.25, 2.25]
@@ -356,9 +379,13 @@ if __name__ == "__main__":
                    "UVLF_plot_z" :           UVLF_plot_z,
                    "first_file" :            first_file,
                    "last_file" :             last_file,
+                   "batch_bytes" :           batch_bytes,
+                   "prefetch_depth" :        prefetch_depth,
+                   "prefetch_bytes" :        prefetch_bytes,
                    "dust_to_gas_ratio" :     dust_to_gas_ratio,
                    "radius_dust_grains" :    radius_dust_grains,
-                   "density_dust_grains" :   density_dust_grains
+                   "density_dust_grains" :   density_dust_grains,
+                   "checkpoint_dir" :        checkpoint_dir
                    }
 
     combined_galaxy = {**galaxy_plots, **galaxy_opts}
@@ -368,7 +395,8 @@ if __name__ == "__main__":
         if galaxy_plots[field] == 1:
             galdata.plot_galaxy_properties(rank, size, comm, gal_ini_files,
                                            model_tags, combined_galaxy,
-                                           output_directory, output_format)
+                                           output_directory, output_format,
+                                           backend=backend)
             break
 
 
@@ -453,6 +481,29 @@ if __name__ == "__main__":
     cut_slice = 40
     cut_thickness = 1
 
+    # For quick drafts, the slices and per-snapshot power spectra can use
+    # reduced resolution copies of the grids with ``GridSize / 2^grid_level``
+    # cells along a side.  These must first be built with ``GridPyramid.py``.
+    # The neutral fractions are always calculated at full resolution.
+    grid_level = 0
+
+    # The power spectra can be calculated in single precision, roughly halving
+    # the memory needed for large grids.  Use ``ReionData.compare_ps_precision``
+    # (or ``ps_precision.py``) to check the difference for your grids.
+    ps_single_precision = 0
+
+    # The power spectra at fixed neutral fraction and the zreion-density cross
+    # correlation can be calculated by every MPI task together, each reading a
+    # slab of the grids (see ``DistributedFFT.py``).  This spreads the memory
+    # of a single grid across the tasks.  ``GridSize`` must be divisible by
+    # the number of tasks.
+    distributed_fft = 0
+
+    # The zreion-density plots read the reionization redshift grid written by
+    # ``RSAGE``.  If it doesn't exist, it can instead be built from the
+    # ionization grids (see ``ReionRedshift.py``).
+    build_zreion = 0
+
     # Finally, if we want to sweep a parameter space worth of models and
     # construct contours of constant tau and duration. To grab all the .ini
     # files from a directory with specified alpha values, specify a directory
@@ -507,7 +558,32 @@ if __name__ == "__main__":
                    "small_scale_err" :      small_scale_err,
                    "large_scale_err" :      large_scale_err,
                    "cut_slice" :            cut_slice,
-                   "cut_thickness" :        cut_thickness}
+                   "cut_thickness" :        cut_thickness,
+                   "grid_level" :           grid_level,
+                   "ps_single_precision" :  ps_single_precision,
+                   "distributed_fft" :      distributed_fft,
+                   "build_zreion" :         build_zreion,
+                   "prefetch_depth" :       prefetch_depth,
+                   "prefetch_bytes" :       prefetch_bytes,
+                   "checkpoint_dir" :       checkpoint_dir}
+
+    # The contours only need the neutral fraction history of each model, so
+    # they're made from the summary store (see ``ScanSummary.py``) rather than
+    # reading every grid of every model. The summaries are kept in the
+    # checkpoint directory, or the output directory if we're not
+    # checkpointing.
+    if reion_plots["contours"]:
+        if checkpoint_dir is not None:
+            summary_dir = checkpoint_dir
+        else:
+            summary_dir = output_directory
+
+        scan.plot_scan_contours(rank, size, comm, gal_ini_files,
+                                reion_ini_files, alpha_beta_limits,
+                                duration_definition, summary_dir,
+                                output_directory, output_format,
+                                backend=backend)
+        reion_plots["contours"] = 0
 
     reion_combined = {**reion_plots, **reion_opts}
 
@@ -517,5 +593,5 @@ if __name__ == "__main__":
             reiondata.plot_reion_properties(rank, size, comm, reion_ini_files,
                                             gal_ini_files, model_tags,
                                             reion_combined, output_directory,
-                                            output_format)
+                                            output_format, backend=backend)
             break
@@ -8,15 +8,16 @@ import matplotlib
 matplotlib.use('Agg')
 import pylab as plt
 
-from mpi4py import MPI
-
 import PlotScripts
 import ReadScripts
 import AllVars
+import ParallelBackend as pb
+from ParallelBackend import MPI
 
-comm= MPI.COMM_WORLD
-rank = comm.Get_rank()
-size = comm.Get_size()
+backend = pb.get_backend()
+comm = backend.comm
+rank = backend.rank
+size = backend.size
 
 output_format = ".png"
 matplotlib.rcdefaults()
@@ -17,10 +17,19 @@ import PlotScripts
 import ReadScripts
 import AllVars
 import misc_func as misc 
+import PowerSpecStore as pspecstore
 
 label_size = 20
 output_format = ".png"
 
+# The wavenumber bins of the small and large scales that are plotted.  For the
+# Kali 256^3 grids these are k ~ 1.0 h/Mpc and k ~ 0.2 h/Mpc.
+small_scale_bin = 25
+large_scale_bin = 4
+
+# Only the first ``num_plot_models`` models are plotted.
+num_plot_models = 5
+
 def T_naught(z, h, OM, OB):
     """
     Calculates the 21cm brightness temperature for specified cosmology +
@@ -385,31 +394,51 @@ def plot_power(XHII_fraction, P_smallscale, P_largescale, model_tags,
     plt.close()
 
 
-def load_and_plot(save_tag, target_XHII_fraction, OutputDir):
+def load_and_plot(save_tag, target_XHII_fraction, OutputDir,
+                  small_scale_bin=small_scale_bin,
+                  large_scale_bin=large_scale_bin,
+                  num_models=num_plot_models):
+    """
+    Plots the small and large scale power of the models saved by
+    ``__main__``.
+
+    Parameters
+    ----------
+
+    save_tag : String
+        Tag the store of spectra was saved with.
+
+    target_XHII_fraction : List of floats
+        Neutral fractions marked on the plots against redshift.
+
+    OutputDir : String
+        Directory the store was saved in and the plots are saved to.
 
-    fnames = ["XHII_fraction", "P21_smallscale", "P21_largescale",
-              "PHII_smallscale", "PHII_largescale", "model_tags"]
+    small_scale_bin, large_scale_bin : Integers, optional
+        Index of the wavenumber bin of the small and large scale.
 
-    for count, tag in enumerate(fnames):
-        fname = "./{0}/{1}_{2}.npz".format(OutputDir, save_tag, tag) 
+    num_models : Integer, optional
+        Only the first ``num_models`` models are plotted.
+    """
 
-        if count == 0:
-            XHII_fraction = np.array(np.load(fname)["arr_0"][0:5])
+    # The spectra of every model are saved in a single store.
+    fname = "./{0}/{1}_pspec.npz".format(OutputDir, save_tag)
+    store = pspecstore.load_pspec_store(fname)
 
-        elif count == 1:
-            P21_smallscale = np.load(fname)["arr_0"][0:5]
+    num_snaps = store["num_snaps"][0:num_models]
+    model_tags = store["model_tags"][0:num_models]
 
-        elif count == 2:
-            P21_largescale = np.load(fname)["arr_0"][0:5]
+    def split_models(values):
+        return [values[model_number, :num_snaps[model_number]]
+                for model_number in range(len(num_snaps))]
 
-        elif count == 3:
-            PHII_smallscale = np.load(fname)["arr_0"][0:5]
+    XHII_fraction = split_models(store["XHI"])
 
-        elif count == 4:
-            PHII_largescale = np.load(fname)["arr_0"][0:5]
+    P21_smallscale = split_models(store["P21"][..., small_scale_bin])
+    P21_largescale = split_models(store["P21"][..., large_scale_bin])
 
-        elif count == 5:
-            model_tags = np.load(fname)["arr_0"][0:5]
+    PHII_smallscale = split_models(store["PHII"][..., small_scale_bin])
+    PHII_largescale = split_models(store["PHII"][..., large_scale_bin])
 
     plot_power(XHII_fraction, P21_smallscale, P21_largescale, model_tags, 
                OutputDir, 0, 0)
@@ -519,11 +548,11 @@ if __name__ == '__main__':
 
     ##
     have_data = 0
-    P21_smallscale = [[] for x in range(len(SnapList))]
-    P21_largescale = [[] for x in range(len(SnapList))]
-
-    PHII_smallscale = [[] for x in range(len(SnapList))]
-    PHII_largescale = [[] for x in range(len(SnapList))]
+    k_allmodels = [[] for x in range(len(SnapList))]
+    P21_allmodels = [[] for x in range(len(SnapList))]
+    P21_err_allmodels = [[] for x in range(len(SnapList))]
+    PHII_allmodels = [[] for x in range(len(SnapList))]
+    PHII_err_allmodels = [[] for x in range(len(SnapList))]
     ##
 
     if have_data == 1:
@@ -557,22 +586,30 @@ if __name__ == '__main__':
                 tmp_k, tmp_PowSpec, tmp_Error, \
                 tmp_k_XHII, tmp_Pspec_XHII, tmp_Error_XHII = calculate_power_spectrum(XHII, density) 
 
-                tmp_PowSpec *= tmp_k**3 * T0*T0 * 2.0 *np.pi 
-                tmp_Pspec_XHII *= tmp_k_XHII**3 * 2.0 *np.pi 
-
-                P21_largescale[model_number].append(tmp_PowSpec[4])
-                P21_smallscale[model_number].append(tmp_PowSpec[25])
-
-                PHII_largescale[model_number].append(tmp_Pspec_XHII[4])
-                PHII_smallscale[model_number].append(tmp_Pspec_XHII[25])
-
-
-    fnames = ["XHII_fraction", "P21_smallscale", "P21_largescale",
-              "PHII_smallscale", "PHII_largescale", "model_tags"]
-    save_arrs = [XHII_fraction, P21_smallscale, P21_largescale,
-                 PHII_smallscale, PHII_largescale, model_tags]
-
-    for tag, arr in zip(fnames, save_arrs):
-        fname = "{0}/{1}_{2}".format(OutputDir, save_tag, tag) 
-        np.savez(fname, arr) 
-
+                factor_21 = tmp_k**3 * T0*T0 * 2.0 *np.pi 
+                factor_XHII = tmp_k_XHII**3 * 2.0 *np.pi 
+
+                # Keep the full spectra, the scales are picked when plotting.
+                k_allmodels[model_number].append(tmp_k)
+                P21_allmodels[model_number].append(tmp_PowSpec * factor_21)
+                P21_err_allmodels[model_number].append(tmp_Error * factor_21)
+                PHII_allmodels[model_number].append(tmp_Pspec_XHII * factor_XHII)
+                PHII_err_allmodels[model_number].append(tmp_Error_XHII * factor_XHII)
+
+    # Save the spectra of all models in a single store.
+    stores = []
+    for model_number in range(len(fname_ionized)):
+        redshifts = np.array(AllVars.SnapZ)[SnapList[model_number]]
+        stores.append(pspecstore.build_pspec_store(k_allmodels[model_number],
+                                                   P21_allmodels[model_number],
+                                                   PHII_allmodels[model_number],
+                                                   redshifts,
+                                                   XHII_fraction[model_number],
+                                                   P21_err_allmodels[model_number],
+                                                   PHII_err_allmodels[model_number]))
+
+    store = pspecstore.stack_pspec_stores(stores)
+    store["model_tags"] = np.array(model_tags)
+
+    fname = "{0}/{1}_pspec.npz".format(OutputDir, save_tag)
+    pspecstore.save_pspec_store(fname, store)
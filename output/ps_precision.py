@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Validation harness for the single precision power spectrum path
+(``ReionData.calc_ps(..., single_precision=True)``).
+
+Computes the 21cm and HII power spectra of a snapshot in both single and
+double precision and prints the relative difference in each k bin.
+
+Usage:
+
+.. code::
+
+    $ python ps_precision.py <XHII_path> <XHII_precision> <density_path> <density_precision> <GridSize> <BoxSize>
+
+where the precisions follow ``ReadScripts.read_binary_grid`` (1 for float, 2
+for double) and ``BoxSize`` is in Mpc/h.  Without any arguments, a random
+ionization and density field is used instead.
+"""
+
+from __future__ import print_function
+
+import sys
+import numpy as np
+
+import ReadScripts as rs
+import ReionData as rd
+
+
+def make_test_fields(GridSize, seed=0):
+    """
+    Creates a smooth, random ionization and overdensity field to test on.
+
+    Parameters
+    ----------
+
+    GridSize : Integer
+        Number of cells along one side of the grids.
+
+    seed : Integer, optional
+        Seed for the random number generator.
+
+    Returns
+    ---------
+
+    XHII, density : 3D ``np.ndarray`` of floats
+        Ionization field (between 0 and 1) and the overdensity (positive).
+    """
+
+    rng = np.random.RandomState(seed)
+
+    # Smooth some white noise so there's power on a range of scales.
+    noise = rng.normal(size=(GridSize, GridSize, GridSize))
+    k = np.fft.fftfreq(GridSize)
+    k2 = np.add.outer(np.add.outer(k**2, k**2), k**2)
+    field = np.real(np.fft.ifftn(np.fft.fftn(noise) * np.exp(-k2 * 200.0)))
+    field /= np.std(field)
+
+    density = np.exp(0.5 * field)
+    XHII = 1.0 / (1.0 + np.exp(-4.0 * field))
+
+    return XHII, density
+
+
+def print_comparison(XHII, density, boxsize):
+    """
+    Prints the single and double precision spectra and their relative
+    difference in each k bin.
+
+    Returns
+    ---------
+
+    max_diff : Float
+        The largest absolute relative difference across both spectra.
+    """
+
+    k, rel_21cm, rel_XHII = rd.compare_ps_precision(XHII, density, boxsize)
+
+    print("{0:>12s} {1:>16s} {2:>16s}".format("k [h/Mpc]", "rel diff 21cm",
+                                              "rel diff HII"))
+    for idx in range(len(k)):
+        print("{0:12.4e} {1:16.4e} {2:16.4e}".format(k[idx], rel_21cm[idx],
+                                                     rel_XHII[idx]))
+
+    max_diff = max(np.nanmax(np.abs(rel_21cm)), np.nanmax(np.abs(rel_XHII)))
+    print("Maximum relative difference is {0:.4e}".format(max_diff))
+
+    return max_diff
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) == 7:
+        GridSize = int(sys.argv[5])
+        boxsize = float(sys.argv[6])
+
+        XHII = rs.read_binary_grid(sys.argv[1], GridSize, int(sys.argv[2]))
+        density = rs.read_binary_grid(sys.argv[3], GridSize, int(sys.argv[4]))
+    elif len(sys.argv) == 1:
+        GridSize = 64
+        boxsize = 100.0
+        XHII, density = make_test_fields(GridSize)
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+    print_comparison(XHII, density, boxsize)
@@ -19,7 +19,7 @@ import argparse
 import sys
 import os
 import pytest
-from tqdm import tqdm
+import functools
 
 # Get the directory the testing happens in.
 # Used a global variable for convenience as quite a few functions will use this.
@@ -31,6 +31,7 @@ sys.path.append(scripts_dir)
 import AllVars
 import ReadScripts
 import PlotScripts
+import ParallelBackend as pb
 
 
 def parse_input_arguments():
@@ -55,14 +56,23 @@ def parse_input_arguments():
 
     parser = argparse.ArgumentParser()
 
-    parser.add_argument("-f", "--SAGE_file", dest="SAGE_fname", 
-                        help="Location of the SAGE file to check.  Required.")
+    parser.add_argument("-f", "--SAGE_file", dest="SAGE_fname", nargs="+",
+                        help="Location of the SAGE file(s) to check.  "
+                             "Multiple files are checked in parallel.  "
+                             "Required.")
 
     parser.add_argument("-s", "--simulation", dest="simulation", 
                         help="Name of the simulation we're checking. "
                              "Default:Kali.  Accepted: Kali, MiniMill.",
                         default="Kali")
 
+    parser.add_argument("-b", "--backend", dest="backend",
+                        help="Parallel backend the files are distributed "
+                             "with.  Default: Chosen by "
+                             "`ParallelBackend.get_backend()`.  Accepted: "
+                             "mpi, pool, serial.",
+                        default=None)
+
     args = parser.parse_args()
 
     if (args.SAGE_fname is None): 
@@ -72,23 +82,21 @@ def parse_input_arguments():
     return vars(args) 
 
 
-def check_sage_file(SAGE_fname, simulation="Kali"):
+def set_simulation_params(simulation):
     """
-    Goes through the specified SAGE file and does a number of checks.
+    Sets the parameters (e.g., the snapshot redshifts) of the simulation SAGE
+    used.
 
     Parameters
     ----------
 
-    SAGE_fname: String.  Required.
-        Name of the SAGE file to check.
-
-    simulation: String.  Default: Kali.
-        Name of the simulation SAGE used. 
+    simulation: String.  Required.
+        Name of the simulation.  Accepted: Kali, MiniMill.
 
     Returns
     ----------
 
-    None.  If a check fails, the program will exit.
+    None.
     """
 
     if simulation == "Kali":
@@ -100,6 +108,57 @@ def check_sage_file(SAGE_fname, simulation="Kali"):
               "`check_sage_file.")
         raise ValueError
 
+
+def find_file_violations(SAGE_fname, simulation="Kali"):
+    """
+    Reads the specified SAGE file and finds every FoF Halo that does not have
+    exactly one central.
+
+    Parameters
+    ----------
+
+    SAGE_fname: String.  Required.
+        Name of the SAGE file to check.
+
+    simulation: String.  Default: Kali.
+        Name of the simulation SAGE used. 
+
+    Returns
+    ----------
+
+    violations: Dictionary.
+        See `find_central_violations`.
+    """
+
+    set_simulation_params(simulation)
+
+    Gals, Gals_Desc = ReadScripts.ReadGals_SAGE(SAGE_fname, None, 
+                                                len(AllVars.SnapZ)) 
+
+    return find_central_violations(Gals, len(AllVars.SnapZ))
+
+
+def check_sage_file(SAGE_fname, simulation="Kali"):
+    """
+    Goes through the specified SAGE file and does a number of checks.
+
+    Parameters
+    ----------
+
+    SAGE_fname: String.  Required.
+        Name of the SAGE file to check.
+
+    simulation: String.  Default: Kali.
+        Name of the simulation SAGE used. 
+
+    Returns
+    ----------
+
+    None.  If a check fails, the program will exit.
+    """
+
+    set_simulation_params(simulation)
+
     Gals, Gals_Desc = ReadScripts.ReadGals_SAGE(SAGE_fname, None, 
                                                 len(AllVars.SnapZ)) 
 
@@ -108,6 +167,146 @@ def check_sage_file(SAGE_fname, simulation="Kali"):
     check_centrals(Gals, NTrees)
 
 
+def check_sage_files(SAGE_fnames, simulation="Kali", backend=None):
+    """
+    Checks a number of SAGE files in parallel.  Every violation in every file
+    is reported before failing.
+
+    Parameters
+    ----------
+
+    SAGE_fnames: List of strings.  Required.
+        Names of the SAGE files to check.
+
+    simulation: String.  Default: Kali.
+        Name of the simulation SAGE used. 
+
+    backend: `ParallelBackend` backend.  Default: None.
+        The backend the files are distributed with.  If not specified, one is
+        chosen by `ParallelBackend.get_backend()`.
+
+    Returns
+    ----------
+
+    None.  If a check fails, the program will exit.
+    """
+
+    if backend is None:
+        backend = pb.get_backend()
+
+    worker = functools.partial(find_file_violations, simulation=simulation)
+
+    num_violations = 0
+    for SAGE_fname, violations in backend.map(worker, list(SAGE_fnames)):
+        report_violations(violations, SAGE_fname)
+        num_violations += len(violations["TreeNr"])
+
+    num_violations = backend.allreduce(num_violations)
+    if num_violations > 0:
+        raise ValueError("There were {0} FoF Halos that did not have exactly 1 "
+                         "central.".format(num_violations))
+
+
+def find_central_violations(Gals, num_snaps):
+    """
+    Finds every FoF Halo (at every snapshot) that does not have exactly one
+    central.
+
+    The galaxies that exist at each snapshot are sorted once by (TreeNr,
+    snapshot, FoFHaloNr) and the number of centrals within each FoF Halo is
+    summed over the group boundaries.
+
+    Parameters
+    ----------
+
+    Gals: numpy structured array.  Required.
+        Galaxies that will be checked.
+        See `ReadGals_SAGE` in `output/ReadScripts.py` for full data type
+        description. 
+
+    num_snaps: Integer.  Required.
+        Number of snapshots tracked by each galaxy.
+
+    Returns
+    ----------
+
+    violations: Dictionary.
+        Keyed by "TreeNr", "snapshot", "FoFHaloNr" and "num_centrals".  Each
+        is an array with one entry per FoF Halo that does not have exactly
+        one central.
+    """
+
+    alive_gal, alive_snap = np.nonzero(Gals.GridHistory[:, :num_snaps] != -1)
+
+    treenr = np.asarray(Gals.TreeNr)[alive_gal]
+    fofnr = Gals.GridFoFHaloNr[alive_gal, alive_snap]
+    is_central = (Gals.GridType[alive_gal, alive_snap] == 0).astype(np.int64)
+
+    order = np.lexsort((fofnr, alive_snap, treenr))
+    treenr = treenr[order]
+    alive_snap = alive_snap[order]
+    fofnr = fofnr[order]
+    is_central = is_central[order]
+
+    violations = {"TreeNr" : np.empty(0, dtype=np.int64),
+                  "snapshot" : np.empty(0, dtype=np.int64),
+                  "FoFHaloNr" : np.empty(0, dtype=np.int64),
+                  "num_centrals" : np.empty(0, dtype=np.int64)}
+
+    if len(order) == 0:
+        return violations
+
+    # A new FoF Halo starts wherever any of the sort keys change.
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = (treenr[1:] != treenr[:-1]) | \
+                    (alive_snap[1:] != alive_snap[:-1]) | \
+                    (fofnr[1:] != fofnr[:-1])
+    group_start = np.nonzero(new_group)[0]
+
+    num_centrals = np.add.reduceat(is_central, group_start)
+    w_bad = np.nonzero(num_centrals != 1)[0]
+
+    violations["TreeNr"] = treenr[group_start[w_bad]].astype(np.int64)
+    violations["snapshot"] = alive_snap[group_start[w_bad]].astype(np.int64)
+    violations["FoFHaloNr"] = fofnr[group_start[w_bad]].astype(np.int64)
+    violations["num_centrals"] = num_centrals[w_bad]
+
+    return violations
+
+
+def report_violations(violations, SAGE_fname=None):
+    """
+    Prints every FoF Halo that does not have exactly one central.
+
+    Parameters
+    ----------
+
+    violations: Dictionary.  Required.
+        See `find_central_violations`.
+
+    SAGE_fname: String.  Default: None.
+        Name of the file the violations were found in.
+
+    Returns
+    ----------
+
+    None.
+    """
+
+    if SAGE_fname is not None and len(violations["TreeNr"]) > 0:
+        print("File {0} has {1} FoF Halos that did not have exactly 1 "
+              "central.".format(SAGE_fname, len(violations["TreeNr"])))
+
+    for treenr, snapshot, fof, num_centrals in zip(violations["TreeNr"],
+                                                  violations["snapshot"],
+                                                  violations["FoFHaloNr"],
+                                                  violations["num_centrals"]):
+        print("For Tree {0}, FoFHaloNr {1} (existing at snapshot "
+              "{2}) had {3} centrals.  There should only ever be " 
+              "1 central per FoF Halo.".format(treenr, fof, snapshot,
+                                               num_centrals))
+
+
 def check_centrals(Gals, NTrees):
     """
     Ensures that there is only one central for each FoF Halo. 
@@ -121,7 +320,8 @@ def check_centrals(Gals, NTrees):
         description. 
 
     NTrees: Integer.  Required.
-        Number of trees in the file. 
+        Number of trees in the file.  Every galaxy in ``Gals`` is checked, so
+        this is only kept for compatibility.
 
     Returns
     ----------
@@ -129,35 +329,14 @@ def check_centrals(Gals, NTrees):
     None.  If a check fails, the program will exit.
     """
 
-    for treenr in tqdm(range(NTrees)): 
-        w_gal = np.where(Gals.TreeNr == treenr)[0]
-
-        if len(w_gal) == 0:
-            continue
-   
-        for snapshot in range(len(AllVars.SnapZ)):            
-            w_alive = w_gal[np.where((Gals.GridHistory[w_gal, snapshot] != -1))[0]]
-                
-            FoFNr = Gals.GridFoFHaloNr[w_alive, snapshot]
-            unique_FoFNr = np.unique(FoFNr)
-            for fof in unique_FoFNr:
-                w_fof = w_alive[np.where(FoFNr == fof)[0]]
-                   
-                unique, unique_count = np.unique(Gals.GridType[w_fof,
-                                                 snapshot], return_counts = True)
-
-                if (unique_count[0] == 0 and unique_count[0] > 1):
-                    print("For Tree {0}, FoFHaloNr {1} (existing at snapshot "
-                          "{2}) had {3} centrals.  There should only ever be " 
-                          "1 central per FoF Halo.".format(treenr, fof,
-                                                           snapshot,
-                                                           unique_count[0]))
-                    print("FoFNr: {0}".format(Gals.GridFoFHaloNr[w_fof,
-                                              snapshot]))
-                    print("Type: {0}".format(Gals.GridType[w_fof, snapshot]))
-                    raise ValueError
+    violations = find_central_violations(Gals, len(AllVars.SnapZ))
+    report_violations(violations)
+
+    if len(violations["TreeNr"]) > 0:
+        raise ValueError
 
 if __name__ == "__main__":
 
     args = parse_input_arguments()
-    check_sage_file(args["SAGE_fname"], args["simulation"])
+    check_sage_files(args["SAGE_fname"], args["simulation"],
+                     pb.get_backend(args["backend"]))
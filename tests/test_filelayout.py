@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+Tests the file catalogue of ``FileLayout.py``.  The catalogue answers
+``exists()``, ``file_size()``, ``find()`` and ``listdir()`` from a single
+listing of each directory.  Files created, rewritten or deleted after the
+listing must be seen once the directory is dropped with ``forget()`` or
+listed again with ``refresh=True``.
+"""
+
+from __future__ import print_function
+import numpy as np
+import sys
+import os
+import shutil
+import tempfile
+
+# Get the directory the testing happens in.
+test_dir = os.path.dirname(os.path.realpath(__file__))
+
+scripts_dir = "{0}/../output/".format(test_dir)
+sys.path.append(scripts_dir)
+
+import FileLayout as layout
+
+
+def write_grid(path, num_cells):
+    np.arange(num_cells, dtype=np.float64).tofile(path)
+
+
+def make_catalogue(max_age=None):
+    """
+    Creates a catalogue and a directory holding the XHII grids of snapshots 27
+    and 28 (8 cells each).  The catalogue lists the directory before
+    returning.
+    """
+
+    directory = tempfile.mkdtemp()
+    fbase = "{0}/run_XHII".format(directory)
+
+    for snap in [27, 28]:
+        write_grid(layout.format_path("XHII", fbase, snap=snap), 8)
+
+    catalogue = layout.LayoutCatalogue(max_age=max_age)
+    assert catalogue.listdir(directory) == ["run_XHII_027", "run_XHII_028"]
+
+    return catalogue, directory, fbase
+
+
+def test_listing_is_kept():
+    """
+    Changes made after the listing are not seen until the directory is
+    listed again.
+    """
+
+    catalogue, directory, fbase = make_catalogue()
+
+    path_027 = layout.format_path("XHII", fbase, snap=27)
+    path_028 = layout.format_path("XHII", fbase, snap=28)
+    path_029 = layout.format_path("XHII", fbase, snap=29)
+
+    write_grid(path_029, 8)
+    write_grid(path_027, 16)
+    os.remove(path_028)
+
+    assert not catalogue.exists(path_029)
+    assert catalogue.exists(path_028)
+    assert catalogue.file_size(path_027) == 64
+    assert sorted(catalogue.find("XHII", fbase)) == [27, 28]
+
+    shutil.rmtree(directory)
+
+
+def check_changes(catalogue, directory, fbase, update):
+    """
+    Creates, rewrites and deletes files after the directory has been listed.
+    ``update(path)`` makes the catalogue see the change to ``path``.
+    """
+
+    path_027 = layout.format_path("XHII", fbase, snap=27)
+    path_029 = layout.format_path("XHII", fbase, snap=29)
+
+    assert catalogue.exists(path_027)
+    assert not catalogue.exists(path_029)
+    assert catalogue.file_size(path_027) == 64
+
+    # Created after the listing.
+    write_grid(path_029, 8)
+    update(path_029)
+    assert catalogue.exists(path_029)
+    assert catalogue.file_size(path_029) == 64
+    assert sorted(catalogue.find("XHII", fbase)) == [27, 28, 29]
+    assert "run_XHII_029" in catalogue.listdir(directory)
+
+    # Rewritten in place with a different size.
+    write_grid(path_027, 16)
+    update(path_027)
+    assert catalogue.file_size(path_027) == 128
+    assert catalogue.find("XHII", fbase)[27] == (path_027, 128)
+
+    # Deleted after the listing.
+    os.remove(path_029)
+    update(path_029)
+    assert not catalogue.exists(path_029)
+    assert sorted(catalogue.find("XHII", fbase)) == [27, 28]
+    assert "run_XHII_029" not in catalogue.listdir(directory)
+    try:
+        catalogue.file_size(path_029)
+    except IOError:
+        pass
+    else:
+        raise AssertionError("file_size() of a deleted file didn't raise.")
+
+    shutil.rmtree(directory)
+
+
+def test_forget():
+    """
+    Dropping the directory of a file, or every directory.
+    """
+
+    catalogue, directory, fbase = make_catalogue()
+    check_changes(catalogue, directory, fbase, catalogue.forget)
+
+    catalogue, directory, fbase = make_catalogue()
+    check_changes(catalogue, directory, fbase, lambda path: catalogue.forget())
+
+
+def test_refresh():
+    """
+    Listing the directory again with ``refresh=True``.
+    """
+
+    catalogue, directory, fbase = make_catalogue()
+    check_changes(catalogue, directory, fbase,
+                  lambda path: catalogue.listdir(directory, refresh=True))
+
+    catalogue, directory, fbase = make_catalogue()
+    check_changes(catalogue, directory, fbase,
+                  lambda path: catalogue.find("XHII", fbase, refresh=True))
+
+
+def test_max_age():
+    """
+    Listings older than ``max_age`` are listed again.
+    """
+
+    catalogue, directory, fbase = make_catalogue(max_age=0.0)
+    check_changes(catalogue, directory, fbase, lambda path: None)
+
+
+def test_missing_directory():
+    """
+    A directory that is created after it was first queried.
+    """
+
+    catalogue = layout.LayoutCatalogue()
+    directory = "{0}/new".format(tempfile.mkdtemp())
+    path = "{0}/galaxies_0".format(directory)
+
+    assert not catalogue.exists(path)
+    assert catalogue.listdir(directory) == []
+
+    os.makedirs(directory)
+    write_grid(path, 2)
+
+    assert catalogue.exists(path)
+    assert catalogue.find("galaxies", "{0}/galaxies".format(directory)) == \
+           {0 : (path, 16)}
+
+    shutil.rmtree(os.path.dirname(directory))
+
+
+def test_find():
+    """
+    Kinds with a snapshot, file number or both.
+    """
+
+    directory = tempfile.mkdtemp()
+    catalogue = layout.LayoutCatalogue()
+
+    write_grid(layout.format_path("density", "{0}/dens".format(directory),
+                                  snap=5), 1)
+    write_grid(layout.tree_path(directory, 3, 0), 1)
+    write_grid("{0}/dens005.dens.dat.bak".format(directory), 1)
+
+    assert catalogue.find("density", "{0}/dens".format(directory)) == \
+           {5 : ("{0}/dens005.dens.dat".format(directory), 8)}
+    assert sorted(catalogue.find("subgroup_trees", directory)) == [3]
+
+    layout.register_kind("test_both", "{fbase}_{snap:03d}_{filenr}.h5")
+    write_grid("{0}/out_012_3.h5".format(directory), 1)
+    assert sorted(catalogue.find("test_both", "{0}/out".format(directory),
+                                 refresh=True)) == [(12, 3)]
+    del layout.KINDS["test_both"]
+
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+
+    test_listing_is_kept()
+    test_forget()
+    test_refresh()
+    test_max_age()
+    test_missing_directory()
+    test_find()
+
+    print("Done")
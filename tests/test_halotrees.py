@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""
+Tests the tree index of ``HaloTrees.py``.  The pointer-jumped index of a
+synthetic file of trees is compared against walking the LHalo pointers halo
+by halo.
+"""
+
+from __future__ import print_function
+import numpy as np
+import sys
+import os
+
+# Get the directory the testing happens in.
+test_dir = os.path.dirname(os.path.realpath(__file__))
+
+scripts_dir = "{0}/../output/".format(test_dir)
+sys.path.append(scripts_dir)
+
+import HaloTrees as ht
+
+Halo_Desc = np.dtype([("Descendant", np.int32),
+                      ("FirstProgenitor", np.int32),
+                      ("NextProgenitor", np.int32),
+                      ("FirstHaloInFOFgroup", np.int32),
+                      ("NextHaloInFOFgroup", np.int32),
+                      ("Mvir", np.float32),
+                      ("SnapNum", np.int32)])
+
+
+def make_tree(rng, num_snaps):
+    """
+    Builds a single tree with tree-local pointers.  Each halo has up to three
+    progenitors at the previous snapshot and the halos of each snapshot are
+    split into FoF groups.  The halos are stored in a random order so the
+    pointers jump backwards and forwards through the tree.
+    """
+
+    # Built from the last snapshot back.  Each halo is (snap, descendant).
+    halos = [(num_snaps - 1, -1) for root in range(rng.integers(1, 4))]
+    current = list(range(len(halos)))
+    for snap in range(num_snaps - 2, -1, -1):
+        previous = []
+        for desc in current:
+            for prog in range(rng.integers(0, 4)):
+                previous.append(len(halos))
+                halos.append((snap, desc))
+        current = previous
+
+    num_halos = len(halos)
+    order = rng.permutation(num_halos)
+    new_idx = np.empty(num_halos, dtype=np.int64)
+    new_idx[order] = np.arange(num_halos)
+
+    tree = np.zeros(num_halos, dtype=Halo_Desc)
+    for field in ["Descendant", "FirstProgenitor", "NextProgenitor",
+                  "NextHaloInFOFgroup"]:
+        tree[field] = -1
+    tree["Mvir"] = rng.random(num_halos)
+
+    progenitors = [[] for halo in range(num_halos)]
+    for halo, (snap, desc) in enumerate(halos):
+        tree["SnapNum"][new_idx[halo]] = snap
+        if desc >= 0:
+            tree["Descendant"][new_idx[halo]] = new_idx[desc]
+            progenitors[desc].append(new_idx[halo])
+
+    for halo in range(num_halos):
+        progs = progenitors[halo]
+        if len(progs) > 0:
+            tree["FirstProgenitor"][new_idx[halo]] = progs[0]
+            for this_prog, next_prog in zip(progs[:-1], progs[1:]):
+                tree["NextProgenitor"][this_prog] = next_prog
+
+    for snap in range(num_snaps):
+        members = rng.permutation(np.nonzero(tree["SnapNum"] == snap)[0])
+        splits = np.sort(rng.choice(np.arange(1, max(len(members), 1)),
+                                    size=min(2, max(len(members) - 1, 0)),
+                                    replace=False))
+        for group in np.split(members, splits):
+            tree["FirstHaloInFOFgroup"][group] = group[0]
+            tree["NextHaloInFOFgroup"][group[:-1]] = group[1:]
+
+    return tree
+
+
+def make_file(seed=7, num_trees=6, num_snaps=6):
+    """
+    Builds a file of trees.
+    """
+
+    rng = np.random.default_rng(seed)
+    trees = [make_tree(rng, num_snaps) for tree in range(num_trees)]
+
+    Halos = np.concatenate(trees)
+    HalosPerTree = np.array([len(tree) for tree in trees], dtype=np.int32)
+
+    return Halos, HalosPerTree
+
+
+def walk(start, next_ptr):
+    """
+    Follows a tree-local pointer chain halo by halo.
+    """
+
+    chain = []
+    halo = start
+    while halo >= 0:
+        chain.append(halo)
+        halo = next_ptr[halo]
+
+    return chain
+
+
+def brute_force(Halos, HalosPerTree):
+    """
+    The progenitors, FoF groups and main branches of each halo (as indices
+    within the file), found by walking the pointers of each tree.
+    """
+
+    progenitors = []
+    fof_groups = {}
+    main_branches = {}
+
+    offset = 0
+    for num_halos in HalosPerTree:
+        tree = Halos[offset:offset + num_halos]
+
+        for halo in range(num_halos):
+            progs = walk(tree["FirstProgenitor"][halo], tree["NextProgenitor"])
+            progenitors.append([offset + prog for prog in progs])
+
+            head = tree["FirstHaloInFOFgroup"][halo]
+            members = walk(head, tree["NextHaloInFOFgroup"])
+            fof_groups[offset + head] = [offset + member for member in members]
+
+            if tree["Descendant"][halo] < 0:
+                branch = walk(halo, tree["FirstProgenitor"])
+                main_branches[offset + halo] = [offset + member
+                                                for member in branch]
+
+        offset += num_halos
+
+    return progenitors, fof_groups, main_branches
+
+
+def test_tree_index():
+    """
+    Compares the index against the brute-force pointer walk.
+    """
+
+    Halos, HalosPerTree = make_file()
+    index = ht.build_tree_index(Halos, HalosPerTree)
+
+    progenitors, fof_groups, branches = brute_force(Halos, HalosPerTree)
+
+    offsets = index["progenitor_offsets"]
+    for halo in range(len(Halos)):
+        assert list(index["progenitors"][offsets[halo]:offsets[halo+1]]) == \
+               progenitors[halo]
+    assert list(ht.progenitor_counts(index)) == \
+           [len(progs) for progs in progenitors]
+
+    assert sorted(index["fof_heads"]) == sorted(fof_groups)
+    offsets = index["fof_offsets"]
+    for group, head in enumerate(index["fof_heads"]):
+        members = list(index["fof_members"][offsets[group]:offsets[group+1]])
+        assert members == fof_groups[head]
+        assert np.all(index["fof_group"][members] == group)
+
+    sums = ht.fof_aggregate(index, Halos["Mvir"], "sum")
+    maxes = ht.fof_aggregate(index, Halos["Mvir"], "max")
+    counts = ht.fof_aggregate(index, Halos["Mvir"], "count")
+    for group, head in enumerate(index["fof_heads"]):
+        members = fof_groups[head]
+        assert np.isclose(sums[group], np.sum(Halos["Mvir"][members]))
+        assert maxes[group] == np.max(Halos["Mvir"][members])
+        assert counts[group] == len(members)
+
+    roots = ht.find_roots(index)
+    assert sorted(roots) == sorted(branches)
+    for root, branch in zip(roots, ht.main_branches(index, roots)):
+        assert list(branch[branch >= 0]) == branches[root]
+
+    snapnum, mass = ht.mass_accretion_histories(Halos, index, roots)
+    for root, root_snaps, root_mass in zip(roots, snapnum, mass):
+        branch = branches[root]
+        assert list(root_snaps[:len(branch)]) == \
+               list(Halos["SnapNum"][branch])
+        assert np.all(root_mass[:len(branch)] == Halos["Mvir"][branch])
+        assert np.all(np.isnan(root_mass[len(branch):]))
+
+
+def test_wrong_halo_count():
+    """
+    The number of halos in the trees must match the halos passed.
+    """
+
+    Halos, HalosPerTree = make_file()
+
+    try:
+        ht.build_tree_index(Halos[:-1], HalosPerTree)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("build_tree_index() didn't raise.")
+
+
+if __name__ == "__main__":
+
+    test_tree_index()
+    test_wrong_halo_count()
+
+    print("Done")
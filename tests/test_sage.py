@@ -43,6 +43,7 @@ sys.path.append(scripts_dir)
 
 import AllVars
 import ReadScripts
+import FileLayout as layout
 
 
 def get_trees():
@@ -353,21 +354,21 @@ def read_grids(SAGE_params, cifog_params, snapshot, reshape=False):
     # hardcoded to be in double.
 
     nion_prefix = get_nion_prefix(SAGE_params)
-    nion_path = "{0}/grids/nion/{1}_{2}_nionHI_{3:03d}".format(OutputDir, RunPrefix,
-                                                       nion_prefix, snapshot)
+    nion_fbase = "{0}/grids/nion/{1}_{2}_nionHI".format(OutputDir, RunPrefix,
+                                                        nion_prefix)
+    nion_path = layout.format_path("nion", nion_fbase, snap=snapshot)
     nion_precision = int(cifog_params["nionFilesAreInDoublePrecision"]) + 1
     nion_grid = ReadScripts.read_binary_grid(nion_path, GridSize,
                                              nion_precision, reshape=reshape)
 
-    XHII_path = "{0}/grids/cifog/{1}_XHII_{2:03d}".format(OutputDir, RunPrefix,
-                                                          snapshot)
+    XHII_fbase = "{0}/grids/cifog/{1}_XHII".format(OutputDir, RunPrefix)
+    XHII_path = layout.format_path("XHII", XHII_fbase, snap=snapshot)
     XHII_precision = 2
     XHII_grid = ReadScripts.read_binary_grid(XHII_path, GridSize,
                                              XHII_precision, reshape=reshape)
 
-    photHI_path = "{0}/grids/cifog/{1}_photHI_{2:03d}".format(OutputDir,
-                                                              RunPrefix,
-                                                              snapshot)
+    photHI_fbase = "{0}/grids/cifog/{1}_photHI".format(OutputDir, RunPrefix)
+    photHI_path = layout.format_path("photHI", photHI_fbase, snap=snapshot)
 
     photHI_precision = 2
     photHI_grid = ReadScripts.read_binary_grid(photHI_path, GridSize,
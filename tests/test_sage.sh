@@ -1,6 +1,20 @@
 currdir=`pwd`
 cd tests/
 
+python3 test_filelayout.py
+exit_code=$?
+if [ $exit_code -ne 0 ]; then
+  echo "test_filelayout.py exited with errorcode $exit_code"
+  exit $exit_code
+fi
+
+python3 test_halotrees.py
+exit_code=$?
+if [ $exit_code -ne 0 ]; then
+  echo "test_halotrees.py exited with errorcode $exit_code"
+  exit $exit_code
+fi
+
 python3 test_sage.py
 exit_code=$?
 if [ $exit_code -ne 0 ]; then
@@ -6,6 +6,11 @@ to create a unique combination of variables to update for each run.
 The script also gives the option of making ``slurm`` files with the paths
 correctly specified and also submit them (**BE CAREFUL WHEN SUBMITTING**).
 
+For large sweeps, ``make_sweep()`` takes a Cartesian (or list) specification
+of the varied fields, renders every ``.ini`` and ``.slurm`` file in memory and
+writes a manifest of the runs that ``MiscData.get_ini_from_manifest()`` reads
+instead of listing directories.
+
 All ``.ini`` and ``.slurm`` files are created using template files.  Examples
 files are included in the base repo.
 
@@ -19,7 +24,8 @@ from __future__ import print_function
 import numpy as np
 import sys
 import os
-from shutil import copyfile
+import json
+import itertools
 import subprocess
 
 # Get the directory the script is in.
@@ -30,6 +36,7 @@ sys.path.append(output_path)
 
 import ReadScripts
 import AllVars
+import RunParams as runparams
 
 
 def check_input_parameters(SAGE_fields_update, cifog_fields_update,
@@ -151,18 +158,18 @@ def create_directories(run_directory):
             print("Created directory {0}".format(dir_))
 
    
-def update_ini_files(base_SAGE_ini, base_cifog_ini,
-                     SAGE_fields_update, cifog_fields_update,
-                     run_directory):
+def apply_run_params(SAGE_params, cifog_params, SAGE_fields_update,
+                     cifog_fields_update, run_directory):
     """
-    Using template ini files for ``SAGE`` and ``cifog``, creates new ones with 
-    the directory paths and field names updated. 
+    Updates the template parameters for a single run.  The paths that
+    ``RSAGE`` determines itself are set to ``None``.
 
     Parameters
     ----------
 
-    base_SAGE_ini, base_cifog_ini : Strings
-        Paths to the template SAGE and cifog ini files.
+    SAGE_params, cifog_params : Dictionaries
+        The template parameters, see ``ReadScripts.read_SAGE_ini()`` and
+        ``ReadScripts.read_cifog_ini()``.  These are not modified.
 
     SAGE_fields_update, cifog_fields_update : Dictionaries
         Fields that will be updated and their new value.
@@ -173,12 +180,12 @@ def update_ini_files(base_SAGE_ini, base_cifog_ini,
     Returns
     ----------
 
-    SAGE_fname, cifog_fname : Strings
-        Names of the newly created ``SAGE`` and ``cifog`` ini files.
+    SAGE_params, cifog_params : Dictionaries
+        The parameters of the run.
     """
 
-    SAGE_params = ReadScripts.read_SAGE_ini(base_SAGE_ini)
-    cifog_params, cifog_headers = ReadScripts.read_cifog_ini(base_cifog_ini)
+    SAGE_params = dict(SAGE_params)
+    cifog_params = dict(cifog_params)
 
     # This is the outermost directory. 
     SAGE_params["OutputDir"] = "{0}".format(run_directory)
@@ -204,30 +211,187 @@ def update_ini_files(base_SAGE_ini, base_cifog_ini,
     for name in cifog_fields_update:
         cifog_params[name] = cifog_fields_update[name] 
 
+    return SAGE_params, cifog_params
+
+
+def ini_paths(run_directory, run_name):
+    """
+    Returns the paths of the ``SAGE`` and ``cifog`` ``.ini`` files of a run.
+    """
+
+    SAGE_fname = "{0}/ini_files/{1}_SAGE.ini".format(run_directory, run_name)
+    cifog_fname = "{0}/ini_files/{1}_cifog.ini".format(run_directory, run_name)
+
+    return SAGE_fname, cifog_fname
+
+
+def render_SAGE_ini(SAGE_params):
+    """
+    Returns the contents of a ``SAGE`` ``.ini`` file.
+    """
+
+    lines = ["{0} {1}\n".format(name, SAGE_params[name])
+             for name in SAGE_params.keys()]
+
+    return "".join(lines)
+
+
+def render_cifog_ini(cifog_params, cifog_headers):
+    """
+    Returns the contents of a ``cifog`` ``.ini`` file.  Each header is written
+    before the field that follows it.
+    """
+
+    lines = []
+    for name in cifog_params.keys():
+
+        if name in cifog_headers.keys():
+            lines.append("{0}\n".format(cifog_headers[name]))
+
+        lines.append("{0} = {1}\n".format(name, cifog_params[name]))
+
+    return "".join(lines)
+
+
+def read_slurm_template(base_slurm_file):
+    """
+    Reads the template ``.slurm`` file into a list of lines.
+    """
+
+    with open(base_slurm_file, "r") as f:
+        return f.read().splitlines()
+
+
+def render_slurm(slurm_template, run_name, Nproc, SAGE_ini, cifog_ini,
+                 run_directory):
+    """
+    Returns the contents of the ``.slurm`` file of a run.
+
+    Parameters
+    ----------
+
+    slurm_template : List of strings
+        The lines of the template ``.slurm`` file, see
+        ``read_slurm_template()``.
+
+    run_name : String
+        The unique name of the run (``FileNameGalaxies``).
+
+    Nproc : Integer
+        Number of processors the run will be executed with.
+
+    SAGE_ini, cifog_ini : Strings
+        Paths to the ``.ini`` files of the run.
+
+    run_directory : String
+        Path to the base ``RSAGE`` directory of the run.
+
+    Returns
+    ----------
+
+    slurm_contents : String
+        The ``.slurm`` file.
+    """
+
+    # Want to replace lines in the slurm file. Set up the strings. 
+    job_name = "#SBATCH --job-name={0}".format(run_name) 
+    ntask = "#SBATCH --ntasks={0}".format(Nproc)
+    NUMPROC = "NUMPROC={0}".format(Nproc)
+    SAGE_ini = 'SAGE_ini="{0}"'.format(SAGE_ini)
+    cifog_ini = 'cifog_ini="{0}"'.format(cifog_ini)
+    run_prefix = 'run_prefix="{0}"'.format(run_name) 
+    path_to_log = 'path_to_log="{0}/log_files/{1}.log"'.format(run_directory, run_name)
+
+    # Replace strings at specific line numbers (counting from 1).
+    line_numbers = [2, 4, 17, 19, 20, 24, 25]  
+    string_names = [job_name, ntask, NUMPROC, SAGE_ini, cifog_ini, 
+                    run_prefix, path_to_log]
+
+    if len(slurm_template) < max(line_numbers):
+        raise ValueError("The template slurm file only has {0} lines but line "
+                         "{1} must be replaced.".format(len(slurm_template),
+                                                        max(line_numbers)))
+
+    lines = list(slurm_template)
+    for line, name in zip(line_numbers, string_names):
+        lines[line - 1] = name
+
+    return "\n".join(lines) + "\n"
+
+
+def update_ini_files(base_SAGE_ini, base_cifog_ini,
+                     SAGE_fields_update, cifog_fields_update,
+                     run_directory):
+    """
+    Using template ini files for ``SAGE`` and ``cifog``, creates new ones with 
+    the directory paths and field names updated. 
+
+    Parameters
+    ----------
+
+    base_SAGE_ini, base_cifog_ini : Strings
+        Paths to the template SAGE and cifog ini files.
+
+    SAGE_fields_update, cifog_fields_update : Dictionaries
+        Fields that will be updated and their new value.
+
+    run_directory : String
+        Path to the base ``RSAGE`` directory.
+
+    Returns
+    ----------
+
+    SAGE_fname, cifog_fname : Strings
+        Names of the newly created ``SAGE`` and ``cifog`` ini files.
+    """
+
+    SAGE_params = ReadScripts.read_SAGE_ini(base_SAGE_ini)
+    cifog_params, cifog_headers = ReadScripts.read_cifog_ini(base_cifog_ini)
+
+    SAGE_params, cifog_params = apply_run_params(SAGE_params, cifog_params,
+                                                 SAGE_fields_update,
+                                                 cifog_fields_update,
+                                                 run_directory)
+
+    return write_run_ini(SAGE_params, cifog_params, cifog_headers,
+                         run_directory)
+
+
+def write_run_ini(SAGE_params, cifog_params, cifog_headers, run_directory):
+    """
+    Writes the ``SAGE`` and ``cifog`` ``.ini`` files of a run.
+
+    Parameters
+    ----------
+
+    SAGE_params, cifog_params : Dictionaries
+        The parameters of the run, see ``apply_run_params()``.
+
+    cifog_headers : Dictionary
+        The headers of the ``cifog`` ``.ini`` file, see
+        ``ReadScripts.read_cifog_ini()``.
+
+    run_directory : String
+        Path to the base ``RSAGE`` directory.
+
+    Returns
+    ----------
+
+    SAGE_fname, cifog_fname : Strings
+        Names of the newly created ``SAGE`` and ``cifog`` ini files.
+    """
+
     # The unique identifier amongst each run will be `FileNameGalaxies`. 
     prefix_tag = SAGE_params["FileNameGalaxies"]
 
     # Write out the new ini files, using `FileNameGalaxies` as the tag.
-    SAGE_fname = "{0}/ini_files/{1}_SAGE.ini".format(run_directory,
-                                                     prefix_tag) 
-
-    cifog_fname = "{0}/ini_files/{1}_cifog.ini".format(run_directory,
-                                                       prefix_tag) 
+    SAGE_fname, cifog_fname = ini_paths(run_directory, prefix_tag)
 
     with open (SAGE_fname, "w+") as f:
-        for name in SAGE_params.keys():
-            string = "{0} {1}\n".format(name, SAGE_params[name])
-            f.write(string)
+        f.write(render_SAGE_ini(SAGE_params))
 
     with open (cifog_fname, "w+") as f:
-        for name in cifog_params.keys():
-
-            if name in cifog_headers.keys():
-                string = "{0}\n".format(cifog_headers[name])
-                f.write(string)
-
-            string = "{0} = {1}\n".format(name, cifog_params[name])
-            f.write(string)
+        f.write(render_cifog_ini(cifog_params, cifog_headers))
 
     return SAGE_fname, cifog_fname
 
@@ -264,6 +428,10 @@ def make_ini_files(base_SAGE_ini, base_cifog_ini,
     SAGE_ini_names = []
     cifog_ini_names = []
 
+    # The templates are only read once.
+    SAGE_base = ReadScripts.read_SAGE_ini(base_SAGE_ini)
+    cifog_base, cifog_headers = ReadScripts.read_cifog_ini(base_cifog_ini)
+
     # Now for each run, create a unique dictionary containing the fields for 
     # this run, update the ini files then create all the output directories. 
     for run_number in range(len(run_directories)):
@@ -278,9 +446,14 @@ def make_ini_files(base_SAGE_ini, base_cifog_ini,
         for name in cifog_fields_update.keys():
             thisrun_cifog_update[name] = cifog_fields_update[name][run_number]
 
-        SAGE_fname, cifog_fname = update_ini_files(base_SAGE_ini, base_cifog_ini,
-                                                   thisrun_SAGE_update, thisrun_cifog_update,
-                                                   run_directories[run_number])        
+        SAGE_params, cifog_params = apply_run_params(SAGE_base, cifog_base,
+                                                     thisrun_SAGE_update,
+                                                     thisrun_cifog_update,
+                                                     run_directories[run_number])
+
+        SAGE_fname, cifog_fname = write_run_ini(SAGE_params, cifog_params,
+                                                cifog_headers,
+                                                run_directories[run_number])
 
         SAGE_ini_names.append(SAGE_fname)
         cifog_ini_names.append(cifog_fname)
@@ -319,39 +492,21 @@ def make_slurm_files(base_slurm_file, SAGE_ini_names, cifog_ini_names,
     """
     slurm_names = []
 
+    slurm_template = read_slurm_template(base_slurm_file)
+
     for run_number in range(len(SAGE_ini_names)):
         
-        SAGE_params = ReadScripts.read_SAGE_ini(SAGE_ini_names[run_number])
-        run_name = SAGE_params["FileNameGalaxies"]
+        SAGE_params = runparams.load_SAGE_params(SAGE_ini_names[run_number])
+        run_name = SAGE_params.FileNameGalaxies
 
         slurm_fname = "{0}/slurm_files/{1}.slurm".format(run_directories[run_number],
                                                          run_name) 
 
-        tmp_slurm_fname = "{0}.tmp".format(base_slurm_file)
-        copyfile(base_slurm_file, tmp_slurm_fname)
-
-        # Want to replace lines in the slurm file. Set up the strings. 
-        job_name = "#SBATCH --job-name={0}".format(run_name) 
-        ntask = "#SBATCH --ntasks={0}".format(Nproc)
-        NUMPROC = "NUMPROC={0}".format(Nproc)
-        SAGE_ini = 'SAGE_ini="{0}"'.format(SAGE_ini_names[run_number])
-        cifog_ini = 'cifog_ini="{0}"'.format(cifog_ini_names[run_number])
-        run_prefix = 'run_prefix="{0}"'.format(run_name) 
-        path_to_log = 'path_to_log="{0}/log_files/{1}.log"'.format(run_directories[run_number], run_name)
-
-        # Replace strings at specific line numbers.
-        line_numbers = [2, 4, 17, 19, 20, 24, 25]  
-        string_names = [job_name, ntask, NUMPROC, SAGE_ini, cifog_ini, 
-                        run_prefix, path_to_log]
-        for line, name in zip(line_numbers, string_names):
-            # Use @ as the delimiter here for sed. 
-            command = "sed -i '{0}s@.*@{1}@' {2} ".format(line, name,
-                                                          tmp_slurm_fname)
-            subprocess.call(command, shell=True)
-
-        # Finally move the temporary file to the final location.
-        command = "mv {0} {1}".format(tmp_slurm_fname, slurm_fname)
-        subprocess.call(command, shell=True)
+        with open(slurm_fname, "w") as f:
+            f.write(render_slurm(slurm_template, run_name, Nproc,
+                                 SAGE_ini_names[run_number],
+                                 cifog_ini_names[run_number],
+                                 run_directories[run_number]))
         print("Created {0}".format(slurm_fname))
 
         slurm_names.append(slurm_fname)
@@ -439,6 +594,253 @@ def create_and_submit(SAGE_fields_update, cifog_fields_update, run_directories,
         submit_slurm_jobs(slurm_names)
 
  
+def expand_sweep(SAGE_spec, cifog_spec, mode="cartesian"):
+    """
+    Expands a parameter specification into the updated fields of each run.
+
+    Parameters
+    ----------
+
+    SAGE_spec, cifog_spec : Dictionaries
+        The ``SAGE`` and ``cifog`` fields that are varied.  Values are the list
+        of values of each field (a single value is used for every run).
+
+    mode : String, optional
+        ``"cartesian"`` creates a run for every combination of the values.
+        ``"list"`` pairs the i-th value of every field, so every list must
+        have the same length.
+
+    Returns
+    ----------
+
+    runs : List of tuples
+        The ``(SAGE_fields_update, cifog_fields_update)`` of each run.
+
+    Errors 
+    ----------
+
+    ValueError:
+        Raised if ``mode`` is not ``"cartesian"`` or ``"list"``.
+
+        Raised if ``mode`` is ``"list"`` and the fields have different
+        lengths.
+    """
+
+    fields = [("SAGE", name, values) for name, values in SAGE_spec.items()] + \
+             [("cifog", name, values) for name, values in cifog_spec.items()]
+
+    values_allfields = []
+    for _, _, values in fields:
+        if isinstance(values, (list, tuple, np.ndarray)):
+            values_allfields.append(list(values))
+        else:
+            values_allfields.append([values])
+
+    if mode == "cartesian":
+        combinations = itertools.product(*values_allfields)
+    elif mode == "list":
+        lengths = set(len(values) for values in values_allfields
+                      if len(values) != 1)
+        if len(lengths) > 1:
+            raise ValueError("For a 'list' sweep every field must have the "
+                             "same number of values (or a single value). The "
+                             "lengths were {0}".format(sorted(lengths)))
+
+        num_runs = lengths.pop() if lengths else 1
+        combinations = zip(*[values*num_runs if len(values) == 1 else values
+                             for values in values_allfields])
+    else:
+        raise ValueError("The sweep mode must be 'cartesian' or 'list'. You "
+                         "specified {0}".format(mode))
+
+    runs = []
+    for combination in combinations:
+        SAGE_update = {}
+        cifog_update = {}
+        for (ini_type, name, _), value in zip(fields, combination):
+            if ini_type == "SAGE":
+                SAGE_update[name] = value
+            else:
+                cifog_update[name] = value
+
+        runs.append((SAGE_update, cifog_update))
+
+    return runs
+
+
+def _json_default(obj):
+    """
+    Converts ``numpy`` scalars for the manifest.
+    """
+
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
+def write_files(files):
+    """
+    Writes many files.
+
+    Parameters
+    ----------
+
+    files : List of tuples
+        The ``(path, contents)`` of each file.
+    """
+
+    for fname, contents in files:
+        with open(fname, "w") as f:
+            f.write(contents)
+
+
+def make_sweep(SAGE_spec, cifog_spec, run_directory, base_SAGE_ini,
+               base_cifog_ini, base_slurm_file, Nproc, mode="cartesian",
+               name_format="run{run_number:04d}", manifest_fname=None):
+    """
+    Creates the ``.ini`` and ``.slurm`` files for every run of a parameter
+    sweep and a manifest that lists them.
+
+    The templates are read once and every file is rendered in memory before
+    any is written.
+
+    Parameters
+    ----------
+
+    SAGE_spec, cifog_spec : Dictionaries
+        The fields that are varied, see ``expand_sweep()``.
+
+    run_directory : String
+        Path to the base ``RSAGE`` directory of the runs.  Formatted with the
+        fields of each run (and ``run_number`` and ``run_name``), e.g.,
+        ``"/path/to/{run_name}"`` gives every run its own directory.
+
+    base_SAGE_ini, base_cifog_ini : Strings
+        Paths to the template SAGE and cifog ``.ini`` files.
+
+    base_slurm_file : String
+        Path to the template ``.slurm`` file.
+
+    Nproc : Integer
+        Number of processors each run will be executed with.
+
+    mode : String, optional
+        ``"cartesian"`` or ``"list"``, see ``expand_sweep()``.
+
+    name_format : String, optional
+        Used to name runs that don't specify ``FileNameGalaxies``.  Formatted
+        with the fields of each run and ``run_number``, e.g.,
+        ``"fej_alpha{alpha:.2f}_beta{beta:.2f}"``.
+
+    manifest_fname : String, optional
+        Path to the manifest.  If not specified, ``sweep_manifest.json``
+        within the directory that is common to every run.
+
+    Returns
+    ----------
+
+    manifest : Dictionary
+        The templates and ``mode`` of the sweep and, in ``runs``, the run id
+        (``FileNameGalaxies``), updated fields and paths of each run.  See
+        ``MiscData.load_sweep_manifest()``.
+
+    Errors 
+    ----------
+
+    ValueError:
+        Raised in any of the template files do not exist.
+
+        Raised if two runs would write to the same files.
+    """
+
+    for my_file in [base_SAGE_ini, base_cifog_ini, base_slurm_file]: 
+        if not os.path.isfile(my_file):
+            print("File {0} does not exist.".format(my_file))
+            raise ValueError
+
+    # The templates are only read once.
+    SAGE_base = ReadScripts.read_SAGE_ini(base_SAGE_ini)
+    cifog_base, cifog_headers = ReadScripts.read_cifog_ini(base_cifog_ini)
+    slurm_template = read_slurm_template(base_slurm_file)
+
+    files = []
+    runs = []
+    for run_number, (SAGE_update, cifog_update) in \
+            enumerate(expand_sweep(SAGE_spec, cifog_spec, mode)):
+
+        fields = dict(SAGE_update)
+        fields.update(cifog_update)
+
+        if "FileNameGalaxies" not in SAGE_update:
+            SAGE_update["FileNameGalaxies"] = name_format.format(run_number=run_number,
+                                                                 **fields)
+        run_name = SAGE_update["FileNameGalaxies"]
+
+        this_run_directory = run_directory.format(run_number=run_number,
+                                                  run_name=run_name, **fields)
+
+        SAGE_params, cifog_params = apply_run_params(SAGE_base, cifog_base,
+                                                     SAGE_update, cifog_update,
+                                                     this_run_directory)
+
+        SAGE_fname, cifog_fname = ini_paths(this_run_directory, run_name)
+        slurm_fname = "{0}/slurm_files/{1}.slurm".format(this_run_directory,
+                                                         run_name)
+
+        files.append((SAGE_fname, render_SAGE_ini(SAGE_params)))
+        files.append((cifog_fname, render_cifog_ini(cifog_params,
+                                                    cifog_headers)))
+        files.append((slurm_fname, render_slurm(slurm_template, run_name,
+                                                Nproc, SAGE_fname,
+                                                cifog_fname,
+                                                this_run_directory)))
+
+        runs.append({"run_id" : run_name,
+                     "run_number" : run_number,
+                     "SAGE_params" : SAGE_update,
+                     "cifog_params" : cifog_update,
+                     "run_directory" : this_run_directory,
+                     "SAGE_ini" : SAGE_fname,
+                     "cifog_ini" : cifog_fname,
+                     "slurm" : slurm_fname})
+
+    # Runs that share a name and directory would overwrite each other.
+    fnames = [fname for fname, _ in files]
+    if len(set(fnames)) != len(fnames):
+        duplicates = sorted(set(fname for fname in fnames
+                                if fnames.count(fname) > 1))
+        raise ValueError("Multiple runs would write to the same files, e.g., "
+                         "{0}. Give each run a unique `FileNameGalaxies` (see "
+                         "`name_format`).".format(duplicates[0]))
+
+    run_directories = sorted(set(run["run_directory"] for run in runs))
+    for directory in run_directories:
+        create_directories(directory)
+
+    write_files(files)
+    print("Created the ini and slurm files for {0} runs.".format(len(runs)))
+
+    manifest = {"mode" : mode,
+                "base_SAGE_ini" : base_SAGE_ini,
+                "base_cifog_ini" : base_cifog_ini,
+                "base_slurm_file" : base_slurm_file,
+                "Nproc" : Nproc,
+                "runs" : runs}
+
+    if manifest_fname is None:
+        manifest_fname = "{0}/sweep_manifest.json".format(os.path.commonpath(run_directories))
+
+    # Written to a temporary name then moved into place, so a partially
+    # written manifest is never read.
+    tmp_fname = "{0}.tmp".format(manifest_fname)
+    with open(tmp_fname, "w") as f:
+        json.dump(manifest, f, indent=1, default=_json_default)
+    os.replace(tmp_fname, manifest_fname)
+    print("Saved the manifest to {0}".format(manifest_fname))
+
+    return manifest
+
+
 if __name__ == '__main__':
 
     # ===================================================================== #